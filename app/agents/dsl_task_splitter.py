@@ -1,6 +1,11 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Iterator
 from dataclasses import dataclass
-from uuid import uuid4
+from collections import deque
+import hashlib
+
+# 遍历顺序
+DFS = "dfs"   # 深度优先前序遍历，与DSL文档顺序一致
+BFS = "bfs"   # 广度优先，按层级从上到下
 
 @dataclass
 class TaskNode:
@@ -14,6 +19,87 @@ class TaskNode:
     parent_task_id: str       # 父任务ID
     items: List[str]          # 子任务ID列表（对应DSL中的items）
     properties: Dict[str, Any] # 节点的所有其他属性
+    path: str = ""            # 节点在DSL中的 JSON Pointer（如 /items/0/items/2），根节点为空字符串
+
+
+def make_task_id(path: str) -> str:
+    """由节点路径计算任务ID，同一结构的DSL每次拆分得到相同的ID
+    
+    Args:
+        path: 节点的 JSON Pointer
+        
+    Returns:
+        task_id: 16位十六进制任务ID
+    """
+    return hashlib.blake2b(path.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _items_of(node: Dict[str, Any]) -> List[Any]:
+    """节点的items列表，不存在或格式不对时返回空列表"""
+    items = node.get('items')
+    return items if isinstance(items, list) else []
+
+
+class SubtreeView:
+    """DSL子树的只读视图
+    
+    直接引用原DSL中的节点，不复制任何数据；子节点视图在访问时才创建。
+    调用方不能通过视图修改DSL。
+    """
+    __slots__ = ('node', 'path')
+
+    def __init__(self, node: Dict[str, Any], path: str = ""):
+        self.node = node    # 原DSL中的节点
+        self.path = path    # 节点的 JSON Pointer
+
+    @property
+    def task_id(self) -> str:
+        return make_task_id(self.path)
+
+    @property
+    def node_id(self) -> str:
+        return self.node.get('id', '')
+
+    @property
+    def node_type(self) -> str:
+        return self.node.get('type', '')
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """获取节点属性（不包括items）"""
+        return default if key == 'items' else self.node.get(key, default)
+
+    def __len__(self) -> int:
+        """子节点数"""
+        return len(_items_of(self.node))
+
+    def children(self) -> Iterator['SubtreeView']:
+        """按顺序产出子节点视图"""
+        for index, item in enumerate(_items_of(self.node)):
+            if isinstance(item, dict):
+                yield SubtreeView(item, f"{self.path}/items/{index}")
+
+    def walk(self, order: str = DFS) -> Iterator['SubtreeView']:
+        """按指定顺序产出子树中的所有节点视图（包括自身）
+        
+        Args:
+            order: 遍历顺序，DFS 或 BFS
+        """
+        pending = deque([self])
+        while pending:
+            view = pending.pop() if order == DFS else pending.popleft()
+            yield view
+            if order == DFS:
+                pending.extend(reversed(list(view.children())))
+            else:
+                pending.extend(view.children())
+
+    def to_dict(self) -> Dict[str, Any]:
+        """返回原DSL中的节点本身，不复制"""
+        return self.node
+
+    def __repr__(self) -> str:
+        return f"SubtreeView(path={self.path!r}, node_id={self.node_id!r}, node_type={self.node_type!r})"
+
 
 class DSLTaskSplitter:
     """DSL任务拆分器 - 专门处理基于items嵌套的DSL结构
@@ -24,11 +110,16 @@ class DSLTaskSplitter:
     2. 保持节点原有的所有属性
     3. 维护任务间的父子关系
     4. 支持按需获取任务信息
+    5. 任务ID由节点路径确定，相同结构的DSL多次拆分得到相同的ID，可以用于缓存任务结果
+    6. 按节点ID和节点类型建立索引，查找为 O(1)
     """
     
     def __init__(self):
         self.tasks: Dict[str, TaskNode] = {}
         self.root_task_id: str = None
+        self.node_index: Dict[str, str] = {}          # 节点ID -> 任务ID（节点ID重复时保留第一个）
+        self.type_index: Dict[str, List[str]] = {}    # 节点类型 -> 任务ID列表，按前序遍历顺序
+        self.dsl: Optional[Dict[str, Any]] = None     # 最近一次拆分的DSL，子树视图直接引用其中的节点
 
     def _extract_node_properties(self, node: Dict[str, Any]) -> Dict[str, Any]:
         """提取节点的所有属性（除了items）
@@ -41,41 +132,50 @@ class DSLTaskSplitter:
         """
         return {k: v for k, v in node.items() if k != 'items'}
 
-    def _create_task_node(self, node: Dict[str, Any], parent_task_id: str = None) -> str:
-        """创建任务节点
+    def _make_task_node(self, node: Dict[str, Any], parent_task_id: Optional[str], path: str) -> TaskNode:
+        """为单个DSL节点创建任务节点，子任务ID由路径直接算出，无需等待子节点被遍历
         
         Args:
             node: DSL节点数据
             parent_task_id: 父任务ID
+            path: 节点的 JSON Pointer
             
         Returns:
-            task_id: 新创建的任务ID
+            task_node: 任务节点
         """
-        task_id = str(uuid4())
-        
-        # 获取items列表（如果存在）
-        items = node.get('items', [])
-        # 提取其他所有属性
-        properties = self._extract_node_properties(node)
-        
-        # 创建任务节点
-        task_node = TaskNode(
-            task_id=task_id,
+        return TaskNode(
+            task_id=make_task_id(path),
             node_id=node.get('id', ''),
             node_type=node.get('type', ''),
             parent_task_id=parent_task_id,
-            items=[],  # 初始化为空列表，后续添加子任务ID
-            properties=properties
+            items=[make_task_id(f"{path}/items/{index}") for index in range(len(_items_of(node)))],
+            properties=self._extract_node_properties(node),
+            path=path
         )
+
+    def iter_tasks(self, dsl_data: Dict[str, Any], order: str = DFS) -> Iterator[TaskNode]:
+        """按遍历顺序逐个产出任务，不保存已产出的任务
         
-        self.tasks[task_id] = task_node
+        与 split_dsl 不同，这里不建立任务表和索引，内存占用只与遍历的待处理节点数有关，
+        适合逐个处理大型DSL中的节点。迭代实现，深层嵌套的DSL不会超出递归深度限制。
         
-        # 处理items中的每个子节点
-        for item in items:
-            child_task_id = self._create_task_node(item, task_id)
-            task_node.items.append(child_task_id)
+        Args:
+            dsl_data: DSL数据结构
+            order: 遍历顺序，DFS（前序，与文档顺序一致）或 BFS（按层级）
             
-        return task_id
+        Yields:
+            task_node: 任务节点
+        """
+        if order not in (DFS, BFS):
+            raise ValueError(f"未知的遍历顺序: {order}")
+        # 待处理队列中保存 (节点, 父任务ID, 路径)
+        pending = deque([(dsl_data, None, "")])
+        while pending:
+            node, parent_task_id, path = pending.pop() if order == DFS else pending.popleft()
+            task_node = self._make_task_node(node, parent_task_id, path)
+            yield task_node
+            children = [(item, task_node.task_id, f"{path}/items/{index}") for index, item in enumerate(_items_of(node))]
+            pending.extend(reversed(children) if order == DFS else children)
 
     def split_dsl(self, dsl_data: Dict[str, Any]) -> List[Dict[str, Any]]:
         """拆分DSL结构为任务队列
@@ -88,26 +188,37 @@ class DSLTaskSplitter:
         """
         # 重置状态
         self.tasks.clear()
+        self.node_index.clear()
+        self.type_index.clear()
         self.root_task_id = None
+        self.dsl = dsl_data
         
-        # 创建任务树
-        self.root_task_id = self._create_task_node(dsl_data)
+        # 按前序遍历创建任务树并建立索引
+        for task_node in self.iter_tasks(dsl_data):
+            self.tasks[task_node.task_id] = task_node
+            if task_node.node_id and task_node.node_id not in self.node_index:
+                self.node_index[task_node.node_id] = task_node.task_id
+            self.type_index.setdefault(task_node.node_type, []).append(task_node.task_id)
+        self.root_task_id = make_task_id("")
         
         # 构建任务队列
-        task_queue = []
-        for task_id, task_node in self.tasks.items():
-            task_info = {
-                'task_id': task_id,
-                'node_id': task_node.node_id,
-                'node_type': task_node.node_type,
-                'parent_task_id': task_node.parent_task_id,
-                'items': task_node.items,
-                'properties': task_node.properties
-            }
-            task_queue.append(task_info)
+        task_queue = [self._task_info(task_node) for task_node in self.tasks.values()]
             
         return task_queue
 
+    @staticmethod
+    def _task_info(task_node: TaskNode) -> Dict[str, Any]:
+        """把任务节点转换为任务信息字典"""
+        return {
+            'task_id': task_node.task_id,
+            'node_id': task_node.node_id,
+            'node_type': task_node.node_type,
+            'parent_task_id': task_node.parent_task_id,
+            'items': task_node.items,
+            'properties': task_node.properties,
+            'path': task_node.path
+        }
+
     def get_task_by_id(self, task_id: str) -> Dict[str, Any]:
         """根据任务ID获取任务信息
         
@@ -119,36 +230,68 @@ class DSLTaskSplitter:
         """
         if task_id not in self.tasks:
             return None
+        return self._task_info(self.tasks[task_id])
+
+    def get_task_by_node_id(self, node_id: str) -> Optional[Dict[str, Any]]:
+        """根据DSL节点ID获取任务信息
+        
+        Args:
+            node_id: DSL节点ID
             
-        task_node = self.tasks[task_id]
-        return {
-            'task_id': task_id,
-            'node_id': task_node.node_id,
-            'node_type': task_node.node_type,
-            'parent_task_id': task_node.parent_task_id,
-            'items': task_node.items,
-            'properties': task_node.properties
-        }
+        Returns:
+            task_info: 任务完整信息，节点不存在时返回None
+        """
+        task_id = self.node_index.get(node_id)
+        return self.get_task_by_id(task_id) if task_id is not None else None
+
+    def get_tasks_by_type(self, node_type: str) -> List[Dict[str, Any]]:
+        """获取指定类型的所有任务
+        
+        Args:
+            node_type: 节点类型
+            
+        Returns:
+            tasks: 任务信息列表，按前序遍历顺序
+        """
+        return [self._task_info(self.tasks[task_id]) for task_id in self.type_index.get(node_type, [])]
+
+    def get_subtree(self, task_id: str) -> Optional[SubtreeView]:
+        """获取任务对应子树的只读视图，直接引用原DSL中的节点，不复制数据
+        
+        Args:
+            task_id: 任务ID
+            
+        Returns:
+            view: 子树视图，任务不存在时返回None
+        """
+        task_node = self.tasks.get(task_id)
+        if task_node is None:
+            return None
+        node = self.dsl
+        # 路径形如 /items/0/items/2，按下标逐层定位
+        for index in task_node.path.split('/')[2::2]:
+            node = node['items'][int(index)]
+        return SubtreeView(node, task_node.path)
 
     def get_task_with_children(self, task_id: str) -> Dict[str, Any]:
         """获取任务及其所有子任务的完整信息
         
+        会为子树中的每个节点生成新的字典，只需要读取子树时使用 get_subtree
+        
         Args:
             task_id: 任务ID
             
         Returns:
             task_info: 包含子任务完整信息的任务数据
         """
-        task_info = self.get_task_by_id(task_id)
-        if not task_info:
+        root_info = self.get_task_by_id(task_id)
+        if not root_info:
             return None
             
-        # 递归获取所有子任务信息
-        children_info = []
-        for child_id in task_info['items']:
-            child_info = self.get_task_with_children(child_id)
-            if child_info:
-                children_info.append(child_info)
-                
-        task_info['children_info'] = children_info
-        return task_info
+        # 迭代地获取所有子任务信息
+        stack = [root_info]
+        while stack:
+            task_info = stack.pop()
+            task_info['children_info'] = [self.get_task_by_id(child_id) for child_id in task_info['items']]
+            stack.extend(task_info['children_info'])
+        return root_info
@@ -0,0 +1,283 @@
+"""
+DSL 并行编辑模块
+对整页范围的修改要求，按 DSLTaskSplitter 拆分出的子树把 DSL 分成若干部分，同时请求模型修改，
+再按拆分器记录的父子关系和 items 顺序组装回完整的 DSL
+"""
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from dataclasses import dataclass, field
+import logging
+
+from app.agents.dsl_task_splitter import DSLTaskSplitter
+from app.agents.task_scheduler import SUCCEEDED, TaskScheduler
+from app.core.metrics import metrics
+from app.core.tokens import estimate_tokens
+from app.dsl.canonical import canonical_json
+from app.dsl.codec import align
+from app.dsl.json_repair import try_repair_json
+from app.dsl.json_stream import extract_json
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 发送请求的函数：接收消息列表和温度，返回包含 text 的响应，失败时返回None
+Sender = Callable[[List[Dict[str, str]], float], Awaitable[Optional[Dict[str, Any]]]]
+
+# 表示修改范围是整个DSL的关键词
+_PAGE_WIDE_KEYWORDS = ("所有", "全部", "全局", "整个", "整体", "每个", "统一", "批量", "翻译", "主题", "暗色", "深色")
+
+# 表示要求修改DSL的动词，只提到范围而没有修改动作的消息（例如询问）不视为修改
+_EDIT_VERBS = ("改", "换", "翻译", "替换", "设置", "设为", "调整", "应用", "使用", "统一", "变成", "转成", "删除", "去掉",
+               "增加", "添加", "加上")
+
+# 表示询问的词，包含这些词或以问号结尾的消息是提问而不是修改要求
+_QUESTION_MARKERS = ("吗", "几个", "多少", "什么", "哪些", "哪个", "是否", "有没有", "怎么", "如何", "为什么")
+
+PARALLEL_EDIT_PROMPT = """你是一个专业的低代码平台 DSL 助手。用户对整个DSL提出了修改要求，DSL已被拆分成多个部分同时处理，
+你只负责下面给出的节点。请按用户的要求修改这些节点，并遵守：
+1. 只返回一个 JSON 对象 {"nodes": [...]}，节点的数量和顺序与输入相同，不要添加说明文字
+2. 保持每个节点的 id 和 type 不变，不要增加或删除节点
+3. 输入中没有 items 的节点返回时也不要添加 items，它的子节点由其他部分处理
+4. 与修改要求无关的节点原样返回"""
+
+
+def is_page_wide_instruction(message: str) -> bool:
+    """
+    判断消息是否为针对整个DSL的修改要求，例如翻译所有文字、统一应用主题
+
+    消息需要同时包含整页范围的关键词和修改动词，并且不是提问，
+    “整个页面有几个按钮？”这样的问题不会被当作修改。
+
+    Args:
+        message: 用户输入的消息
+
+    Returns:
+        bool: 是否为整页范围的修改
+    """
+    text = message.strip()
+    if text.endswith(("?", "？")) or any(marker in text for marker in _QUESTION_MARKERS):
+        return False
+    return any(keyword in text for keyword in _PAGE_WIDE_KEYWORDS) and any(verb in text for verb in _EDIT_VERBS)
+
+
+@dataclass
+class EditUnit:
+    """一次模型请求负责的部分：若干个连续的子树或省略了items的节点"""
+    task_ids: List[str] = field(default_factory=list)   # 节点对应的任务ID，按前序遍历顺序
+    shells: List[bool] = field(default_factory=list)    # 各节点是否省略了items（子节点由其他部分处理）
+    nodes: List[Dict] = field(default_factory=list)     # 发送给模型的节点
+    tokens: int = 0                                      # 节点的估算 token 数
+
+
+@dataclass
+class EditPlan:
+    """DSL的划分结果"""
+    units: List[EditUnit]              # 各部分，按前序遍历顺序
+    splitter: DSLTaskSplitter          # 拆分DSL使用的拆分器，记录了节点的父子关系和 items 顺序
+    originals: Dict[str, Dict]         # 任务ID到原节点的映射
+
+
+@dataclass
+class ParallelEditResult:
+    """并行编辑的结果"""
+    dsl: Dict                                                  # 组装后的完整DSL
+    units: int                                                 # 拆分出的部分数
+    failures: List[str] = field(default_factory=list)          # 修改失败、保持原样的部分的说明
+
+    @property
+    def changed(self) -> bool:
+        return self.units > len(self.failures)
+
+
+class ParallelDSLEditor:
+    """按子树拆分DSL并行请求模型修改的执行器"""
+
+    def __init__(self, unit_token_budget: int, concurrency: int, temperature: float = 0.7, max_retries: int = 0):
+        """
+        初始化并行编辑器
+
+        Args:
+            unit_token_budget: 每个部分的 token 预算，完整子树不超过预算时整体发送，否则拆开它的 items
+            concurrency: 每次编辑同时请求模型的部分数上限
+            temperature: 请求模型时使用的温度
+            max_retries: 单个部分请求失败或输出不合法时的最大重试次数
+        """
+        self.unit_token_budget = unit_token_budget
+        self.concurrency = concurrency
+        self.temperature = temperature
+        # 各部分之间没有依赖，全部同时就绪，由调度器在并发上限内执行并按部分重试
+        self.scheduler = TaskScheduler(concurrency, max_retries=max_retries, metric_prefix="parallel_edit_units")
+
+    @staticmethod
+    def _index(splitter: DSLTaskSplitter, dsl: Dict) -> Tuple[Dict[str, Dict], Dict[str, int]]:
+        """
+        拆分DSL并建立任务ID到原节点的映射和每个子树的估算 token 数
+
+        Returns:
+            Tuple[Dict[str, Dict], Dict[str, int]]: 原节点映射和子树 token 数
+        """
+        splitter.split_dsl(dsl)
+        task_ids = list(splitter.tasks)
+        # 拆分器按前序遍历创建任务，以相同顺序遍历原DSL即可一一对应
+        originals: Dict[str, Dict] = {}
+        stack = [dsl]
+        for task_id in task_ids:
+            node = stack.pop()
+            originals[task_id] = node
+            stack.extend(reversed(node.get("items", [])))
+
+        sizes: Dict[str, int] = {}
+        for task_id in reversed(task_ids):
+            task = splitter.tasks[task_id]
+            sizes[task_id] = estimate_tokens(canonical_json(task.properties)) + sum(sizes[child] for child in task.items)
+        return originals, sizes
+
+    def plan(self, dsl: Dict) -> EditPlan:
+        """
+        把DSL划分为若干部分
+
+        超出预算的节点只发送自身属性，它的 items 继续拆分；按前序遍历顺序把相邻的部分合并到同一个请求中，
+        每个请求不超过预算。
+
+        Args:
+            dsl: 完整DSL
+
+        Returns:
+            EditPlan: 划分结果
+        """
+        # 每次编辑使用独立的拆分器，同一个编辑器可以同时处理多个请求
+        splitter = DSLTaskSplitter()
+        originals, sizes = self._index(splitter, dsl)
+        units: List[EditUnit] = []
+        current = EditUnit()
+        stack = [splitter.root_task_id]
+        while stack:
+            task_id = stack.pop()
+            task = splitter.tasks[task_id]
+            shell = sizes[task_id] > self.unit_token_budget and bool(task.items)
+            tokens = sizes[task_id] - sum(sizes[child] for child in task.items) if shell else sizes[task_id]
+            if current.task_ids and current.tokens + tokens > self.unit_token_budget:
+                units.append(current)
+                current = EditUnit()
+            current.task_ids.append(task_id)
+            current.shells.append(shell)
+            current.nodes.append(task.properties if shell else originals[task_id])
+            current.tokens += tokens
+            if shell:
+                stack.extend(reversed(task.items))
+        if current.task_ids:
+            units.append(current)
+        return EditPlan(units, splitter, originals)
+
+    def _messages(self, unit: EditUnit, instruction: str) -> List[Dict[str, str]]:
+        """生成一个部分的请求消息"""
+        return [
+            {"role": "system", "content": PARALLEL_EDIT_PROMPT},
+            {"role": "user", "content": f"修改要求：{instruction}\n\n需要修改的节点:\n{canonical_json({'nodes': unit.nodes})}"}
+        ]
+
+    @staticmethod
+    def _parse(unit: EditUnit, text: str) -> List[Dict]:
+        """
+        从模型输出中取出修改后的节点并检查与输入一一对应
+
+        Raises:
+            ValueError: 输出不是合法的节点列表
+        """
+        def accept(value: Any) -> bool:
+            return isinstance(value, dict) and isinstance(value.get("nodes"), list)
+
+        extractor = extract_json(text, accept)
+        output = extractor.result
+        if not extractor.has_result and extractor.broken_start() is not None:
+            repaired = try_repair_json(extractor.text[extractor.broken_start():])
+            if repaired is not None and accept(repaired.value):
+                output = repaired.value
+        if output is None:
+            raise ValueError("模型没有返回节点列表")
+
+        nodes = output["nodes"]
+        if len(nodes) != len(unit.nodes):
+            raise ValueError(f"返回了 {len(nodes)} 个节点，应为 {len(unit.nodes)} 个")
+        for original, node in zip(unit.nodes, nodes):
+            if not isinstance(node, dict) or node.get("id") != original.get("id") or not isinstance(node.get("type"), str):
+                raise ValueError(f"节点 {original.get('id')} 的 id 或 type 与原节点不一致")
+        return nodes
+
+    async def edit(self, dsl: Dict, instruction: str, send: Sender) -> ParallelEditResult:
+        """
+        并行修改整个DSL
+
+        Args:
+            dsl: 完整DSL，不会被修改
+            instruction: 用户的修改要求
+            send: 发送模型请求的函数
+
+        Returns:
+            ParallelEditResult: 组装后的DSL和失败的部分，失败的部分保持原样
+        """
+        plan = self.plan(dsl)
+        units = plan.units
+        metrics.inc("parallel_edit_requests_total")
+        logger.info(f"DSL 拆分为 {len(units)} 个部分并行修改，并发数 {self.concurrency}")
+
+        async def run_unit(task: Dict[str, Any], inputs: Dict[str, Any]) -> List[Dict]:
+            unit = units[int(task["task_id"])]
+            response = await send(self._messages(unit, instruction), self.temperature)
+            if not response:
+                raise ValueError("模型请求失败")
+            return self._parse(unit, response.get("text", ""))
+
+        tasks = [{"task_id": str(index), "parent_task_id": None, "items": []} for index in range(len(units))]
+        schedule = await self.scheduler.run(tasks, run_unit)
+
+        edited: Dict[str, Tuple[Dict, bool]] = {}
+        failures: List[str] = []
+        for index, unit in enumerate(units):
+            key = str(index)
+            if schedule.states[key] != SUCCEEDED:
+                first = unit.nodes[0].get("id") or unit.task_ids[0]
+                error = schedule.errors.get(key, schedule.states[key])
+                failures.append(f"从节点 {first} 开始的 {len(unit.nodes)} 个节点: {error}")
+                continue
+            for task_id, shell, original, node in zip(unit.task_ids, unit.shells, unit.nodes, schedule.results[key]):
+                if shell:
+                    node = {key: value for key, value in node.items() if key != "items"}
+                # 与原节点对齐，未修改的部分直接复用原对象
+                edited[task_id] = (align(node, original), shell)
+
+        if failures:
+            logger.warning(f"并行修改中有 {len(failures)} 个部分失败，已保持原样: {'; '.join(failures)}")
+        return ParallelEditResult(self._assemble(plan, edited), len(units), failures)
+
+    @staticmethod
+    def _assemble(plan: EditPlan, edited: Dict[str, Tuple[Dict, bool]]) -> Dict:
+        """按拆分器记录的父子关系和 items 顺序组装修改后的DSL"""
+        tasks = plan.splitter.tasks
+        results: Dict[str, Dict] = {}
+        for task_id in reversed(list(tasks)):
+            original = plan.originals[task_id]
+            task = tasks[task_id]
+            node, shell = edited.get(task_id, (None, bool(task.items)))
+            if node is not None and not shell:
+                results[task_id] = node
+                continue
+            if node is None:
+                # 所在部分修改失败，或节点包含在已修改的子树中（结果不会被使用）
+                node = task.properties
+            items = [results[child] for child in task.items]
+            if node is task.properties and all(item is child for item, child in zip(items, original.get("items", []))):
+                results[task_id] = original
+                continue
+            # 保持 items 在原节点中的位置
+            assembled = {}
+            for key in original:
+                if key == "items":
+                    assembled["items"] = items
+                elif key in node:
+                    assembled[key] = node[key]
+            for key, value in node.items():
+                if key not in assembled:
+                    assembled[key] = value
+            results[task_id] = assembled
+        return results[plan.splitter.root_task_id]
+
@@ -0,0 +1,231 @@
+"""
+DSL 任务调度模块
+根据 DSLTaskSplitter 拆分出的任务的父子关系构建依赖图，在并发上限内用异步工作协程执行已就绪的任务，
+支持父节点优先或子节点优先的顺序、单个任务重试、取消以及进度事件
+"""
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from dataclasses import dataclass, field
+import asyncio
+import logging
+
+from app.core.metrics import metrics
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 执行顺序
+TOP_DOWN = "top_down"     # 父任务完成后才执行子任务，例如先生成页面骨架再生成组件
+BOTTOM_UP = "bottom_up"   # 子任务全部完成后才执行父任务，例如先修改组件再汇总到容器
+
+# 任务状态
+PENDING = "pending"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+SKIPPED = "skipped"       # 依赖的任务失败，没有执行
+CANCELLED = "cancelled"
+
+# 执行单个任务的函数：接收任务信息和所依赖任务的结果（按任务ID），返回任务结果
+TaskWorker = Callable[[Dict[str, Any], Dict[str, Any]], Awaitable[Any]]
+
+
+@dataclass
+class ProgressEvent:
+    """任务进度事件"""
+    kind: str                      # 事件类型：started、retrying、succeeded、failed、skipped、cancelled
+    task_id: str                   # 任务ID
+    finished: int                  # 已结束（成功、失败、跳过或取消）的任务数
+    total: int                     # 任务总数
+    attempt: int = 0               # 第几次尝试，从1开始
+    error: Optional[str] = None    # 失败原因
+
+
+@dataclass
+class ScheduleResult:
+    """一次调度的结果"""
+    states: Dict[str, str] = field(default_factory=dict)    # 各任务的最终状态
+    results: Dict[str, Any] = field(default_factory=dict)   # 成功任务的结果
+    errors: Dict[str, str] = field(default_factory=dict)    # 失败任务的错误说明
+    cancelled: bool = False                                  # 调度是否被取消
+
+    @property
+    def ok(self) -> bool:
+        return not self.cancelled and all(state == SUCCEEDED for state in self.states.values())
+
+
+class TaskScheduler:
+    """按依赖关系并发执行DSL任务的调度器"""
+
+    def __init__(self, concurrency: int, order: str = TOP_DOWN, max_retries: int = 0, retry_delay: float = 0.5,
+                 metric_prefix: str = "task_scheduler"):
+        """
+        初始化调度器，调度器不保存单次调度的状态，同一个实例可以同时执行多次调度
+
+        Args:
+            concurrency: 每次调度同时执行的任务数上限
+            order: 执行顺序，TOP_DOWN（父任务先执行）或 BOTTOM_UP（子任务先执行）
+            max_retries: 单个任务失败后的最大重试次数
+            retry_delay: 第一次重试前的等待时间（秒），之后每次翻倍
+            metric_prefix: 任务计数指标的前缀
+        """
+        if order not in (TOP_DOWN, BOTTOM_UP):
+            raise ValueError(f"未知的执行顺序: {order}")
+        self.concurrency = max(1, concurrency)
+        self.order = order
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.metric_prefix = metric_prefix
+
+    def dependencies(self, tasks: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+        """
+        构建依赖图
+
+        Args:
+            tasks: DSLTaskSplitter.split_dsl 返回的任务列表
+
+        Returns:
+            Dict[str, List[str]]: 任务ID到其依赖的任务ID列表
+        """
+        known = {task["task_id"] for task in tasks}
+        if self.order == TOP_DOWN:
+            return {
+                task["task_id"]: [task["parent_task_id"]] if task["parent_task_id"] in known else []
+                for task in tasks
+            }
+        return {task["task_id"]: [child for child in task["items"] if child in known] for task in tasks}
+
+    async def run(self, tasks: List[Dict[str, Any]], worker: TaskWorker,
+                  on_progress: Optional[Callable[[ProgressEvent], None]] = None,
+                  cancel_event: Optional[asyncio.Event] = None) -> ScheduleResult:
+        """
+        执行所有任务
+
+        依赖全部成功的任务进入就绪队列，由最多 concurrency 个工作协程执行；任务重试后仍失败时，
+        直接或间接依赖它的任务被跳过。
+
+        Args:
+            tasks: DSLTaskSplitter.split_dsl 返回的任务列表
+            worker: 执行单个任务的协程函数
+            on_progress: 接收进度事件的回调
+            cancel_event: 设置后取消本次调度，执行中的任务被中止，未开始的任务不再执行
+
+        Returns:
+            ScheduleResult: 各任务的状态和结果
+        """
+        by_id = {task["task_id"]: task for task in tasks}
+        depends_on = self.dependencies(tasks)
+        dependents: Dict[str, List[str]] = {task_id: [] for task_id in by_id}
+        for task_id, deps in depends_on.items():
+            for dep in deps:
+                dependents[dep].append(task_id)
+        waiting = {task_id: len(deps) for task_id, deps in depends_on.items()}
+
+        result = ScheduleResult(states={task_id: PENDING for task_id in by_id})
+        total = len(by_id)
+        finished = 0
+        ready: asyncio.Queue = asyncio.Queue()
+        # 调度结束或被取消时置为True，此后工作协程收到的取消不再当作任务失败
+        stopping = False
+        all_done = asyncio.Event()
+        if cancel_event is None:
+            cancel_event = asyncio.Event()
+
+        def emit(kind: str, task_id: str, attempt: int = 0, error: Optional[str] = None) -> None:
+            if on_progress is None:
+                return
+            try:
+                on_progress(ProgressEvent(kind, task_id, finished, total, attempt, error))
+            except Exception as e:
+                # 回调出错不能中断调度，否则等待中的任务永远不会结束
+                logger.warning(f"进度回调出错: {str(e)}")
+
+        def mark(task_id: str, state: str, error: Optional[str] = None) -> None:
+            nonlocal finished
+            result.states[task_id] = state
+            finished += 1
+            emit(state, task_id, error=error)
+
+        def finish(task_id: str, state: str, error: Optional[str] = None) -> None:
+            mark(task_id, state, error)
+            if state == SUCCEEDED:
+                for dependent in dependents[task_id]:
+                    waiting[dependent] -= 1
+                    if waiting[dependent] == 0:
+                        ready.put_nowait(dependent)
+            else:
+                # 直接或间接依赖失败任务的任务不再执行
+                stack = list(dependents[task_id])
+                while stack:
+                    dependent = stack.pop()
+                    if result.states[dependent] == PENDING:
+                        mark(dependent, SKIPPED)
+                        stack.extend(dependents[dependent])
+            if finished == total:
+                all_done.set()
+
+        async def execute(task_id: str) -> None:
+            task = by_id[task_id]
+            inputs = {dep: result.results[dep] for dep in depends_on[task_id]}
+            for attempt in range(1, self.max_retries + 2):
+                emit("started" if attempt == 1 else "retrying", task_id, attempt)
+                try:
+                    value = await worker(task, inputs)
+                except Exception as e:
+                    error = str(e) or e.__class__.__name__
+                    if attempt > self.max_retries:
+                        logger.warning(f"任务 {task_id} 执行失败: {error}")
+                        metrics.inc(f"{self.metric_prefix}_failed_total")
+                        result.errors[task_id] = error
+                        finish(task_id, FAILED, error)
+                        return
+                    logger.info(f"任务 {task_id} 第 {attempt} 次执行失败，准备重试: {error}")
+                    metrics.inc(f"{self.metric_prefix}_retries_total")
+                    await asyncio.sleep(self.retry_delay * (2 ** (attempt - 1)))
+                    continue
+                except BaseException as e:
+                    if stopping:
+                        # 调度本身被取消，工作协程随之结束
+                        raise
+                    # 任务抛出的 CancelledError 等异常不能让工作协程退出，否则该任务永远不会结束，调度一直等待
+                    error = str(e) or e.__class__.__name__
+                    logger.warning(f"任务 {task_id} 执行中止: {error}")
+                    metrics.inc(f"{self.metric_prefix}_failed_total")
+                    result.errors[task_id] = error
+                    finish(task_id, FAILED, error)
+                    return
+                result.results[task_id] = value
+                metrics.inc(f"{self.metric_prefix}_succeeded_total")
+                finish(task_id, SUCCEEDED)
+                return
+
+        async def work_loop() -> None:
+            while True:
+                task_id = await ready.get()
+                result.states[task_id] = RUNNING
+                await execute(task_id)
+
+        for task_id, count in waiting.items():
+            if count == 0:
+                ready.put_nowait(task_id)
+        if total == 0:
+            all_done.set()
+
+        metrics.inc(f"{self.metric_prefix}_total", total)
+        workers = [asyncio.create_task(work_loop()) for _ in range(min(self.concurrency, total))]
+        done_waiter = asyncio.create_task(all_done.wait())
+        cancel_waiter = asyncio.create_task(cancel_event.wait())
+        try:
+            await asyncio.wait([done_waiter, cancel_waiter], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            stopping = True
+            for pending in (done_waiter, cancel_waiter, *workers):
+                pending.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        if not all_done.is_set():
+            result.cancelled = True
+            for task_id, state in result.states.items():
+                if state in (PENDING, RUNNING):
+                    mark(task_id, CANCELLED)
+            logger.info(f"任务调度已取消，完成 {sum(s == SUCCEEDED for s in result.states.values())}/{total} 个任务")
+        return result
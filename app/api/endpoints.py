@@ -1,14 +1,23 @@
 """
 API路由模块
 """
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, Header, Query
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
 from typing import List, Dict, Literal, Any, Optional, Union
+from contextlib import AsyncExitStack
 import logging
 import json
 
+from app.core.admission import AdmissionRejected
+from app.core.batch import run_batch
 from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.response_cache import get_response_cache
+from app.core.session import SessionManager
+from app.core.session_store import SessionConflict, create_session_store
+from app.dsl.diff import diff_dsl
+from app.dsl.json_stream import extract_json
 from app.models.dsl_assistant_langchain import DSLAssistant
 from app.models.dsl_assistant_api import DSLAssistantAPI
 
@@ -18,9 +27,14 @@ logger = logging.getLogger(__name__)
 # 创建路由器
 router = APIRouter()
 
-# 初始化两个版本的助手
-langchain_assistant = DSLAssistant()
-api_assistant = DSLAssistantAPI()
+# 按会话管理两个版本的助手实例
+session_manager = SessionManager(
+    factories={"langchain": DSLAssistant, "api": DSLAssistantAPI},
+    max_sessions=settings.SESSION_MAX_COUNT,
+    max_bytes=settings.SESSION_MAX_BYTES,
+    idle_ttl=settings.SESSION_IDLE_TTL,
+    store=create_session_store(settings.SESSION_STORE, settings.SESSION_DB_PATH)
+)
 
 class ChatRequest(BaseModel):
     message: str = Field(..., description="用户的输入消息", min_length=1)
@@ -28,6 +42,13 @@ class ChatRequest(BaseModel):
         default="api",
         description="使用的助手版本：langchain（LangChain版本）或api（直接API调用版本）"
     )
+    session_id: Optional[str] = Field(None, description="会话ID，优先于 X-Session-ID 请求头")
+    edit_mode: Optional[Literal["full", "patch", "parallel"]] = Field(
+        None,
+        description="编辑模式（仅api版本）：full（模型返回完整DSL）、patch（模型返回JSON Patch）"
+                    "或parallel（按子树拆分并行修改整个DSL），默认使用服务配置"
+    )
+    no_cache: bool = Field(False, description="为true时跳过响应缓存，总是请求模型")
 
 class DSLRequest(BaseModel):
     dsl_content: str = Field(..., description="DSL 文件内容", min_length=1)
@@ -35,14 +56,38 @@ class DSLRequest(BaseModel):
         default="api",
         description="使用的助手版本：langchain（LangChain版本）或api（直接API调用版本）"
     )
+    session_id: Optional[str] = Field(None, description="会话ID，优先于 X-Session-ID 请求头")
+
+class VersionRequest(BaseModel):
+    """撤销/重做请求模型"""
+    version: Literal["langchain", "api"] = Field(
+        default="api",
+        description="使用的助手版本：langchain（LangChain版本）或api（直接API调用版本）"
+    )
+    session_id: Optional[str] = Field(None, description="会话ID，优先于 X-Session-ID 请求头")
 
 class ChatResponse(BaseModel):
     """聊天响应模型，支持文本或DSL响应"""
     response: str = Field(..., description="助手的响应内容")
     response_type: Literal["text", "dsl"] = Field(..., description="响应类型：text（文本）或dsl（DSL JSON）")
     dsl: Optional[Dict] = Field(None, description="如果响应包含DSL修改，则返回完整的DSL")
+    diff: Optional[List[Dict[str, Any]]] = Field(None, description="如果响应包含DSL修改，则返回本次修改相对上一版本的节点差异")
     history: List[Dict[str, str]] = Field(..., description="对话历史记录")
 
+class BatchJob(BaseModel):
+    """批量请求中的单个作业"""
+    id: Optional[str] = Field(None, description="作业标识，原样出现在该作业的结果中")
+    session_id: Optional[str] = Field(None, description="在该会话的当前DSL上执行指令，同一会话的作业按提交顺序依次执行")
+    dsl_content: Optional[str] = Field(None, description="要修改的DSL内容，指定会话时先加载到该会话，否则在临时会话中执行")
+    message: str = Field(..., description="要执行的指令", min_length=1)
+    edit_mode: Optional[Literal["full", "patch", "parallel"]] = Field(None, description="编辑模式，默认使用服务配置")
+    no_cache: bool = Field(False, description="为true时跳过响应缓存，总是请求模型")
+
+class BatchRequest(BaseModel):
+    """批量聊天请求模型，只支持api版本"""
+    jobs: List[BatchJob] = Field(..., description="作业列表", min_length=1)
+    concurrency: Optional[int] = Field(None, description="同时执行的作业数，默认并且最多为服务配置的上限", ge=1)
+
 class HistoryResponse(BaseModel):
     history: List[Dict[str, str]]
 
@@ -51,35 +96,142 @@ class DSLResponse(BaseModel):
     message: str = Field(..., description="操作结果消息")
     dsl: Optional[Dict] = Field(None, description="加载的DSL内容")
 
-def get_assistant(version: str):
-    """根据版本获取对应的助手实例"""
-    if version == "langchain":
-        return langchain_assistant
-    return api_assistant
+def get_assistant(version: str, session_id: Optional[str] = None):
+    """
+    根据会话ID和版本独占使用对应的助手实例，不存在时按需创建
+    
+    在 async with 块内使用，同一会话的请求依次执行，修改后在块内调用 session_manager.acommit
+    """
+    return session_manager.session(session_id, version)
+
+def get_request_options(request: ChatRequest) -> Dict[str, Any]:
+    """提取传给 process_request 的可选参数，LangChain 版本不支持 patch 编辑模式"""
+    options: Dict[str, Any] = {}
+    if request.no_cache:
+        options["no_cache"] = True
+    if request.edit_mode is None:
+        return options
+    if request.version == "langchain":
+        raise HTTPException(status_code=400, detail="LangChain 版本不支持 edit_mode 参数")
+    options["edit_mode"] = request.edit_mode
+    return options
+
+def resolve_session_id(body_session_id: Optional[str], header_session_id: Optional[str]) -> Optional[str]:
+    """请求体中的 session_id 优先，其次是 X-Session-ID 请求头"""
+    return body_session_id or header_session_id
 
 def is_json_response(response: str) -> bool:
     """
-    判断响应是否是JSON格式
+    判断响应是否是JSON格式，助手没有记录响应类型时使用
     """
-    try:
-        json_start = response.find("{")
-        if json_start == -1:
-            return False
-        json_end = response.rfind("}") + 1
-        json.loads(response[json_start:json_end])
-        return True
-    except json.JSONDecodeError:
-        return False
+    return extract_json(response).has_result
+
+def latest_diff(assistant) -> Optional[List[Dict[str, Any]]]:
+    """
+    计算当前DSL版本相对上一版本的节点差异
+    
+    Args:
+        assistant: 助手实例
+        
+    Returns:
+        Optional[List[Dict[str, Any]]]: 差异操作，没有上一版本（刚加载或已被淘汰）时返回None
+    """
+    current = assistant.versions.current
+    if current is None:
+        return None
+    previous = assistant.get_dsl_version(current.number - 1)
+    if previous is None:
+        return None
+    return diff_dsl(previous, assistant.get_complete_dsl(), getattr(assistant, "merkle", None))
+
+def build_chat_result(assistant, response: str) -> Dict[str, Any]:
+    """
+    根据助手的响应构建聊天结果，/chat 与 /chat/stream 的最终事件共用
+    
+    Args:
+        assistant: 处理请求的助手实例
+        response: 助手的响应内容
+        
+    Returns:
+        Dict[str, Any]: 包含响应内容、响应类型、完整DSL、本次修改的差异和对话历史的结果
+    """
+    # 判断响应类型，助手在处理请求时已经记录了类型，无需再次解析响应
+    response_type = getattr(assistant, "last_response_type", None)
+    if response_type not in ("dsl", "text"):
+        response_type = "dsl" if is_json_response(response) else "text"
+    
+    # 获取完整的DSL和本次修改的差异（如果有）
+    dsl = None
+    diff = None
+    if response_type == "dsl":
+        if hasattr(assistant, "get_complete_dsl"):
+            dsl = assistant.get_complete_dsl()
+            diff = latest_diff(assistant)
+        else:
+            # 如果响应是JSON格式但助手没有get_complete_dsl方法
+            try:
+                dsl = json.loads(response)
+            except json.JSONDecodeError:
+                pass
+    
+    return {
+        "response": response,
+        "response_type": response_type,
+        "dsl": dsl,
+        "diff": diff,
+        "history": assistant.get_chat_history()
+    }
+
+def admission_error(error: AdmissionRejected) -> HTTPException:
+    """
+    把模型服务繁忙的拒绝转换为 HTTP 错误，客户端按 Retry-After 等待后重试
+    
+    Args:
+        error: 准入控制抛出的异常
+        
+    Returns:
+        HTTPException: 状态码为 429 或 503 的错误
+    """
+    return HTTPException(status_code=error.status_code, detail=str(error),
+                         headers={"Retry-After": str(error.retry_after)})
+
+def conflict_error(error: SessionConflict) -> HTTPException:
+    """
+    把会话保存冲突转换为 HTTP 错误，会话已被其他请求修改，客户端重新获取状态后重试
+    
+    Args:
+        error: 会话存储抛出的异常
+        
+    Returns:
+        HTTPException: 状态码为 409 的错误
+    """
+    return HTTPException(status_code=409, detail=str(error))
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """
+    格式化一条 Server-Sent Events 消息
+    
+    Args:
+        event: 事件名称
+        data: 事件数据，序列化为单行JSON
+        
+    Returns:
+        str: SSE 格式的消息文本
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 @router.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, x_session_id: Optional[str] = Header(None)):
     """
     处理用户聊天请求
     
     请求示例:
     {
         "message": "你好，请帮我分析一下当前的 DSL 结构",
-        "version": "api"  // 可选，默认使用api版本
+        "version": "api",  // 可选，默认使用api版本
+        "session_id": "editor-1",  // 可选，也可以通过 X-Session-ID 请求头传递
+        "edit_mode": "patch",  // 可选，仅api版本，patch 让模型只返回 JSON Patch，parallel 按子树拆分并行修改整个DSL
+        "no_cache": false  // 可选，为true时跳过响应缓存
     }
     
     响应示例:
@@ -87,53 +239,190 @@ async def chat(request: ChatRequest):
         "response": "...",  // 响应内容
         "response_type": "text",  // 或 "dsl"
         "dsl": {...},  // 可选，当response_type为"dsl"时存在
+        "diff": [{"op": "update", "path": "/items/0", "id": "title", "set": {"text": "..."}, "unset": []}],  // 可选，本次修改的节点差异
         "history": [...]
     }
     """
     try:
         logger.info(f"收到聊天请求，使用{request.version}版本")
-        assistant = get_assistant(request.version)
-        response = assistant.process_request(request.message)  
-        history = assistant.get_chat_history()
-        
-        # 判断响应类型
-        response_type = "dsl" if is_json_response(response) else "text"
-        
-        # 获取完整的DSL（如果有）
-        dsl = None
-        if response_type == "dsl":
-            if hasattr(assistant, "get_complete_dsl"):
-                dsl = assistant.get_complete_dsl()
-            else:
-                # 如果响应是JSON格式但助手没有get_complete_dsl方法
-                try:
-                    dsl = json.loads(response)
-                except json.JSONDecodeError:
-                    pass
+        options = get_request_options(request)
+        session_id = resolve_session_id(request.session_id, x_session_id)
+        async with get_assistant(request.version, session_id) as assistant:
+            response = await assistant.process_request(request.message, **options)
+            await session_manager.acommit(session_id, request.version)
+            result = build_chat_result(assistant, response)
         
         # 使用JSONResponse以确保正确的编码
         return JSONResponse(
-            content={
-                "response": response,
-                "response_type": response_type,
-                "dsl": dsl,
-                "history": history
-            },
+            content=result,
             media_type="application/json; charset=utf-8"
         )
+    except HTTPException:
+        raise
+    except AdmissionRejected as e:
+        raise admission_error(e)
+    except SessionConflict as e:
+        raise conflict_error(e)
     except Exception as e:
         logger.error(f"处理聊天请求时出错: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/chat/stream")
+async def chat_stream(request: ChatRequest, x_session_id: Optional[str] = Header(None)):
+    """
+    以 Server-Sent Events 方式流式处理用户聊天请求
+    
+    请求体与 /chat 相同。响应为 text/event-stream，包含两类事件:
+    
+        event: token
+        data: {"text": "..."}        // 模型生成的文本片段，按生成顺序推送
+        
+        event: done
+        data: {"response": "...", "response_type": "text", "dsl": {...}, "history": [...]}
+    
+    处理失败时推送 event: error，data 中包含 detail 字段；模型服务繁忙时在推送任何事件之前
+    直接返回带 Retry-After 的 429 或 503
+    """
+    logger.info(f"收到流式聊天请求，使用{request.version}版本")
+    options = get_request_options(request)
+    session_id = resolve_session_id(request.session_id, x_session_id)
+    # 会话在整个流式响应期间保持独占，响应结束或客户端断开时释放
+    lease = AsyncExitStack()
+    assistant = await lease.enter_async_context(get_assistant(request.version, session_id))
+    events = assistant.process_request_stream(request.message, **options)
+    
+    # 先取到第一个事件再开始响应，没有获得模型服务的名额时还能返回错误状态码
+    try:
+        first = await events.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except AdmissionRejected as e:
+        await lease.aclose()
+        raise admission_error(e)
+    except BaseException:
+        await lease.aclose()
+        raise
+    
+    async def replay():
+        if first is not None:
+            yield first
+            async for event in events:
+                yield event
+    
+    async def event_generator():
+        try:
+            async for kind, text in replay():
+                if kind == "token":
+                    yield format_sse("token", {"text": text})
+                else:
+                    await session_manager.acommit(session_id, request.version)
+                    yield format_sse("done", build_chat_result(assistant, text))
+        except Exception as e:
+            logger.error(f"处理流式聊天请求时出错: {str(e)}", exc_info=True)
+            yield format_sse("error", {"detail": str(e)})
+        finally:
+            await events.aclose()
+            await lease.aclose()
+    
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream; charset=utf-8",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # 关闭 Nginx 等反向代理的缓冲，保证逐条推送
+        }
+    )
+
+async def run_batch_job(job: BatchJob) -> Dict[str, Any]:
+    """
+    执行批量请求中的单个作业，语义与在对应会话上调用 /chat 相同
+    
+    Args:
+        job: 作业
+        
+    Returns:
+        Dict[str, Any]: 响应内容、响应类型和完整DSL，不包含对话历史
+    """
+    if job.session_id is None and job.dsl_content is None:
+        raise ValueError("作业需要指定 session_id 或 dsl_content")
+    async with AsyncExitStack() as stack:
+        # 没有指定会话的作业使用临时助手，不占用会话名额
+        if job.session_id is not None:
+            assistant = await stack.enter_async_context(get_assistant("api", job.session_id))
+        else:
+            assistant = DSLAssistantAPI()
+        if job.dsl_content is not None and not assistant.load_dsl(job.dsl_content):
+            raise ValueError(f"DSL 格式无效：{assistant.last_load_error}" if assistant.last_load_error else "DSL 格式无效")
+        options: Dict[str, Any] = {"no_cache": job.no_cache}
+        if job.edit_mode is not None:
+            options["edit_mode"] = job.edit_mode
+        response = await assistant.process_request(job.message, **options)
+        if job.session_id is not None:
+            await session_manager.acommit(job.session_id, "api")
+        result = build_chat_result(assistant, response)
+    del result["history"]
+    return result
+
+@router.post("/chat/batch")
+async def chat_batch(request: BatchRequest):
+    """
+    并发执行一批指令，按完成顺序以 NDJSON 逐行返回结果
+    
+    请求示例:
+    {
+        "jobs": [
+            {"id": "page-1", "session_id": "editor-1", "message": "把标题改成红色"},
+            {"id": "page-2", "dsl_content": "{...}", "message": "删除底部按钮", "edit_mode": "patch"}
+        ],
+        "concurrency": 4  // 可选，不超过 BATCH_MAX_CONCURRENCY
+    }
+    
+    响应为 application/x-ndjson，每个作业完成时输出一行:
+    
+        {"index": 0, "id": "page-1", "status": "ok", "response": "...", "response_type": "dsl", "dsl": {...}}
+        {"index": 1, "id": "page-2", "status": "error", "detail": "..."}
+    
+    单个作业失败不影响其他作业，所有作业完成后输出最后一行:
+    
+        {"status": "done", "total": 2, "succeeded": 1, "failed": 1}
+    """
+    if len(request.jobs) > settings.BATCH_MAX_JOBS:
+        raise HTTPException(status_code=400, detail=f"单次最多提交 {settings.BATCH_MAX_JOBS} 个作业")
+    concurrency = min(request.concurrency or settings.BATCH_MAX_CONCURRENCY, settings.BATCH_MAX_CONCURRENCY)
+    logger.info(f"收到批量聊天请求，共 {len(request.jobs)} 个作业，并发数 {concurrency}")
+    
+    async def line_generator():
+        succeeded = 0
+        async for outcome in run_batch(request.jobs, run_batch_job, concurrency, key=lambda job: job.session_id):
+            job = request.jobs[outcome.index]
+            line = {"index": outcome.index, "id": job.id}
+            if outcome.ok:
+                succeeded += 1
+                line.update(status="ok", **outcome.result)
+            else:
+                line.update(status="error", detail=str(outcome.error))
+            yield json.dumps(line, ensure_ascii=False) + "\n"
+        summary = {"status": "done", "total": len(request.jobs), "succeeded": succeeded,
+                   "failed": len(request.jobs) - succeeded}
+        logger.info(f"批量聊天请求完成，成功 {succeeded} 个，失败 {len(request.jobs) - succeeded} 个")
+        yield json.dumps(summary, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(
+        line_generator(),
+        media_type="application/x-ndjson; charset=utf-8",
+        headers={"X-Accel-Buffering": "no"}
+    )
+
 @router.post("/load_dsl", response_model=DSLResponse)
-async def load_dsl(request: DSLRequest):
+async def load_dsl(request: DSLRequest, x_session_id: Optional[str] = Header(None)):
     """
     加载 DSL 文件
     
     请求示例:
     {
         "dsl_content": "{\"type\": \"container\", \"children\": []}",
-        "version": "api"  // 可选，默认使用api版本
+        "version": "api",  // 可选，默认使用api版本
+        "session_id": "editor-1"  // 可选，也可以通过 X-Session-ID 请求头传递
     }
     
     响应示例:
@@ -144,15 +433,18 @@ async def load_dsl(request: DSLRequest):
     """
     try:
         logger.info(f"收到加载DSL请求，使用{request.version}版本")
-        assistant = get_assistant(request.version)
-        success = assistant.load_dsl(request.dsl_content)
-        if not success:
-            raise HTTPException(status_code=400, detail="DSL 格式无效")
-        
-        # 获取完整的DSL（如果有）
-        dsl = None
-        if hasattr(assistant, "get_complete_dsl"):
-            dsl = assistant.get_complete_dsl()
+        session_id = resolve_session_id(request.session_id, x_session_id)
+        async with get_assistant(request.version, session_id) as assistant:
+            success = assistant.load_dsl(request.dsl_content)
+            if not success:
+                reason = getattr(assistant, "last_load_error", None)
+                raise HTTPException(status_code=400, detail=f"DSL 格式无效：{reason}" if reason else "DSL 格式无效")
+            await session_manager.acommit(session_id, request.version)
+            
+            # 获取完整的DSL（如果有）
+            dsl = None
+            if hasattr(assistant, "get_complete_dsl"):
+                dsl = assistant.get_complete_dsl()
         
         # 使用JSONResponse以确保正确的编码
         return JSONResponse(
@@ -162,22 +454,31 @@ async def load_dsl(request: DSLRequest):
             },
             media_type="application/json; charset=utf-8"
         )
+    except HTTPException:
+        raise
+    except SessionConflict as e:
+        raise conflict_error(e)
     except Exception as e:
         logger.error(f"加载DSL时出错: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/history", response_model=HistoryResponse)
-async def get_history(version: Literal["langchain", "api"] = "api"):
+async def get_history(
+    version: Literal["langchain", "api"] = "api",
+    session_id: Optional[str] = None,
+    x_session_id: Optional[str] = Header(None)
+):
     """
     获取对话历史记录
     
     参数:
     - version: 使用的助手版本，可选值：langchain或api，默认为api
+    - session_id: 会话ID，可选，也可以通过 X-Session-ID 请求头传递
     """
     try:
         logger.info(f"获取历史记录，使用{version}版本")
-        assistant = get_assistant(version)
-        history = assistant.get_chat_history()
+        async with get_assistant(version, resolve_session_id(session_id, x_session_id)) as assistant:
+            history = assistant.get_chat_history()
         
         # 使用JSONResponse以确保正确的编码
         return JSONResponse(
@@ -189,18 +490,178 @@ async def get_history(version: Literal["langchain", "api"] = "api"):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/clear_history")
-async def clear_history(version: Literal["langchain", "api"] = "api"):
+async def clear_history(
+    version: Literal["langchain", "api"] = "api",
+    session_id: Optional[str] = None,
+    x_session_id: Optional[str] = Header(None)
+):
     """
     清空对话历史
     
     参数:
     - version: 使用的助手版本，可选值：langchain或api，默认为api
+    - session_id: 会话ID，可选，也可以通过 X-Session-ID 请求头传递
     """
     try:
         logger.info(f"清空历史记录，使用{version}版本")
-        assistant = get_assistant(version)
-        assistant.clear_history()
+        session_id = resolve_session_id(session_id, x_session_id)
+        async with get_assistant(version, session_id) as assistant:
+            assistant.clear_history()
+            await session_manager.acommit(session_id, version)
         return JSONResponse({"message": "历史记录已清空"})
+    except SessionConflict as e:
+        raise conflict_error(e)
     except Exception as e:
         logger.error(f"清空历史记录时出错: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/metrics")
+async def get_metrics():
+    """
+    获取服务运行指标，包括会话数量、淘汰次数、会话状态占用的内存和响应缓存命中情况
+    """
+    cache = get_response_cache()
+    return JSONResponse(
+        content={
+            **metrics.snapshot(),
+            "sessions": session_manager.stats(),
+            "response_cache": cache.stats() if cache is not None else None
+        },
+        media_type="application/json; charset=utf-8"
+    )
+
+async def switch_dsl_version(action: str, request: VersionRequest, x_session_id: Optional[str]):
+    """执行撤销或重做，并返回切换后的DSL版本"""
+    session_id = resolve_session_id(request.session_id, x_session_id)
+    async with get_assistant(request.version, session_id) as assistant:
+        dsl = assistant.undo() if action == "undo" else assistant.redo()
+        if dsl is None:
+            raise HTTPException(status_code=409, detail="没有可撤销的修改" if action == "undo" else "没有可重做的修改")
+        try:
+            await session_manager.acommit(session_id, request.version)
+        except SessionConflict as e:
+            raise conflict_error(e)
+        dsl_version = assistant.versions.current.number
+    return JSONResponse(
+        content={
+            "message": "已撤销上一次修改" if action == "undo" else "已重做被撤销的修改",
+            "dsl_version": dsl_version,
+            "dsl": dsl
+        },
+        media_type="application/json; charset=utf-8"
+    )
+
+@router.post("/undo")
+async def undo(request: VersionRequest, x_session_id: Optional[str] = Header(None)):
+    """
+    撤销上一次DSL修改，对话历史保留
+    
+    响应示例:
+    {
+        "message": "已撤销上一次修改",
+        "dsl_version": 2,
+        "dsl": {...}
+    }
+    """
+    logger.info(f"收到撤销请求，使用{request.version}版本")
+    return await switch_dsl_version("undo", request, x_session_id)
+
+@router.post("/redo")
+async def redo(request: VersionRequest, x_session_id: Optional[str] = Header(None)):
+    """
+    重做被撤销的DSL修改
+    """
+    logger.info(f"收到重做请求，使用{request.version}版本")
+    return await switch_dsl_version("redo", request, x_session_id)
+
+@router.get("/dsl/versions")
+async def list_dsl_versions(
+    version: Literal["langchain", "api"] = "api",
+    session_id: Optional[str] = None,
+    x_session_id: Optional[str] = Header(None)
+):
+    """
+    列出会话中保留的DSL版本
+    """
+    async with get_assistant(version, resolve_session_id(session_id, x_session_id)) as assistant:
+        current = assistant.versions.current
+        versions = assistant.versions.list_versions()
+    return JSONResponse(
+        content={
+            "current": current.number if current else None,
+            "versions": versions
+        },
+        media_type="application/json; charset=utf-8"
+    )
+
+@router.get("/dsl/version/{number}")
+async def get_dsl_version(
+    number: int,
+    version: Literal["langchain", "api"] = "api",
+    session_id: Optional[str] = None,
+    x_session_id: Optional[str] = Header(None)
+):
+    """
+    获取指定版本的完整DSL
+    
+    参数:
+    - number: DSL版本号，加载DSL时为1，每次成功修改后递增
+    - version: 使用的助手版本，可选值：langchain或api，默认为api
+    - session_id: 会话ID，可选，也可以通过 X-Session-ID 请求头传递
+    """
+    async with get_assistant(version, resolve_session_id(session_id, x_session_id)) as assistant:
+        dsl = assistant.get_dsl_version(number)
+    if dsl is None:
+        raise HTTPException(status_code=404, detail=f"DSL版本 {number} 不存在或已被淘汰")
+    return JSONResponse(
+        content={"dsl_version": number, "dsl": dsl},
+        media_type="application/json; charset=utf-8"
+    )
+
+@router.get("/dsl/diff")
+async def diff_dsl_versions(
+    from_version: Optional[int] = Query(None, alias="from"),
+    to_version: Optional[int] = Query(None, alias="to"),
+    version: Literal["langchain", "api"] = "api",
+    session_id: Optional[str] = None,
+    x_session_id: Optional[str] = Header(None)
+):
+    """
+    比较会话中两个DSL版本的节点差异
+    
+    参数:
+    - from: 旧版本号，默认为 to 的上一个版本
+    - to: 新版本号，默认为当前版本
+    - version: 使用的助手版本，可选值：langchain或api，默认为api
+    - session_id: 会话ID，可选，也可以通过 X-Session-ID 请求头传递
+    
+    响应示例:
+    {
+        "from": 2,
+        "to": 3,
+        "diff": [
+            {"op": "update", "path": "/items/0/items/1", "id": "title", "set": {"text": "新标题"}, "unset": []},
+            {"op": "move", "from": "/items/0/items/3", "path": "/items/0/items/0", "id": "banner"},
+            {"op": "remove", "path": "/items/1", "id": "footer"},
+            {"op": "add", "path": "/items/0/items/4", "id": "submit", "node": {...}}
+        ]
+    }
+    
+    update、move、add 的 path 指向新版本中的位置，remove 的 path 和 move 的 from 指向旧版本中的位置
+    """
+    async with get_assistant(version, resolve_session_id(session_id, x_session_id)) as assistant:
+        current = assistant.versions.current
+        if current is None:
+            raise HTTPException(status_code=404, detail="当前会话没有加载DSL")
+        target = to_version if to_version is not None else current.number
+        base = from_version if from_version is not None else target - 1
+        dsls = {}
+        for number in (base, target):
+            dsls[number] = assistant.get_dsl_version(number)
+            if dsls[number] is None:
+                raise HTTPException(status_code=404, detail=f"DSL版本 {number} 不存在或已被淘汰")
+        diff = diff_dsl(dsls[base], dsls[target], getattr(assistant, "merkle", None))
+    return JSONResponse(
+        content={"from": base, "to": target, "diff": diff},
+        media_type="application/json; charset=utf-8"
+    )
@@ -0,0 +1,197 @@
+"""
+模型请求准入控制模块
+限制同时发往模型服务的请求数，超出的请求进入有界队列按先后顺序等待名额。
+队列已满或排队超时的请求立即失败，由接口返回带 Retry-After 的 429/503，而不是让所有请求一起变慢直到超时
+"""
+from typing import Deque, Optional
+from collections import deque
+from contextlib import asynccontextmanager
+import asyncio
+import logging
+import math
+import time
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 建议客户端重试等待时间的上限（秒）
+_MAX_RETRY_AFTER = 60
+
+
+class AdmissionRejected(Exception):
+    """请求未获得模型服务的名额"""
+
+    def __init__(self, detail: str, status_code: int, retry_after: int):
+        """
+        初始化
+
+        Args:
+            detail: 错误说明
+            status_code: 返回给客户端的状态码，队列已满为429，排队超时为503
+            retry_after: 建议客户端等待多少秒后重试
+        """
+        super().__init__(detail)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """全局并发上限和有界等待队列
+
+    名额释放时直接交给队首的等待者，等待者按到达顺序获得名额，新到的请求不会插队。
+    """
+
+    def __init__(self, limit: int, max_queue: int, queue_timeout: float, metric_prefix: str = "model_admission"):
+        """
+        初始化
+
+        Args:
+            limit: 同时持有名额的请求数上限，0表示不限制
+            max_queue: 等待名额的请求数上限
+            queue_timeout: 排队等待名额的最长时间（秒）
+            metric_prefix: 指标名称前缀
+        """
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.metric_prefix = metric_prefix
+        self._active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        # 名额平均占用时间（秒），用于估算 Retry-After
+        self._hold_time = 1.0
+
+    @property
+    def active(self) -> int:
+        """持有名额的请求数"""
+        return self._active
+
+    @property
+    def queued(self) -> int:
+        """排队等待名额的请求数"""
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """
+        按当前排队人数和名额平均占用时间估算客户端应等待的秒数
+
+        Returns:
+            int: 建议的重试等待秒数
+        """
+        estimate = (self.queued + 1) * self._hold_time / max(1, self.limit)
+        return max(1, min(_MAX_RETRY_AFTER, math.ceil(estimate)))
+
+    async def acquire(self) -> None:
+        """
+        获取一个名额，没有空闲名额时排队等待
+
+        Raises:
+            AdmissionRejected: 队列已满（429）或排队超时（503）
+        """
+        started = time.monotonic()
+        if self._active < self.limit and not self.queued:
+            self._active += 1
+            self._admitted(started)
+            return
+        if self.queued >= self.max_queue:
+            metrics.inc(f"{self.metric_prefix}_rejected_total")
+            logger.warning(f"模型请求队列已满（{self.max_queue}），拒绝新请求")
+            raise AdmissionRejected("模型服务繁忙，请稍后重试", 429, self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._update_gauges()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._discard(waiter)
+            metrics.inc(f"{self.metric_prefix}_timeout_total")
+            logger.warning(f"模型请求排队超过 {self.queue_timeout} 秒，放弃等待")
+            raise AdmissionRejected("模型服务繁忙，排队超时，请稍后重试", 503, self.retry_after())
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # 名额已经交给了自己，转交给下一个等待者
+                self.release()
+            else:
+                self._discard(waiter)
+            raise
+        self._admitted(started)
+
+    def release(self, held: Optional[float] = None) -> None:
+        """
+        释放名额，有等待者时直接交给队首的等待者
+
+        Args:
+            held: 名额的占用时间（秒），用于更新平均占用时间
+        """
+        if held is not None:
+            self._hold_time = 0.8 * self._hold_time + 0.2 * held
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._update_gauges()
+                return
+        self._active -= 1
+        self._update_gauges()
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        在 async with 块内持有一个名额，不限制并发时直接执行
+
+        Raises:
+            AdmissionRejected: 未获得名额
+        """
+        if self.limit <= 0:
+            yield
+            return
+        await self.acquire()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def _admitted(self, started: float) -> None:
+        """记录获得名额的请求及其排队时间"""
+        metrics.inc(f"{self.metric_prefix}_admitted_total")
+        metrics.observe(f"{self.metric_prefix}_wait_seconds", time.monotonic() - started)
+        self._update_gauges()
+
+    def _discard(self, waiter: asyncio.Future) -> None:
+        """把放弃等待的请求移出队列"""
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+        self._update_gauges()
+
+    def _update_gauges(self) -> None:
+        """导出当前的并发数和队列长度"""
+        metrics.set_gauge(f"{self.metric_prefix}_active", self._active)
+        metrics.set_gauge(f"{self.metric_prefix}_queue_depth", self.queued)
+
+
+_controller: Optional[AdmissionController] = None
+
+
+def get_admission_controller() -> AdmissionController:
+    """
+    获取所有模型请求共享的准入控制器
+
+    Returns:
+        AdmissionController: 准入控制器
+    """
+    global _controller
+    if _controller is None:
+        _controller = AdmissionController(
+            settings.MODEL_MAX_CONCURRENCY,
+            settings.MODEL_QUEUE_MAX_SIZE,
+            settings.MODEL_QUEUE_TIMEOUT
+        )
+        logger.info(f"模型请求准入控制已启用，并发上限: {settings.MODEL_MAX_CONCURRENCY}，"
+                    f"队列长度: {settings.MODEL_QUEUE_MAX_SIZE}，排队超时: {settings.MODEL_QUEUE_TIMEOUT} 秒")
+    return _controller
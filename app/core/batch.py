@@ -0,0 +1,86 @@
+"""
+批量作业执行模块
+在并发上限内同时执行多个作业，按完成顺序逐个返回结果；同一个键（例如会话ID）的作业按提交顺序串行执行
+"""
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, Optional, Sequence
+from dataclasses import dataclass
+import asyncio
+import logging
+
+from app.core.metrics import metrics
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BatchOutcome:
+    """单个作业的执行结果"""
+    index: int                          # 作业在提交列表中的下标
+    result: Any = None                  # 作业成功时的返回值
+    error: Optional[Exception] = None   # 作业失败时的异常
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+async def run_batch(jobs: Sequence[Any], worker: Callable[[Any], Awaitable[Any]], concurrency: int,
+                    key: Optional[Callable[[Any], Optional[Hashable]]] = None,
+                    metric_prefix: str = "batch_jobs") -> AsyncIterator[BatchOutcome]:
+    """
+    并发执行作业，按完成顺序产出结果
+
+    单个作业抛出的异常记录在结果中，不影响其他作业。调用方提前停止迭代（例如客户端断开连接）时，
+    尚未完成的作业会被取消。
+
+    Args:
+        jobs: 作业列表
+        worker: 执行单个作业的协程函数
+        concurrency: 同时执行的作业数上限
+        key: 返回作业串行键的函数，键相同的作业按提交顺序依次执行，返回None的作业不受限制
+        metric_prefix: 作业计数指标的前缀
+
+    Yields:
+        BatchOutcome: 作业结果
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    locks: Dict[Hashable, asyncio.Lock] = {}
+    done: asyncio.Queue = asyncio.Queue()
+
+    async def call(job: Any) -> Any:
+        async with semaphore:
+            return await worker(job)
+
+    async def run(index: int, job: Any, lock: Optional[asyncio.Lock]) -> None:
+        outcome = BatchOutcome(index)
+        try:
+            # 先排队获取串行锁再占用并发名额，等待同一会话的作业不会占着名额
+            if lock is None:
+                outcome.result = await call(job)
+            else:
+                async with lock:
+                    outcome.result = await call(job)
+            metrics.inc(f"{metric_prefix}_succeeded_total")
+        except Exception as e:
+            logger.warning(f"作业 {index} 执行失败: {str(e)}")
+            metrics.inc(f"{metric_prefix}_failed_total")
+            outcome.error = e
+        done.put_nowait(outcome)
+
+    tasks = []
+    for index, job in enumerate(jobs):
+        job_key = key(job) if key is not None else None
+        lock = None
+        if job_key is not None:
+            lock = locks.setdefault(job_key, asyncio.Lock())
+        tasks.append(asyncio.create_task(run(index, job, lock)))
+    metrics.inc(f"{metric_prefix}_total", len(tasks))
+
+    try:
+        for _ in range(len(tasks)):
+            yield await done.get()
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
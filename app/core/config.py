@@ -20,6 +20,61 @@ class Settings(BaseSettings):
     MODEL_API_BASE: str = "http://192.100.8.139:8080/v1"
     MODEL_API_KEY: Optional[str] = os.getenv("SF_API_KEY", "not-needed")
     
+    # 模型服务连接池设置
+    MODEL_REQUEST_TIMEOUT: float = 60.0  # 单次请求超时时间（秒）
+    MODEL_CONNECT_TIMEOUT: float = 10.0  # 建立连接超时时间（秒）
+    MODEL_POOL_MAX_CONNECTIONS: int = 100  # 连接池最大连接数
+    MODEL_POOL_MAX_KEEPALIVE: int = 20  # 最大保持活动的空闲连接数
+    MODEL_POOL_KEEPALIVE_EXPIRY: float = 30.0  # 空闲连接保持时间（秒）
+    MODEL_MAX_RETRIES: int = 3  # 最大尝试次数
+    MODEL_RETRY_DELAY: float = 0.5  # 第一次重试前等待时间的上限（秒），之后每次翻倍，实际等待时间在0到上限之间随机
+    MODEL_RETRY_MAX_DELAY: float = 8.0  # 重试等待时间的上限（秒），也限制遵循模型服务 Retry-After 时的等待
+    MODEL_RETRY_STATUS_CODES: List[int] = [429, 502, 503]  # 会重试的响应状态码，连接错误和超时也会重试
+    MODEL_RETRY_BUDGET_RATIO: float = 0.2  # 每个请求积累的重试额度，模型服务持续失败时重试次数不超过请求数的该比例
+    MODEL_RETRY_BUDGET_BURST: float = 10.0  # 重试额度的上限
+    MODEL_CIRCUIT_FAILURE_THRESHOLD: int = 5  # 模型服务连续失败多少次后熔断，熔断期间直接返回 503，0表示不熔断
+    MODEL_CIRCUIT_RESET_TIMEOUT: float = 30.0  # 熔断后经过多少秒放行一个探测请求
+    MODEL_SINGLEFLIGHT: bool = True  # 相同提示词的并发模型请求合并为一次，所有请求方共享结果
+    MODEL_MAX_CONCURRENCY: int = 16  # 同时发往模型服务的请求数上限，0表示不限制
+    MODEL_QUEUE_MAX_SIZE: int = 64  # 等待名额的模型请求数上限，队列已满时立即返回 429
+    MODEL_QUEUE_TIMEOUT: float = 15.0  # 模型请求排队等待名额的最长时间（秒），超时返回 503
+    
+    # DSL 编辑设置
+    DSL_EDIT_MODE: str = "full"  # 默认编辑模式：full（返回完整DSL）、patch（返回 JSON Patch）或 parallel（按子树拆分并行修改）
+    DSL_VERSION_MAX_BYTES: int = 16 * 1024 * 1024  # 每个会话DSL版本库的内存预算（字节）
+    DSL_VERSION_MAX_COUNT: int = 100  # 每个会话最多保留的DSL版本数
+    DSL_CONTEXT_TOKEN_BUDGET: int = 4000  # DSL上下文的 token 预算，超出时只发送相关子树和大纲，0表示始终发送完整DSL
+    DSL_PROMPT_CODEC: bool = True  # 发送给模型的DSL使用无损紧凑编码（省略默认值、合并重复样式），patch 模式下不使用
+    DSL_CODEC_ALIAS_KEYS: bool = False  # 紧凑编码时是否为长属性名设置别名
+    DSL_OUTPUT_MAX_CONTINUATIONS: int = 2  # 模型输出的DSL因长度上限被截断时，最多请求模型续写的次数
+    DSL_SCHEMA_PATH: str = ""  # 额外组件类型定义的 JSON 文件，为空时只使用内置组件类型
+    DSL_SCHEMA_ALLOW_UNKNOWN_TYPES: bool = False  # 是否允许注册表之外的组件类型
+    DSL_PARALLEL_EDIT_MIN_TOKENS: int = 6000  # full 模式下明确的整页修改要求（如把所有文字翻译成英文）在DSL超过该 token 数时按子树拆分并行请求模型，0表示只在 parallel 模式下并行修改
+    DSL_PARALLEL_EDIT_UNIT_TOKENS: int = 1500  # 并行修改时每个请求包含的DSL的 token 预算
+    DSL_PARALLEL_EDIT_CONCURRENCY: int = 8  # 并行修改时同时请求模型的数量
+    DSL_PARALLEL_EDIT_RETRIES: int = 1  # 并行修改时单个部分请求失败或输出不合法时的重试次数，仍然失败的部分保持原样
+    DSL_MERKLE_CACHE_SIZE: int = 200000  # 每个会话缓存 Merkle 摘要的DSL节点数上限，超出时清空重新计算
+    
+    # 响应缓存设置
+    RESPONSE_CACHE_MAX_ENTRIES: int = 1024  # 进程内缓存的模型响应条数，0表示关闭缓存
+    RESPONSE_CACHE_TTL: float = 3600.0  # 缓存条目的有效期（秒）
+    RESPONSE_CACHE_DB_PATH: str = ""  # 被淘汰条目溢出到的 SQLite 文件，为空时不溢出
+    
+    # 批量请求设置
+    BATCH_MAX_JOBS: int = 1000  # /chat/batch 单次请求最多包含的作业数
+    BATCH_MAX_CONCURRENCY: int = 8  # /chat/batch 同时请求模型的作业数上限，请求中的 concurrency 不能超过该值
+    
+    # 对话历史设置
+    HISTORY_KEEP_TURNS: int = 6  # 原样放入提示词的最近对话轮数，更早的对话在后台折叠成摘要
+    HISTORY_TOKEN_CEILING: int = 3000  # 放入提示词的历史消息（含摘要）的 token 上限
+    
+    # 会话设置
+    SESSION_MAX_COUNT: int = 1000  # 单个进程最多保留的会话数
+    SESSION_MAX_BYTES: int = 512 * 1024 * 1024  # 所有会话状态的内存上限（字节）
+    SESSION_IDLE_TTL: float = 3600.0  # 会话空闲淘汰时间（秒），0表示不按时间淘汰
+    SESSION_STORE: str = "memory"  # 会话状态存储后端：memory（仅进程内）或 sqlite（多 worker 共享）
+    SESSION_DB_PATH: str = "sessions.db"  # SQLite 会话存储的数据库文件
+    
     # CORS设置
     BACKEND_CORS_ORIGINS: List[str] = ["*"]
     
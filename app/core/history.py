@@ -0,0 +1,216 @@
+"""
+对话历史管理模块
+只把最近几轮对话原样放进提示词，过期的DSL快照替换为占位文本，更早的对话在后台折叠成摘要
+"""
+from typing import Awaitable, Callable, Dict, List, Optional
+import asyncio
+import logging
+
+from app.core.metrics import metrics
+from app.core.tokens import estimate_tokens
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 摘要消息的前缀，摘要作为 system 消息保存在对话历史开头
+SUMMARY_PREFIX = "之前对话的摘要："
+
+# 加载DSL时写入对话历史的消息前缀
+DSL_LOAD_PREFIX = "我已经加载了以下 DSL"
+
+# 替换过期DSL快照的占位文本
+DSL_SNAPSHOT_PLACEHOLDER = "（DSL快照已省略，最新的DSL见当前DSL结构）"
+
+# 生成摘要时每条消息最多保留的字符数
+_SUMMARY_INPUT_CHARS = 500
+
+SUMMARY_SYSTEM_PROMPT = """你负责压缩低代码平台 DSL 助手的对话历史。
+请把已有摘要和新增的对话合并成一段简洁的中文摘要，保留用户的修改意图、偏好和尚未完成的事项，
+不要包含DSL的JSON内容，不超过300字。只输出摘要本身。"""
+
+# 摘要函数：接收提示消息列表，返回摘要文本，失败时返回None
+Summarizer = Callable[[List[Dict[str, str]]], Awaitable[Optional[str]]]
+
+
+def is_summary(message: Dict[str, str]) -> bool:
+    """消息是否为历史摘要"""
+    return message.get("role") == "system" and message.get("content", "").startswith(SUMMARY_PREFIX)
+
+
+def is_dsl_snapshot(message: Dict[str, str]) -> bool:
+    """
+    消息是否为完整的DSL快照
+
+    加载DSL时的用户消息和助手返回的完整DSL都属于快照；按节点返回的修改（{"nodes": ...}）
+    和 JSON Patch 体积小且说明了改了什么，不视为快照。
+
+    Args:
+        message: 对话消息
+
+    Returns:
+        bool: 是否为DSL快照
+    """
+    content = message.get("content", "")
+    if message.get("role") == "user":
+        return content.startswith(DSL_LOAD_PREFIX)
+    return message.get("role") == "assistant" and content.startswith("{") and not content.startswith('{"nodes"')
+
+
+class HistoryManager:
+    """对话历史管理器
+
+    对话历史本身仍由助手保存（用于会话存储和 /history 接口），管理器负责两件事：
+    构建提示词时只取摘要和未折叠的对话，并控制在 token 上限内；
+    未折叠的对话超过 2 * keep_turns 轮后，由后台任务把较早的部分折叠进摘要，只留下最近 keep_turns 轮，
+    使保存的历史也保持有界。
+
+    折叠按批进行而不是每轮都滑动窗口：两次折叠之间摘要和已有的历史消息保持不变，
+    新一轮对话只追加在末尾，推理服务的前缀缓存可以持续命中。
+    """
+
+    def __init__(self, keep_turns: int = 6, token_ceiling: int = 3000, summarizer: Optional[Summarizer] = None):
+        """
+        初始化对话历史管理器
+
+        Args:
+            keep_turns: 折叠后原样保留的最近对话轮数（每轮包含用户和助手两条消息）
+            token_ceiling: 放入提示词的历史消息的 token 上限
+            summarizer: 生成摘要的异步函数，为空时超出窗口的对话直接丢弃
+        """
+        self.keep_turns = keep_turns
+        self.token_ceiling = token_ceiling
+        self.summarizer = summarizer
+        self._task: Optional[asyncio.Task] = None
+
+    def window(self, history: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """
+        生成放入提示词的历史消息
+
+        Args:
+            history: 完整的对话历史
+
+        Returns:
+            List[Dict[str, str]]: 摘要加未折叠的对话（最多 2 * keep_turns 轮），DSL快照替换为占位文本，
+            总量不超过 token 上限
+        """
+        summary = history[0] if history and is_summary(history[0]) else None
+        body = history[1:] if summary is not None else history
+        recent = body[-self.keep_turns * 4:] if self.keep_turns > 0 else []
+        recent = [
+            {"role": message["role"], "content": DSL_SNAPSHOT_PLACEHOLDER} if is_dsl_snapshot(message) else message
+            for message in recent
+        ]
+
+        budget = self.token_ceiling
+        if summary is not None:
+            summary_tokens = estimate_tokens(summary["content"])
+            if summary_tokens > budget:
+                # 摘要本身超出上限时按比例截断
+                keep_chars = max(len(summary["content"]) * budget // max(summary_tokens, 1), 0)
+                summary = {"role": "system", "content": summary["content"][:keep_chars]}
+                summary_tokens = estimate_tokens(summary["content"])
+            budget -= summary_tokens
+
+        # 从最新的消息往前保留，超出上限后丢弃更早的消息
+        kept: List[Dict[str, str]] = []
+        for message in reversed(recent):
+            cost = estimate_tokens(message["content"])
+            if cost > budget:
+                break
+            kept.append(message)
+            budget -= cost
+        kept.reverse()
+        # 不以孤立的助手回复开头
+        while kept and kept[0]["role"] == "assistant":
+            kept.pop(0)
+
+        dropped = len(recent) - len(kept)
+        if dropped:
+            metrics.inc("history_messages_trimmed_total", dropped)
+        return ([summary] if summary is not None else []) + kept
+
+    def schedule_compaction(self, get_history: Callable[[], List[Dict[str, str]]]) -> None:
+        """
+        在后台把超出窗口的旧对话折叠进摘要，不阻塞当前请求
+
+        Args:
+            get_history: 返回助手当前对话历史列表的函数；历史在摘要生成期间被清空或替换时放弃本次折叠
+        """
+        history = get_history()
+        if len(self._foldable(history)) == 0:
+            return
+        if self._task is not None and not self._task.done():
+            # 上一次折叠还在进行，下一轮对话结束后再处理
+            return
+        try:
+            self._task = asyncio.get_running_loop().create_task(self._compact(get_history))
+        except RuntimeError:
+            # 没有运行中的事件循环（例如同步调用），直接丢弃超出窗口的对话
+            self._apply(history, len(self._foldable(history)), None)
+
+    def _foldable(self, history: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """未折叠的对话超过 2 * keep_turns 轮时，除最近 keep_turns 轮以外需要折叠的旧消息"""
+        start = 1 if history and is_summary(history[0]) else 0
+        if len(history) - start <= self.keep_turns * 4:
+            return []
+        return history[start:len(history) - self.keep_turns * 2]
+
+    def _apply(self, history: List[Dict[str, str]], count: int, summary: Optional[str]) -> None:
+        """用新摘要替换最前面的 count 条旧消息"""
+        start = 1 if history and is_summary(history[0]) else 0
+        del history[start:start + count]
+        if summary:
+            summary_message = {"role": "system", "content": f"{SUMMARY_PREFIX}{summary}"}
+            if start:
+                history[0] = summary_message
+            else:
+                history.insert(0, summary_message)
+        metrics.inc("history_messages_folded_total", count)
+
+    async def _compact(self, get_history: Callable[[], List[Dict[str, str]]]) -> None:
+        """后台折叠任务"""
+        history = get_history()
+        folded = self._foldable(history)
+        previous = history[0]["content"][len(SUMMARY_PREFIX):] if history and is_summary(history[0]) else ""
+
+        summary = None
+        if self.summarizer is not None:
+            try:
+                summary = await self.summarizer(build_summary_prompt(previous, folded))
+            except Exception as e:
+                logger.warning(f"生成对话摘要失败: {str(e)}")
+            if summary is None:
+                metrics.inc("history_summary_failures_total")
+
+        current = get_history()
+        offset = 1 if current and is_summary(current[0]) else 0
+        if current is not history or current[offset:offset + len(folded)] != folded:
+            # 摘要生成期间历史被清空、重新加载或改写
+            logger.info("对话历史已变化，放弃本次摘要")
+            return
+        self._apply(current, len(folded), summary or previous or None)
+        logger.info(f"已将 {len(folded)} 条旧消息折叠进摘要，当前历史 {len(current)} 条")
+
+
+def build_summary_prompt(previous_summary: str, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """
+    构建生成摘要的提示消息
+
+    Args:
+        previous_summary: 已有的摘要
+        messages: 需要折叠的旧消息
+
+    Returns:
+        List[Dict[str, str]]: 发送给模型的消息列表
+    """
+    lines = []
+    for message in messages:
+        content = DSL_SNAPSHOT_PLACEHOLDER if is_dsl_snapshot(message) else message["content"]
+        role = "用户" if message["role"] == "user" else "助手"
+        lines.append(f"{role}：{content[:_SUMMARY_INPUT_CHARS]}")
+    user_content = f"已有摘要：{previous_summary or '无'}\n\n新增对话：\n" + "\n".join(lines)
+    return [
+        {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+        {"role": "user", "content": user_content}
+    ]
+
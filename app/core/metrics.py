@@ -0,0 +1,93 @@
+"""
+运行指标模块
+提供进程内的计数器、仪表和耗时统计，通过 /metrics 接口导出
+"""
+from typing import Dict, Any
+import threading
+
+
+class Metrics:
+    """线程安全的进程内指标注册表
+
+    - 计数器（counter）：只增不减，例如请求数、淘汰次数
+    - 仪表（gauge）：可任意设置的当前值，例如活跃会话数
+    - 统计（summary）：记录观测值的次数、总和与最大值，例如等待时间
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, float] = {}
+        self._summaries: Dict[str, Dict[str, float]] = {}
+
+    def inc(self, name: str, value: float = 1) -> None:
+        """
+        增加计数器
+
+        Args:
+            name: 指标名称
+            value: 增加的数值
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        """
+        设置仪表的当前值
+
+        Args:
+            name: 指标名称
+            value: 当前值
+        """
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: float) -> None:
+        """
+        记录一次观测值
+
+        Args:
+            name: 指标名称
+            value: 观测值
+        """
+        with self._lock:
+            summary = self._summaries.get(name)
+            if summary is None:
+                summary = {"count": 0, "sum": 0.0, "max": value}
+                self._summaries[name] = summary
+            summary["count"] += 1
+            summary["sum"] += value
+            summary["max"] = max(summary["max"], value)
+
+    def get(self, name: str) -> float:
+        """
+        读取计数器或仪表的当前值
+
+        Args:
+            name: 指标名称
+
+        Returns:
+            float: 当前值，不存在时返回0
+        """
+        with self._lock:
+            if name in self._counters:
+                return self._counters[name]
+            return self._gauges.get(name, 0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        获取所有指标的快照
+
+        Returns:
+            Dict[str, Any]: 包含 counters、gauges、summaries 的指标数据
+        """
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "summaries": {name: dict(summary) for name, summary in self._summaries.items()}
+            }
+
+
+# 全局指标实例
+metrics = Metrics()
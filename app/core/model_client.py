@@ -0,0 +1,175 @@
+"""
+模型服务异步客户端模块
+为所有助手实例提供共享的 keep-alive 连接池，避免每次请求都重新建立连接
+"""
+from typing import Dict, Optional, Tuple, Any
+from contextlib import asynccontextmanager
+import asyncio
+import logging
+
+import httpx
+
+from app.core.admission import get_admission_controller
+from app.core.config import settings
+from app.core.resilience import CircuitBreaker, RetryBudget
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+class ModelClient:
+    """基于 httpx.AsyncClient 的模型服务客户端
+
+    同一个 api_base 的所有请求复用一个连接池。httpx 的连接池绑定在创建它的事件循环上，
+    因此在事件循环发生变化时（例如测试中多次调用 asyncio.run）会自动重建底层客户端。
+    每个请求在发送前先经过熔断器，再从全局准入控制器获取名额，请求完成（流式请求为读取结束）后释放。
+    熔断器和重试预算按 api_base 共享，由响应状态码和连接错误判断模型服务是否可用。
+    """
+
+    def __init__(self, api_base: str, api_key: Optional[str] = None):
+        """
+        初始化模型客户端
+
+        Args:
+            api_base: 模型服务的基础地址
+            api_key: 模型服务的API密钥
+        """
+        self.api_base = (api_base or "").rstrip("/")
+        self.headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        }
+        self.timeout = httpx.Timeout(
+            settings.MODEL_REQUEST_TIMEOUT,
+            connect=settings.MODEL_CONNECT_TIMEOUT
+        )
+        self.limits = httpx.Limits(
+            max_connections=settings.MODEL_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.MODEL_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=settings.MODEL_POOL_KEEPALIVE_EXPIRY
+        )
+        self.breaker = CircuitBreaker(settings.MODEL_CIRCUIT_FAILURE_THRESHOLD, settings.MODEL_CIRCUIT_RESET_TIMEOUT)
+        self.retry_budget = RetryBudget(settings.MODEL_RETRY_BUDGET_RATIO, settings.MODEL_RETRY_BUDGET_BURST)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """
+        获取当前事件循环下可用的 httpx 客户端，必要时创建
+
+        Returns:
+            httpx.AsyncClient: 共享的异步客户端
+        """
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                base_url=self.api_base,
+                headers=self.headers,
+                timeout=self.timeout,
+                limits=self.limits
+            )
+            self._loop = loop
+            logger.info(f"已创建模型服务连接池: {self.api_base}")
+        return self._client
+
+    @asynccontextmanager
+    async def _guard(self):
+        """
+        在熔断器和准入控制的保护下发送请求，连接错误和超时记为失败
+
+        Raises:
+            AdmissionRejected: 熔断器打开（CircuitOpen）或没有获得名额
+        """
+        probe = self.breaker.before_request()
+        try:
+            async with get_admission_controller().slot():
+                yield
+        except httpx.TransportError:
+            self.breaker.on_failure()
+            raise
+        finally:
+            if probe:
+                self.breaker.release()
+
+    def _record(self, response: httpx.Response) -> None:
+        """按响应状态码记录模型服务是否可用，服务端错误和过载记为失败"""
+        if response.status_code >= 500 or response.status_code in settings.MODEL_RETRY_STATUS_CODES:
+            self.breaker.on_failure()
+        else:
+            self.breaker.on_success()
+
+    async def post(self, path: str, payload: Dict[str, Any]) -> httpx.Response:
+        """
+        发送 POST 请求
+
+        Args:
+            path: 请求路径，例如 /chat/completions
+            payload: 请求体
+
+        Returns:
+            httpx.Response: 响应对象
+
+        Raises:
+            AdmissionRejected: 熔断器打开或没有获得模型服务的名额
+        """
+        async with self._guard():
+            response = await self._get_client().post(path, json=payload)
+            self._record(response)
+            return response
+
+    @asynccontextmanager
+    async def stream(self, path: str, payload: Dict[str, Any]):
+        """
+        以流式方式发送 POST 请求，需配合 async with 使用，名额在退出 async with 块时释放
+
+        Args:
+            path: 请求路径
+            payload: 请求体
+
+        Yields:
+            httpx.Response: 流式响应
+
+        Raises:
+            AdmissionRejected: 熔断器打开或没有获得模型服务的名额
+        """
+        async with self._guard():
+            async with self._get_client().stream("POST", path, json=payload) as response:
+                self._record(response)
+                yield response
+
+    async def aclose(self) -> None:
+        """关闭底层连接池"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+        self._loop = None
+
+
+# 按 (api_base, api_key) 共享的客户端实例
+_clients: Dict[Tuple[str, Optional[str]], ModelClient] = {}
+
+
+def get_model_client(api_base: str, api_key: Optional[str] = None) -> ModelClient:
+    """
+    获取共享的模型客户端，相同地址和密钥的助手复用同一个连接池
+
+    Args:
+        api_base: 模型服务的基础地址
+        api_key: 模型服务的API密钥
+
+    Returns:
+        ModelClient: 共享的客户端实例
+    """
+    key = (api_base or "", api_key)
+    client = _clients.get(key)
+    if client is None:
+        client = ModelClient(api_base, api_key)
+        _clients[key] = client
+    return client
+
+
+async def close_model_clients() -> None:
+    """关闭所有共享的模型客户端，在应用关闭时调用"""
+    for client in list(_clients.values()):
+        await client.aclose()
+    _clients.clear()
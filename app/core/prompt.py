@@ -0,0 +1,73 @@
+"""
+提示词构建模块
+按“稳定内容在前、变化内容在后”的顺序组装消息，使推理服务的前缀缓存（KV cache）在多轮对话间尽量命中
+"""
+from typing import Dict, List, Optional
+import logging
+
+from app.core.metrics import metrics
+from app.core.tokens import estimate_tokens
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+def _common_prefix_len(a: str, b: str) -> int:
+    """两个字符串公共前缀的长度，用二分查找比较切片，避免逐字符循环"""
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[:mid] == b[:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+class PromptBuilder:
+    """提示词构建器
+
+    消息顺序固定为：系统提示词和DSL上下文（同一条 system 消息）→ 历史摘要和最近几轮对话 → 当前用户消息。
+    DSL 只在被修改后才会变化，历史只在末尾追加，因此相邻两轮的提示词共享很长的前缀。
+    构建器记住上一次的提示词，统计本次可以复用的前缀 token 数。
+    """
+
+    def __init__(self):
+        self._last_prompt: Optional[List[str]] = None
+
+    def build(self, system_prompt: str, dsl_context: str, history: List[Dict[str, str]],
+              message: str) -> List[Dict[str, str]]:
+        """
+        组装发送给模型的消息列表
+
+        Args:
+            system_prompt: 系统提示词
+            dsl_context: 规范序列化后的DSL上下文
+            history: 放入提示词的历史消息
+            message: 当前用户消息
+
+        Returns:
+            List[Dict[str, str]]: 消息列表
+        """
+        messages = [{"role": "system", "content": f"{system_prompt}\n\n{dsl_context}"}]
+        messages.extend(history)
+        messages.append({"role": "user", "content": message})
+        self._record_prefix(messages)
+        return messages
+
+    def _record_prefix(self, messages: List[Dict[str, str]]) -> None:
+        """统计与上一次提示词共享的前缀 token 数"""
+        current = [f"{m['role']}\n{m['content']}" for m in messages]
+        total = sum(estimate_tokens(part) for part in current)
+        reused = 0
+        if self._last_prompt is not None:
+            for previous, part in zip(self._last_prompt, current):
+                if previous == part:
+                    reused += estimate_tokens(part)
+                    continue
+                reused += estimate_tokens(part[:_common_prefix_len(previous, part)])
+                break
+        self._last_prompt = current
+        metrics.observe("prompt_tokens", total)
+        metrics.observe("prompt_prefix_reused_tokens", reused)
+        logger.debug(f"提示词约 {total} tokens，可复用前缀约 {reused} tokens")
@@ -0,0 +1,187 @@
+"""
+模型请求容错模块
+- 指数退避加随机抖动，避免所有客户端在同一时刻一起重试
+- 重试预算，重试次数与正常请求数成比例，模型服务故障时重试不会成倍放大流量
+- 熔断器，连续失败后在一段时间内直接拒绝请求，之后只放行一个探测请求检查服务是否恢复
+"""
+from typing import Callable, Optional
+import logging
+import math
+import random
+import time
+
+from app.core.admission import AdmissionRejected
+from app.core.metrics import metrics
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+def backoff_delay(attempt: int, base: float, cap: float, rand: Callable[[], float] = random.random) -> float:
+    """
+    计算第 attempt 次重试前的等待时间（full jitter）：在 0 到 min(cap, base * 2^(attempt-1)) 之间随机取值
+
+    Args:
+        attempt: 重试序号，从1开始
+        base: 第一次重试的等待时间上限（秒）
+        cap: 等待时间上限（秒）
+        rand: 返回 [0, 1) 随机数的函数
+
+    Returns:
+        float: 等待秒数
+    """
+    return rand() * min(cap, base * (2 ** max(0, attempt - 1)))
+
+
+class RetryBudget:
+    """按请求数累积的重试额度
+
+    每个首次请求存入 ratio 个额度，每次重试取出一个，额度不超过 burst。
+    正常情况下少量重试不受影响；模型服务持续失败时重试次数最多为请求数的 ratio 倍。
+    """
+
+    def __init__(self, ratio: float, burst: float):
+        """
+        初始化
+
+        Args:
+            ratio: 每个首次请求存入的额度
+            burst: 额度上限，也是初始额度
+        """
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+
+    def deposit(self) -> None:
+        """记录一次首次请求"""
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        """
+        为一次重试取出额度
+
+        Returns:
+            bool: 额度充足时返回True，否则不应重试
+        """
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class CircuitOpen(AdmissionRejected):
+    """熔断器处于打开状态，请求被直接拒绝"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("模型服务暂时不可用，请稍后重试", 503, retry_after)
+
+
+class CircuitBreaker:
+    """熔断器
+
+    - closed：正常放行，连续失败 failure_threshold 次后打开
+    - open：直接拒绝，reset_timeout 秒后进入 half_open
+    - half_open：只放行一个探测请求，成功则关闭，失败则重新打开，探测期间其他请求仍被拒绝
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    # 导出到指标的状态值
+    _STATE_VALUES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, metric_prefix: str = "model_circuit",
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        初始化
+
+        Args:
+            failure_threshold: 打开熔断器的连续失败次数，0表示不熔断
+            reset_timeout: 打开后多少秒放行探测请求
+            metric_prefix: 指标名称前缀
+            clock: 返回当前时间（秒）的函数
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.metric_prefix = metric_prefix
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def before_request(self) -> bool:
+        """
+        请求发送前调用，决定是否放行
+
+        Returns:
+            bool: 是否为半开状态下的探测请求，探测请求结束时需要调用 release
+
+        Raises:
+            CircuitOpen: 熔断器打开，或半开状态下已有探测请求
+        """
+        if self.state == self.CLOSED:
+            return False
+        if self.state == self.OPEN:
+            remaining = self._opened_at + self.reset_timeout - self.clock()
+            if remaining > 0:
+                self._reject(remaining)
+            self._set_state(self.HALF_OPEN)
+            logger.info("熔断器进入半开状态，放行一个探测请求")
+        if self._probing:
+            self._reject(self.reset_timeout)
+        self._probing = True
+        return True
+
+    def on_success(self) -> None:
+        """请求成功（模型服务可用）"""
+        self.failures = 0
+        self._probing = False
+        if self.state != self.CLOSED:
+            self._set_state(self.CLOSED)
+            logger.info("探测请求成功，熔断器关闭")
+
+    def on_failure(self) -> None:
+        """请求失败（模型服务不可用或过载）"""
+        self.failures += 1
+        self._probing = False
+        if self.state == self.HALF_OPEN or (self.failure_threshold > 0 and self.failures >= self.failure_threshold):
+            if self.state != self.OPEN:
+                metrics.inc(f"{self.metric_prefix}_opened_total")
+                logger.warning(f"模型服务连续失败 {self.failures} 次，熔断器打开 {self.reset_timeout} 秒")
+            self._opened_at = self.clock()
+            self._set_state(self.OPEN)
+
+    def release(self) -> None:
+        """探测请求结束时调用，没有记录结果的探测请求（例如被取消）释放探测名额，不改变状态"""
+        self._probing = False
+
+    def _reject(self, remaining: float) -> None:
+        """拒绝请求"""
+        metrics.inc(f"{self.metric_prefix}_rejected_total")
+        raise CircuitOpen(max(1, math.ceil(remaining)))
+
+    def _set_state(self, state: str) -> None:
+        """切换状态并导出"""
+        self.state = state
+        metrics.set_gauge(f"{self.metric_prefix}_state", self._STATE_VALUES[state])
+
+
+def retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """
+    解析响应头中以秒数表示的 Retry-After
+
+    Args:
+        value: 响应头的值
+
+    Returns:
+        Optional[float]: 秒数，缺失或不是秒数（例如 HTTP 日期）时返回None
+    """
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        return None
+    return seconds if seconds >= 0 else None
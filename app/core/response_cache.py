@@ -0,0 +1,308 @@
+"""
+模型响应缓存模块
+以 DSL 内容摘要、规范化后的指令、模型名称和温度为键缓存模型输出，相同的请求无需再次调用模型
+"""
+from typing import Any, Dict, List, Optional, Tuple
+from collections import OrderedDict
+import asyncio
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.dsl.canonical import canonical_json, content_hash
+from app.dsl.merkle import MerkleIndex
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_message(message: str) -> str:
+    """
+    规范化用户指令：统一全角半角、大小写和空白
+
+    Args:
+        message: 用户输入的消息
+
+    Returns:
+        str: 规范化后的消息
+    """
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", message)).strip().casefold()
+
+
+def make_cache_key(dsl: Any, message: str, model: Optional[str], temperature: float,
+                   index: Optional[MerkleIndex] = None, **extra: Any) -> str:
+    """
+    计算缓存键
+
+    Args:
+        dsl: 发送请求时的完整DSL
+        message: 用户输入的消息
+        model: 模型名称
+        temperature: 温度参数
+        index: 会话的 Merkle 摘要缓存，传入时使用DSL的 Merkle 摘要，只需计算上次以来变化的路径
+        **extra: 其他影响模型输出的参数，例如编辑模式
+
+    Returns:
+        str: 缓存键
+    """
+    dsl_digest = index.hexdigest(dsl) if index is not None else content_hash(dsl)
+    parts = [dsl_digest, normalize_message(message), model or "", temperature, extra]
+    return hashlib.blake2b(canonical_json(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+
+class ResponseCache:
+    """进程内 LRU + TTL 的响应缓存，可选把淘汰的条目溢出到 SQLite
+
+    内存中的条目按访问顺序保存在 OrderedDict 中，超出数量上限时淘汰最久未使用的条目。
+    配置了 SQLite 文件时，被淘汰的条目写入数据库，内存未命中时再从数据库查找，
+    同一主机上的多个 worker 也可以共享溢出的条目。异步代码使用 aget / aset，SQLite 读写在线程池中执行。
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600.0, db_path: Optional[str] = None):
+        """
+        初始化响应缓存
+
+        Args:
+            max_entries: 内存中最多保留的条目数
+            ttl: 条目的有效期（秒）
+            db_path: SQLite 溢出文件路径，为空时不溢出
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # SQLite 连接单独加锁，读写溢出文件时不阻塞内存中的查找
+        self._db_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        查找缓存的响应，未命中内存时同步读取 SQLite，异步代码中应使用 aget
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            Optional[str]: 缓存的模型输出，未命中或已过期时返回None
+        """
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is None and self._conn is not None:
+            row = self._load(key, now)
+            if row is not None:
+                value = row[0]
+                evicted = self._put_memory(key, *row)
+                if evicted:
+                    self._spill(evicted)
+                self._spill_hit()
+        if value is None:
+            metrics.inc("response_cache_misses_total")
+        return value
+
+    async def aget(self, key: str) -> Optional[str]:
+        """
+        查找缓存的响应，SQLite 读取在线程池中执行，不阻塞事件循环
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            Optional[str]: 缓存的模型输出，未命中或已过期时返回None
+        """
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is None and self._conn is not None:
+            row = await asyncio.to_thread(self._load, key, now)
+            if row is not None:
+                value = row[0]
+                evicted = self._put_memory(key, *row)
+                if evicted:
+                    await asyncio.to_thread(self._spill, evicted)
+                self._spill_hit()
+        if value is None:
+            metrics.inc("response_cache_misses_total")
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        """
+        缓存模型输出，被淘汰的条目同步写入 SQLite，异步代码中应使用 aset
+
+        Args:
+            key: 缓存键
+            value: 模型输出
+        """
+        evicted = self._put_memory(key, value, time.time() + self.ttl)
+        if evicted:
+            self._spill(evicted)
+
+    async def aset(self, key: str, value: str) -> None:
+        """
+        缓存模型输出，被淘汰条目的 SQLite 写入在线程池中执行，不阻塞事件循环
+
+        Args:
+            key: 缓存键
+            value: 模型输出
+        """
+        evicted = self._put_memory(key, value, time.time() + self.ttl)
+        if evicted:
+            await asyncio.to_thread(self._spill, evicted)
+
+    async def discard(self, key: str) -> None:
+        """
+        删除条目，用于缓存的输出已不能使用的情况，SQLite 中的同名条目在线程池中删除
+
+        Args:
+            key: 缓存键
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            entries = len(self._entries)
+        metrics.inc("response_cache_discards_total")
+        metrics.set_gauge("response_cache_entries", entries)
+        if self._conn is not None:
+            await asyncio.to_thread(self._delete, key)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM response_cache")
+        metrics.set_gauge("response_cache_entries", 0)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取缓存统计信息
+
+        Returns:
+            Dict[str, Any]: 条目数和容量
+        """
+        return {"entries": len(self._entries), "max_entries": self.max_entries, "ttl": self.ttl}
+
+    def close(self) -> None:
+        """关闭 SQLite 溢出文件"""
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _get_memory(self, key: str, now: float) -> Optional[str]:
+        """查找内存中的条目，命中时计数"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        metrics.inc("response_cache_hits_total")
+        return value
+
+    def _load(self, key: str, now: float) -> Optional[Tuple[str, float]]:
+        """从 SQLite 读取未过期的溢出条目"""
+        with self._db_lock:
+            if self._conn is None:
+                return None
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] <= now:
+            return None
+        return row[0], row[1]
+
+    @staticmethod
+    def _spill_hit() -> None:
+        """记录一次溢出条目的命中（条目已放回内存）"""
+        metrics.inc("response_cache_hits_total")
+        metrics.inc("response_cache_spill_hits_total")
+
+    def _put_memory(self, key: str, value: str, expires_at: float) -> List[Tuple[str, str, float]]:
+        """
+        写入内存并淘汰超出上限的条目
+
+        Args:
+            key: 缓存键
+            value: 模型输出
+            expires_at: 过期时间
+
+        Returns:
+            List[Tuple[str, str, float]]: 需要溢出到 SQLite 的 (键, 值, 过期时间)
+        """
+        now = time.time()
+        evicted = []
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted_key, (evicted_value, evicted_expires) = self._entries.popitem(last=False)
+                metrics.inc("response_cache_evictions_total")
+                if self._conn is not None and evicted_expires > now:
+                    evicted.append((evicted_key, evicted_value, evicted_expires))
+            entries = len(self._entries)
+        metrics.set_gauge("response_cache_entries", entries)
+        return evicted
+
+    def _delete(self, key: str) -> None:
+        """删除 SQLite 中的溢出条目"""
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+
+    def _spill(self, evicted: List[Tuple[str, str, float]]) -> None:
+        """把淘汰的条目写入 SQLite，并顺便清理已过期的溢出条目"""
+        with self._db_lock:
+            if self._conn is None:
+                return
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)", evicted
+            )
+            self._conn.execute("DELETE FROM response_cache WHERE expires_at <= ?", (time.time(),))
+
+
+_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """
+    获取所有助手共享的响应缓存
+
+    Returns:
+        Optional[ResponseCache]: 响应缓存，配置中关闭缓存时返回None
+    """
+    global _cache
+    if settings.RESPONSE_CACHE_MAX_ENTRIES <= 0:
+        return None
+    if _cache is None:
+        _cache = ResponseCache(
+            settings.RESPONSE_CACHE_MAX_ENTRIES,
+            settings.RESPONSE_CACHE_TTL,
+            settings.RESPONSE_CACHE_DB_PATH or None
+        )
+        logger.info(f"响应缓存已启用，容量: {settings.RESPONSE_CACHE_MAX_ENTRIES}，有效期: {settings.RESPONSE_CACHE_TTL} 秒")
+    return _cache
+
+
+def close_response_cache() -> None:
+    """关闭共享的响应缓存"""
+    global _cache
+    if _cache is not None:
+        _cache.close()
+        _cache = None
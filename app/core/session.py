@@ -0,0 +1,293 @@
+"""
+会话管理模块
+按会话ID按需创建助手实例，使用有界内存的 LRU 和空闲 TTL 淘汰不活跃的会话
+"""
+from typing import Dict, Callable, Any, Optional, Tuple
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+import asyncio
+import json
+import logging
+import time
+
+from app.core.metrics import metrics
+from app.core.session_store import SessionConflict, SessionStore
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 未指定会话ID时使用的默认会话
+DEFAULT_SESSION_ID = "default"
+
+
+@dataclass
+class SessionEntry:
+    """单个会话的缓存条目"""
+    assistant: Any              # 助手实例
+    created_at: float           # 创建时间
+    last_access: float          # 最近访问时间
+    size_bytes: int = 0         # 估算的内存占用（字节）
+    revision: int = 0           # 与会话存储同步时的版本号
+    pins: int = 0               # 正在使用该会话的请求数，大于0时不会被淘汰
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)  # 串行化同一会话的请求
+
+
+def estimate_assistant_size(assistant: Any) -> int:
+    """
+    估算助手实例持有的会话状态大小
+
+    Args:
+        assistant: 助手实例
+
+    Returns:
+        int: 当前DSL、分离的items、对话历史序列化后的字节数加上DSL版本库的估算占用
+    """
+    size = 0
+    for value in (getattr(assistant, "current_dsl", None), getattr(assistant, "separated_items", None)):
+        if value:
+            size += len(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+    for message in assistant.get_chat_history():
+        size += len(message.get("content", "").encode("utf-8"))
+    versions = getattr(assistant, "versions", None)
+    if versions is not None:
+        size += versions.total_bytes
+    return size
+
+
+class SessionManager:
+    """会话管理器
+
+    以 (会话ID, 助手版本) 为键缓存助手实例。条目按访问顺序保存在 OrderedDict 中，
+    最久未访问的会话位于头部，因此 TTL 过期检查和 LRU 淘汰都只需要从头部弹出。
+    
+    配置了会话存储时，进程内的实例只是存储的缓存：获取会话时比较版本号，
+    其他 worker 修改过的会话会从存储重新加载；每次请求结束后把变化写回存储。
+    写回时比较版本号，基于过期状态的修改会被拒绝（SessionConflict）。
+    会话只能通过 session / acommit 使用：同一会话的请求在会话锁内依次执行，使用中的会话不会被淘汰，
+    存储读写在线程池中执行，不阻塞事件循环。
+    """
+
+    def __init__(
+        self,
+        factories: Dict[str, Callable[[], Any]],
+        max_sessions: int = 1000,
+        max_bytes: int = 512 * 1024 * 1024,
+        idle_ttl: float = 3600.0,
+        store: Optional[SessionStore] = None
+    ):
+        """
+        初始化会话管理器
+
+        Args:
+            factories: 助手版本到构造函数的映射
+            max_sessions: 最多同时保留的会话数
+            max_bytes: 所有会话状态的内存上限（字节）
+            idle_ttl: 会话空闲多久后被淘汰（秒），小于等于0表示不按时间淘汰
+            store: 会话状态存储，为空时会话只保存在当前进程内存中
+        """
+        self.factories = factories
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.store = store
+        self._sessions: "OrderedDict[Tuple[str, str], SessionEntry]" = OrderedDict()
+        self._total_bytes = 0
+
+    @asynccontextmanager
+    async def session(self, session_id: Optional[str], version: str):
+        """
+        在 async with 块内独占使用会话：同一会话的请求按到达顺序依次执行，
+        块内会话不会被 LRU 或 TTL 淘汰，请求在块内完成 获取 → 处理 → acommit。
+        会话存储的读取在线程池中执行，不阻塞事件循环
+
+        Args:
+            session_id: 会话ID，为空时使用默认会话
+            version: 助手版本
+
+        Yields:
+            Any: 助手实例
+        """
+        key, entry, created = self._lookup(session_id, version)
+        entry.pins += 1
+        try:
+            if created:
+                self._enforce_limits(keep=key)
+                self._update_gauges()
+            async with entry.lock:
+                if self.store is not None and await asyncio.to_thread(self.store.revision, *key) != entry.revision:
+                    self._apply_loaded(key, entry, await asyncio.to_thread(self.store.load, *key))
+                yield entry.assistant
+        finally:
+            entry.pins -= 1
+            if self._sessions.get(key) is entry:
+                entry.last_access = time.monotonic()
+                self._sessions.move_to_end(key)
+                self._enforce_limits(keep=key)
+                self._update_gauges()
+
+    async def acommit(self, session_id: Optional[str], version: str) -> None:
+        """
+        请求处理完成后在 session 块内调用：把会话状态的变化写回存储，并重新估算内存占用。
+        会话存储的写入在线程池中执行，不阻塞事件循环
+
+        Args:
+            session_id: 会话ID
+            version: 助手版本
+
+        Raises:
+            SessionConflict: 会话在本次请求读取之后已被其他 worker 修改，本次修改被丢弃
+            KeyError: 会话已被删除，本次修改无法保存
+        """
+        key, entry = self._committed_entry(session_id, version)
+        if self.store is not None:
+            # 在事件循环线程中导出状态，避免与其他协程对助手实例的修改交错
+            state = entry.assistant.export_state()
+            try:
+                entry.revision = await asyncio.to_thread(self.store.save, key[0], key[1], state, entry.revision)
+            except SessionConflict:
+                self._conflicted(key, entry)
+                raise
+        self.update_size(session_id, version)
+
+    def update_size(self, session_id: Optional[str], version: str) -> None:
+        """
+        在请求处理完成后重新估算会话占用的内存，并在超出上限时淘汰最久未访问的会话
+
+        Args:
+            session_id: 会话ID
+            version: 助手版本
+        """
+        key = (session_id or DEFAULT_SESSION_ID, version)
+        entry = self._sessions.get(key)
+        if entry is None:
+            return
+        new_size = estimate_assistant_size(entry.assistant)
+        self._total_bytes += new_size - entry.size_bytes
+        entry.size_bytes = new_size
+        self._enforce_limits(keep=key)
+        self._update_gauges()
+
+    def remove(self, session_id: Optional[str], version: Optional[str] = None) -> None:
+        """
+        删除会话
+
+        Args:
+            session_id: 会话ID
+            version: 助手版本，为空时删除该会话的所有版本
+        """
+        session_id = session_id or DEFAULT_SESSION_ID
+        for key in [k for k in self._sessions if k[0] == session_id and (version is None or k[1] == version)]:
+            self._pop(key)
+        if self.store is not None:
+            self.store.delete(session_id, version)
+        self._update_gauges()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取会话统计信息
+
+        Returns:
+            Dict[str, Any]: 会话数量和内存占用
+        """
+        return {
+            "sessions": len(self._sessions),
+            "bytes_held": self._total_bytes,
+            "max_sessions": self.max_sessions,
+            "max_bytes": self.max_bytes
+        }
+
+    def _lookup(self, session_id: Optional[str], version: str) -> Tuple[Tuple[str, str], SessionEntry, bool]:
+        """查找会话条目并更新访问时间，不存在时创建，返回键、条目和是否新建"""
+        key = (session_id or DEFAULT_SESSION_ID, version)
+        now = time.monotonic()
+        self._evict_expired(now)
+
+        entry = self._sessions.get(key)
+        if entry is not None:
+            entry.last_access = now
+            self._sessions.move_to_end(key)
+            return key, entry, False
+
+        if version not in self.factories:
+            raise ValueError(f"不支持的助手版本: {version}")
+
+        entry = SessionEntry(assistant=self.factories[version](), created_at=now, last_access=now)
+        self._sessions[key] = entry
+        metrics.inc("sessions_created_total")
+        logger.info(f"已创建会话 {key[0]}（{version}版本），当前会话数: {len(self._sessions)}")
+        return key, entry, True
+
+    def _committed_entry(self, session_id: Optional[str], version: str) -> Tuple[Tuple[str, str], SessionEntry]:
+        """获取要写回的会话条目，会话已不存在时报错，而不是静默丢弃本次修改"""
+        key = (session_id or DEFAULT_SESSION_ID, version)
+        entry = self._sessions.get(key)
+        if entry is None:
+            metrics.inc("sessions_commit_lost_total")
+            logger.error(f"会话 {key[0]}（{version}版本）在请求处理期间被删除，修改未保存")
+            raise KeyError(f"会话 {key[0]}（{version}版本）已不存在，修改未保存")
+        return key, entry
+
+    def _apply_loaded(self, key: Tuple[str, str], entry: SessionEntry,
+                      loaded: Optional[Tuple[Dict[str, Any], int]]) -> None:
+        """把从会话存储加载的最新状态恢复到助手实例，会话已从存储删除时重置为新会话"""
+        if loaded is None:
+            if entry.revision == 0:
+                return
+            entry.assistant = self.factories[key[1]]()
+            entry.revision = 0
+            logger.info(f"会话 {key[0]}（{key[1]}版本）已从会话存储删除，重置为新会话")
+        else:
+            state, revision = loaded
+            entry.assistant.import_state(state)
+            entry.revision = revision
+            logger.info(f"已从会话存储加载会话 {key[0]}（{key[1]}版本），版本号: {revision}")
+        self._total_bytes -= entry.size_bytes
+        entry.size_bytes = estimate_assistant_size(entry.assistant)
+        self._total_bytes += entry.size_bytes
+
+    def _conflicted(self, key: Tuple[str, str], entry: SessionEntry) -> None:
+        """保存冲突后，本地实例持有未保存的修改，标记为过期使下次获取时从存储重新加载"""
+        entry.revision = -1
+        logger.warning(f"会话 {key[0]}（{key[1]}版本）已被其他请求修改，本次修改未保存")
+
+    def _pop(self, key: Tuple[str, str]) -> SessionEntry:
+        """移除会话条目并扣减内存统计"""
+        entry = self._sessions.pop(key)
+        self._total_bytes -= entry.size_bytes
+        return entry
+
+    def _evict_expired(self, now: float) -> None:
+        """淘汰空闲超过 TTL 的会话，只检查最久未访问的头部条目"""
+        if self.idle_ttl <= 0:
+            return
+        while self._sessions:
+            key, entry = next(iter(self._sessions.items()))
+            if now - entry.last_access < self.idle_ttl:
+                break
+            if entry.pins:
+                # 正在使用的会话不算空闲
+                entry.last_access = now
+                self._sessions.move_to_end(key)
+                continue
+            self._pop(key)
+            metrics.inc("sessions_evicted_total")
+            metrics.inc("sessions_evicted_ttl_total")
+            logger.info(f"会话 {key[0]}（{key[1]}版本）空闲超时，已淘汰")
+
+    def _enforce_limits(self, keep: Tuple[str, str]) -> None:
+        """在会话数或内存占用超出上限时按 LRU 淘汰，当前会话和正在使用的会话不会被淘汰"""
+        while len(self._sessions) > self.max_sessions or self._total_bytes > self.max_bytes:
+            key = next((k for k, e in self._sessions.items() if k != keep and not e.pins), None)
+            if key is None:
+                # 其余会话都在使用中，暂时允许超出上限，请求结束后再淘汰
+                break
+            self._pop(key)
+            metrics.inc("sessions_evicted_total")
+            metrics.inc("sessions_evicted_lru_total")
+            logger.info(f"会话 {key[0]}（{key[1]}版本）因容量限制被淘汰")
+
+    def _update_gauges(self) -> None:
+        """同步会话数量和内存占用指标"""
+        metrics.set_gauge("sessions_active", len(self._sessions))
+        metrics.set_gauge("session_bytes_held", self._total_bytes)
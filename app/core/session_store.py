@@ -0,0 +1,408 @@
+"""
+会话状态持久化模块
+为多进程（gunicorn 多 worker）部署提供共享的会话状态存储
+"""
+from typing import Dict, List, Optional, Tuple, Any
+from abc import ABC, abstractmethod
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+
+from app.core.metrics import metrics
+from app.dsl.canonical import content_hash
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+class SessionConflict(Exception):
+    """会话状态在本进程读取之后已被其他请求或 worker 修改，保存被拒绝"""
+
+    def __init__(self, session_id: str, version: str, expected_revision: int, actual_revision: int):
+        """
+        初始化
+
+        Args:
+            session_id: 会话ID
+            version: 助手版本
+            expected_revision: 本进程读取时的版本号
+            actual_revision: 存储中当前的版本号，会话已被删除时为0
+        """
+        super().__init__(f"会话 {session_id}（{version}版本）已被其他请求修改，请重试")
+        self.expected_revision = expected_revision
+        self.actual_revision = actual_revision
+
+
+class SessionStore(ABC):
+    """会话状态存储后端的基类
+
+    会话状态是一个包含 current_dsl、separated_items、dsl_versions（DSL版本库）、chat_history 的字典，
+    由助手的 export_state / import_state 方法导出和恢复。
+    """
+
+    @abstractmethod
+    def revision(self, session_id: str, version: str) -> int:
+        """
+        获取会话状态的版本号，每次保存后递增，用于判断本地缓存是否过期
+
+        Args:
+            session_id: 会话ID
+            version: 助手版本
+
+        Returns:
+            int: 版本号，会话不存在时返回0
+        """
+
+    @abstractmethod
+    def load(self, session_id: str, version: str) -> Optional[Tuple[Dict[str, Any], int]]:
+        """
+        加载会话状态
+
+        Args:
+            session_id: 会话ID
+            version: 助手版本
+
+        Returns:
+            Optional[Tuple[Dict[str, Any], int]]: 会话状态和版本号，会话不存在时返回None
+        """
+
+    @abstractmethod
+    def save(self, session_id: str, version: str, state: Dict[str, Any], expected_revision: int) -> int:
+        """
+        保存会话状态（比较并交换）：只有存储中的版本号仍等于 expected_revision 时才写入
+
+        Args:
+            session_id: 会话ID
+            version: 助手版本
+            state: 会话状态
+            expected_revision: 读取会话状态时的版本号，新会话为0
+
+        Returns:
+            int: 保存后的版本号
+
+        Raises:
+            SessionConflict: 会话在读取之后已被修改或删除
+        """
+
+    @abstractmethod
+    def delete(self, session_id: str, version: Optional[str] = None) -> None:
+        """
+        删除会话状态
+
+        Args:
+            session_id: 会话ID
+            version: 助手版本，为空时删除该会话的所有版本
+        """
+
+    def close(self) -> None:
+        """释放存储资源"""
+
+
+def _encode(value: Any) -> bytes:
+    """将值序列化为压缩后的紧凑JSON"""
+    return zlib.compress(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def _decode(data: Optional[bytes]) -> Any:
+    """解码 _encode 生成的数据"""
+    if data is None:
+        return None
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+
+def _digest(value: Any) -> str:
+    """计算值的摘要，用于判断内容是否变化"""
+    return content_hash(value)
+
+
+def _history_digest(digest: str, messages: List[Dict[str, str]]) -> str:
+    """
+    在前一段对话历史的滚动摘要之后依次加入消息，得到整段历史的摘要
+
+    Args:
+        digest: 前一段历史的摘要，空历史为空字符串
+        messages: 追加的消息
+
+    Returns:
+        str: 追加后的摘要
+    """
+    for message in messages:
+        hasher = hashlib.blake2b(digest.encode("ascii"), digest_size=16)
+        hasher.update(message["role"].encode("utf-8"))
+        hasher.update(b"\0")
+        hasher.update(message["content"].encode("utf-8"))
+        digest = hasher.hexdigest()
+    return digest
+
+
+class SQLiteSessionStore(SessionStore):
+    """基于 SQLite（WAL 模式）的会话状态存储
+
+    同一主机上的多个 worker 共享一个数据库文件。每轮对话只写入变化的部分：
+    DSL 和 items 根据摘要判断是否需要重写，对话历史按序号追加新增的消息，
+    DSL 版本库每个版本一行，只写入新增的版本并删除已淘汰或被丢弃的版本。
+    保存时比较版本号，两个 worker 基于同一版本并发修改时，后保存的一方收到 SessionConflict，
+    而不是覆盖先保存的修改。
+    """
+
+    def __init__(self, db_path: str):
+        """
+        初始化存储
+
+        Args:
+            db_path: 数据库文件路径
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=30000")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT NOT NULL,
+                version TEXT NOT NULL,
+                revision INTEGER NOT NULL,
+                dsl BLOB,
+                dsl_digest TEXT,
+                items BLOB,
+                items_digest TEXT,
+                history_len INTEGER NOT NULL DEFAULT 0,
+                history_digest TEXT NOT NULL DEFAULT '',
+                dsl_version INTEGER,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (session_id, version)
+            );
+            CREATE TABLE IF NOT EXISTS session_versions (
+                session_id TEXT NOT NULL,
+                version TEXT NOT NULL,
+                number INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                message TEXT NOT NULL,
+                dsl BLOB NOT NULL,
+                items BLOB NOT NULL,
+                PRIMARY KEY (session_id, version, number)
+            );
+            CREATE TABLE IF NOT EXISTS session_history (
+                session_id TEXT NOT NULL,
+                version TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content BLOB NOT NULL,
+                PRIMARY KEY (session_id, version, seq)
+            );
+        """)
+        logger.info(f"会话状态存储已打开: {db_path}")
+
+    def revision(self, session_id: str, version: str) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT revision FROM sessions WHERE session_id = ? AND version = ?",
+                (session_id, version)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def load(self, session_id: str, version: str) -> Optional[Tuple[Dict[str, Any], int]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT revision, dsl, items, dsl_version FROM sessions WHERE session_id = ? AND version = ?",
+                (session_id, version)
+            ).fetchone()
+            if row is None:
+                return None
+            history_rows = self._conn.execute(
+                "SELECT role, content FROM session_history WHERE session_id = ? AND version = ? ORDER BY seq",
+                (session_id, version)
+            ).fetchall()
+            version_rows = self._conn.execute(
+                "SELECT number, created_at, message, dsl, items FROM session_versions "
+                "WHERE session_id = ? AND version = ? ORDER BY number",
+                (session_id, version)
+            ).fetchall()
+        revision, dsl, items, dsl_version = row
+        state = {
+            "current_dsl": _decode(dsl),
+            "separated_items": _decode(items) or {},
+            "dsl_versions": {
+                "current": dsl_version,
+                "versions": [
+                    {"number": number, "created_at": created_at, "message": message,
+                     "dsl": _decode(version_dsl), "items": _decode(version_items)}
+                    for number, created_at, message, version_dsl, version_items in version_rows
+                ]
+            },
+            "chat_history": [{"role": role, "content": zlib.decompress(content).decode("utf-8")}
+                             for role, content in history_rows]
+        }
+        metrics.inc("session_store_loads_total")
+        return state, revision
+
+    def save(self, session_id: str, version: str, state: Dict[str, Any], expected_revision: int) -> int:
+        dsl = state.get("current_dsl")
+        items = state.get("separated_items") or {}
+        history: List[Dict[str, str]] = state.get("chat_history") or []
+        dsl_versions = state.get("dsl_versions") or {}
+        current_version = dsl_versions.get("current")
+        dsl_digest = _digest(dsl)
+        items_digest = _digest(items)
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT revision, dsl_digest, items_digest, history_len, history_digest, dsl_version FROM sessions "
+                    "WHERE session_id = ? AND version = ?",
+                    (session_id, version)
+                ).fetchone()
+                stored_revision = row[0] if row else 0
+                if stored_revision != expected_revision:
+                    raise SessionConflict(session_id, version, expected_revision, stored_revision)
+                now = time.time()
+                written = self._save_versions(session_id, version, dsl_versions.get("versions") or [])
+
+                if row is None:
+                    revision = 1
+                    self._conn.execute(
+                        "INSERT INTO sessions (session_id, version, revision, dsl, dsl_digest, items, items_digest, "
+                        "history_len, history_digest, dsl_version, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (session_id, version, revision, _encode(dsl), dsl_digest, _encode(items), items_digest,
+                         len(history), _history_digest("", history), current_version, now)
+                    )
+                    start = 0
+                    written += 2
+                else:
+                    old_revision, old_dsl_digest, old_items_digest, old_history_len, old_history_digest, old_version = row
+                    revision = old_revision + 1
+                    if current_version != old_version:
+                        self._conn.execute(
+                            "UPDATE sessions SET dsl_version = ? WHERE session_id = ? AND version = ?",
+                            (current_version, session_id, version)
+                        )
+                        written += 1
+                    if dsl_digest != old_dsl_digest:
+                        self._conn.execute(
+                            "UPDATE sessions SET dsl = ?, dsl_digest = ? WHERE session_id = ? AND version = ?",
+                            (_encode(dsl), dsl_digest, session_id, version)
+                        )
+                        written += 1
+                    if items_digest != old_items_digest:
+                        self._conn.execute(
+                            "UPDATE sessions SET items = ?, items_digest = ? WHERE session_id = ? AND version = ?",
+                            (_encode(items), items_digest, session_id, version)
+                        )
+                        written += 1
+                    # 以已存储部分的滚动摘要判断历史是否只是在末尾追加，
+                    # 历史折叠会改写开头的消息，只比较最后一条消息无法发现
+                    start = old_history_len
+                    prefix_digest = _history_digest("", history[:old_history_len])
+                    if len(history) < old_history_len or prefix_digest != old_history_digest:
+                        # 历史被清空或改写，需要整体重写
+                        self._conn.execute(
+                            "DELETE FROM session_history WHERE session_id = ? AND version = ?",
+                            (session_id, version)
+                        )
+                        start = 0
+                        prefix_digest = ""
+                    if written == 0 and start == len(history) == old_history_len:
+                        # 状态没有变化，不递增版本号，避免其他 worker 无谓地重新加载
+                        self._conn.execute("COMMIT")
+                        return old_revision
+                    updated = self._conn.execute(
+                        "UPDATE sessions SET revision = ?, history_len = ?, history_digest = ?, updated_at = ? "
+                        "WHERE session_id = ? AND version = ? AND revision = ?",
+                        (revision, len(history), _history_digest(prefix_digest, history[start:]), now,
+                         session_id, version, expected_revision)
+                    )
+                    if updated.rowcount != 1:
+                        raise SessionConflict(session_id, version, expected_revision, old_revision)
+
+                new_messages = history[start:]
+                if new_messages:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO session_history (session_id, version, seq, role, content) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        [(session_id, version, start + i, m["role"], zlib.compress(m["content"].encode("utf-8")))
+                         for i, m in enumerate(new_messages)]
+                    )
+                    written += len(new_messages)
+                self._conn.execute("COMMIT")
+            except SessionConflict:
+                self._conn.execute("ROLLBACK")
+                metrics.inc("session_store_conflicts_total")
+                raise
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        metrics.inc("session_store_saves_total")
+        metrics.inc("session_store_rows_written_total", written)
+        return revision
+
+    def _save_versions(self, session_id: str, version: str, versions: List[Dict[str, Any]]) -> int:
+        """
+        同步 DSL 版本库：版本创建后不再修改，以版本号和创建时间识别，只写入新增的版本，
+        删除已淘汰或撤销后被新提交丢弃的版本
+
+        Returns:
+            int: 写入和删除的行数
+        """
+        stored = dict(self._conn.execute(
+            "SELECT number, created_at FROM session_versions WHERE session_id = ? AND version = ?",
+            (session_id, version)
+        ).fetchall())
+        wanted = {item["number"]: item for item in versions}
+        stale = [number for number, created_at in stored.items()
+                 if number not in wanted or wanted[number]["created_at"] != created_at]
+        if stale:
+            self._conn.executemany(
+                "DELETE FROM session_versions WHERE session_id = ? AND version = ? AND number = ?",
+                [(session_id, version, number) for number in stale]
+            )
+        added = [item for item in versions if stored.get(item["number"]) != item["created_at"]]
+        if added:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO session_versions (session_id, version, number, created_at, message, dsl, items) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(session_id, version, item["number"], item["created_at"], item.get("message", ""),
+                  _encode(item["dsl"]), _encode(item["items"])) for item in added]
+            )
+        return len(stale) + len(added)
+
+    def delete(self, session_id: str, version: Optional[str] = None) -> None:
+        with self._lock:
+            if version is None:
+                self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                self._conn.execute("DELETE FROM session_history WHERE session_id = ?", (session_id,))
+                self._conn.execute("DELETE FROM session_versions WHERE session_id = ?", (session_id,))
+            else:
+                self._conn.execute("DELETE FROM sessions WHERE session_id = ? AND version = ?", (session_id, version))
+                self._conn.execute("DELETE FROM session_history WHERE session_id = ? AND version = ?",
+                                   (session_id, version))
+                self._conn.execute("DELETE FROM session_versions WHERE session_id = ? AND version = ?",
+                                   (session_id, version))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def create_session_store(backend: str, db_path: str) -> Optional[SessionStore]:
+    """
+    根据配置创建会话状态存储
+
+    Args:
+        backend: 存储后端，memory（仅进程内，不持久化）或 sqlite
+        db_path: SQLite 数据库文件路径
+
+    Returns:
+        Optional[SessionStore]: 存储实例，memory 后端返回None
+    """
+    if backend == "sqlite":
+        return SQLiteSessionStore(db_path)
+    if backend != "memory":
+        raise ValueError(f"不支持的会话存储后端: {backend}")
+    return None
@@ -0,0 +1,86 @@
+"""
+并发请求合并模块
+相同键的并发调用只执行一次，所有调用方等待同一个结果；某个调用方被取消时不影响其他调用方，
+所有调用方都离开后才取消底层调用
+"""
+from typing import Any, Awaitable, Callable, Dict, Hashable
+import asyncio
+import logging
+
+from app.core.metrics import metrics
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """一次正在进行的调用"""
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """合并相同键的并发调用
+
+    只合并正在进行的调用：调用结束后键立即释放，之后的调用会重新执行，结果不做缓存。
+    """
+
+    def __init__(self, metric_prefix: str = "singleflight"):
+        """
+        初始化
+
+        Args:
+            metric_prefix: 指标名称前缀
+        """
+        self.metric_prefix = metric_prefix
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def __len__(self) -> int:
+        """正在进行的调用数"""
+        return len(self._calls)
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        执行调用，相同键的调用正在进行时等待它的结果
+
+        Args:
+            key: 调用的键，键相同的调用视为同一个请求
+            func: 执行调用的协程函数，只有第一个调用方的函数会被执行
+
+        Returns:
+            Any: 调用结果，调用抛出的异常会传给所有调用方
+        """
+        call = self._calls.get(key)
+        if call is None or call.task.done():
+            call = _Call(asyncio.ensure_future(func()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _, key=key, call=call: self._release(key, call))
+            metrics.inc(f"{self.metric_prefix}_calls_total")
+        else:
+            metrics.inc(f"{self.metric_prefix}_shared_total")
+            logger.info("相同的请求正在进行，等待其结果")
+
+        call.waiters += 1
+        try:
+            # shield 使单个调用方被取消时不会取消共享的调用
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                # 最后一个调用方也离开了，结果不再有人需要
+                call.task.cancel()
+                metrics.inc(f"{self.metric_prefix}_cancelled_total")
+                logger.info("所有调用方都已离开，取消正在进行的请求")
+            raise
+        finally:
+            call.waiters -= 1
+
+    def _release(self, key: Hashable, call: _Call) -> None:
+        """调用结束后释放键"""
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if not call.task.cancelled():
+            # 读取异常，所有调用方都已离开时避免出现 "exception was never retrieved" 警告
+            call.task.exception()
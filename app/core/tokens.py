@@ -0,0 +1,25 @@
+"""
+Token 估算模块
+在不依赖具体分词器的情况下粗略估算提示词的 token 数，用于控制提示词预算
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本的 token 数
+
+    中文等多字节字符按每字约 1 个 token 计算，ASCII 字符按每 4 个字符约 1 个 token 计算。
+    多字节字符数通过 UTF-8 编码长度推算，避免在 Python 层逐字符遍历。
+
+    Args:
+        text: 待估算的文本
+
+    Returns:
+        int: 估算的 token 数
+    """
+    if not text:
+        return 0
+    extra_bytes = len(text.encode("utf-8")) - len(text)
+    # 常见中文字符占 3 个字节，每个字符多出 2 个字节
+    wide_chars = extra_bytes // 2
+    return wide_chars + (len(text) - wide_chars + 3) // 4
@@ -0,0 +1,3 @@
+"""
+DSL 数据处理工具包
+"""
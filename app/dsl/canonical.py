@@ -0,0 +1,33 @@
+"""
+DSL 规范化模块
+生成与键顺序和空白无关的规范 JSON 文本及其摘要，用于缓存键和内容比较
+"""
+from typing import Any
+import hashlib
+import json
+
+
+def canonical_json(value: Any) -> str:
+    """
+    生成规范 JSON 文本：键按字典序排列，不含多余空白，非 ASCII 字符原样保留
+
+    Args:
+        value: JSON 值
+
+    Returns:
+        str: 规范 JSON 文本，内容相同的值得到相同的文本
+    """
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+
+
+def content_hash(value: Any) -> str:
+    """
+    计算 JSON 值的规范摘要
+
+    Args:
+        value: JSON 值
+
+    Returns:
+        str: 32 位十六进制摘要
+    """
+    return hashlib.blake2b(canonical_json(value).encode("utf-8"), digest_size=16).hexdigest()
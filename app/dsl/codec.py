@@ -0,0 +1,448 @@
+"""
+DSL 紧凑编码模块
+把发送给模型的 DSL 编码为更短的等价形式：省略各组件类型的默认属性、合并重复的样式对象、可选地为长属性名设置别名。
+编码是无损的，编码器在返回前会验证解码结果与原文逐字节一致
+"""
+from typing import Any, Dict, List, Optional, Set, Tuple
+from collections import Counter
+import json
+import logging
+
+from app.dsl.canonical import canonical_json
+from app.dsl.merkle import MerkleIndex
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+CODEC_VERSION = 1
+
+# 不参与默认值提取的节点属性
+_STRUCTURAL_KEYS = ("id", "type", "items", "children", "style")
+
+# 子节点所在的属性
+_CHILD_KEYS = ("items", "children")
+
+# 出现次数达到该值的属性值才会成为默认值
+_MIN_DEFAULT_COUNT = 2
+
+# 样式对象至少出现该次数且序列化后不短于该长度才会被合并
+_MIN_STYLE_COUNT = 2
+_MIN_STYLE_LENGTH = 24
+
+# 长度不小于该值且出现次数不少于该值的属性名才会设置别名
+_MIN_ALIAS_KEY_LENGTH = 8
+_MIN_ALIAS_KEY_COUNT = 4
+
+_ABSENT = "$absent"
+_STYLE_PREFIX = "style."
+
+# 使用紧凑编码时追加到提示词的说明
+CODEC_PROMPT = """
+
+**DSL紧凑编码：**
+下方DSL使用紧凑编码，编码表中：
+- $defaults 给出每种组件类型的默认属性（props）和默认样式（style），节点中省略的属性和样式取默认值
+- 节点的 "$absent" 列出该节点本来没有的默认属性（样式以 style. 开头）
+- style 为 "$s1" 这样的字符串时，表示引用 $styles 中的同名样式
+- $keys 是长属性名的别名
+返回DSL或节点时使用同样的编码（可以省略默认值、引用 $styles、使用别名），不要返回编码表本身。"""
+
+
+def _is_node(value: Any) -> bool:
+    """是否为DSL节点"""
+    return isinstance(value, dict) and isinstance(value.get("type"), str)
+
+
+def _iter_nodes(roots: List[Dict]):
+    """前序遍历所有节点"""
+    stack = list(reversed(roots))
+    while stack:
+        node = stack.pop()
+        if not _is_node(node):
+            continue
+        yield node
+        for key in reversed(_CHILD_KEYS):
+            children = node.get(key)
+            if isinstance(children, list):
+                stack.extend(reversed(children))
+
+
+def _iter_keys(value: Any):
+    """遍历值中的所有对象键"""
+    stack = [value]
+    while stack:
+        current = stack.pop()
+        if isinstance(current, dict):
+            for key, child in current.items():
+                yield key
+                stack.append(child)
+        elif isinstance(current, list):
+            stack.extend(current)
+
+
+def _merge(present: List[Tuple[str, Any]], defaults: Dict[str, Any], template: Dict[str, int]) -> Dict[str, Any]:
+    """把缺省的默认属性按类型的键顺序模板插回节点"""
+    present_keys = {key for key, _ in present}
+    pending = sorted((key for key in defaults if key not in present_keys), key=lambda k: template.get(k, len(template)))
+    result: Dict[str, Any] = {}
+    index = 0
+    for key, value in present:
+        position = template.get(key, len(template))
+        while index < len(pending) and template.get(pending[index], len(template)) < position:
+            result[pending[index]] = json.loads(defaults[pending[index]])
+            index += 1
+        result[key] = value
+    for key in pending[index:]:
+        result[key] = json.loads(defaults[key])
+    return result
+
+
+def _most_common_defaults(values: Dict[str, Counter], total: int) -> Dict[str, str]:
+    """选出出现足够多次的属性值作为默认值，返回属性名到规范 JSON 文本的映射"""
+    defaults = {}
+    for key, counter in values.items():
+        value, count = counter.most_common(1)[0]
+        if count >= _MIN_DEFAULT_COUNT and count * 2 >= total:
+            defaults[key] = value
+    return defaults
+
+
+class DSLCodec:
+    """DSL 紧凑编码器
+
+    编码表包括：
+    - $defaults：每种组件类型的默认属性（props）和默认样式（style），节点中与默认值相同的属性被省略；
+      节点本来没有某个默认属性时用 "$absent" 列出，解码时不会补回
+    - $styles：重复出现的样式对象，节点的 style 写成 "$s<序号>" 引用
+    - $keys：长属性名的别名（可选）
+
+    解码时缺省的属性按该类型在原文中的键顺序插回，因此未修改的节点可以逐字节还原。
+    """
+
+    def __init__(self, defaults: Dict[str, Dict[str, Dict[str, str]]], templates: Dict[str, Dict[str, Dict[str, int]]],
+                 styles: Dict[str, Dict], aliases: Dict[str, str]):
+        """
+        初始化编码器，通常通过 build_codec 创建
+
+        Args:
+            defaults: 类型 → {"props": {属性: 规范JSON}, "style": {样式: 规范JSON}}
+            templates: 类型 → {"props": {属性: 位置}, "style": {样式: 位置}}
+            styles: 样式引用名 → 样式对象（已省略默认样式）
+            aliases: 别名 → 原属性名
+        """
+        self.defaults = defaults
+        self.templates = templates
+        self.styles = styles
+        self.aliases = aliases
+        self._style_refs = {canonical_json(style): name for name, style in styles.items()}
+        self._key_to_alias = {key: alias for alias, key in aliases.items()}
+
+    @classmethod
+    def fit(cls, roots: List[Dict], alias_keys: bool = False) -> "DSLCodec":
+        """
+        根据DSL内容生成编码表
+
+        Args:
+            roots: 需要编码的DSL（或子树）列表
+            alias_keys: 是否为长属性名设置别名
+
+        Returns:
+            DSLCodec: 编码器
+        """
+        counts: Dict[str, int] = Counter()
+        props: Dict[str, Dict[str, Counter]] = {}
+        style_values: Dict[str, Dict[str, Counter]] = {}
+        templates: Dict[str, Dict[str, Dict[str, int]]] = {}
+
+        for node in _iter_nodes(roots):
+            node_type = node["type"]
+            counts[node_type] += 1
+            template = templates.setdefault(node_type, {"props": {}, "style": {}})
+            for key, value in node.items():
+                template["props"].setdefault(key, len(template["props"]))
+                if key not in _STRUCTURAL_KEYS:
+                    props.setdefault(node_type, {}).setdefault(key, Counter())[canonical_json(value)] += 1
+            style = node.get("style")
+            if isinstance(style, dict):
+                for key, value in style.items():
+                    template["style"].setdefault(key, len(template["style"]))
+                    style_values.setdefault(node_type, {}).setdefault(key, Counter())[canonical_json(value)] += 1
+
+        defaults: Dict[str, Dict[str, Dict[str, str]]] = {}
+        for node_type, total in counts.items():
+            entry = {
+                "props": _most_common_defaults(props.get(node_type, {}), total),
+                "style": _most_common_defaults(style_values.get(node_type, {}), total)
+            }
+            if entry["props"] or entry["style"]:
+                defaults[node_type] = entry
+
+        codec = cls(defaults, templates, {}, {})
+
+        # 省略默认样式后仍然重复的样式对象放入 $styles
+        style_counter: Counter = Counter()
+        for node in _iter_nodes(roots):
+            style = node.get("style")
+            if isinstance(style, dict):
+                stripped = codec._strip_style(node["type"], style)[0]
+                text = canonical_json(stripped)
+                if len(text) >= _MIN_STYLE_LENGTH:
+                    style_counter[text] += 1
+        styles = {}
+        for text, count in style_counter.most_common():
+            if count < _MIN_STYLE_COUNT:
+                break
+            styles[f"$s{len(styles) + 1}"] = json.loads(text)
+
+        aliases = {}
+        if alias_keys:
+            key_counter = Counter(key for key in _iter_keys(roots) if len(key) >= _MIN_ALIAS_KEY_LENGTH)
+            for key, count in key_counter.most_common():
+                if count < _MIN_ALIAS_KEY_COUNT:
+                    break
+                aliases[f"@{len(aliases) + 1}"] = key
+
+        return cls(defaults, templates, styles, aliases)
+
+    def tables(self) -> Dict[str, Any]:
+        """
+        编码表，随编码后的DSL一起发送给模型
+
+        Returns:
+            Dict[str, Any]: 包含 $codec、$defaults、$styles、$keys 的字典，默认值以 JSON 值而不是文本表示
+        """
+        tables: Dict[str, Any] = {"$codec": CODEC_VERSION}
+        if self.defaults:
+            tables["$defaults"] = self._alias({
+                node_type: {part: {key: json.loads(value) for key, value in values.items()}
+                            for part, values in entry.items() if values}
+                for node_type, entry in self.defaults.items()
+            })
+        if self.styles:
+            tables["$styles"] = self._alias(self.styles)
+        if self.aliases:
+            tables["$keys"] = self.aliases
+        return tables
+
+    def _strip_style(self, node_type: str, style: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+        """省略与默认值相同的样式，返回剩余样式和缺少的默认样式"""
+        defaults = self.defaults.get(node_type, {}).get("style", {})
+        if not defaults:
+            return style, []
+        stripped = {key: value for key, value in style.items()
+                    if key not in defaults or canonical_json(value) != defaults[key]}
+        absent = [f"{_STYLE_PREFIX}{key}" for key in defaults if key not in style]
+        return stripped, absent
+
+    def _encode_node(self, node: Dict[str, Any]) -> Dict[str, Any]:
+        """编码单个节点（递归处理子节点）"""
+        node_type = node["type"]
+        entry = self.defaults.get(node_type, {})
+        prop_defaults = entry.get("props", {})
+        style = node.get("style")
+
+        children = {key: [self._encode_node(child) if _is_node(child) else child for child in node[key]]
+                    for key in _CHILD_KEYS if isinstance(node.get(key), list)}
+
+        encoded: Dict[str, Any] = {}
+        absent = [key for key in prop_defaults if key not in node]
+        for key, value in node.items():
+            if key in prop_defaults and canonical_json(value) == prop_defaults[key]:
+                continue
+            if key in children:
+                value = children[key]
+            elif key == "style" and isinstance(value, dict):
+                value, style_absent = self._strip_style(node_type, value)
+                absent.extend(style_absent)
+                value = self._style_refs.get(canonical_json(value), value)
+            encoded[key] = value
+        if absent:
+            encoded[_ABSENT] = absent
+
+        if self._decoded_order(encoded) == (list(node), list(style) if isinstance(style, dict) else None):
+            return encoded
+
+        # 缺省属性插回的位置由键顺序模板决定，原文的键顺序与模板不一致时保留该节点的全部属性，
+        # 只标记缺少的默认属性，解码时不会插入任何属性
+        encoded = {key: children.get(key, value) for key, value in node.items()}
+        absent = [key for key in prop_defaults if key not in node]
+        if isinstance(style, dict):
+            absent.extend(f"{_STYLE_PREFIX}{key}" for key in entry.get("style", {}) if key not in style)
+        if absent:
+            encoded[_ABSENT] = absent
+        return encoded
+
+    def _decoded_order(self, encoded: Dict[str, Any]) -> Tuple[List[str], Optional[List[str]]]:
+        """编码后的节点解码后的属性顺序和样式顺序，用于编码时校验"""
+        node_type = encoded["type"]
+        entry = self.defaults.get(node_type, {})
+        template = self.templates[node_type]
+        absent = set(encoded.get(_ABSENT) or [])
+        present = [(key, None) for key in encoded if key != _ABSENT]
+        prop_defaults = {key: "null" for key in entry.get("props", {}) if key not in absent}
+        order = list(_merge(present, prop_defaults, template["props"]))
+        style = encoded.get("style")
+        if isinstance(style, str) and style in self.styles:
+            style = self.styles[style]
+        if not isinstance(style, dict):
+            return order, None
+        style_defaults = {key: "null" for key in entry.get("style", {}) if f"{_STYLE_PREFIX}{key}" not in absent}
+        return order, list(_merge([(key, None) for key in style], style_defaults, template["style"]))
+
+    def _decode_node(self, encoded: Dict[str, Any]) -> Dict[str, Any]:
+        """解码单个节点（递归处理子节点）"""
+        node_type = encoded["type"]
+        entry = self.defaults.get(node_type, {})
+        template = self.templates.get(node_type, {"props": {}, "style": {}})
+        absent = set(encoded.pop(_ABSENT, None) or [])
+
+        prop_defaults = {key: value for key, value in entry.get("props", {}).items() if key not in absent}
+        present: List[Tuple[str, Any]] = []
+        for key, value in encoded.items():
+            if key in _CHILD_KEYS and isinstance(value, list):
+                value = [self._decode_node(dict(child)) if _is_node(child) else child for child in value]
+            elif key == "style":
+                value = self._decode_style(value, entry, template, absent)
+            present.append((key, value))
+        return _merge(present, prop_defaults, template["props"])
+
+    def _decode_style(self, value: Any, entry: Dict[str, Dict[str, str]], template: Dict[str, Dict[str, int]],
+                      absent: Set[str]) -> Any:
+        """解码样式：展开 $styles 引用并补回默认样式"""
+        if isinstance(value, str) and value in self.styles:
+            value = self.styles[value]
+        if not isinstance(value, dict):
+            return value
+        style_defaults = {key: default for key, default in entry.get("style", {}).items()
+                          if f"{_STYLE_PREFIX}{key}" not in absent}
+        return _merge(list(value.items()), style_defaults, template["style"])
+
+    def _alias(self, value: Any) -> Any:
+        """把属性名替换为别名"""
+        if not self._key_to_alias:
+            return value
+        if isinstance(value, dict):
+            return {self._key_to_alias.get(key, key): self._alias(child) for key, child in value.items()}
+        if isinstance(value, list):
+            return [self._alias(child) for child in value]
+        return value
+
+    def _unalias(self, value: Any) -> Any:
+        """把别名还原为属性名"""
+        if not self.aliases:
+            return value
+        if isinstance(value, dict):
+            return {self.aliases.get(key, key): self._unalias(child) for key, child in value.items()}
+        if isinstance(value, list):
+            return [self._unalias(child) for child in value]
+        return value
+
+    def encode(self, node: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        编码DSL（或子树）
+
+        Args:
+            node: DSL节点
+
+        Returns:
+            Dict[str, Any]: 编码后的节点
+        """
+        return self._alias(self._encode_node(node))
+
+    def decode(self, encoded: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        解码DSL（或子树），也用于解析模型按同样编码返回的结果
+
+        Args:
+            encoded: 编码后的节点
+
+        Returns:
+            Dict[str, Any]: 解码后的节点
+        """
+        node = self._unalias(encoded)
+        if not _is_node(node):
+            return node
+        return self._decode_node(dict(node))
+
+
+def _uses_reserved_names(roots: List[Dict]) -> bool:
+    """DSL中是否有与编码标记冲突的属性名或样式引用"""
+    for key in _iter_keys(roots):
+        if key.startswith("$") or key.startswith("@"):
+            return True
+    return any(isinstance(node.get("style"), str) and node["style"].startswith("$") for node in _iter_nodes(roots))
+
+
+def build_codec(roots: List[Dict], alias_keys: bool = False) -> Optional[DSLCodec]:
+    """
+    为DSL生成编码器并验证编码无损且确实更短
+
+    Args:
+        roots: 需要编码的DSL（或子树）列表
+        alias_keys: 是否为长属性名设置别名
+
+    Returns:
+        Optional[DSLCodec]: 编码器；DSL中有冲突的属性名、编码无法逐字节还原或不能缩短文本时返回None
+    """
+    roots = [root for root in roots if _is_node(root)]
+    if not roots or _uses_reserved_names(roots):
+        return None
+    codec = DSLCodec.fit(roots, alias_keys)
+    encoded_size = len(canonical_json(codec.tables()))
+    original_size = 0
+    for root in roots:
+        original = json.dumps(root, ensure_ascii=False)
+        encoded = codec.encode(root)
+        if json.dumps(codec.decode(encoded), ensure_ascii=False) != original:
+            logger.warning("DSL紧凑编码无法无损还原，使用原始DSL")
+            return None
+        encoded_size += len(canonical_json(encoded))
+        original_size += len(canonical_json(root))
+    if encoded_size >= original_size:
+        return None
+    logger.info(f"DSL紧凑编码：{original_size} → {encoded_size} 字符")
+    return codec
+
+
+def align(new: Any, reference: Any, index: Optional[MerkleIndex] = None) -> Any:
+    """
+    让新值中与参考值内容相同的部分直接使用参考值
+
+    模型返回的DSL解码后，未修改的节点与原DSL内容相同但键顺序可能不同；对齐后这些节点直接复用原对象，
+    输出与原DSL逐字节一致，修改过的节点中原有的属性也保持原来的顺序。
+    对象是否相同按 Merkle 摘要比较，每个对象只计算一次摘要。
+
+    Args:
+        new: 新值
+        reference: 参考值
+        index: 摘要缓存，传入会话的缓存时参考值中已计算过的摘要直接复用
+
+    Returns:
+        Any: 对齐后的值
+    """
+    if index is None:
+        index = MerkleIndex()
+    if new is reference:
+        return reference
+    if isinstance(new, dict) and isinstance(reference, dict):
+        if index.digest(new) == index.digest(reference):
+            return reference
+        result = {key: align(new[key], reference[key], index) for key in reference if key in new}
+        for key, value in new.items():
+            if key not in reference:
+                result[key] = value
+        return result
+    if isinstance(new, list) and isinstance(reference, list):
+        by_id = {item["id"]: item for item in reference if isinstance(item, dict) and "id" in item}
+        result = []
+        for position, value in enumerate(new):
+            if isinstance(value, dict) and value.get("id") in by_id:
+                result.append(align(value, by_id[value["id"]], index))
+            elif position < len(reference):
+                result.append(align(value, reference[position], index))
+            else:
+                result.append(value)
+        return result
+    if type(new) is type(reference) and new == reference:
+        return reference
+    return new
@@ -0,0 +1,250 @@
+"""
+DSL 上下文选择模块
+根据用户消息从 DSL 中挑选相关的子树，连同紧凑的整体大纲一起作为提示词上下文，控制在 token 预算之内
+"""
+from typing import Dict, List, Optional, Any, Set
+from dataclasses import dataclass, field
+import json
+import re
+import logging
+
+from app.agents.dsl_task_splitter import DSLTaskSplitter
+from app.core.tokens import estimate_tokens
+from app.dsl.canonical import canonical_json
+from app.dsl.codec import DSLCodec
+from app.dsl.merkle import MerkleIndex
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 参与相关性匹配的节点属性
+_TEXT_PROPERTIES = ("name", "title", "text", "label", "content", "placeholder")
+
+# 常见中文描述到节点类型的映射
+_TYPE_SYNONYMS = {
+    "按钮": "button",
+    "文本": "text",
+    "文字": "text",
+    "标题": "title",
+    "图片": "image",
+    "页面": "page",
+    "容器": "container",
+    "输入框": "input",
+    "表单": "form",
+    "表格": "table",
+}
+
+# 大纲最多占用预算的比例
+_OUTLINE_BUDGET_RATIO = 0.3
+
+# 得分不低于最高分的该比例的节点才会被选中
+_SCORE_RATIO = 0.5
+
+_ASCII_TERM = re.compile(r"[a-z0-9_#\-]{2,}")
+_CJK_RUN = re.compile(r"[一-鿿]+")
+
+
+@dataclass
+class ScopedContext:
+    """按相关性裁剪后的DSL上下文"""
+    outline: str                                        # 整体大纲
+    subtrees: List[Dict[str, Any]]                      # 选中的子树（包含items）
+    pointers: List[str] = field(default_factory=list)   # 每个子树在完整DSL中的 JSON Pointer
+    node_ids: List[str] = field(default_factory=list)   # 选中子树的根节点ID
+    estimated_tokens: int = 0                           # 上下文的估算 token 数
+
+    def render(self, codec: Optional[DSLCodec] = None) -> str:
+        """
+        生成放入提示词的上下文文本
+
+        Args:
+            codec: 紧凑编码器，为空时子树按规范 JSON 输出
+
+        Returns:
+            str: 大纲和相关子树
+        """
+        parts = [f"DSL大纲（节点ID [类型] 名称）:\n{self.outline}"]
+        if codec is not None:
+            parts.append(f"编码表:\n{canonical_json(codec.tables())}")
+        parts.append("与本次请求相关的节点:")
+        for pointer, subtree in zip(self.pointers, self.subtrees):
+            value = codec.encode(subtree) if codec is not None else subtree
+            parts.append(f"路径 {pointer or '/'}:\n{canonical_json(value)}")
+        return "\n\n".join(parts)
+
+    def subtree_by_id(self, node_id: str) -> Optional[Dict[str, Any]]:
+        """
+        按节点ID获取选中的子树
+
+        Args:
+            node_id: 子树根节点的ID
+
+        Returns:
+            Optional[Dict[str, Any]]: 子树，不在选中范围内时返回None
+        """
+        for candidate, subtree in zip(self.node_ids, self.subtrees):
+            if candidate == node_id:
+                return subtree
+        return None
+
+
+def _message_terms(message: str) -> Set[str]:
+    """提取消息中的匹配词：英文单词和中文的二元组"""
+    lowered = message.lower()
+    terms = set(_ASCII_TERM.findall(lowered))
+    for run in _CJK_RUN.findall(lowered):
+        if len(run) == 1:
+            terms.add(run)
+        terms.update(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def _node_text(task: Dict[str, Any]) -> str:
+    """节点参与匹配的文本"""
+    properties = task["properties"]
+    values = [str(task["node_id"]), str(task["node_type"])]
+    values.extend(str(properties[key]) for key in _TEXT_PROPERTIES if isinstance(properties.get(key), (str, int, float)))
+    return " ".join(values).lower()
+
+
+def _score(task: Dict[str, Any], terms: Set[str], wanted_types: Set[str]) -> int:
+    """节点与消息的相关性得分"""
+    text = _node_text(task)
+    score = sum(1 for term in terms if term in text)
+    if task["node_type"] and str(task["node_type"]).lower() in wanted_types:
+        score += 1
+    return score
+
+
+class ContextSelector:
+    """基于 DSLTaskSplitter 节点索引的上下文选择器"""
+
+    def __init__(self, token_budget: int):
+        """
+        初始化上下文选择器
+
+        Args:
+            token_budget: 上下文的 token 预算
+        """
+        self.token_budget = token_budget
+        self.splitter = DSLTaskSplitter()
+        # 上次选择时DSL的 Merkle 摘要、估算 token 数和拆分结果，DSL未变化时直接复用
+        self._digest: Optional[bytes] = None
+        self._full_tokens = 0
+        self._tasks: Optional[List[Dict[str, Any]]] = None
+
+    def _subtree(self, task_id: str) -> Dict[str, Any]:
+        """完整的子树，直接使用原DSL中的节点，不复制"""
+        return self.splitter.get_subtree(task_id).to_dict()
+
+    def _has_selected_ancestor(self, task_id: str, selected: Set[str]) -> bool:
+        """任务的某个祖先是否已被选中"""
+        parent_id = self.splitter.tasks[task_id].parent_task_id
+        while parent_id is not None:
+            if parent_id in selected:
+                return True
+            parent_id = self.splitter.tasks[parent_id].parent_task_id
+        return False
+
+    def _outline(self, tasks: List[Dict[str, Any]], budget: int) -> str:
+        """生成按层级缩进的大纲，超出预算时截断"""
+        depths: Dict[str, int] = {}
+        lines: List[str] = []
+        used = 0
+        for index, task in enumerate(tasks):
+            parent_id = task["parent_task_id"]
+            depth = depths[parent_id] + 1 if parent_id is not None else 0
+            depths[task["task_id"]] = depth
+            name = task["properties"].get("name") or task["properties"].get("title") or ""
+            line = f"{'  ' * depth}- {task['node_id'] or '?'} [{task['node_type']}] {name}".rstrip()
+            cost = estimate_tokens(line) + 1
+            if used + cost > budget:
+                lines.append(f"...（其余 {len(tasks) - index} 个节点省略）")
+                break
+            lines.append(line)
+            used += cost
+        return "\n".join(lines)
+
+    def select(self, dsl: Dict[str, Any], message: str, index: Optional[MerkleIndex] = None) -> Optional[ScopedContext]:
+        """
+        为消息挑选相关的子树
+
+        Args:
+            dsl: 完整的DSL
+            message: 用户输入的消息
+            index: 会话的 Merkle 摘要缓存，传入时DSL与上次相同则不再重新估算和拆分
+
+        Returns:
+            Optional[ScopedContext]: 裁剪后的上下文；完整DSL没有超出预算、没有节点与消息相关
+            或相关子树放不进预算时返回None，调用方应回退到完整上下文
+        """
+        digest = index.digest(dsl) if index is not None else None
+        if digest is None or digest != self._digest:
+            self._digest = digest
+            self._full_tokens = estimate_tokens(json.dumps(dsl, ensure_ascii=False))
+            self._tasks = None
+        full_tokens = self._full_tokens
+        if full_tokens <= self.token_budget:
+            return None
+
+        if self._tasks is None:
+            self._tasks = self.splitter.split_dsl(dsl)
+        tasks = self._tasks
+        terms = _message_terms(message)
+        wanted_types = {node_type for word, node_type in _TYPE_SYNONYMS.items() if word in message}
+        wanted_types.update(term for term in terms if term.isascii())
+
+        scored = []
+        for order, task in enumerate(tasks):
+            if task["parent_task_id"] is None or not task["node_id"]:
+                # 根节点选中等于发送完整DSL；没有ID的节点无法按ID合并回完整DSL
+                continue
+            score = _score(task, terms, wanted_types)
+            if score > 0:
+                scored.append((score, order, task["task_id"]))
+        if not scored:
+            logger.info("没有与消息相关的DSL节点，使用完整上下文")
+            return None
+
+        scored.sort(key=lambda entry: (-entry[0], entry[1]))
+        threshold = scored[0][0] * _SCORE_RATIO
+
+        outline = self._outline(tasks, int(self.token_budget * _OUTLINE_BUDGET_RATIO))
+        remaining = self.token_budget - estimate_tokens(outline)
+
+        chosen: Dict[str, Dict[str, Any]] = {}
+        chosen_tokens: Dict[str, int] = {}
+        for score, _, task_id in scored:
+            if score < threshold:
+                break
+            if self._has_selected_ancestor(task_id, set(chosen)):
+                continue
+            subtree = self._subtree(task_id)
+            cost = estimate_tokens(json.dumps(subtree, ensure_ascii=False))
+            # 新选中的节点包含已选中的后代时，后代的预算归还
+            covered = [other for other in chosen if self._has_selected_ancestor(other, {task_id})]
+            freed = sum(chosen_tokens[other] for other in covered)
+            if cost - freed > remaining:
+                continue
+            for other in covered:
+                del chosen[other]
+                del chosen_tokens[other]
+            chosen[task_id] = subtree
+            chosen_tokens[task_id] = cost
+            remaining -= cost - freed
+        if not chosen:
+            logger.info("相关子树超出上下文预算，使用完整上下文")
+            return None
+
+        # 按文档顺序排列选中的子树
+        order = {task["task_id"]: index for index, task in enumerate(tasks)}
+        task_ids = sorted(chosen, key=order.get)
+        context = ScopedContext(
+            outline=outline,
+            subtrees=[chosen[task_id] for task_id in task_ids],
+            pointers=[self.splitter.tasks[task_id].path for task_id in task_ids],
+            node_ids=[self.splitter.tasks[task_id].node_id for task_id in task_ids],
+            estimated_tokens=self.token_budget - remaining
+        )
+        logger.info(f"已选择 {len(task_ids)} 个相关子树，上下文约 {context.estimated_tokens} tokens（完整DSL约 {full_tokens} tokens）")
+        return context
@@ -0,0 +1,203 @@
+"""
+DSL 结构差异模块
+在节点级别比较两个 DSL 版本：子节点按 id 匹配，没有 id 时按子树的 Merkle 摘要匹配，摘要相同的子树整体跳过，
+items 中的重排按最长递增子序列找出最少的移动，整体耗时与变化的部分成正比
+"""
+from typing import Any, Dict, List, Optional, Set, Tuple
+from bisect import bisect_left
+
+from app.dsl.merkle import MerkleIndex
+
+# 子节点所在的属性
+_CHILD_KEYS = ("items", "children")
+
+# 栈和待配对列表中的条目：(旧节点, 新节点, 旧路径, 新路径)
+_Pair = Tuple[Dict, Dict, str, str]
+
+
+def _stable_positions(sequence: List[int]) -> Set[int]:
+    """
+    求最长递增子序列
+
+    Args:
+        sequence: 匹配上的子节点按新顺序排列时的旧下标
+
+    Returns:
+        Set[int]: 属于最长递增子序列的位置，这些子节点保持不动，其余的视为移动
+    """
+    tails: List[int] = []       # 长度为 k+1 的递增子序列的最小结尾值
+    tail_positions: List[int] = []
+    previous = [-1] * len(sequence)
+    for position, value in enumerate(sequence):
+        k = bisect_left(tails, value)
+        if k == len(tails):
+            tails.append(value)
+            tail_positions.append(position)
+        else:
+            tails[k] = value
+            tail_positions[k] = position
+        previous[position] = tail_positions[k - 1] if k > 0 else -1
+    stable = set()
+    position = tail_positions[-1] if tail_positions else -1
+    while position != -1:
+        stable.add(position)
+        position = previous[position]
+    return stable
+
+
+def _child_list(node: Dict, key: str) -> List:
+    """节点的子节点数组，不存在或不是数组时为空"""
+    kids = node.get(key)
+    return kids if kids.__class__ is list else []
+
+
+def _property_changes(old: Dict, new: Dict) -> Tuple[Dict[str, Any], List[str]]:
+    """节点自身属性（不含子节点数组）的变化：新增或修改的属性和被删除的属性"""
+    changed = {}
+    for key, value in new.items():
+        if key in _CHILD_KEYS and value.__class__ is list:
+            continue
+        if key not in old:
+            changed[key] = value
+        else:
+            previous = old[key]
+            if previous is not value and previous != value:
+                changed[key] = value
+    removed = [key for key, value in old.items()
+               if key not in new and not (key in _CHILD_KEYS and value.__class__ is list)]
+    return changed, removed
+
+
+def diff_dsl(old: Dict, new: Dict, index: Optional[MerkleIndex] = None) -> List[Dict[str, Any]]:
+    """
+    计算两个 DSL 之间的节点级差异
+
+    同一个数组中的子节点先按 id、没有 id 的按子树摘要匹配；未匹配的节点再在整棵树范围内配对，
+    配对成功表示节点移动到了其他父节点下。仍未配对的新节点为新增，旧节点为删除，
+    被新增或删除的子树作为整体报告，不再展开其中的后代。
+
+    返回的操作按发现顺序排列，路径为 JSON Pointer：
+    - {"op": "update", "path", "id", "set": {属性: 新值}, "unset": [属性]}：节点自身属性变化
+    - {"op": "move", "from", "path", "id"}：节点从旧树的 from 移动到新树的 path
+    - {"op": "remove", "path", "id"}：删除旧树中 path 处的子树
+    - {"op": "add", "path", "id", "node"}：在新树的 path 处新增子树
+
+    Args:
+        old: 旧的完整DSL
+        new: 新的完整DSL
+        index: Merkle 摘要缓存，传入会话的缓存时未变化的子树无需重新计算摘要
+
+    Returns:
+        List[Dict[str, Any]]: 差异操作，两个DSL相同时为空列表
+    """
+    if index is None:
+        index = MerkleIndex()
+    digest = index.digest
+    ops: List[Dict[str, Any]] = []
+    added: List[Tuple[Dict, str]] = []      # 未匹配的新子节点及其在新树中的路径
+    removed: List[Tuple[Dict, str]] = []    # 未匹配的旧子节点及其在旧树中的路径
+    stack: List[_Pair] = [(old, new, "", "")]
+
+    def match_children(old_node: Dict, new_node: Dict, old_path: str, new_path: str) -> None:
+        """匹配同一属性下的子节点，匹配上的节点对入栈继续比较"""
+        for key in _CHILD_KEYS:
+            old_kids = _child_list(old_node, key)
+            new_kids = _child_list(new_node, key)
+            if not old_kids and not new_kids:
+                continue
+            old_by_id: Dict[Any, int] = {}
+            old_by_digest: Dict[bytes, List[int]] = {}
+            for i, child in enumerate(old_kids):
+                if child.__class__ is not dict:
+                    continue
+                child_id = child.get("id")
+                if child_id.__class__ is str or child_id.__class__ is int:
+                    old_by_id.setdefault(child_id, i)
+                else:
+                    old_by_digest.setdefault(digest(child), []).append(i)
+            for candidates in old_by_digest.values():
+                candidates.reverse()
+
+            matched: Set[int] = set()
+            pairs: List[Tuple[int, int]] = []
+            for j, child in enumerate(new_kids):
+                if child.__class__ is not dict:
+                    continue
+                child_id = child.get("id")
+                i = None
+                if child_id.__class__ is str or child_id.__class__ is int:
+                    i = old_by_id.get(child_id)
+                    if i in matched:
+                        i = None
+                else:
+                    candidates = old_by_digest.get(digest(child))
+                    if candidates:
+                        i = candidates.pop()
+                if i is None:
+                    added.append((child, f"{new_path}/{key}/{j}"))
+                    continue
+                matched.add(i)
+                pairs.append((i, j))
+            for i, child in enumerate(old_kids):
+                if child.__class__ is dict and i not in matched:
+                    removed.append((child, f"{old_path}/{key}/{i}"))
+
+            stable = _stable_positions([i for i, _ in pairs])
+            for position, (i, j) in enumerate(pairs):
+                if position not in stable:
+                    ops.append({"op": "move", "from": f"{old_path}/{key}/{i}", "path": f"{new_path}/{key}/{j}",
+                                "id": new_kids[j].get("id")})
+            # 倒序入栈，出栈时按文档顺序比较
+            for i, j in reversed(pairs):
+                stack.append((old_kids[i], new_kids[j], f"{old_path}/{key}/{i}", f"{new_path}/{key}/{j}"))
+
+    while True:
+        while stack:
+            old_node, new_node, old_path, new_path = stack.pop()
+            if old_node is new_node or digest(old_node) == digest(new_node):
+                continue
+            changed, unset = _property_changes(old_node, new_node)
+            if changed or unset:
+                ops.append({"op": "update", "path": new_path, "id": new_node.get("id"), "set": changed, "unset": unset})
+            match_children(old_node, new_node, old_path, new_path)
+
+        # 在整棵树范围内为未匹配的节点配对，配对成功的节点跨父节点移动
+        removed_by_id: Dict[Any, int] = {}
+        removed_by_digest: Dict[bytes, List[int]] = {}
+        for position, (node, _) in enumerate(removed):
+            node_id = node.get("id")
+            if node_id.__class__ is str or node_id.__class__ is int:
+                removed_by_id.setdefault(node_id, position)
+            else:
+                removed_by_digest.setdefault(digest(node), []).append(position)
+        for candidates in removed_by_digest.values():
+            candidates.reverse()
+
+        paired: Set[int] = set()
+        unpaired: List[Tuple[Dict, str]] = []
+        for node, path in added:
+            node_id = node.get("id")
+            position = None
+            if node_id.__class__ is str or node_id.__class__ is int:
+                position = removed_by_id.get(node_id)
+                if position in paired:
+                    position = None
+            else:
+                candidates = removed_by_digest.get(digest(node))
+                if candidates:
+                    position = candidates.pop()
+            if position is None:
+                unpaired.append((node, path))
+                continue
+            paired.add(position)
+            old_node, old_path = removed[position]
+            ops.append({"op": "move", "from": old_path, "path": path, "id": node_id})
+            stack.append((old_node, node, old_path, path))
+        added = unpaired
+        removed = [entry for position, entry in enumerate(removed) if position not in paired]
+        if not stack:
+            break
+
+    ops.extend({"op": "remove", "path": path, "id": node.get("id")} for node, path in removed)
+    ops.extend({"op": "add", "path": path, "id": node.get("id"), "node": node} for node, path in added)
+    return ops
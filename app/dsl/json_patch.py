@@ -0,0 +1,262 @@
+"""
+JSON Patch 模块
+按 RFC 6902 校验并应用 JSON Patch 操作，应用过程采用写时复制，不修改原文档
+"""
+from typing import Any, Callable, Dict, List, Union
+import copy
+
+JSONContainer = Union[Dict[str, Any], List[Any]]
+
+# 支持的操作类型
+PATCH_OPERATIONS = ("add", "remove", "replace", "move", "copy", "test")
+
+
+class JsonPatchError(ValueError):
+    """JSON Patch 校验或应用失败"""
+    pass
+
+
+def parse_pointer(pointer: str) -> List[str]:
+    """
+    解析 JSON Pointer（RFC 6901）
+
+    Args:
+        pointer: JSON Pointer 字符串，例如 /items/0/style
+
+    Returns:
+        List[str]: 路径片段列表，根路径返回空列表
+    """
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise JsonPatchError(f"无效的 JSON Pointer: {pointer!r}")
+    return [token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")]
+
+
+def _list_index(container: List[Any], token: str, allow_end: bool = False) -> int:
+    """把路径片段解析为列表下标"""
+    if allow_end and token == "-":
+        return len(container)
+    # isdigit 也接受其他文字的数字（如 "١"），只允许 ASCII 数字
+    if not (token.isascii() and token.isdigit()) or (len(token) > 1 and token[0] == "0"):
+        raise JsonPatchError(f"无效的数组下标: {token!r}")
+    index = int(token)
+    limit = len(container) + (1 if allow_end else 0)
+    if index >= limit:
+        raise JsonPatchError(f"数组下标越界: {index}")
+    return index
+
+
+def _is_number(value: Any) -> bool:
+    """是否为 JSON 数字，bool 虽然是 int 的子类但不是数字"""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _json_equal(a: Any, b: Any) -> bool:
+    """
+    按 JSON 类型比较两个值：布尔值与数字不相等（true 不等于 1），数字按数值比较（1.0 等于 1，RFC 6902 4.6 节），
+    对象和数组逐项递归比较
+
+    Args:
+        a: 第一个值
+        b: 第二个值
+
+    Returns:
+        bool: 是否相等
+    """
+    if _is_number(a) and _is_number(b):
+        return a == b
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(_json_equal(value, b[key]) for key, value in a.items())
+    if isinstance(a, list):
+        return len(a) == len(b) and all(_json_equal(x, y) for x, y in zip(a, b))
+    return a == b
+
+
+def _child(node: Any, token: str) -> Any:
+    """获取容器中路径片段对应的子节点"""
+    if isinstance(node, dict):
+        if token not in node:
+            raise JsonPatchError(f"路径不存在: {token!r}")
+        return node[token]
+    if isinstance(node, list):
+        return node[_list_index(node, token)]
+    raise JsonPatchError(f"无法在非容器值中查找: {token!r}")
+
+
+def resolve_pointer(doc: Any, pointer: str) -> Any:
+    """
+    获取 JSON Pointer 指向的值
+
+    Args:
+        doc: JSON 文档
+        pointer: JSON Pointer 字符串
+
+    Returns:
+        Any: 指向的值
+    """
+    node = doc
+    for token in parse_pointer(pointer):
+        node = _child(node, token)
+    return node
+
+
+def _update_parent(node: Any, tokens: List[str], action: Callable[[JSONContainer, str], None]) -> Any:
+    """
+    沿路径复制容器（写时复制），并在复制出的父容器上执行修改
+
+    路径之外的子树保持共享，不会被复制。
+
+    Args:
+        node: 当前节点
+        tokens: 剩余路径片段，至少包含一个片段
+        action: 在父容器副本上执行的修改，参数为父容器和最后一个路径片段
+
+    Returns:
+        Any: 修改后的新节点
+    """
+    if not isinstance(node, (dict, list)):
+        raise JsonPatchError(f"无法在非容器值中修改: {tokens[0]!r}")
+    container = dict(node) if isinstance(node, dict) else list(node)
+    if len(tokens) == 1:
+        action(container, tokens[0])
+        return container
+    key: Union[str, int] = tokens[0]
+    if isinstance(container, list):
+        key = _list_index(container, tokens[0])
+    elif key not in container:
+        raise JsonPatchError(f"路径不存在: {tokens[0]!r}")
+    container[key] = _update_parent(container[key], tokens[1:], action)
+    return container
+
+
+def _add(doc: Any, pointer: str, value: Any) -> Any:
+    tokens = parse_pointer(pointer)
+    if not tokens:
+        return value
+
+    def action(container: JSONContainer, token: str) -> None:
+        if isinstance(container, dict):
+            container[token] = value
+        else:
+            container.insert(_list_index(container, token, allow_end=True), value)
+
+    return _update_parent(doc, tokens, action)
+
+
+def _remove(doc: Any, pointer: str) -> Any:
+    tokens = parse_pointer(pointer)
+    if not tokens:
+        raise JsonPatchError("不能删除文档根节点")
+
+    def action(container: JSONContainer, token: str) -> None:
+        if isinstance(container, dict):
+            if token not in container:
+                raise JsonPatchError(f"路径不存在: {pointer!r}")
+            del container[token]
+        else:
+            del container[_list_index(container, token)]
+
+    return _update_parent(doc, tokens, action)
+
+
+def _replace(doc: Any, pointer: str, value: Any) -> Any:
+    tokens = parse_pointer(pointer)
+    if not tokens:
+        return value
+
+    def action(container: JSONContainer, token: str) -> None:
+        if isinstance(container, dict):
+            if token not in container:
+                raise JsonPatchError(f"路径不存在: {pointer!r}")
+            container[token] = value
+        else:
+            container[_list_index(container, token)] = value
+
+    return _update_parent(doc, tokens, action)
+
+
+def validate_patch(patch: Any) -> List[Dict[str, Any]]:
+    """
+    校验 JSON Patch 的结构
+
+    Args:
+        patch: 待校验的操作列表
+
+    Returns:
+        List[Dict[str, Any]]: 校验通过的操作列表
+    """
+    if not isinstance(patch, list):
+        raise JsonPatchError("JSON Patch 必须是操作数组")
+    for i, operation in enumerate(patch):
+        if not isinstance(operation, dict):
+            raise JsonPatchError(f"第 {i} 个操作不是对象")
+        op = operation.get("op")
+        if op not in PATCH_OPERATIONS:
+            raise JsonPatchError(f"第 {i} 个操作的类型无效: {op!r}")
+        if not isinstance(operation.get("path"), str):
+            raise JsonPatchError(f"第 {i} 个操作缺少 path")
+        if op in ("add", "replace", "test") and "value" not in operation:
+            raise JsonPatchError(f"第 {i} 个操作缺少 value")
+        if op in ("move", "copy") and not isinstance(operation.get("from"), str):
+            raise JsonPatchError(f"第 {i} 个操作缺少 from")
+    return patch
+
+
+def is_patch(value: Any) -> bool:
+    """
+    判断解析出的 JSON 是否是 JSON Patch 操作数组
+
+    Args:
+        value: 解析出的 JSON 值
+
+    Returns:
+        bool: 是否为非空且每项都带有 op 字段的数组
+    """
+    return isinstance(value, list) and bool(value) and all(
+        isinstance(operation, dict) and "op" in operation for operation in value
+    )
+
+
+def apply_patch(doc: Any, patch: List[Dict[str, Any]]) -> Any:
+    """
+    应用 JSON Patch
+
+    操作按顺序执行，任意一步失败都会抛出 JsonPatchError，原文档保持不变。
+    未被修改的子树与原文档共享，调用方不应原地修改返回的文档。
+
+    Args:
+        doc: 原文档
+        patch: JSON Patch 操作列表
+
+    Returns:
+        Any: 应用后的新文档
+    """
+    validate_patch(patch)
+    for i, operation in enumerate(patch):
+        op = operation["op"]
+        path = operation["path"]
+        try:
+            if op == "add":
+                doc = _add(doc, path, operation["value"])
+            elif op == "remove":
+                doc = _remove(doc, path)
+            elif op == "replace":
+                doc = _replace(doc, path, operation["value"])
+            elif op == "move":
+                source = operation["from"]
+                if path != source and path.startswith(source + "/"):
+                    raise JsonPatchError("不能把节点移动到它自己的子节点中")
+                value = resolve_pointer(doc, source)
+                doc = _add(_remove(doc, source), path, value)
+            elif op == "copy":
+                value = copy.deepcopy(resolve_pointer(doc, operation["from"]))
+                doc = _add(doc, path, value)
+            elif op == "test":
+                if not _json_equal(resolve_pointer(doc, path), operation["value"]):
+                    raise JsonPatchError(f"test 操作失败: {path!r}")
+        except JsonPatchError as e:
+            raise JsonPatchError(f"第 {i} 个操作（{op} {path}）应用失败: {e}") from None
+    return doc
@@ -0,0 +1,311 @@
+"""
+JSON 修复模块
+在本地一次线性扫描修复模型输出中常见的 JSON 语法问题：多余或缺少的逗号、注释、未转义的控制字符、
+单引号字符串、Python 字面量、括号不配对以及输出被截断
+"""
+from typing import Any, List, Optional
+from dataclasses import dataclass, field
+import json
+import re
+import logging
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"[ \t\r\n]+")
+_BARE_WORD = re.compile(r"[A-Za-z0-9_+\-.$@]+")
+_NUMBER = re.compile(r"-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+\-]?[0-9]+)?")
+_PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t", "\b": "\\b", "\f": "\\f"}
+_CLOSERS = {"{": "}", "[": "]"}
+_ESCAPES = set('"\\/bfnrtu')
+_STRING_BODY = re.compile(r"[^\"'\\\x00-\x1f]*")
+
+# 解析状态：期望的下一个记号
+_VALUE = "value"
+_VALUE_OR_END = "value_or_end"
+_KEY = "key"
+_KEY_OR_END = "key_or_end"
+_COLON = "colon"
+_COMMA_OR_END = "comma_or_end"
+
+
+class JsonRepairError(ValueError):
+    """JSON 无法在本地修复"""
+    pass
+
+
+@dataclass
+class RepairResult:
+    """JSON 修复结果"""
+    value: Any                                       # 修复后解析出的值
+    text: str                                        # 修复后的 JSON 文本
+    fixes: List[str] = field(default_factory=list)   # 进行的修复，例如 trailing_comma、truncated
+    truncated: bool = False                          # 输出是否在 JSON 结束之前被截断
+
+
+class _Repairer:
+    """单次修复的扫描状态"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.out: List[str] = []
+        self.fixes: List[str] = []
+        self.stack: List[str] = []
+        self.member_starts: List[int] = []   # 各层容器中当前成员（包括它前面的逗号）在输出中的起始位置
+        self.expect = _VALUE
+        self.truncated = False
+
+    def fix(self, kind: str) -> None:
+        if kind not in self.fixes:
+            self.fixes.append(kind)
+
+    def run(self, pos: int) -> str:
+        text = self.text
+        size = len(text)
+        while pos < size:
+            char = text[pos]
+            if char in " \t\r\n":
+                pos = _WHITESPACE.match(text, pos).end()
+            elif char == "/" and text.startswith(("//", "/*"), pos):
+                pos = self._skip_comment(pos)
+            elif char in "\"'":
+                pos = self._string(pos)
+            elif char in "{[":
+                self._before_value()
+                self.out.append(char)
+                self.stack.append(char)
+                self.member_starts.append(len(self.out))
+                self.expect = _KEY_OR_END if char == "{" else _VALUE_OR_END
+                pos += 1
+            elif char in "}]":
+                pos += 1
+                if self._close(char):
+                    break
+            elif char == ",":
+                self._comma()
+                pos += 1
+            elif char == ":":
+                if self.expect != _COLON:
+                    raise JsonRepairError(f"位置 {pos} 出现多余的冒号")
+                self.out.append(":")
+                self.expect = _VALUE
+                pos += 1
+            else:
+                pos = self._bare_word(pos)
+            if not self.stack and self.expect == _COMMA_OR_END:
+                break
+
+        if self.stack:
+            self._close_truncated()
+        return "".join(self.out)
+
+    def _skip_comment(self, pos: int) -> int:
+        """跳过 // 或 /* */ 注释"""
+        self.fix("comment")
+        if self.text.startswith("//", pos):
+            end = self.text.find("\n", pos)
+            return len(self.text) if end == -1 else end + 1
+        end = self.text.find("*/", pos + 2)
+        return len(self.text) if end == -1 else end + 2
+
+    def _before_value(self) -> None:
+        """出现一个值之前，按需补上缺少的逗号"""
+        if self.expect == _COMMA_OR_END and self.stack:
+            self.fix("missing_comma")
+            self._comma()
+        if self.expect in (_KEY, _KEY_OR_END, _COLON):
+            raise JsonRepairError("对象中缺少属性名")
+
+    def _comma(self) -> None:
+        if self.expect != _COMMA_OR_END:
+            # 连续的逗号或容器开头的逗号
+            self.fix("extra_comma")
+            return
+        self.member_starts[-1] = len(self.out)
+        self.out.append(",")
+        self.expect = _KEY if self.stack[-1] == "{" else _VALUE
+
+    def _close(self, char: str) -> bool:
+        """处理结束括号，最外层的容器结束时返回True"""
+        if char not in (_CLOSERS[opener] for opener in self.stack):
+            self.fix("extra_bracket")
+            return False
+        if self.expect in (_KEY, _VALUE) and self.out and self.out[-1] == ",":
+            self.fix("trailing_comma")
+            self.out.pop()
+        elif self.expect in (_COLON, _VALUE):
+            raise JsonRepairError("属性缺少值")
+        while _CLOSERS[self.stack[-1]] != char:
+            # 内层容器缺少结束括号
+            self.fix("missing_bracket")
+            self._pop()
+        self._pop()
+        return not self.stack
+
+    def _pop(self) -> None:
+        self.out.append(_CLOSERS[self.stack.pop()])
+        self.member_starts.pop()
+        self.expect = _COMMA_OR_END
+
+    def _string(self, pos: int) -> int:
+        """读取字符串，转义其中的控制字符，把单引号字符串改为双引号"""
+        quote = self.text[pos]
+        if quote == "'":
+            self.fix("single_quote")
+        is_key = self.expect in (_KEY, _KEY_OR_END)
+        if self.expect == _COMMA_OR_END and self.stack and self.stack[-1] == "{":
+            # 属性之间缺少逗号
+            self.fix("missing_comma")
+            self._comma()
+            is_key = True
+        if not is_key:
+            self._before_value()
+
+        pieces = ['"']
+        text = self.text
+        size = len(text)
+        index = pos + 1
+        start = index
+        while True:
+            index = _STRING_BODY.match(text, index).end()
+            if index >= size:
+                pieces.append(text[start:index])
+                self.truncated = True
+                self.fix("truncated")
+                break
+            char = text[index]
+            if char == "\\":
+                if index + 1 >= size:
+                    # 截断在转义符处，丢弃这个反斜杠
+                    pieces.append(text[start:index])
+                    start = index = size
+                    continue
+                escaped = text[index + 1]
+                if quote == "'" and escaped == "'":
+                    pieces.append(text[start:index])
+                    pieces.append("'")
+                    index += 2
+                    start = index
+                    continue
+                if escaped not in _ESCAPES:
+                    # 无效的转义，把反斜杠本身转义
+                    self.fix("invalid_escape")
+                    pieces.append(text[start:index])
+                    pieces.append("\\\\")
+                    index += 1
+                    start = index
+                    continue
+                index += 2
+                continue
+            if char == quote:
+                pieces.append(text[start:index])
+                index += 1
+                break
+            if char == "'":
+                index += 1
+                continue
+            if char == '"':
+                # 单引号字符串中的双引号需要转义
+                pieces.append(text[start:index])
+                pieces.append('\\"')
+                index += 1
+                start = index
+                continue
+            if char < " ":
+                pieces.append(text[start:index])
+                pieces.append(_CONTROL_ESCAPES.get(char, f"\\u{ord(char):04x}"))
+                self.fix("control_character")
+                index += 1
+                start = index
+                continue
+            index += 1
+        pieces.append('"')
+        self.out.append("".join(pieces))
+        self.expect = _COLON if is_key else _COMMA_OR_END
+        return index
+
+    def _bare_word(self, pos: int) -> int:
+        """读取未加引号的字面量、数字或属性名"""
+        match = _BARE_WORD.match(self.text, pos)
+        if match is None:
+            raise JsonRepairError(f"位置 {pos} 出现无法识别的字符 {self.text[pos]!r}")
+        word = match.group()
+        end = match.end()
+        if self.expect in (_KEY, _KEY_OR_END):
+            self.fix("unquoted_key")
+            self.out.append(json.dumps(word))
+            self.expect = _COLON
+            return end
+        at_end = end >= len(self.text) and bool(self.stack)
+        if word in _PYTHON_LITERALS:
+            self.fix("python_literal")
+            word = _PYTHON_LITERALS[word]
+        elif word not in ("true", "false", "null") and not _NUMBER.fullmatch(word):
+            if at_end:
+                # 输出在字面量中间被截断，丢弃不完整的部分
+                self.truncated = True
+                self.fix("truncated")
+                return end
+            raise JsonRepairError(f"无效的值 {word[:20]!r}")
+        if at_end:
+            # 输入末尾完整的数字或字面量予以保留（例如模型只是漏了结束括号）。
+            # 仍然标记为截断：输出因长度上限被截断时数字可能不完整，调用方不使用这样的修复结果
+            self.truncated = True
+            self.fix("truncated")
+        self._before_value()
+        self.out.append(word)
+        self.expect = _COMMA_OR_END
+        return end
+
+    def _close_truncated(self) -> None:
+        """输出被截断：丢弃不完整的成员并补齐所有结束括号"""
+        self.truncated = True
+        self.fix("truncated")
+        if self.expect in (_KEY, _COLON, _VALUE):
+            # 没有值的属性、只有属性名的属性或末尾的逗号
+            del self.out[self.member_starts[-1]:]
+        while self.stack:
+            self._pop()
+
+
+def repair_json(text: str) -> RepairResult:
+    """
+    修复并解析文本中的第一个 JSON 对象或数组
+
+    Args:
+        text: 以 JSON 开头（之前可以有说明文字）的模型输出
+
+    Returns:
+        RepairResult: 修复结果
+
+    Raises:
+        JsonRepairError: 找不到 JSON 或无法修复
+    """
+    match = re.search(r"[{\[]", text)
+    if match is None:
+        raise JsonRepairError("输出中没有 JSON")
+    repairer = _Repairer(text)
+    repaired = repairer.run(match.start())
+    try:
+        value = json.loads(repaired)
+    except json.JSONDecodeError as e:
+        raise JsonRepairError(f"修复后仍无法解析: {str(e)}")
+    return RepairResult(value, repaired, repairer.fixes, repairer.truncated)
+
+
+def try_repair_json(text: str) -> Optional[RepairResult]:
+    """
+    修复 JSON，无法修复时返回None
+
+    Args:
+        text: 以 JSON 开头的模型输出
+
+    Returns:
+        Optional[RepairResult]: 修复结果
+    """
+    try:
+        return repair_json(text)
+    except JsonRepairError as e:
+        logger.debug(f"JSON 无法在本地修复: {str(e)}")
+        return None
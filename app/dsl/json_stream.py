@@ -0,0 +1,379 @@
+"""
+增量 JSON 提取模块
+逐块读取模型输出，跳过代码块标记和说明文字，找出其中完整的 JSON 值；
+输出中的 JSON 出现无法修复的语法错误时立即发现，流式调用方可以提前停止生成
+"""
+from typing import Any, Callable, List, Optional, Tuple
+import json
+import re
+import logging
+
+from app.dsl.json_repair import try_repair_json
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+_OPEN = re.compile(r"[{\[]")
+_RECOVER = re.compile(r'["{}\[\]]')
+_WHITESPACE = re.compile(r"[ \t\r\n]*")
+_STRING_BODY = re.compile(r'[^"\\\x00-\x1f]*')
+_SCALAR_BODY = re.compile(r"[0-9A-Za-z+\-.]*")
+_SCALAR = re.compile(r"-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+\-]?[0-9]+)?|true|false|null|True|False|None")
+_FENCE = re.compile(r"```[A-Za-z0-9_\-]*")
+_SCALAR_START = set("-0123456789tfnTFN")
+
+# 解析状态：期望的下一个记号
+_VALUE = "value"                  # 值（冒号之后、数组中逗号之后）
+_VALUE_OR_END = "value_or_end"    # 值或 ]（[ 之后）
+_KEY = "key"                      # 键（对象中逗号之后）
+_KEY_OR_END = "key_or_end"        # 键或 }（{ 之后）
+_COLON = "colon"                  # 冒号（键之后）
+_COMMA_OR_END = "comma_or_end"    # 逗号或容器结束（值之后）
+
+
+class JSONExtractor:
+    """增量 JSON 提取器
+
+    说明文字中的 { 或 [ 会开始一个候选值，候选值中解析到第一个“键: ”之后才认为模型确实在输出 JSON。
+    确认之前出现语法错误只说明这是一段普通文字，继续向后查找；确认之后出现语法错误时记为无效输出，
+    不可能再成为合法的 JSON，流式调用方可以据此停止生成。出错的 JSON 只按括号配对跳过，之后继续查找。
+
+    json_repair 能够修复的问题（多余或缺少的逗号、字符串中的控制字符和无效转义、Python 字面量）不视为错误，
+    值结束时由 json_repair 修复后解析。
+
+    每个字符只被处理一次，字符串内容和空白用正则表达式整段跳过，总耗时与输出长度成线性关系。
+    """
+
+    def __init__(self, accept: Optional[Callable[[Any], bool]] = None):
+        """
+        初始化提取器
+
+        Args:
+            accept: 判断解析出的值是否为调用方需要的结果（例如合法的DSL），为空时接受第一个完整的值
+        """
+        self.accept = accept
+        self.values: List[Any] = []                 # 完整解析出的 JSON 值，按出现顺序
+        self.spans: List[Tuple[int, int]] = []      # 每个值在输出中的起止位置
+        self.result: Any = None                     # 第一个被接受的值
+        self.result_fixes: List[str] = []           # 得到结果时进行的本地修复，为空表示无需修复
+        self.has_result = False
+        self.errors = 0                             # 已确认的 JSON 中出现语法错误的次数
+        self.error_detail: Optional[str] = None
+
+        self._chunks: List[str] = []
+        self._length = 0
+        self._bad_spans: List[Tuple[int, int]] = []
+        self._leading_error = False
+        self._recovering = 0                        # 跳过出错的 JSON 时尚未配对的括号数
+
+        # 当前候选值的解析状态
+        self._stack: List[str] = []
+        self._expect = _VALUE
+        self._committed = False
+        self._in_string = False
+        self._string_is_key = False
+        self._escape = False
+        self._scalar: Optional[str] = None
+        self._start = 0
+        self._parts: List[str] = []
+        self._part_from = 0
+
+    @property
+    def invalid(self) -> bool:
+        """是否已经出现无法成为合法 JSON 的输出，且还没有找到需要的结果"""
+        return self.errors > 0 and not self.has_result
+
+    @property
+    def malformed(self) -> bool:
+        """
+        输出是否以 JSON 开头（之前只有空白或代码块标记）且该 JSON 已出现语法错误
+
+        这种情况下模型显然是在返回DSL，继续生成也得不到合法的结果；
+        说明文字中间夹带的错误 JSON 不算，整段输出仍可作为普通对话
+        """
+        return self._leading_error and not self.has_result
+
+    @property
+    def text(self) -> str:
+        """目前为止读取的全部输出"""
+        if len(self._chunks) > 1:
+            self._chunks = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+
+    def feed(self, chunk: str) -> None:
+        """
+        读取一段输出
+
+        Args:
+            chunk: 模型输出的文本片段
+        """
+        if not chunk:
+            return
+        self._chunks.append(chunk)
+        base = self._length
+        self._length += len(chunk)
+        self._part_from = 0
+        pos = 0
+        size = len(chunk)
+
+        while pos < size:
+            if self._recovering:
+                pos = self._skip_broken(chunk, pos, base)
+                continue
+
+            if not self._stack:
+                match = _OPEN.search(chunk, pos)
+                if match is None:
+                    break
+                pos = match.start()
+                self._begin(chunk, pos, base)
+                pos += 1
+                continue
+
+            if self._in_string:
+                if not self._escape:
+                    pos = _STRING_BODY.match(chunk, pos).end()
+                    if pos >= size:
+                        break
+                char = chunk[pos]
+                if self._escape:
+                    # 无效的转义和字符串中的控制字符可以修复，不视为错误
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._expect = _COLON if self._string_is_key else _COMMA_OR_END
+                pos += 1
+                continue
+
+            if self._scalar is not None:
+                end = _SCALAR_BODY.match(chunk, pos).end()
+                self._scalar += chunk[pos:end]
+                pos = end
+                if pos >= size:
+                    break
+                if not _SCALAR.fullmatch(self._scalar):
+                    pos = self._fail(chunk, pos, base, f"无效的值 {self._scalar[:20]}")
+                    continue
+                self._scalar = None
+                self._expect = _COMMA_OR_END
+                continue
+
+            pos = _WHITESPACE.match(chunk, pos).end()
+            if pos >= size:
+                break
+            pos = self._structural(chunk, pos, base)
+
+        if self._stack and not self._recovering:
+            # 候选值跨越多个片段，保存本片段中属于它的部分
+            self._parts.append(chunk[self._part_from:])
+
+    def _skip_broken(self, chunk: str, pos: int, base: int) -> int:
+        """按括号配对跳过出错的 JSON，忽略其中的语法，返回下一个位置"""
+        if self._in_string:
+            if not self._escape:
+                pos = _STRING_BODY.match(chunk, pos).end()
+                if pos >= len(chunk):
+                    return pos
+            char = chunk[pos]
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._in_string = False
+            return pos + 1
+
+        match = _RECOVER.search(chunk, pos)
+        if match is None:
+            return len(chunk)
+        pos = match.start()
+        char = chunk[pos]
+        if char == '"':
+            self._in_string = True
+        elif char in "{[":
+            self._recovering += 1
+        else:
+            self._recovering -= 1
+            if not self._recovering:
+                self._bad_spans[-1] = (self._start, base + pos + 1)
+        return pos + 1
+
+    def _begin(self, chunk: str, pos: int, base: int) -> None:
+        """在说明文字中遇到 { 或 [，开始一个候选值"""
+        self._stack = [chunk[pos]]
+        self._expect = _KEY_OR_END if chunk[pos] == "{" else _VALUE_OR_END
+        self._committed = False
+        self._start = base + pos
+        self._parts = []
+        self._part_from = pos
+
+    def _structural(self, chunk: str, pos: int, base: int) -> int:
+        """处理容器中的结构字符，返回下一个位置"""
+        char = chunk[pos]
+        expect = self._expect
+
+        if expect in (_VALUE, _VALUE_OR_END):
+            if char == "{":
+                self._stack.append("{")
+                self._expect = _KEY_OR_END
+            elif char == "[":
+                self._stack.append("[")
+                self._expect = _VALUE_OR_END
+            elif char == '"':
+                self._in_string = True
+                self._string_is_key = False
+            elif char in _SCALAR_START:
+                self._scalar = ""
+                return pos
+            elif char == "]" and (expect == _VALUE_OR_END or self._stack[-1] == "["):
+                # 数组末尾多余的逗号可以修复
+                return self._close(chunk, pos, base)
+            else:
+                return self._fail(chunk, pos, base, f"此处应为值，实际为 {char!r}")
+        elif expect in (_KEY, _KEY_OR_END):
+            if char == '"':
+                self._in_string = True
+                self._string_is_key = True
+            elif char == "}":
+                # 对象末尾多余的逗号可以修复
+                return self._close(chunk, pos, base)
+            else:
+                return self._fail(chunk, pos, base, f"此处应为属性名，实际为 {char!r}")
+        elif expect == _COLON:
+            if char != ":":
+                return self._fail(chunk, pos, base, f"属性名之后应为冒号，实际为 {char!r}")
+            self._committed = True
+            self._expect = _VALUE
+        else:
+            top = self._stack[-1]
+            if char == ",":
+                self._expect = _KEY if top == "{" else _VALUE
+            elif (char == "}" and top == "{") or (char == "]" and top == "["):
+                return self._close(chunk, pos, base)
+            elif char == '"' or (top == "[" and (char in "{[" or char in _SCALAR_START)):
+                # 缺少逗号可以修复，按逗号之后的位置继续解析
+                self._expect = _KEY if top == "{" else _VALUE
+                return self._structural(chunk, pos, base)
+            else:
+                return self._fail(chunk, pos, base, f"此处应为逗号或结束符，实际为 {char!r}")
+        return pos + 1
+
+    def _close(self, chunk: str, pos: int, base: int) -> int:
+        """容器结束，最外层的容器结束时解析整个候选值"""
+        self._stack.pop()
+        self._expect = _COMMA_OR_END
+        if self._stack:
+            return pos + 1
+
+        end = base + pos + 1
+        if not self._committed:
+            # 没有键值对的 {} 或 [...]，当作普通文字
+            return pos + 1
+        source = "".join(self._parts) + chunk[self._part_from:pos + 1]
+        self._parts = []
+        fixes: List[str] = []
+        try:
+            value = json.loads(source)
+        except json.JSONDecodeError as e:
+            # 数字、转义等细节由 json 模块最终校验，可以修复的问题在这里修复
+            repaired = try_repair_json(source)
+            if repaired is None:
+                self._record_error(end, str(e))
+                return pos + 1
+            value, fixes = repaired.value, repaired.fixes
+        self.values.append(value)
+        self.spans.append((self._start, end))
+        if not self.has_result and (self.accept is None or self.accept(value)):
+            self.result = value
+            self.result_fixes = fixes
+            self.has_result = True
+        return pos + 1
+
+    def _fail(self, chunk: str, pos: int, base: int, detail: str) -> int:
+        """
+        候选值出现语法错误
+
+        已确认的 JSON 记为错误并从下一个字符继续查找；未确认的候选值只是普通文字，
+        从出错的字符重新查找（它本身可能就是新的 { 或 [）
+        """
+        committed = self._committed
+        depth = len(self._stack)
+        in_string = self._in_string
+        self._stack = []
+        self._parts = []
+        self._in_string = False
+        self._escape = False
+        self._scalar = None
+        if committed:
+            self._record_error(base + pos + 1, detail)
+            # 从出错的位置开始按括号配对跳过这段 JSON，字符串中的错误字符直接跳过
+            self._recovering = depth
+            self._in_string = in_string
+            return pos + 1 if in_string else pos
+        return pos
+
+    def _record_error(self, end: int, detail: str) -> None:
+        """记录已确认的 JSON 中的语法错误"""
+        if not self.errors and not self.values:
+            self._leading_error = not _FENCE.sub("", self.text[:self._start]).strip()
+        self.errors += 1
+        self.error_detail = detail
+        self._bad_spans.append((self._start, end))
+        logger.debug(f"模型输出的JSON出现语法错误: {detail}")
+
+    def pending(self) -> bool:
+        """是否有已确认但尚未结束的 JSON（例如输出被截断）"""
+        return bool(self._stack) and self._committed and not self._recovering
+
+    def broken_start(self) -> Optional[int]:
+        """
+        第一个出错或尚未结束的 JSON 在输出中的起始位置，用于本地修复
+
+        Returns:
+            Optional[int]: 起始位置，没有出错或未结束的 JSON 时返回None
+        """
+        if self._bad_spans:
+            return self._bad_spans[0][0]
+        if self.pending():
+            return self._start
+        return None
+
+    def prose(self) -> str:
+        """
+        去掉其中 JSON 和代码块标记后的说明文字
+
+        Returns:
+            str: 完整的值、出错的 JSON 和未结束的 JSON 之外的文字
+        """
+        text = self.text
+        bad_spans = list(self._bad_spans)
+        if self._recovering:
+            bad_spans[-1] = (bad_spans[-1][0], len(text))
+        spans = sorted(self.spans + bad_spans)
+        if self.pending():
+            spans.append((self._start, len(text)))
+        parts = []
+        position = 0
+        for start, end in spans:
+            parts.append(text[position:start].strip())
+            position = max(position, end)
+        parts.append(text[position:].strip())
+        return " ".join(_FENCE.sub("", part).strip() for part in parts if part).strip()
+
+
+def extract_json(text: str, accept: Optional[Callable[[Any], bool]] = None) -> JSONExtractor:
+    """
+    从完整的输出中提取 JSON
+
+    Args:
+        text: 模型的完整输出
+        accept: 判断解析出的值是否为需要的结果
+
+    Returns:
+        JSONExtractor: 读取了全部输出的提取器
+    """
+    extractor = JSONExtractor(accept)
+    extractor.feed(text)
+    return extractor
@@ -0,0 +1,161 @@
+"""
+DSL Merkle 摘要模块
+自底向上为 DSL 的每个节点计算结构摘要：节点的摘要由自身属性和子节点的摘要得出，内容相同的子树摘要相同。
+摘要按对象身份缓存，写时复制修改后的新树与旧树共享未变化的子树，重新计算时只需处理变化的路径
+"""
+from typing import Any, Dict, List, Optional, Tuple
+import hashlib
+import json
+
+# 与 canonical_json 相同的规范序列化：键按字典序排列，不含多余空白
+_dumps = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), sort_keys=True).encode
+
+# 子节点所在的属性，摘要中按固定顺序排列，与节点中的键顺序无关
+_CHILD_KEYS = ("items", "children")
+
+# 分段标记：规范 JSON 文本中不会出现未转义的控制字符，拼接后的输入没有歧义
+_SECTION = {key: f"\x00{key}\x00".encode("utf-8") for key in _CHILD_KEYS}
+_NODE = b"\x01"
+_VALUE = b"\x02"
+
+_NO_IDS: Tuple = ()
+
+
+class MerkleIndex:
+    """按对象身份缓存的 DSL 子树摘要
+
+    条目保存节点对象本身的引用，条目存在期间对象不会被回收，它的 id() 也不会被其他对象复用。
+    调用方必须把 DSL 树当作不可变数据（见 app.dsl.tree），原地修改过的节点会得到过期的摘要。
+    除摘要外，每个条目还记录子树中所有节点的 id，供校验器检查跳过的子树之间 id 是否重复。
+    """
+
+    def __init__(self, max_entries: int = 200000):
+        """
+        初始化摘要缓存
+
+        Args:
+            max_entries: 最多缓存的节点数，超出时清空后重新计算
+        """
+        self.max_entries = max_entries
+        # id(节点) -> (节点, 摘要, 子树中的节点id)
+        self._entries: Dict[int, Tuple[Dict, bytes, Tuple]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        self._entries.clear()
+
+    def peek(self, node: Any) -> Optional[Tuple[Dict, bytes, Tuple]]:
+        """
+        查找已缓存的条目，不计算摘要
+
+        Args:
+            node: DSL节点
+
+        Returns:
+            Optional[Tuple[Dict, bytes, Tuple]]: (节点, 摘要, 子树中的节点id)，未缓存时返回None
+        """
+        entry = self._entries.get(id(node))
+        if entry is not None and entry[0] is node:
+            return entry
+        return None
+
+    def digest(self, node: Dict) -> bytes:
+        """
+        获取节点的摘要，未缓存的部分自底向上计算
+
+        Args:
+            node: DSL节点
+
+        Returns:
+            bytes: 16 字节摘要
+        """
+        return self._entry(node)[1]
+
+    def hexdigest(self, node: Dict) -> str:
+        """
+        获取节点摘要的十六进制形式
+
+        Args:
+            node: DSL节点
+
+        Returns:
+            str: 32 位十六进制摘要
+        """
+        return self._entry(node)[1].hex()
+
+    def ids(self, node: Dict) -> Tuple:
+        """
+        子树中通过 items 和 children 嵌套的所有节点的 id（字符串或整数），按后序排列
+
+        Args:
+            node: DSL节点
+
+        Returns:
+            Tuple: 节点id
+        """
+        return self._entry(node)[2]
+
+    def _entry(self, node: Dict) -> Tuple[Dict, bytes, Tuple]:
+        """获取节点的条目，未缓存时计算"""
+        entry = self.peek(node)
+        if entry is None:
+            if not isinstance(node, dict):
+                raise TypeError("只能计算对象节点的摘要")
+            if len(self._entries) >= self.max_entries:
+                self._entries.clear()
+            self._build(node)
+            entry = self._entries[id(node)]
+        return entry
+
+    def _build(self, root: Dict) -> None:
+        """后序遍历计算未缓存节点的摘要，已缓存的子树整体跳过"""
+        entries = self._entries
+        get = entries.get
+        blake2b = hashlib.blake2b
+        # 栈中保存 (节点, 子节点是否已入栈)
+        stack: List[Tuple[Dict, bool]] = [(root, False)]
+        pop = stack.pop
+        push = stack.append
+        while stack:
+            node, expanded = pop()
+            node_id = node.get("id")
+            own_ids = (node_id,) if node_id.__class__ is str or node_id.__class__ is int else _NO_IDS
+            if not expanded:
+                entry = get(id(node))
+                if entry is not None and entry[0] is node:
+                    continue
+                if node.get("items").__class__ is not list and node.get("children").__class__ is not list:
+                    # 叶子节点整体序列化
+                    entries[id(node)] = (node, blake2b(_dumps(node).encode("utf-8"), digest_size=16).digest(), own_ids)
+                    continue
+                push((node, True))
+                for key in _CHILD_KEYS:
+                    kids = node.get(key)
+                    if kids.__class__ is list:
+                        for child in kids:
+                            if child.__class__ is dict:
+                                push((child, False))
+                continue
+
+            props = {key: value for key, value in node.items() if key not in _CHILD_KEYS or value.__class__ is not list}
+            hasher = blake2b(_dumps(props).encode("utf-8"), digest_size=16)
+            ids: List = []
+            for key in _CHILD_KEYS:
+                kids = node.get(key)
+                if kids.__class__ is not list:
+                    continue
+                hasher.update(_SECTION[key])
+                for child in kids:
+                    if child.__class__ is dict:
+                        _, child_digest, child_ids = entries[id(child)]
+                        hasher.update(_NODE)
+                        hasher.update(child_digest)
+                        ids.extend(child_ids)
+                    else:
+                        hasher.update(_VALUE)
+                        hasher.update(blake2b(_dumps(child).encode("utf-8"), digest_size=16).digest())
+            ids.extend(own_ids)
+            entries[id(node)] = (node, hasher.digest(), tuple(ids))
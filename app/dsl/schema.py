@@ -0,0 +1,316 @@
+"""
+DSL 结构校验模块
+按组件类型注册表把 DSL 规则编译成一次遍历的校验器，在 O(n) 内检查节点类型、父子组件约束、必填属性和 id 唯一性，
+并给出出错节点的 JSON Pointer 路径
+"""
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+from dataclasses import dataclass
+import json
+import logging
+
+from app.core.config import settings
+from app.dsl.merkle import MerkleIndex
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 校验时使用的哨兵值，区分未注册的类型和允许任意子节点的类型
+_UNKNOWN = object()
+
+
+@dataclass(frozen=True)
+class ComponentSchema:
+    """组件类型的结构约束"""
+    type: str                                   # 组件类型
+    required: Tuple[str, ...] = ()              # 除 type 之外必须存在的属性
+    children: Optional[FrozenSet[str]] = None   # 允许的子节点类型，None 表示任意类型，空集合表示不能有子节点
+    root_only: bool = False                     # 是否只能作为根节点
+
+
+@dataclass(frozen=True)
+class SchemaError:
+    """一处校验错误"""
+    path: str      # 出错节点的 JSON Pointer，根节点为空字符串
+    message: str   # 错误说明
+
+    def __str__(self) -> str:
+        return f"{self.path or '/'}: {self.message}"
+
+
+def _pointer(trail: Optional[tuple]) -> str:
+    """把遍历时记录的 (父路径, 属性, 下标) 链还原为 JSON Pointer"""
+    parts = []
+    while trail is not None:
+        trail, key, index = trail
+        parts.append(f"/{key}/{index}")
+    return "".join(reversed(parts))
+
+
+def format_errors(errors: List[SchemaError], limit: int = 5) -> str:
+    """
+    把校验错误格式化为一行说明
+
+    Args:
+        errors: 校验错误列表
+        limit: 最多列出的错误条数
+
+    Returns:
+        str: 以分号分隔的错误说明
+    """
+    text = "；".join(str(error) for error in errors[:limit])
+    if len(errors) > limit:
+        text += f"；等 {len(errors)} 处错误"
+    return text
+
+
+class DSLValidator:
+    """由组件注册表编译得到的 DSL 校验器，可以在多个会话之间共享
+
+    除规则外只保存校验通过的子树摘要，摘要由内容决定，不同会话中内容相同的子树可以共用。
+    """
+
+    def __init__(self, schemas: Iterable[ComponentSchema], allow_unknown_types: bool = False,
+                 max_clean: int = 200000):
+        """
+        初始化校验器
+
+        Args:
+            schemas: 组件类型约束
+            allow_unknown_types: 是否允许注册表之外的组件类型，未知类型不检查子节点和属性
+            max_clean: 最多记录的校验通过的子树摘要数，超出时清空
+        """
+        schemas = list(schemas)
+        self.allow_unknown_types = allow_unknown_types
+        # 编译为按类型查找的字典，校验时每个节点只做常数次查找
+        self._children = {schema.type: schema.children for schema in schemas}
+        self._required = {schema.type: schema.required for schema in schemas if schema.required}
+        self._root_only = frozenset(schema.type for schema in schemas if schema.root_only)
+        # 作为非根节点校验通过的子树的 Merkle 摘要
+        self.max_clean = max_clean
+        self._clean: set = set()
+
+    @property
+    def types(self) -> List[str]:
+        """已注册的组件类型"""
+        return sorted(self._children)
+
+    def validate(self, dsl: Any, max_errors: int = 20, index: Optional[MerkleIndex] = None) -> List[SchemaError]:
+        """
+        校验整棵 DSL 树
+
+        传入摘要缓存时进行增量校验：摘要已缓存且以前校验通过的子树只检查它与父节点的类型约束，
+        子树中的 id 与其余部分一起检查是否重复，其他检查整体跳过。写时复制修改后的DSL只需检查变化的路径。
+        增量校验发现错误时重新完整校验，返回的错误与完整校验一致。
+
+        Args:
+            dsl: DSL根节点
+            max_errors: 收集到这么多错误后停止校验
+            index: 会话的 Merkle 摘要缓存，为空时完整校验
+
+        Returns:
+            List[SchemaError]: 校验错误，按深度优先前序排列，合法时为空列表
+        """
+        if not isinstance(dsl, dict):
+            return [SchemaError("", "DSL根节点必须是对象")]
+
+        children_rules = self._children
+        required_props = self._required
+        root_only = self._root_only
+        allow_unknown = self.allow_unknown_types
+        # 错误先记录为 (路径链, 说明)，只在出错时才拼接路径字符串
+        errors: List[Tuple[Optional[tuple], str]] = []
+        first_seen: Dict[Any, Optional[tuple]] = {}
+        clean = self._clean if index is not None else None
+        peek = index.peek if index is not None else None
+        skipped_ids: List[Any] = []
+        visited: List[Dict] = []
+
+        # 栈中保存 (节点, 父节点允许的子类型, 父节点类型, 路径链)
+        stack: List[tuple] = [(dsl, None, None, None)]
+        pop = stack.pop
+        push = stack.append
+        while stack:
+            node, allowed, parent_type, trail = pop()
+            if clean is not None and trail is not None:
+                entry = peek(node)
+                if entry is not None and entry[1] in clean and (allowed is None or node["type"] in allowed):
+                    skipped_ids.extend(entry[2])
+                    continue
+                visited.append(node)
+            node_type = node.get("type")
+            rule = children_rules.get(node_type, _UNKNOWN) if node_type.__class__ is str else _UNKNOWN
+
+            if rule is _UNKNOWN:
+                if node_type is None:
+                    errors.append((trail, "缺少 type 属性"))
+                elif node_type.__class__ is not str or not node_type:
+                    errors.append((trail, "type 必须是非空字符串"))
+                elif not allow_unknown:
+                    errors.append((trail, f"未知的组件类型 {node_type}"))
+                rule = None
+            else:
+                if allowed is not None and node_type not in allowed:
+                    errors.append((trail, f"{parent_type} 中不能包含 {node_type}"))
+                elif trail is not None and node_type in root_only:
+                    errors.append((trail, f"{node_type} 只能作为根节点"))
+                required = required_props.get(node_type)
+                if required:
+                    for prop in required:
+                        if prop not in node:
+                            errors.append((trail, f"{node_type} 缺少必填属性 {prop}"))
+
+            node_id = node.get("id")
+            if node_id is not None:
+                if node_id.__class__ is not str and node_id.__class__ is not int:
+                    errors.append((trail, "id 必须是字符串或整数"))
+                elif node_id in first_seen:
+                    errors.append((trail, f"id {node_id} 与 {_pointer(first_seen[node_id]) or '/'} 重复"))
+                else:
+                    first_seen[node_id] = trail
+
+            # 倒序入栈，出栈时先 items 后 children，与前序遍历的顺序一致
+            for key in ("children", "items"):
+                kids = node.get(key)
+                if kids is None:
+                    continue
+                if kids.__class__ is not list:
+                    errors.append((trail, f"{key} 必须是数组"))
+                    continue
+                if not kids:
+                    continue
+                if rule is not None and not rule:
+                    errors.append((trail, f"{node_type} 不能包含子节点"))
+                    continue
+                for position in range(len(kids) - 1, -1, -1):
+                    child = kids[position]
+                    if child.__class__ is dict:
+                        push((child, rule, node_type, (trail, key, position)))
+                    else:
+                        errors.append(((trail, key, position), "子节点必须是对象"))
+
+            if len(errors) >= max_errors:
+                break
+
+        if clean is not None:
+            if skipped_ids:
+                unique = set(skipped_ids)
+                if errors or len(unique) != len(skipped_ids) or not unique.isdisjoint(first_seen):
+                    # 跳过的子树参与了错误，完整校验以给出准确的路径
+                    return self.validate(dsl, max_errors)
+            if not errors:
+                if len(clean) + len(visited) > self.max_clean:
+                    clean.clear()
+                # 计算新节点的摘要后记录为校验通过
+                index.digest(dsl)
+                clean.update(entry[1] for entry in map(peek, visited) if entry is not None)
+
+        if not errors:
+            return []
+        return [SchemaError(_pointer(trail), message) for trail, message in errors[:max_errors]]
+
+    def is_valid(self, dsl: Any) -> bool:
+        """DSL是否完全合法"""
+        return not self.validate(dsl, max_errors=1)
+
+
+class SchemaRegistry:
+    """组件类型注册表"""
+
+    def __init__(self, schemas: Iterable[ComponentSchema] = ()):
+        self._schemas: Dict[str, ComponentSchema] = {}
+        for schema in schemas:
+            self.register(schema)
+
+    def register(self, schema: ComponentSchema) -> None:
+        """注册组件类型，已存在的同名类型会被覆盖"""
+        self._schemas[schema.type] = schema
+
+    def get(self, component_type: str) -> Optional[ComponentSchema]:
+        """获取组件类型的约束"""
+        return self._schemas.get(component_type)
+
+    def __contains__(self, component_type: str) -> bool:
+        return component_type in self._schemas
+
+    def load_file(self, path: str) -> None:
+        """
+        从 JSON 文件注册组件类型
+
+        文件格式为 {"类型": {"required": [...], "children": [...] 或 null, "root_only": false}}
+
+        Args:
+            path: JSON 文件路径
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            definitions = json.load(f)
+        for component_type, definition in definitions.items():
+            children = definition.get("children")
+            self.register(ComponentSchema(
+                type=component_type,
+                required=tuple(definition.get("required", ())),
+                children=None if children is None else frozenset(children),
+                root_only=bool(definition.get("root_only", False)),
+            ))
+        logger.info(f"已从 {path} 注册 {len(definitions)} 个组件类型")
+
+    def compile(self, allow_unknown_types: bool = False) -> DSLValidator:
+        """
+        编译为校验器
+
+        Args:
+            allow_unknown_types: 是否允许未注册的组件类型
+
+        Returns:
+            DSLValidator: 校验器
+        """
+        return DSLValidator(self._schemas.values(), allow_unknown_types)
+
+
+_LEAF = frozenset()
+
+
+def default_registry() -> SchemaRegistry:
+    """
+    内置的组件类型注册表
+
+    Returns:
+        SchemaRegistry: 包含常用组件类型的注册表
+    """
+    return SchemaRegistry([
+        ComponentSchema("app", root_only=True),
+        ComponentSchema("page"),
+        ComponentSchema("container"),
+        ComponentSchema("form"),
+        ComponentSchema("list"),
+        ComponentSchema("table"),
+        ComponentSchema("card"),
+        ComponentSchema("tabs", children=frozenset({"tab"})),
+        ComponentSchema("tab"),
+        ComponentSchema("text", children=_LEAF),
+        ComponentSchema("title", children=_LEAF),
+        ComponentSchema("button", children=_LEAF),
+        ComponentSchema("link", children=_LEAF),
+        ComponentSchema("icon", children=_LEAF),
+        ComponentSchema("input", children=_LEAF),
+        ComponentSchema("image", required=("src",), children=_LEAF),
+        ComponentSchema("divider", children=_LEAF),
+    ])
+
+
+_validator: Optional[DSLValidator] = None
+
+
+def get_validator() -> DSLValidator:
+    """
+    获取所有助手共享的DSL校验器
+
+    Returns:
+        DSLValidator: 按配置编译的校验器
+    """
+    global _validator
+    if _validator is None:
+        registry = default_registry()
+        if settings.DSL_SCHEMA_PATH:
+            registry.load_file(settings.DSL_SCHEMA_PATH)
+        _validator = registry.compile(settings.DSL_SCHEMA_ALLOW_UNKNOWN_TYPES)
+    return _validator
@@ -0,0 +1,172 @@
+"""
+DSL 树操作模块
+采用写时复制和结构共享分离、组合 DSL 中的 items 节点，只复制发生变化的路径
+"""
+from typing import Dict, List, Tuple, Any
+
+# 约定：这里返回的树与输入树共享未变化的子树，调用方必须把 DSL 树当作不可变数据，
+# 需要修改时使用写时复制（例如 app.dsl.json_patch.apply_patch），不要原地修改。
+
+
+def _items_path(path: str) -> str:
+    """当前节点的items路径"""
+    return f"{path}.items" if path else "items"
+
+
+def _child_path(path: str, index: int) -> str:
+    """第 index 个子节点的路径"""
+    return f"{path}.children[{index}]" if path else f"children[{index}]"
+
+
+def _separate(node: Dict, path: str, separated: Dict[str, List[Dict]]) -> Dict:
+    """递归分离items，节点没有变化时原样返回"""
+    has_items = "items" in node
+    if has_items:
+        # 先记录当前节点的items，保持与深度优先前序遍历一致的顺序
+        separated[_items_path(path)] = node["items"]
+
+    new_children = None
+    children = node.get("children")
+    if children:
+        for i, child in enumerate(children):
+            new_child = _separate(child, _child_path(path, i), separated)
+            if new_child is not child:
+                if new_children is None:
+                    new_children = list(children)
+                new_children[i] = new_child
+
+    if not has_items and new_children is None:
+        return node
+
+    result = dict(node)
+    if has_items:
+        del result["items"]
+    if new_children is not None:
+        result["children"] = new_children
+    return result
+
+
+def separate_items(dsl: Dict, path: str = "") -> Tuple[Dict, Dict[str, List[Dict]]]:
+    """
+    分离DSL中的items节点
+
+    只有包含items的节点及其祖先会被浅复制，其余子树与输入共享。
+
+    Args:
+        dsl: DSL字典
+        path: 当前节点路径
+
+    Returns:
+        Tuple[Dict, Dict[str, List[Dict]]]: 返回处理后的DSL和分离出的items
+    """
+    separated: Dict[str, List[Dict]] = {}
+    result = _separate(dsl, path, separated)
+    return result, separated
+
+
+def combine_items(dsl: Dict, items: Dict[str, List[Dict]], path: str = "") -> Dict:
+    """
+    重新组合DSL和items
+
+    只有需要挂回items的节点及其祖先会被浅复制，其余子树与输入共享。
+
+    Args:
+        dsl: 处理后的DSL
+        items: 分离的items
+        path: 当前节点路径
+
+    Returns:
+        Dict: 组合后的完整DSL
+    """
+    if not items:
+        return dsl
+
+    new_children = None
+    children = dsl.get("children")
+    if children:
+        for i, child in enumerate(children):
+            new_child = combine_items(child, items, _child_path(path, i))
+            if new_child is not child:
+                if new_children is None:
+                    new_children = list(children)
+                new_children[i] = new_child
+
+    current_path = _items_path(path)
+    has_items = current_path in items
+    if not has_items and new_children is None:
+        return dsl
+
+    result = dict(dsl)
+    if new_children is not None:
+        result["children"] = new_children
+    if has_items:
+        result["items"] = items[current_path]
+    return result
+
+
+def count_nodes(dsl: Any) -> int:
+    """
+    统计DSL中通过 items 和 children 嵌套的节点数
+
+    Args:
+        dsl: DSL字典
+
+    Returns:
+        int: 节点总数
+    """
+    count = 0
+    stack = [dsl]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, dict):
+            continue
+        count += 1
+        stack.extend(node.get("items") or ())
+        stack.extend(node.get("children") or ())
+    return count
+
+
+def replace_nodes(dsl: Dict, replacements: Dict[str, Dict]) -> Tuple[Dict, int]:
+    """
+    按节点 id 替换DSL中的节点（写时复制）
+
+    在 items 和 children 中查找 id 匹配的节点并整体替换，只有被替换节点的祖先会被浅复制。
+
+    Args:
+        dsl: 完整的DSL
+        replacements: 节点 id 到新节点的映射
+
+    Returns:
+        Tuple[Dict, int]: 替换后的DSL和实际替换的节点数
+    """
+    replaced = 0
+
+    def visit(node: Dict) -> Dict:
+        nonlocal replaced
+        node_id = node.get("id")
+        if node_id in replacements:
+            replaced += 1
+            return replacements[node_id]
+        result = node
+        for key in ("items", "children"):
+            children = node.get(key)
+            if not isinstance(children, list):
+                continue
+            new_children = None
+            for i, child in enumerate(children):
+                if not isinstance(child, dict):
+                    continue
+                new_child = visit(child)
+                if new_child is not child:
+                    if new_children is None:
+                        new_children = list(children)
+                    new_children[i] = new_child
+            if new_children is not None:
+                if result is node:
+                    result = dict(node)
+                result[key] = new_children
+        return result
+
+    if not replacements:
+        return dsl, 0
+    return visit(dsl), replaced
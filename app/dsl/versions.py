@@ -0,0 +1,326 @@
+"""
+DSL 版本管理模块
+按会话保存 DSL 的历史版本，版本之间共享未变化的子树，在内存预算内支持撤销和重做
+"""
+from typing import Any, Dict, List, Optional, Tuple
+from dataclasses import dataclass
+import json
+import logging
+import time
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 每个容器节点的估算额外开销（字节）
+_CONTAINER_OVERHEAD = 64
+
+
+def _estimate_size(value: Any) -> int:
+    """估算一个值序列化后的大小"""
+    return len(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def share_structure(new: Any, old: Any) -> Tuple[Any, int]:
+    """
+    让新树尽可能复用旧树中内容相同的子树
+
+    内容与旧树相同（包括键顺序）的子树直接替换为旧树中的对象，
+    因此连续版本之间只有变化的路径占用额外内存。
+
+    Args:
+        new: 新的 JSON 值
+        old: 旧的 JSON 值
+
+    Returns:
+        Tuple[Any, int]: 共享后的新值，以及新增（未共享）部分的估算字节数
+    """
+    if new is old:
+        return old, 0
+
+    if isinstance(new, dict) and isinstance(old, dict):
+        result = {}
+        added = 0
+        unchanged = list(new) == list(old)
+        for key, value in new.items():
+            if key in old:
+                shared, size = share_structure(value, old[key])
+            else:
+                shared, size = value, _estimate_size(value)
+            if key not in old or shared is not old[key]:
+                unchanged = False
+            result[key] = shared
+            added += size
+        if unchanged:
+            return old, 0
+        return result, added + _CONTAINER_OVERHEAD
+
+    if isinstance(new, list) and isinstance(old, list):
+        # 带 id 的元素按 id 匹配，节点在 items 中移动时仍能共享
+        old_by_id = {item["id"]: item for item in old if isinstance(item, dict) and "id" in item}
+        result = []
+        added = 0
+        unchanged = len(new) == len(old)
+        for i, value in enumerate(new):
+            counterpart = None
+            if isinstance(value, dict) and value.get("id") in old_by_id:
+                counterpart = old_by_id[value["id"]]
+            elif i < len(old):
+                counterpart = old[i]
+            if counterpart is not None:
+                shared, size = share_structure(value, counterpart)
+            else:
+                shared, size = value, _estimate_size(value)
+            if unchanged and shared is not old[i]:
+                unchanged = False
+            result.append(shared)
+            added += size
+        if unchanged:
+            return old, 0
+        return result, added + _CONTAINER_OVERHEAD
+
+    if type(new) is type(old) and new == old:
+        return old, 0
+    return new, _estimate_size(new)
+
+
+@dataclass
+class DSLVersion:
+    """一个DSL版本"""
+    number: int                         # 版本号，从1开始递增
+    dsl: Dict                           # 分离items后的DSL
+    items: Dict[str, List[Dict]]        # 分离出的items
+    size_bytes: int                     # 该版本新增（未与前一版本共享）部分的估算字节数
+    message: str                        # 产生该版本的操作说明
+    created_at: float                   # 创建时间
+
+    def info(self) -> Dict[str, Any]:
+        """版本的摘要信息"""
+        return {
+            "number": self.number,
+            "message": self.message,
+            "size_bytes": self.size_bytes,
+            "created_at": self.created_at
+        }
+
+
+class DSLVersionStore:
+    """DSL 版本库
+
+    版本按时间顺序保存，current 指向当前版本。撤销和重做只移动 current，
+    在撤销后提交新版本会丢弃所有可重做的版本。超出内存预算或数量上限时淘汰最旧的版本。
+    版本库通过 export_state / import_state 随会话状态保存到会话存储，撤销和重做在重启后和多个 worker 之间仍然有效。
+    """
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024, max_versions: int = 100):
+        """
+        初始化版本库
+
+        Args:
+            max_bytes: 所有版本的估算内存上限（字节）
+            max_versions: 最多保留的版本数
+        """
+        self.max_bytes = max_bytes
+        self.max_versions = max_versions
+        self._versions: List[DSLVersion] = []
+        self._current = -1
+        self._next_number = 1
+        self.total_bytes = 0
+
+    @property
+    def current(self) -> Optional[DSLVersion]:
+        """当前版本"""
+        return self._versions[self._current] if self._current >= 0 else None
+
+    def reset(self, dsl: Dict, items: Dict[str, List[Dict]], message: str = "加载DSL") -> DSLVersion:
+        """
+        清空版本库并以给定的DSL作为第一个版本
+
+        Args:
+            dsl: 分离items后的DSL
+            items: 分离出的items
+            message: 操作说明
+
+        Returns:
+            DSLVersion: 新版本
+        """
+        self._versions = []
+        self._current = -1
+        self._next_number = 1
+        self.total_bytes = 0
+        return self.commit(dsl, items, message)
+
+    def commit(self, dsl: Dict, items: Dict[str, List[Dict]], message: str = "") -> DSLVersion:
+        """
+        提交新版本，新版本与当前版本共享未变化的子树
+
+        Args:
+            dsl: 分离items后的DSL
+            items: 分离出的items
+            message: 操作说明
+
+        Returns:
+            DSLVersion: 新版本，其中的 dsl 和 items 已经与旧版本共享结构，调用方应改用它们
+        """
+        # 撤销后提交新版本，丢弃可重做的版本
+        for dropped in self._versions[self._current + 1:]:
+            self.total_bytes -= dropped.size_bytes
+        del self._versions[self._current + 1:]
+        if self.current is not None:
+            self._next_number = self.current.number + 1
+
+        base = self.current
+        if base is None:
+            size = _estimate_size(dsl) + _estimate_size(items)
+        else:
+            dsl, dsl_size = share_structure(dsl, base.dsl)
+            items, items_size = share_structure(items, base.items)
+            size = dsl_size + items_size
+
+        version = DSLVersion(
+            number=self._next_number,
+            dsl=dsl,
+            items=items,
+            size_bytes=size,
+            message=message,
+            created_at=time.time()
+        )
+        self._next_number += 1
+        self._versions.append(version)
+        self._current = len(self._versions) - 1
+        self.total_bytes += size
+        self._evict()
+        return version
+
+    def undo(self) -> Optional[DSLVersion]:
+        """
+        撤销到上一个版本
+
+        Returns:
+            Optional[DSLVersion]: 撤销后的当前版本，没有可撤销的版本时返回None
+        """
+        if self._current <= 0:
+            return None
+        self._current -= 1
+        return self.current
+
+    def redo(self) -> Optional[DSLVersion]:
+        """
+        重做下一个版本
+
+        Returns:
+            Optional[DSLVersion]: 重做后的当前版本，没有可重做的版本时返回None
+        """
+        if self._current < 0 or self._current >= len(self._versions) - 1:
+            return None
+        self._current += 1
+        return self.current
+
+    def get(self, number: int) -> Optional[DSLVersion]:
+        """
+        按版本号获取版本
+
+        Args:
+            number: 版本号
+
+        Returns:
+            Optional[DSLVersion]: 对应的版本，已被淘汰或不存在时返回None
+        """
+        if not self._versions:
+            return None
+        index = number - self._versions[0].number
+        if 0 <= index < len(self._versions):
+            return self._versions[index]
+        return None
+
+    def list_versions(self) -> List[Dict[str, Any]]:
+        """
+        列出所有保留的版本
+
+        Returns:
+            List[Dict[str, Any]]: 版本摘要列表
+        """
+        return [version.info() for version in self._versions]
+
+    def export_state(self) -> Dict[str, Any]:
+        """
+        导出版本库，用于持久化到会话存储
+
+        Returns:
+            Dict[str, Any]: 当前版本号和按时间顺序排列的所有保留版本
+        """
+        return {
+            "current": self.current.number if self.current is not None else None,
+            "versions": [
+                {
+                    "number": version.number,
+                    "dsl": version.dsl,
+                    "items": version.items,
+                    "message": version.message,
+                    "created_at": version.created_at
+                }
+                for version in self._versions
+            ]
+        }
+
+    def import_state(self, state: Dict[str, Any]) -> Optional[DSLVersion]:
+        """
+        从 export_state 导出的数据恢复版本库，相邻版本重新共享未变化的子树
+
+        Args:
+            state: export_state 导出的版本库
+
+        Returns:
+            Optional[DSLVersion]: 恢复后的当前版本，没有版本时返回None
+        """
+        self._versions = []
+        self._current = -1
+        self.total_bytes = 0
+        previous: Optional[DSLVersion] = None
+        for data in state.get("versions") or []:
+            dsl, items = data["dsl"], data["items"]
+            if previous is None:
+                size = _estimate_size(dsl) + _estimate_size(items)
+            else:
+                dsl, dsl_size = share_structure(dsl, previous.dsl)
+                items, items_size = share_structure(items, previous.items)
+                size = dsl_size + items_size
+            previous = DSLVersion(
+                number=data["number"],
+                dsl=dsl,
+                items=items,
+                size_bytes=size,
+                message=data.get("message", ""),
+                created_at=data.get("created_at", time.time())
+            )
+            self._versions.append(previous)
+            self.total_bytes += size
+        if not self._versions:
+            self._next_number = 1
+            return None
+
+        current = state.get("current")
+        self._current = next(
+            (i for i, version in enumerate(self._versions) if version.number == current),
+            len(self._versions) - 1
+        )
+        self._next_number = self._versions[-1].number + 1
+        self._evict()
+        return self.current
+
+    def _evict(self) -> None:
+        """淘汰最旧的版本，当前版本始终保留
+
+        共享的内存计在最先引入它的版本上。最旧的版本被淘汰后，
+        新的最旧版本独自持有它引用的全部数据，因此按完整大小重新计算。
+        """
+        while len(self._versions) > 1 and self._current > 0 and (
+            len(self._versions) > self.max_versions or self.total_bytes > self.max_bytes
+        ):
+            dropped = self._versions.pop(0)
+            self._current -= 1
+            self.total_bytes -= dropped.size_bytes
+            oldest = self._versions[0]
+            full_size = _estimate_size(oldest.dsl) + _estimate_size(oldest.items)
+            self.total_bytes += full_size - oldest.size_bytes
+            oldest.size_bytes = full_size
+            logger.info(f"DSL版本 {dropped.number} 超出版本库容量，已淘汰")
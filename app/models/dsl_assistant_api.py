@@ -2,15 +2,37 @@
 智能 DSL 助手 - API 版本
 直接使用 API 调用实现 DSL 文件的智能理解和编辑
 """
-from typing import List, Dict, Optional, Union, Any, Tuple
+from typing import List, Dict, Optional, Union, Any, Tuple, AsyncIterator
 import json
-import requests
+import asyncio
+import hashlib
+import httpx
 import os
 from dotenv import load_dotenv
 import logging
 from datetime import datetime
-import copy
-import time
+
+from app.agents.parallel_editor import ParallelDSLEditor, is_page_wide_instruction
+from app.core.admission import AdmissionRejected
+from app.core.config import settings
+from app.core.history import HistoryManager
+from app.core.metrics import metrics
+from app.core.prompt import PromptBuilder
+from app.core.resilience import backoff_delay, retry_after_seconds
+from app.core.tokens import estimate_tokens
+from app.core.model_client import get_model_client
+from app.core.response_cache import ResponseCache, get_response_cache, make_cache_key
+from app.core.singleflight import SingleFlight
+from app.dsl.json_patch import apply_patch, is_patch, JsonPatchError
+from app.dsl.json_repair import try_repair_json
+from app.dsl.json_stream import JSONExtractor, extract_json
+from app.dsl.canonical import canonical_json
+from app.dsl.codec import CODEC_PROMPT, DSLCodec, align, build_codec
+from app.dsl.context import ContextSelector, ScopedContext
+from app.dsl.merkle import MerkleIndex
+from app.dsl.schema import SchemaError, format_errors, get_validator
+from app.dsl.tree import separate_items, combine_items, replace_nodes
+from app.dsl.versions import DSLVersionStore, DSLVersion
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -18,21 +40,92 @@ logger = logging.getLogger(__name__)
 # 加载环境变量
 load_dotenv()
 
+# 所有会话共享，相同提示词的并发模型请求只发送一次
+_model_requests = SingleFlight("model_singleflight")
+
 class DSLError(Exception):
     """DSL处理相关的自定义异常"""
     pass
 
+# 系统提示词
+SYSTEM_PROMPT = """你是一个专业的低代码平台 DSL 助手。你的主要职责是：
+1. 理解用户提供的 DSL 结构，并确保修改后保持完整性
+2. 根据用户的自然语言描述精准修改 DSL
+3. 确保返回的 DSL 100% 符合 JSON 语法，避免任何格式错误
+
+**重要规则：**
+1. 如果用户要求修改DSL，你必须返回完整的JSON格式DSL
+2. 如果是普通对话（如询问、分析等），你应该返回普通文本
+3. 严禁在JSON中添加任何注释
+4. 确保返回的JSON中所有字段完整且正确
+
+**处理原则：**
+1. 修改DSL时：返回完整的JSON，不要有任何额外说明
+2. 普通对话时：返回清晰的文本描述，不要包含JSON
+3. 分析DSL时：返回结构化的文本描述，不要包含JSON"""
+
+# patch 编辑模式下追加到系统提示词的规则
+PATCH_MODE_PROMPT = """
+
+**编辑模式：JSON Patch**
+修改DSL时不要返回完整的DSL，只返回一个 RFC 6902 JSON Patch 操作数组，路径基于下方提供的当前DSL，例如：
+[{"op": "replace", "path": "/items/0/style/color", "value": "#ff0000"}]
+支持的操作：add、remove、replace、move、copy、test。只输出JSON数组，不要有任何额外说明。"""
+
+# DSL 超出上下文预算、只提供相关节点时追加到系统提示词的规则
+SCOPED_CONTEXT_PROMPT = """
+
+**上下文说明：**
+DSL较大，下方只提供了整体大纲和与本次请求相关的节点，每个节点都标注了它在完整DSL中的路径。
+修改DSL时不要返回完整的DSL，只返回被修改的节点，格式为 {"nodes": [修改后的完整节点JSON, ...]}，
+每个节点必须保留原有的 id。只输出JSON，不要有任何额外说明。"""
+
+# patch 模式下只提供相关节点时追加的规则
+SCOPED_PATCH_PROMPT = """
+
+**上下文说明：**
+DSL较大，下方只提供了整体大纲和与本次请求相关的节点。补丁路径必须基于完整DSL，
+以节点标注的路径为前缀，例如节点路径为 /items/2 时，修改它的颜色使用 /items/2/style/color。"""
+
+# 输出因长度上限被截断时，请求模型只续写剩余部分
+CONTINUE_PROMPT = """你上一条回复因长度限制被截断了。请从截断处继续输出剩余的内容，
+不要重复已经输出的部分，不要添加任何说明或代码块标记，直接从下一个字符开始。"""
+
+def _strip_fence_prefix(head: str) -> Optional[str]:
+    """
+    去掉续写内容开头的代码块标记
+    
+    Args:
+        head: 续写内容的开头部分
+        
+    Returns:
+        Optional[str]: 去掉标记后的内容，开头太短还无法判断时返回None
+    """
+    stripped = head.lstrip()
+    if not stripped:
+        return None
+    if stripped.startswith("```"):
+        newline = stripped.find("\n")
+        return None if newline == -1 else stripped[newline + 1:]
+    if "```".startswith(stripped):
+        return None
+    return head
+
 class DSLAssistantAPI:
-    def __init__(self, model_name: str = os.getenv("LOCAL_MODEL_NAME")):
+    def __init__(self, model_name: str = os.getenv("LOCAL_MODEL_NAME"), edit_mode: Optional[str] = None):
         """
         初始化 DSL 助手
         
         Args:
             model_name: 要使用的模型名称
+            edit_mode: 默认编辑模式，full（模型返回完整DSL）、patch（模型返回 JSON Patch）
+                或 parallel（按子树拆分并行修改），为空时使用配置项 DSL_EDIT_MODE
         """
         self.api_key = os.getenv("LOCAL_MODEL_API_KEY")
         self.api_base = os.getenv("LOCAL_MODEL_API_BASE")
         self.model_name = model_name
+        self.edit_mode = edit_mode or settings.DSL_EDIT_MODE
+        self.temperature = 0.3  # 降低温度以获得更确定性的输出
         
         # 设置API请求头
         self.headers = {
@@ -40,11 +133,18 @@ class DSLAssistantAPI:
             "Authorization": f"Bearer {self.api_key}"
         }
         
+        # 共享连接池的异步模型客户端
+        self.client = get_model_client(self.api_base, self.api_key)
+        
         # 系统提示词
         self.system_prompt = """你是一个专业的低代码平台 DSL 助手。"""
         
-        # 对话历史
+        # 对话历史，提示词中只包含历史管理器挑选的摘要和最近几轮对话
         self.chat_history: List[Dict[str, str]] = []
+        self.history = HistoryManager(settings.HISTORY_KEEP_TURNS, settings.HISTORY_TOKEN_CEILING, self._summarize)
+        
+        # 提示词构建器，记录相邻两轮提示词共享的前缀
+        self.prompt_builder = PromptBuilder()
         
         # 当前加载的 DSL 内容
         self.current_dsl: Optional[Dict] = None
@@ -52,90 +152,212 @@ class DSLAssistantAPI:
         # 分离的子级DSL内容
         self.separated_items: Dict[str, List[Dict]] = {}
         
+        # DSL 节点的 Merkle 摘要缓存，校验、缓存键、上下文选择和对齐只需处理变化的路径
+        self.merkle = MerkleIndex(settings.DSL_MERKLE_CACHE_SIZE)
+        
+        # DSL 版本库，支持撤销和重做
+        self.versions = DSLVersionStore(settings.DSL_VERSION_MAX_BYTES, settings.DSL_VERSION_MAX_COUNT)
+        
+        # DSL 超出 token 预算时按相关性挑选上下文
+        self.context_selector = ContextSelector(settings.DSL_CONTEXT_TOKEN_BUDGET)
+        
+        # 整页范围的修改按子树拆分并行请求模型
+        self.parallel_editor = ParallelDSLEditor(
+            settings.DSL_PARALLEL_EDIT_UNIT_TOKENS, settings.DSL_PARALLEL_EDIT_CONCURRENCY, self.temperature,
+            settings.DSL_PARALLEL_EDIT_RETRIES
+        )
+        
+        # 最近一次请求的响应类型：dsl（修改了DSL）或 text（普通对话），接口据此返回响应类型，无需再解析响应
+        self.last_response_type = "text"
+        
+        # 最近一次加载DSL失败的原因，结构校验失败时包含出错节点的路径
+        self.last_load_error: Optional[str] = None
+        
+        # 最近一次流式请求的结束原因，length 表示输出达到长度上限被截断
+        self.last_finish_reason: Optional[str] = None
+        
+        # 最近一次处理的模型输出是否因无法使用而被放弃（校验失败、补丁无法应用、被截断等），这样的输出不写入响应缓存
+        self.last_output_rejected = False
+        
         logger.info(f"DSL助手初始化完成，使用模型: {model_name}")
 
-    def _send_api_request(self, messages: List[Dict[str, str]], temperature: float = 0.7) -> Optional[Dict[str, Any]]:
+    def _request_fingerprint(self, messages: List[Dict[str, str]], temperature: float) -> str:
+        """
+        计算模型请求的指纹，模型服务、模型、消息和温度都相同的请求指纹相同
+        
+        Args:
+            messages: 对话消息列表
+            temperature: 温度参数
+            
+        Returns:
+            str: 请求指纹
+        """
+        parts = [self.api_base, self.model_name, temperature, messages]
+        return hashlib.blake2b(canonical_json(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+    async def _send_api_request(self, messages: List[Dict[str, str]], temperature: float = 0.7) -> Optional[Dict[str, Any]]:
+        """
+        发送API请求到语言模型服务
+        
+        其他会话或重复提交的相同请求正在进行时不再单独请求模型，而是等待同一个结果；
+        客户端断开时只取消自己的等待，所有等待方都离开后才取消模型请求
+        
+        Args:
+            messages: 对话消息列表
+            temperature: 温度参数，控制输出的随机性
+            
+        Returns:
+            Optional[Dict[str, Any]]: API响应数据，如果请求失败则返回None
+            
+        Raises:
+            AdmissionRejected: 模型服务繁忙，没有获得请求名额
+        """
+        if not settings.MODEL_SINGLEFLIGHT:
+            return await self._request_model(messages, temperature)
+        key = self._request_fingerprint(messages, temperature)
+        response = await _model_requests.do(key, lambda: self._request_model(messages, temperature))
+        # 每个调用方得到自己的副本
+        return dict(response) if response else response
+
+    async def _request_model(self, messages: List[Dict[str, str]], temperature: float = 0.7) -> Optional[Dict[str, Any]]:
         """
         发送API请求到语言模型服务，包含重试机制
         
+        只重试连接错误、超时和 MODEL_RETRY_STATUS_CODES 中的状态码，重试前按指数退避加随机抖动等待，
+        模型服务返回 Retry-After 时至少等待该时间；重试会消耗共享的重试预算，预算用完时不再重试
+        
         Args:
             messages: 对话消息列表
             temperature: 温度参数，控制输出的随机性
             
         Returns:
             Optional[Dict[str, Any]]: API响应数据，如果请求失败则返回None
+            
+        Raises:
+            AdmissionRejected: 模型服务繁忙或已熔断
         """
-        max_retries = 3
-        retry_delay = 5  # 重试间隔秒数
+        max_retries = max(1, settings.MODEL_MAX_RETRIES)
+        payload = {
+            "model": self.model_name,
+            "messages": messages,
+            "temperature": temperature
+        }
+        self.client.retry_budget.deposit()
         
-        for attempt in range(max_retries):
+        for attempt in range(1, max_retries + 1):
+            retry_after = None
             try:
-                payload = {
-                    "model": self.model_name,
-                    "messages": messages,
-                    "temperature": temperature
-                }
-                
-                logger.info(f"正在发送API请求到 {self.api_base}，第 {attempt + 1} 次尝试")
+                logger.info(f"正在发送API请求到 {self.api_base}，第 {attempt} 次尝试")
                 
-                response = requests.post(
-                    f"{self.api_base}/chat/completions",
-                    headers=self.headers,
-                    json=payload,
-                    timeout=60  # 增加超时时间到60秒
-                )
-                
-                response.raise_for_status()
-                result = response.json()
+                response = await self.client.post("/chat/completions", payload)
                 
-                if "choices" in result and len(result["choices"]) > 0:
-                    return {"text": result["choices"][0]["message"]["content"]}
+                if response.status_code in settings.MODEL_RETRY_STATUS_CODES:
+                    retry_after = retry_after_seconds(response.headers.get("Retry-After"))
+                    reason = f"模型服务返回 {response.status_code}"
+                    failure = f"模型服务持续返回 {response.status_code}，请稍后重试"
                 else:
-                    logger.error("API响应格式不正确")
-                    return None
+                    response.raise_for_status()
+                    result = response.json()
                     
-            except requests.exceptions.Timeout:
-                logger.warning(f"请求超时 (attempt {attempt + 1}/{max_retries})")
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
-                    continue
-                else:
-                    logger.error("连接模型服务器超时，请检查网络连接或服务器状态")
-                    return None
+                    if "choices" in result and len(result["choices"]) > 0:
+                        choice = result["choices"][0]
+                        return {"text": choice["message"]["content"], "finish_reason": choice.get("finish_reason")}
+                    else:
+                        logger.error("API响应格式不正确")
+                        return None
                     
-            except requests.exceptions.ConnectionError:
-                logger.warning(f"连接错误 (attempt {attempt + 1}/{max_retries})")
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
-                    continue
-                else:
-                    logger.error(f"无法连接到模型服务器 {self.api_base}，请检查服务器地址是否正确")
-                    return None
+            except httpx.TimeoutException:
+                reason = "请求超时"
+                failure = "连接模型服务器超时，请检查网络连接或服务器状态"
                     
-            except requests.exceptions.RequestException as e:
+            except httpx.TransportError:
+                reason = "连接错误"
+                failure = f"无法连接到模型服务器 {self.api_base}，请检查服务器地址是否正确"
+                    
+            except httpx.HTTPError as e:
                 logger.error(f"API请求失败: {str(e)}")
                 return None
                 
+            except AdmissionRejected:
+                # 模型服务繁忙或已熔断，交给接口返回 429/503，不在这里重试
+                raise
+                
             except Exception as e:
                 logger.error(f"处理API响应时发生错误: {str(e)}")
                 return None
+            
+            if attempt == max_retries:
+                logger.error(failure)
+                return None
+            if not self.client.retry_budget.withdraw():
+                metrics.inc("model_retry_budget_exhausted_total")
+                logger.error(f"{reason}，重试预算已用完，不再重试: {failure}")
+                return None
+            delay = backoff_delay(attempt, settings.MODEL_RETRY_DELAY, settings.MODEL_RETRY_MAX_DELAY)
+            if retry_after is not None:
+                delay = max(delay, min(retry_after, settings.MODEL_RETRY_MAX_DELAY))
+            metrics.inc("model_retries_total")
+            logger.warning(f"{reason} (attempt {attempt}/{max_retries})，{delay:.2f} 秒后重试")
+            await asyncio.sleep(delay)
 
-    def _validate_dsl(self, dsl: Dict) -> bool:
+    async def _summarize(self, messages: List[Dict[str, str]]) -> Optional[str]:
         """
-        验证DSL的基本结构是否正确
+        调用模型生成对话摘要，供历史管理器在后台使用
+        
+        Args:
+            messages: 摘要提示消息
+            
+        Returns:
+            Optional[str]: 摘要文本，请求失败时返回None
+        """
+        response = await self._send_api_request(messages, temperature=0.3)
+        if not response:
+            return None
+        return response.get("text", "").strip() or None
+
+    def _validate_dsl(self, dsl: Dict) -> List[SchemaError]:
+        """
+        按组件类型注册表校验整棵DSL树，以前校验通过且未变化的子树按 Merkle 摘要跳过
         
         Args:
             dsl: 要验证的DSL字典
             
         Returns:
-            bool: DSL是否有效
+            List[SchemaError]: 校验错误，DSL有效时为空列表
+        """
+        return get_validator().validate(dsl, index=self.merkle)
+
+    def _invalid_output(self, errors: List[SchemaError]) -> str:
+        """
+        记录模型输出的DSL未通过校验，生成返回给用户的说明
+        
+        Args:
+            errors: 校验错误
+            
+        Returns:
+            str: 错误说明
+        """
+        metrics.inc("dsl_validation_failures_total")
+        detail = format_errors(errors)
+        logger.warning(f"模型返回的DSL未通过结构校验: {detail}")
+        return self._reject_output(f"抱歉，模型返回的DSL未通过结构校验，已放弃修改：{detail}")
+
+    def _reject_output(self, reason: str) -> str:
+        """
+        记录本次模型输出无法使用，生成返回给用户的说明
+        
+        Args:
+            reason: 返回给用户的说明
+            
+        Returns:
+            str: 说明本身
         """
-        required_fields = ["type"]
-        return all(field in dsl for field in required_fields)
+        self.last_output_rejected = True
+        return reason
 
     def _separate_items(self, dsl: Dict, path: str = "") -> Tuple[Dict, Dict[str, List[Dict]]]:
         """
-        分离DSL中的items节点
+        分离DSL中的items节点，未变化的子树与输入共享，不再逐层深拷贝
         
         Args:
             dsl: DSL字典
@@ -144,28 +366,11 @@ class DSLAssistantAPI:
         Returns:
             Tuple[Dict, Dict[str, List[Dict]]]: 返回处理后的DSL和分离出的items
         """
-        result = copy.deepcopy(dsl)
-        separated = {}
-        
-        # 处理当前节点的items
-        if "items" in result:
-            items = result.pop("items")
-            current_path = f"{path}.items" if path else "items"
-            separated[current_path] = items
-        
-        # 递归处理children
-        if "children" in result:
-            for i, child in enumerate(result["children"]):
-                child_path = f"{path}.children[{i}]" if path else f"children[{i}]"
-                processed_child, child_items = self._separate_items(child, child_path)
-                result["children"][i] = processed_child
-                separated.update(child_items)
-        
-        return result, separated
+        return separate_items(dsl, path)
 
     def _combine_items(self, dsl: Dict, items: Dict[str, List[Dict]], path: str = "") -> Dict:
         """
-        重新组合DSL和items
+        重新组合DSL和items，未变化的子树与输入共享，不再逐层深拷贝
         
         Args:
             dsl: 处理后的DSL
@@ -175,20 +380,7 @@ class DSLAssistantAPI:
         Returns:
             Dict: 组合后的完整DSL
         """
-        result = copy.deepcopy(dsl)
-        
-        # 处理当前节点的items
-        current_path = f"{path}.items" if path else "items"
-        if current_path in items:
-            result["items"] = items[current_path]
-        
-        # 递归处理children
-        if "children" in result:
-            for i, child in enumerate(result["children"]):
-                child_path = f"{path}.children[{i}]" if path else f"children[{i}]"
-                result["children"][i] = self._combine_items(child, items, child_path)
-        
-        return result
+        return combine_items(dsl, items, path)
 
     def load_dsl(self, dsl_content: str) -> bool:
         """
@@ -202,6 +394,7 @@ class DSLAssistantAPI:
         """
         try:
             logger.info("开始加载DSL文件")
+            self.last_load_error = None
             
             # 清空对话历史和分离的items
             self.chat_history = []
@@ -211,11 +404,13 @@ class DSLAssistantAPI:
             parsed_dsl = json.loads(dsl_content)
             
             # 验证DSL结构
-            if not self._validate_dsl(parsed_dsl):
-                raise DSLError("DSL结构验证失败，缺少必要字段")
+            errors = self._validate_dsl(parsed_dsl)
+            if errors:
+                raise DSLError(f"DSL结构验证失败：{format_errors(errors)}")
             
             # 分离items
             self.current_dsl, self.separated_items = self._separate_items(parsed_dsl)
+            self.versions.reset(self.current_dsl, self.separated_items)
             
             # 将 DSL 加载事件添加到对话历史
             self.chat_history.append({
@@ -233,6 +428,10 @@ class DSLAssistantAPI:
         except json.JSONDecodeError as e:
             logger.error(f"DSL解析错误: {str(e)}")
             return False
+        except DSLError as e:
+            logger.error(str(e))
+            self.last_load_error = str(e)
+            return False
         except Exception as e:
             logger.error(f"加载DSL时发生未知错误: {str(e)}")
             return False
@@ -248,6 +447,75 @@ class DSLAssistantAPI:
             return {}
         return self._combine_items(self.current_dsl, self.separated_items)
 
+    def _update_dsl(self, dsl: Dict, message: str) -> None:
+        """
+        分离items并把修改后的DSL提交为新版本
+        
+        Args:
+            dsl: 修改后的完整DSL
+            message: 产生该版本的用户消息
+        """
+        separated_dsl, separated_items = self._separate_items(dsl)
+        version = self.versions.commit(separated_dsl, separated_items, message)
+        # 使用与上一版本共享结构后的数据，未变化的子树只保存一份
+        self.current_dsl, self.separated_items = version.dsl, version.items
+
+    def _restore_version(self, version: DSLVersion, note: str) -> Dict:
+        """
+        切换到指定版本并在对话历史中记录，使模型知道DSL已回退
+        
+        Args:
+            version: 目标版本
+            note: 记录到对话历史中的操作说明
+            
+        Returns:
+            Dict: 切换后的完整DSL
+        """
+        self.current_dsl, self.separated_items = version.dsl, version.items
+        self.chat_history.append({"role": "user", "content": note})
+        self.chat_history.append({"role": "assistant", "content": f"已{note}，当前DSL为版本 {version.number}。"})
+        logger.info(f"{note}，当前DSL版本: {version.number}")
+        return self.get_complete_dsl()
+
+    def undo(self) -> Optional[Dict]:
+        """
+        撤销上一次DSL修改
+        
+        Returns:
+            Optional[Dict]: 撤销后的完整DSL，没有可撤销的修改时返回None
+        """
+        version = self.versions.undo()
+        if version is None:
+            return None
+        return self._restore_version(version, "撤销上一次修改")
+
+    def redo(self) -> Optional[Dict]:
+        """
+        重做被撤销的DSL修改
+        
+        Returns:
+            Optional[Dict]: 重做后的完整DSL，没有可重做的修改时返回None
+        """
+        version = self.versions.redo()
+        if version is None:
+            return None
+        return self._restore_version(version, "重做被撤销的修改")
+
+    def get_dsl_version(self, number: int) -> Optional[Dict]:
+        """
+        获取指定版本的完整DSL
+        
+        Args:
+            number: 版本号
+            
+        Returns:
+            Optional[Dict]: 该版本的完整DSL，版本不存在或已被淘汰时返回None
+        """
+        version = self.versions.get(number)
+        if version is None:
+            return None
+        return self._combine_items(version.dsl, version.items)
+
     def _format_dsl_structure(self) -> str:
         """
         格式化DSL结构信息
@@ -288,7 +556,471 @@ class DSLAssistantAPI:
         
         return "\n".join(lines)
 
-    def process_request(self, message: str) -> str:
+    def _select_context(self, message: str) -> Optional[ScopedContext]:
+        """
+        DSL超出上下文预算时挑选与消息相关的子树
+        
+        Args:
+            message: 用户输入的消息
+            
+        Returns:
+            Optional[ScopedContext]: 裁剪后的上下文，应使用完整DSL时返回None
+        """
+        if self.context_selector.token_budget <= 0:
+            return None
+        return self.context_selector.select(self.get_complete_dsl(), message, self.merkle)
+
+    def _prompt_codec(self, edit_mode: str, scope: Optional[ScopedContext] = None) -> Optional[DSLCodec]:
+        """
+        为本次请求的DSL上下文生成紧凑编码器
+        
+        Args:
+            edit_mode: 编辑模式，patch 模式下补丁路径必须对应原始DSL，不使用紧凑编码
+            scope: 裁剪后的上下文，不为空时只为相关子树生成编码表
+            
+        Returns:
+            Optional[DSLCodec]: 编码器，关闭编码、patch 模式或编码不能缩短上下文时返回None
+        """
+        if not settings.DSL_PROMPT_CODEC or edit_mode == "patch":
+            return None
+        roots = scope.subtrees if scope is not None else [self.current_dsl]
+        return build_codec(roots, settings.DSL_CODEC_ALIAS_KEYS)
+
+    def _decode_output(self, value: Any, codec: Optional[DSLCodec], reference: Any) -> Any:
+        """
+        解码模型按紧凑编码返回的DSL或节点，并与原内容对齐
+        
+        Args:
+            value: 模型返回的JSON
+            codec: 本次请求使用的编码器，为空时原样返回
+            reference: 对应的原DSL或节点，未修改的部分直接复用
+            
+        Returns:
+            Any: 解码后的DSL或节点
+        """
+        if codec is None or not isinstance(value, dict):
+            return value
+        if "$codec" in value:
+            # 模型连同编码表一起返回时只取DSL本身
+            value = value.get("dsl", value)
+        decoded = codec.decode(value)
+        return align(decoded, reference, self.merkle) if reference is not None else decoded
+
+    def _build_messages(self, message: str, edit_mode: str = "full",
+                        scope: Optional[ScopedContext] = None,
+                        codec: Optional[DSLCodec] = None) -> List[Dict[str, str]]:
+        """
+        构建发送给模型的消息列表
+        
+        Args:
+            message: 用户输入的消息
+            edit_mode: 编辑模式，patch 模式下提供包含items的完整DSL并要求模型返回 JSON Patch
+            scope: 裁剪后的上下文，不为空时只发送大纲和相关子树
+            codec: 紧凑编码器，不为空时DSL按紧凑编码发送
+            
+        Returns:
+            List[Dict[str, str]]: 包含系统提示词、DSL上下文和对话历史的消息列表，
+            稳定的内容排在前面，便于推理服务复用前缀缓存
+        """
+        # 系统提示词按编辑模式拼接，同一模式下保持不变
+        system_prompt = SYSTEM_PROMPT
+        
+        # patch 模式下补丁路径基于完整DSL，模型才能定位items中的节点
+        context_dsl = self.current_dsl
+        if edit_mode == "patch":
+            system_prompt += PATCH_MODE_PROMPT
+            context_dsl = self.get_complete_dsl()
+        
+        if scope is not None:
+            system_prompt += SCOPED_PATCH_PROMPT if edit_mode == "patch" else SCOPED_CONTEXT_PROMPT
+        
+        if codec is not None:
+            system_prompt += CODEC_PROMPT
+        
+        # DSL上下文使用规范的紧凑序列化，内容不变时文本完全相同
+        if scope is not None:
+            dsl_context = f"当前DSL结构:\n{scope.render(codec)}"
+        elif codec is not None:
+            dsl_context = f"当前DSL结构:\n{canonical_json({**codec.tables(), 'dsl': codec.encode(context_dsl)})}"
+        else:
+            dsl_context = f"当前DSL结构:\n{canonical_json(context_dsl)}"
+        
+        # 稳定内容在前：系统提示词和DSL → 摘要和最近几轮对话 → 当前用户消息
+        messages = self.prompt_builder.build(
+            system_prompt, dsl_context, self.history.window(self.chat_history), message
+        )
+        
+        return messages
+
+    def _local_response(self, message: str) -> Optional[str]:
+        """
+        无需调用模型即可回答的请求
+        
+        Args:
+            message: 用户输入的消息
+            
+        Returns:
+            Optional[str]: 本地生成的响应，需要调用模型时返回None
+        """
+        if not self.current_dsl:
+            return "你好！我是DSL智能助手，我可以帮助你理解和修改DSL结构。目前没有加载任何DSL文件，你可以先使用load_dsl接口加载一个DSL文件。"
+        
+        if "分析" in message or "结构" in message:
+            return self._format_dsl_structure()
+        
+        return None
+
+    def _apply_patch_output(self, message: str, patch: Any) -> Optional[str]:
+        """
+        尝试把模型输出作为 JSON Patch 应用到完整DSL上
+        
+        Args:
+            message: 用户输入的消息
+            patch: 从模型输出中提取的JSON
+            
+        Returns:
+            Optional[str]: 应用成功时返回修改后的DSL JSON字符串，补丁无法应用时返回错误说明，
+            输出不是 JSON Patch 时返回None
+        """
+        if not is_patch(patch):
+            return None
+        
+        try:
+            modified_dsl = apply_patch(self.get_complete_dsl(), patch)
+        except JsonPatchError as e:
+            logger.warning(f"JSON Patch 应用失败: {str(e)}")
+            return self._reject_output(f"抱歉，模型返回的修改无法应用：{str(e)}")
+        
+        errors = self._validate_dsl(modified_dsl)
+        if errors:
+            return self._invalid_output(errors)
+        
+        # 更新DSL
+        self._update_dsl(modified_dsl, message)
+        self.last_response_type = "dsl"
+        
+        # 对话历史只记录补丁本身，避免每轮都保存完整DSL
+        self.chat_history.append({"role": "user", "content": message})
+        self.chat_history.append({"role": "assistant", "content": json.dumps(patch, ensure_ascii=False, separators=(",", ":"))})
+        
+        logger.info(f"已应用 JSON Patch，共 {len(patch)} 个操作")
+        return json.dumps(modified_dsl, ensure_ascii=False, indent=2)
+
+    def _apply_scoped_output(self, message: str, output: Any, scope: ScopedContext,
+                             codec: Optional[DSLCodec] = None) -> Optional[str]:
+        """
+        尝试把模型输出作为修改后的节点按ID合并回完整DSL
+        
+        Args:
+            message: 用户输入的消息
+            output: 从模型输出中提取的JSON
+            scope: 本次请求使用的裁剪上下文
+            codec: 本次请求使用的紧凑编码器，不为空时先解码返回的节点
+            
+        Returns:
+            Optional[str]: 合并成功时返回修改后的DSL JSON字符串，节点无法合并时返回错误说明，
+            输出不是节点修改时返回None
+        """
+        if not isinstance(output, dict):
+            return None
+        
+        if isinstance(output.get("nodes"), list):
+            nodes = output["nodes"]
+        elif output.get("id") in scope.node_ids:
+            # 模型直接返回了单个被修改的节点
+            nodes = [output]
+        else:
+            return None
+        
+        if codec is not None:
+            nodes = [
+                self._decode_output(node, codec, scope.subtree_by_id(node.get("id"))) if isinstance(node, dict) else node
+                for node in nodes
+            ]
+        
+        replacements = {}
+        for node in nodes:
+            if not isinstance(node, dict) or not node.get("id") or not node.get("type"):
+                return self._reject_output("抱歉，模型返回的节点缺少 id 或 type，已放弃修改。")
+            replacements[node["id"]] = node
+        
+        modified_dsl, replaced = replace_nodes(self.get_complete_dsl(), replacements)
+        if replaced < len(replacements):
+            return self._reject_output("抱歉，模型返回的节点在当前DSL中不存在，已放弃修改。")
+        # 替换后校验整棵树，节点之间的 id 重复和父子约束只有在完整DSL上才能发现
+        errors = self._validate_dsl(modified_dsl)
+        if errors:
+            return self._invalid_output(errors)
+        
+        # 更新DSL
+        self._update_dsl(modified_dsl, message)
+        self.last_response_type = "dsl"
+        
+        # 对话历史只记录被修改的节点
+        self.chat_history.append({"role": "user", "content": message})
+        self.chat_history.append({"role": "assistant", "content": json.dumps({"nodes": nodes}, ensure_ascii=False, separators=(",", ":"))})
+        
+        logger.info(f"已按ID合并 {replaced} 个被修改的节点")
+        return json.dumps(modified_dsl, ensure_ascii=False, indent=2)
+
+    def _output_acceptor(self, edit_mode: str, scope: Optional[ScopedContext] = None,
+                         codec: Optional[DSLCodec] = None):
+        """
+        生成判断模型输出中的JSON是否为本次请求所需结果的函数，供增量提取器使用
+        
+        Args:
+            edit_mode: 编辑模式
+            scope: 本次请求使用的裁剪上下文
+            codec: 本次请求使用的紧凑编码器
+            
+        Returns:
+            Callable[[Any], bool]: 值为 JSON Patch、被修改的节点或DSL时返回True，完整的结构校验在应用输出时进行
+        """
+        def accept(value: Any) -> bool:
+            if edit_mode == "patch" and is_patch(value):
+                return True
+            if not isinstance(value, dict):
+                return False
+            if scope is not None and (isinstance(value.get("nodes"), list) or value.get("id") in scope.node_ids):
+                return True
+            decoded = self._decode_output(value, codec, None)
+            return isinstance(decoded, dict) and isinstance(decoded.get("type"), str)
+        return accept
+
+    def _handle_model_output(self, message: str, raw_output: str, edit_mode: str = "full",
+                             scope: Optional[ScopedContext] = None, codec: Optional[DSLCodec] = None,
+                             extractor: Optional[JSONExtractor] = None, truncated: bool = False) -> str:
+        """
+        解析模型输出，更新DSL和对话历史
+        
+        Args:
+            message: 用户输入的消息
+            raw_output: 模型返回的原始文本
+            edit_mode: 编辑模式，patch 模式下优先把输出作为 JSON Patch 处理
+            scope: 本次请求使用的裁剪上下文，full 模式下优先把输出作为修改后的节点合并
+            codec: 本次请求使用的紧凑编码器，不为空时先解码模型返回的DSL
+            extractor: 流式读取输出时已经使用的提取器，为空时重新提取
+            truncated: 输出是否因长度上限被截断（续写之后仍未结束）
+            
+        Returns:
+            str: 修改后的DSL JSON字符串或普通对话文本
+        """
+        self.last_output_rejected = False
+        accept = self._output_acceptor(edit_mode, scope, codec)
+        if extractor is None:
+            extractor = extract_json(raw_output, accept)
+        
+        if extractor.has_result:
+            found, output = True, extractor.result
+            if extractor.result_fixes:
+                self._record_repair(extractor.result_fixes)
+        else:
+            found, output = self._repair_output(extractor, accept, truncated)
+        
+        if found:
+            if edit_mode == "patch":
+                patch_result = self._apply_patch_output(message, output)
+                if patch_result is not None:
+                    return patch_result
+            if scope is not None:
+                scoped_result = self._apply_scoped_output(message, output, scope, codec)
+                if scoped_result is not None:
+                    return scoped_result
+            
+            modified_dsl = self._decode_output(output, codec, self.get_complete_dsl())
+            if isinstance(modified_dsl, dict) and "type" in modified_dsl:
+                errors = self._validate_dsl(modified_dsl)
+                if errors:
+                    return self._invalid_output(errors)
+                
+                # 更新DSL
+                self._update_dsl(modified_dsl, message)
+                self.last_response_type = "dsl"
+                
+                # 更新对话历史
+                self.chat_history.append({"role": "user", "content": message})
+                self.chat_history.append({"role": "assistant", "content": json.dumps(modified_dsl, ensure_ascii=False)})
+                
+                return json.dumps(modified_dsl, ensure_ascii=False, indent=2)
+        
+        if truncated and extractor.pending():
+            return self._reject_output("抱歉，模型返回的DSL过长被截断，已放弃修改，请缩小修改范围后重试。")
+        
+        # 处理为普通对话，去掉其中的JSON和代码块标记
+        conversation_text = extractor.prose()
+        
+        # 更新对话历史
+        self.chat_history.append({"role": "user", "content": message})
+        self.chat_history.append({"role": "assistant", "content": conversation_text})
+        
+        return conversation_text
+
+    def _repair_output(self, extractor: JSONExtractor, accept, truncated: bool = False) -> Tuple[bool, Any]:
+        """
+        在本地修复模型输出中出错或未结束的JSON
+        
+        Args:
+            extractor: 读取了完整输出的提取器
+            accept: 判断修复结果是否为本次请求所需结果的函数
+            truncated: 输出是否因长度上限被截断，此时补齐括号会丢失被截断的内容，不使用这样的修复结果
+            
+        Returns:
+            Tuple[bool, Any]: 是否修复成功和修复后的值
+        """
+        start = extractor.broken_start()
+        if start is None:
+            return False, None
+        repaired = try_repair_json(extractor.text[start:])
+        if repaired is None or not accept(repaired.value) or (truncated and repaired.truncated):
+            metrics.inc("model_output_repair_failures_total")
+            logger.info("模型输出的JSON无法在本地修复")
+            return False, None
+        self._record_repair(repaired.fixes)
+        return True, repaired.value
+
+    def _record_repair(self, fixes: List[str]) -> None:
+        """记录本地修复的次数和类型"""
+        metrics.inc("model_output_repaired_total")
+        for fix in fixes:
+            metrics.inc(f"model_output_repair_{fix}_total")
+        logger.info(f"已在本地修复模型输出的JSON: {', '.join(fixes)}")
+
+    def _continuation_messages(self, messages: List[Dict[str, str]], partial_output: str) -> List[Dict[str, str]]:
+        """请求模型续写被截断输出的消息列表，前缀与原请求相同"""
+        return messages + [
+            {"role": "assistant", "content": partial_output},
+            {"role": "user", "content": CONTINUE_PROMPT}
+        ]
+
+    async def _continue_output(self, messages: List[Dict[str, str]], raw_output: str, extractor: JSONExtractor,
+                               finish_reason: Optional[str]) -> Tuple[str, bool]:
+        """
+        输出中的JSON因长度上限被截断时，请求模型只续写剩余的部分
+        
+        Args:
+            messages: 原请求的消息列表
+            raw_output: 已经得到的输出
+            extractor: 读取了已有输出的提取器，续写的内容会继续交给它
+            finish_reason: 原请求的结束原因
+            
+        Returns:
+            Tuple[str, bool]: 拼接续写之后的输出，以及输出是否仍被截断
+        """
+        for _ in range(settings.DSL_OUTPUT_MAX_CONTINUATIONS):
+            if finish_reason != "length" or extractor.has_result or not extractor.pending():
+                break
+            metrics.inc("model_output_continuations_total")
+            logger.info("模型输出被截断，请求续写剩余部分")
+            response = await self._send_api_request(
+                messages=self._continuation_messages(messages, raw_output),
+                temperature=self.temperature
+            )
+            if not response:
+                break
+            suffix = _strip_fence_prefix(response.get("text", "")) or ""
+            extractor.feed(suffix)
+            raw_output += suffix
+            finish_reason = response.get("finish_reason")
+        return raw_output, finish_reason == "length" and not extractor.has_result
+
+    def _use_parallel_edit(self, message: str, edit_mode: str) -> bool:
+        """
+        是否按子树拆分并行修改：parallel 模式总是并行修改；full 模式下只用于明确针对整个DSL的修改要求，
+        且DSL超过配置的大小
+        
+        Args:
+            message: 用户输入的消息
+            edit_mode: 编辑模式
+            
+        Returns:
+            bool: 是否并行修改
+        """
+        if not self.current_dsl:
+            return False
+        if edit_mode == "parallel":
+            return True
+        if settings.DSL_PARALLEL_EDIT_MIN_TOKENS <= 0 or edit_mode != "full":
+            return False
+        if not is_page_wide_instruction(message):
+            return False
+        return estimate_tokens(canonical_json(self.get_complete_dsl())) >= settings.DSL_PARALLEL_EDIT_MIN_TOKENS
+
+    async def _parallel_edit(self, message: str) -> str:
+        """
+        把DSL按子树拆分成多个部分同时请求模型修改，再组装成完整DSL
+        
+        Args:
+            message: 用户输入的消息
+            
+        Returns:
+            str: 修改后的DSL JSON字符串或错误说明
+        """
+        result = await self.parallel_editor.edit(self.get_complete_dsl(), message, self._send_api_request)
+        if not result.changed:
+            return "抱歉，并行修改DSL的请求全部失败，已放弃修改，请重试。"
+        
+        current = self.get_complete_dsl()
+        if result.dsl is current or self.merkle.digest(result.dsl) == self.merkle.digest(current):
+            # 没有任何部分发生变化，不提交新版本
+            note = "DSL中没有需要按要求修改的内容，未做任何修改"
+            self.chat_history.append({"role": "user", "content": message})
+            self.chat_history.append({"role": "assistant", "content": note})
+            return note
+        
+        errors = self._validate_dsl(result.dsl)
+        if errors:
+            return self._invalid_output(errors)
+        
+        # 更新DSL
+        self._update_dsl(result.dsl, message)
+        self.last_response_type = "dsl"
+        
+        # 对话历史只记录修改方式，最新的DSL会出现在之后的提示词中
+        note = f"已把DSL拆分为 {result.units} 个部分并行修改"
+        if result.failures:
+            note += f"，其中 {len(result.failures)} 个部分修改失败并保持原样"
+        self.chat_history.append({"role": "user", "content": message})
+        self.chat_history.append({"role": "assistant", "content": note})
+        
+        return json.dumps(result.dsl, ensure_ascii=False, indent=2)
+
+    def _cache_key(self, message: str, edit_mode: str) -> str:
+        """
+        计算本次请求的响应缓存键
+        
+        Args:
+            message: 用户输入的消息
+            edit_mode: 编辑模式
+            
+        Returns:
+            str: 由完整DSL、规范化指令、模型、温度、编辑模式和编码设置得到的缓存键
+        """
+        return make_cache_key(self.get_complete_dsl(), message, self.model_name, self.temperature, index=self.merkle,
+                              edit_mode=edit_mode, codec=settings.DSL_PROMPT_CODEC,
+                              alias_keys=settings.DSL_CODEC_ALIAS_KEYS)
+
+    async def _cache_output(self, cache: Optional[ResponseCache], cache_key: Optional[str], raw_output: str,
+                            cached: bool, truncated: bool) -> None:
+        """
+        处理完模型输出后更新响应缓存：只缓存通过校验、可以使用的输出，命中的缓存输出已无法使用时删除该条目
+        
+        Args:
+            cache: 响应缓存，跳过缓存时为None
+            cache_key: 缓存键
+            raw_output: 模型输出
+            cached: 输出是否来自缓存
+            truncated: 输出是否因长度上限被截断
+        """
+        if cache is None:
+            return
+        if self.last_output_rejected:
+            if cached:
+                logger.info("缓存的模型输出已无法使用，删除该缓存条目")
+                await cache.discard(cache_key)
+        elif not cached and not truncated:
+            await cache.aset(cache_key, raw_output)
+
+    async def process_request(self, message: str, edit_mode: Optional[str] = None, no_cache: bool = False) -> str:
         """
         处理用户请求，根据内容类型返回不同格式的响应：
         - 如果是普通对话，返回字符串
@@ -296,109 +1028,241 @@ class DSLAssistantAPI:
         
         Args:
             message: 用户输入的消息
+            edit_mode: 本次请求的编辑模式，为空时使用助手的默认编辑模式
+            no_cache: 为True时跳过响应缓存，总是请求模型
             
         Returns:
             str: 助手的响应消息或JSON字符串
         """
         try:
             logger.info(f"开始处理用户请求: {message[:100]}...")
+            self.last_response_type = "text"
             
             # 根据当前状态生成响应
-            if not self.current_dsl:
-                return "你好！我是DSL智能助手，我可以帮助你理解和修改DSL结构。目前没有加载任何DSL文件，你可以先使用load_dsl接口加载一个DSL文件。"
+            local_response = self._local_response(message)
+            if local_response is not None:
+                return local_response
             
-            if "分析" in message or "结构" in message:
-                return self._format_dsl_structure()
+            edit_mode = edit_mode or self.edit_mode
+            if self._use_parallel_edit(message, edit_mode):
+                return await self._parallel_edit(message)
+            if edit_mode == "parallel":
+                # 还没有加载DSL，没有可拆分的内容
+                edit_mode = "full"
             
-            # 准备API请求
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {self.api_key}"
-            }
+            scope = self._select_context(message)
+            codec = self._prompt_codec(edit_mode, scope)
             
-            # 构建系统提示词
-            system_prompt = """你是一个专业的低代码平台 DSL 助手。你的主要职责是：
-1. 理解用户提供的 DSL 结构，并确保修改后保持完整性
-2. 根据用户的自然语言描述精准修改 DSL
-3. 确保返回的 DSL 100% 符合 JSON 语法，避免任何格式错误
-
-**重要规则：**
-1. 如果用户要求修改DSL，你必须返回完整的JSON格式DSL
-2. 如果是普通对话（如询问、分析等），你应该返回普通文本
-3. 严禁在JSON中添加任何注释
-4. 确保返回的JSON中所有字段完整且正确
-
-**处理原则：**
-1. 修改DSL时：返回完整的JSON，不要有任何额外说明
-2. 普通对话时：返回清晰的文本描述，不要包含JSON
-3. 分析DSL时：返回结构化的文本描述，不要包含JSON"""
+            # 相同DSL上的相同指令直接使用缓存的模型输出
+            cache = None if no_cache else get_response_cache()
+            cache_key = self._cache_key(message, edit_mode) if cache is not None else None
+            raw_output = await cache.aget(cache_key) if cache is not None else None
+            cached = raw_output is not None
+            extractor = None
+            truncated = False
+            
+            if raw_output is None:
+                # 发送请求
+                messages = self._build_messages(message, edit_mode, scope, codec)
+                response = await self._send_api_request(
+                    messages=messages,
+                    temperature=self.temperature
+                )
+                
+                if not response:
+                    return "抱歉，处理请求时出现错误。"
+                
+                raw_output = response.get("text", "")
+                extractor = extract_json(raw_output, self._output_acceptor(edit_mode, scope, codec))
+                raw_output, truncated = await self._continue_output(
+                    messages, raw_output, extractor, response.get("finish_reason")
+                )
+            else:
+                logger.info("响应缓存命中，跳过模型请求")
             
-            # 构建对话历史
-            messages = [{"role": "system", "content": system_prompt}]
+            # 解析响应，输出通过校验后才写入缓存
+            result = self._handle_model_output(message, raw_output, edit_mode, scope, codec, extractor, truncated)
+            await self._cache_output(cache, cache_key, raw_output, cached, truncated)
+            self.history.schedule_compaction(lambda: self.chat_history)
+            return result
             
-            # 添加DSL上下文
-            dsl_context = f"当前DSL结构:\n{json.dumps(self.current_dsl, indent=2, ensure_ascii=False)}"
-            messages.append({"role": "assistant", "content": dsl_context})
+        except AdmissionRejected:
+            raise
+        except Exception as e:
+            error_msg = f"处理请求时发生错误: {str(e)}"
+            logger.error(error_msg)
+            return error_msg
+
+    async def _stream_api_request(self, messages: List[Dict[str, str]], temperature: float = 0.7) -> AsyncIterator[str]:
+        """
+        以 stream: true 方式请求模型服务，逐个产出模型生成的文本片段
+        
+        Args:
+            messages: 对话消息列表
+            temperature: 温度参数，控制输出的随机性
             
-            # 添加历史消息
-            messages.extend(self.chat_history)
+        Yields:
+            str: 模型生成的文本片段
+        """
+        payload = {
+            "model": self.model_name,
+            "messages": messages,
+            "temperature": temperature,
+            "stream": True
+        }
+        
+        logger.info(f"正在发送流式API请求到 {self.api_base}")
+        self.last_finish_reason = None
+        
+        async with self.client.stream("/chat/completions", payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    chunk = json.loads(data)
+                except json.JSONDecodeError:
+                    logger.warning(f"无法解析流式响应片段: {data[:100]}")
+                    continue
+                choices = chunk.get("choices") or []
+                if not choices:
+                    continue
+                if choices[0].get("finish_reason"):
+                    self.last_finish_reason = choices[0]["finish_reason"]
+                content = (choices[0].get("delta") or {}).get("content")
+                if content:
+                    yield content
+
+    async def _stream_into(self, messages: List[Dict[str, str]], extractor: JSONExtractor,
+                           continuation: bool = False) -> AsyncIterator[str]:
+        """
+        流式请求模型并把输出交给提取器，拿到需要的结果或JSON已不可能合法时关闭连接，推理服务随之停止生成
+        
+        Args:
+            messages: 对话消息列表
+            extractor: 增量JSON提取器
+            continuation: 是否为续写请求，续写内容开头的代码块标记会被去掉
             
-            # 添加当前用户消息
-            messages.append({"role": "user", "content": message})
+        Yields:
+            str: 模型生成的文本片段
+        """
+        head = "" if continuation else None
+        stream = self._stream_api_request(messages=messages, temperature=self.temperature)
+        try:
+            async for token in stream:
+                if head is not None:
+                    # 续写的开头可能重复代码块标记，判断清楚之前先缓存
+                    head += token
+                    token = _strip_fence_prefix(head)
+                    if token is None:
+                        continue
+                    head = None
+                yield token
+                extractor.feed(token)
+                if extractor.has_result:
+                    metrics.inc("model_output_early_stop_total")
+                    break
+                if extractor.malformed:
+                    break
+            else:
+                if head and head.strip() and not head.lstrip().startswith("`"):
+                    yield head
+                    extractor.feed(head)
+        finally:
+            await stream.aclose()
+
+    async def process_request_stream(self, message: str, edit_mode: Optional[str] = None,
+                                     no_cache: bool = False) -> AsyncIterator[Tuple[str, str]]:
+        """
+        流式处理用户请求，模型生成的文本片段会立即产出
+        
+        Args:
+            message: 用户输入的消息
+            edit_mode: 本次请求的编辑模式，为空时使用助手的默认编辑模式
+            no_cache: 为True时跳过响应缓存，总是请求模型
             
-            # 发送请求
-            response = self._send_api_request(
-                messages=messages,
-                temperature=0.3  # 降低温度以获得更确定性的输出
-            )
+        Yields:
+            Tuple[str, str]: ("token", 文本片段)，最后产出一次 ("result", 完整响应)，
+            完整响应与 process_request 的返回值一致
+        """
+        try:
+            logger.info(f"开始流式处理用户请求: {message[:100]}...")
+            self.last_response_type = "text"
             
-            if not response:
-                return "抱歉，处理请求时出现错误。"
+            local_response = self._local_response(message)
+            if local_response is not None:
+                yield "token", local_response
+                yield "result", local_response
+                return
             
-            # 解析响应
-            raw_output = response.get("text", "")
+            edit_mode = edit_mode or self.edit_mode
+            if self._use_parallel_edit(message, edit_mode):
+                # 各部分的输出需要组装后才有意义，完成后一次性产出
+                result = await self._parallel_edit(message)
+                yield "token", result
+                yield "result", result
+                return
             
-            # 检查是否包含JSON结构
-            json_start = raw_output.find("{")
-            json_end = raw_output.rfind("}") + 1
+            if edit_mode == "parallel":
+                edit_mode = "full"
             
-            if json_start != -1 and json_end != -1:
-                try:
-                    # 尝试解析JSON
-                    dsl_json_str = raw_output[json_start:json_end]
-                    modified_dsl = json.loads(dsl_json_str)
-                    
-                    # 验证是否是有效的DSL
-                    if self._validate_dsl(modified_dsl):
-                        # 更新DSL
-                        self.current_dsl, self.separated_items = self._separate_items(modified_dsl)
-                        
-                        # 更新对话历史
-                        self.chat_history.append({"role": "user", "content": message})
-                        self.chat_history.append({"role": "assistant", "content": json.dumps(modified_dsl, ensure_ascii=False)})
-                        
-                        return json.dumps(modified_dsl, ensure_ascii=False, indent=2)
-                except json.JSONDecodeError:
-                    # 如果不是有效的JSON，当作普通对话处理
-                    pass
+            scope = self._select_context(message)
+            codec = self._prompt_codec(edit_mode, scope)
+            cache = None if no_cache else get_response_cache()
+            cache_key = self._cache_key(message, edit_mode) if cache is not None else None
+            raw_output = await cache.aget(cache_key) if cache is not None else None
+            cached = raw_output is not None
+            extractor = None
+            truncated = False
             
-            # 处理为普通对话
-            # 移除可能的JSON格式内容
-            if json_start != -1 and json_end != -1:
-                conversation_text = raw_output[:json_start].strip() + " " + raw_output[json_end:].strip()
+            if raw_output is not None:
+                # 缓存命中时一次性产出完整输出
+                logger.info("响应缓存命中，跳过模型请求")
+                yield "token", raw_output
             else:
-                conversation_text = raw_output.strip()
-            
-            # 更新对话历史
-            self.chat_history.append({"role": "user", "content": message})
-            self.chat_history.append({"role": "assistant", "content": conversation_text})
+                # 边接收边提取JSON：拿到需要的结果，或返回的JSON已不可能合法时立即停止生成
+                extractor = JSONExtractor(self._output_acceptor(edit_mode, scope, codec))
+                messages = self._build_messages(message, edit_mode, scope, codec)
+                async for token in self._stream_into(messages, extractor):
+                    yield "token", token
+                
+                # 输出因长度上限被截断时请求模型只续写剩余的部分
+                continuations = 0
+                while (self.last_finish_reason == "length" and not extractor.has_result and extractor.pending()
+                       and continuations < settings.DSL_OUTPUT_MAX_CONTINUATIONS):
+                    continuations += 1
+                    metrics.inc("model_output_continuations_total")
+                    logger.info("模型输出被截断，请求续写剩余部分")
+                    async for token in self._stream_into(
+                        self._continuation_messages(messages, extractor.text), extractor, continuation=True
+                    ):
+                        yield "token", token
+                raw_output = extractor.text
+                truncated = self.last_finish_reason == "length" and not extractor.has_result
+                
+                if extractor.malformed:
+                    metrics.inc("model_output_aborted_total")
+                    logger.warning(f"模型输出的JSON无效，已提前停止生成: {extractor.error_detail}")
+                    yield "result", "抱歉，模型返回的DSL格式错误，已停止生成，请重试。"
+                    return
             
-            return conversation_text
+            result = self._handle_model_output(message, raw_output, edit_mode, scope, codec, extractor, truncated)
+            await self._cache_output(cache, cache_key, raw_output, cached, truncated)
+            self.history.schedule_compaction(lambda: self.chat_history)
+            yield "result", result
             
+        except AdmissionRejected:
+            raise
+        except httpx.HTTPError as e:
+            logger.error(f"流式API请求失败: {str(e)}")
+            yield "result", "抱歉，处理请求时出现错误。"
         except Exception as e:
             error_msg = f"处理请求时发生错误: {str(e)}"
             logger.error(error_msg)
-            return error_msg
+            yield "result", error_msg
     
     def get_chat_history(self) -> List[Dict[str, str]]:
         """
@@ -413,3 +1277,35 @@ class DSLAssistantAPI:
         """清空对话历史"""
         self.chat_history = []
         logger.info("对话历史已清空")
+
+    def export_state(self) -> Dict[str, Any]:
+        """
+        导出会话状态，用于持久化到会话存储
+        
+        Returns:
+            Dict[str, Any]: 包含当前DSL、分离的items、DSL版本库和对话历史的会话状态
+        """
+        return {
+            "current_dsl": self.current_dsl,
+            "separated_items": self.separated_items,
+            "dsl_versions": self.versions.export_state(),
+            "chat_history": self.chat_history
+        }
+    
+    def import_state(self, state: Dict[str, Any]) -> None:
+        """
+        从会话存储恢复会话状态
+        
+        Args:
+            state: export_state 导出的会话状态
+        """
+        self.current_dsl = state.get("current_dsl")
+        self.separated_items = state.get("separated_items") or {}
+        self.chat_history = list(state.get("chat_history") or [])
+        current = self.versions.import_state(state.get("dsl_versions") or {})
+        if current is not None:
+            # 使用版本库中共享结构后的数据，未变化的子树只保存一份
+            self.current_dsl, self.separated_items = current.dsl, current.items
+        elif self.current_dsl:
+            # 没有保存版本库的旧会话，以恢复的DSL作为第一个版本
+            self.versions.reset(self.current_dsl, self.separated_items, "从会话存储恢复")
@@ -2,20 +2,33 @@
 智能 DSL 助手 - LangChain 版本
 使用 LangChain 框架实现 DSL 文件的智能理解和编辑
 """
-from typing import List, Dict, Optional, Union, Any, Tuple
+from typing import List, Dict, Optional, Union, Any, Tuple, AsyncIterator
 import os
 import json
+import asyncio
 from dotenv import load_dotenv
 from langchain_community.chat_models import ChatOpenAI
 from langchain.schema import SystemMessage, HumanMessage, AIMessage
-from langchain.memory import ConversationBufferMemory
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.chains import LLMChain
 from langchain.tools import Tool
 from langchain.agents import initialize_agent, AgentType
-import copy
+from langchain.callbacks.streaming_aiter import AsyncIteratorCallbackHandler
 import logging
 
+from app.core.config import settings
+from app.core.history import HistoryManager
+from app.core.metrics import metrics
+from app.core.response_cache import ResponseCache, get_response_cache, make_cache_key
+from app.dsl.canonical import canonical_json
+from app.dsl.codec import CODEC_PROMPT, DSLCodec, align, build_codec
+from app.dsl.json_repair import try_repair_json
+from app.dsl.json_stream import JSONExtractor, extract_json
+from app.dsl.merkle import MerkleIndex
+from app.dsl.schema import SchemaError, format_errors, get_validator
+from app.dsl.tree import separate_items, combine_items
+from app.dsl.versions import DSLVersionStore, DSLVersion
+
 # 配置日志
 logger = logging.getLogger(__name__)
 
@@ -38,6 +51,7 @@ class DSLAssistant:
             openai_api_key=self.api_key,
             openai_api_base=self.api_base,
             temperature=0.3,  # 降低温度以获得更确定性的输出
+            streaming=True,  # 启用流式输出，供 process_request_stream 的回调使用
         )
         
         # 创建系统提示词
@@ -58,11 +72,9 @@ class DSLAssistant:
 3. 分析DSL时：返回结构化的文本描述，不要包含JSON
 """
         
-        # 初始化记忆系统
-        self.memory = ConversationBufferMemory(
-            return_messages=True,
-            memory_key="chat_history"
-        )
+        # 对话历史，每次请求由历史管理器挑选摘要和最近几轮对话显式传给对话链
+        self.chat_history: List[Dict[str, str]] = []
+        self.history = HistoryManager(settings.HISTORY_KEEP_TURNS, settings.HISTORY_TOKEN_CEILING, self._summarize)
         
         # 创建基本对话链
         self.chain = LLMChain(
@@ -72,7 +84,6 @@ class DSLAssistant:
                 MessagesPlaceholder(variable_name="chat_history"),
                 ("human", "{input}")
             ]),
-            memory=self.memory,
             verbose=True
         )
         
@@ -82,24 +93,38 @@ class DSLAssistant:
         # 分离的子级DSL内容
         self.separated_items: Dict[str, List[Dict]] = {}
         
+        # DSL 节点的 Merkle 摘要缓存，校验和缓存键只需处理变化的路径
+        self.merkle = MerkleIndex(settings.DSL_MERKLE_CACHE_SIZE)
+        
+        # DSL 版本库，支持撤销和重做
+        self.versions = DSLVersionStore(settings.DSL_VERSION_MAX_BYTES, settings.DSL_VERSION_MAX_COUNT)
+        
+        # 最近一次请求的响应类型：dsl（修改了DSL）或 text（普通对话）
+        self.last_response_type = "text"
+        
+        # 最近一次加载DSL失败的原因，结构校验失败时包含出错节点的路径
+        self.last_load_error: Optional[str] = None
+        
+        # 最近一次处理的模型输出是否因未通过校验而被放弃，这样的输出不写入响应缓存
+        self.last_output_rejected = False
+        
         logger.info(f"DSL助手初始化完成，使用模型: {model_name}")
 
-    def _validate_dsl(self, dsl: Dict) -> bool:
+    def _validate_dsl(self, dsl: Dict) -> List[SchemaError]:
         """
-        验证DSL的基本结构是否正确
+        按组件类型注册表校验整棵DSL树，以前校验通过且未变化的子树按 Merkle 摘要跳过
         
         Args:
             dsl: 要验证的DSL字典
             
         Returns:
-            bool: DSL是否有效
+            List[SchemaError]: 校验错误，DSL有效时为空列表
         """
-        required_fields = ["type"]
-        return all(field in dsl for field in required_fields)
+        return get_validator().validate(dsl, index=self.merkle)
 
     def _separate_items(self, dsl: Dict, path: str = "") -> Tuple[Dict, Dict[str, List[Dict]]]:
         """
-        分离DSL中的items节点
+        分离DSL中的items节点，未变化的子树与输入共享，不再逐层深拷贝
         
         Args:
             dsl: DSL字典
@@ -108,28 +133,11 @@ class DSLAssistant:
         Returns:
             Tuple[Dict, Dict[str, List[Dict]]]: 返回处理后的DSL和分离出的items
         """
-        result = copy.deepcopy(dsl)
-        separated = {}
-        
-        # 处理当前节点的items
-        if "items" in result:
-            items = result.pop("items")
-            current_path = f"{path}.items" if path else "items"
-            separated[current_path] = items
-        
-        # 递归处理children
-        if "children" in result:
-            for i, child in enumerate(result["children"]):
-                child_path = f"{path}.children[{i}]" if path else f"children[{i}]"
-                processed_child, child_items = self._separate_items(child, child_path)
-                result["children"][i] = processed_child
-                separated.update(child_items)
-        
-        return result, separated
+        return separate_items(dsl, path)
 
     def _combine_items(self, dsl: Dict, items: Dict[str, List[Dict]], path: str = "") -> Dict:
         """
-        重新组合DSL和items
+        重新组合DSL和items，未变化的子树与输入共享，不再逐层深拷贝
         
         Args:
             dsl: 处理后的DSL
@@ -139,20 +147,7 @@ class DSLAssistant:
         Returns:
             Dict: 组合后的完整DSL
         """
-        result = copy.deepcopy(dsl)
-        
-        # 处理当前节点的items
-        current_path = f"{path}.items" if path else "items"
-        if current_path in items:
-            result["items"] = items[current_path]
-        
-        # 递归处理children
-        if "children" in result:
-            for i, child in enumerate(result["children"]):
-                child_path = f"{path}.children[{i}]" if path else f"children[{i}]"
-                result["children"][i] = self._combine_items(child, items, child_path)
-        
-        return result
+        return combine_items(dsl, items, path)
 
     def _format_dsl_structure(self) -> str:
         """
@@ -206,24 +201,27 @@ class DSLAssistant:
         """
         try:
             logger.info("开始加载DSL文件")
+            self.last_load_error = None
             
             # 清空对话历史和分离的items
-            self.memory.clear()
+            self.chat_history = []
             self.separated_items = {}
             
             # 解析DSL
             parsed_dsl = json.loads(dsl_content)
             
             # 验证DSL结构
-            if not self._validate_dsl(parsed_dsl):
-                raise DSLError("DSL结构验证失败，缺少必要字段")
+            errors = self._validate_dsl(parsed_dsl)
+            if errors:
+                raise DSLError(f"DSL结构验证失败：{format_errors(errors)}")
             
             # 分离items
             self.current_dsl, self.separated_items = self._separate_items(parsed_dsl)
+            self.versions.reset(self.current_dsl, self.separated_items)
             
             # 将 DSL 加载事件添加到对话历史
-            self.memory.chat_memory.add_user_message(f"我已经加载了以下 DSL:\n{json.dumps(self.current_dsl, indent=2, ensure_ascii=False)}")
-            self.memory.chat_memory.add_ai_message("DSL 已成功加载，我可以帮您分析和修改它。")
+            self._record_turn(f"我已经加载了以下 DSL:\n{json.dumps(self.current_dsl, indent=2, ensure_ascii=False)}",
+                              "DSL 已成功加载，我可以帮您分析和修改它。")
             
             logger.info(f"DSL文件加载成功，分离出 {len(self.separated_items)} 个items节点")
             return True
@@ -231,6 +229,10 @@ class DSLAssistant:
         except json.JSONDecodeError as e:
             logger.error(f"DSL解析错误: {str(e)}")
             return False
+        except DSLError as e:
+            logger.error(str(e))
+            self.last_load_error = str(e)
+            return False
         except Exception as e:
             logger.error(f"加载DSL时发生未知错误: {str(e)}")
             return False
@@ -245,8 +247,269 @@ class DSLAssistant:
         if not self.current_dsl:
             return {}
         return self._combine_items(self.current_dsl, self.separated_items)
+
+    def _update_dsl(self, dsl: Dict, message: str) -> None:
+        """
+        分离items并把修改后的DSL提交为新版本
+        
+        Args:
+            dsl: 修改后的完整DSL
+            message: 产生该版本的用户消息
+        """
+        separated_dsl, separated_items = self._separate_items(dsl)
+        version = self.versions.commit(separated_dsl, separated_items, message)
+        # 使用与上一版本共享结构后的数据，未变化的子树只保存一份
+        self.current_dsl, self.separated_items = version.dsl, version.items
+
+    def _restore_version(self, version: DSLVersion, note: str) -> Dict:
+        """
+        切换到指定版本并在对话历史中记录，使模型知道DSL已回退
+        
+        Args:
+            version: 目标版本
+            note: 记录到对话历史中的操作说明
+            
+        Returns:
+            Dict: 切换后的完整DSL
+        """
+        self.current_dsl, self.separated_items = version.dsl, version.items
+        self._record_turn(note, f"已{note}，当前DSL为版本 {version.number}。")
+        logger.info(f"{note}，当前DSL版本: {version.number}")
+        return self.get_complete_dsl()
+
+    def undo(self) -> Optional[Dict]:
+        """
+        撤销上一次DSL修改
+        
+        Returns:
+            Optional[Dict]: 撤销后的完整DSL，没有可撤销的修改时返回None
+        """
+        version = self.versions.undo()
+        if version is None:
+            return None
+        return self._restore_version(version, "撤销上一次修改")
+
+    def redo(self) -> Optional[Dict]:
+        """
+        重做被撤销的DSL修改
+        
+        Returns:
+            Optional[Dict]: 重做后的完整DSL，没有可重做的修改时返回None
+        """
+        version = self.versions.redo()
+        if version is None:
+            return None
+        return self._restore_version(version, "重做被撤销的修改")
+
+    def get_dsl_version(self, number: int) -> Optional[Dict]:
+        """
+        获取指定版本的完整DSL
+        
+        Args:
+            number: 版本号
+            
+        Returns:
+            Optional[Dict]: 该版本的完整DSL，版本不存在或已被淘汰时返回None
+        """
+        version = self.versions.get(number)
+        if version is None:
+            return None
+        return self._combine_items(version.dsl, version.items)
     
-    def process_request(self, user_input: str) -> str:
+    def _local_response(self, user_input: str) -> Optional[str]:
+        """
+        无需调用模型即可回答的请求
+        
+        Args:
+            user_input: 用户输入的消息
+            
+        Returns:
+            Optional[str]: 本地生成的响应，需要调用模型时返回None
+        """
+        if not self.current_dsl:
+            return "你好！我是DSL智能助手，我可以帮助你理解和修改DSL结构。目前没有加载任何DSL文件，你可以先使用load_dsl接口加载一个DSL文件。"
+        
+        if "分析" in user_input or "结构" in user_input:
+            return self._format_dsl_structure()
+        
+        return None
+
+    def _record_turn(self, user_input: str, output: str) -> None:
+        """
+        记录一轮对话
+        
+        Args:
+            user_input: 用户输入的消息
+            output: 助手的回复
+        """
+        self.chat_history.append({"role": "user", "content": user_input})
+        self.chat_history.append({"role": "assistant", "content": output})
+
+    def _prompt_codec(self) -> Optional[DSLCodec]:
+        """
+        为当前DSL生成紧凑编码器
+        
+        Returns:
+            Optional[DSLCodec]: 编码器，关闭编码或编码不能缩短上下文时返回None
+        """
+        if not settings.DSL_PROMPT_CODEC:
+            return None
+        return build_codec([self.current_dsl], settings.DSL_CODEC_ALIAS_KEYS)
+
+    def _chain_inputs(self, user_input: str, codec: Optional[DSLCodec] = None) -> Dict[str, Any]:
+        """
+        构建对话链的输入：当前DSL作为上下文，历史只取摘要和最近几轮对话
+        
+        Args:
+            user_input: 用户输入的消息
+            codec: 紧凑编码器，不为空时DSL按紧凑编码发送
+            
+        Returns:
+            Dict[str, Any]: 对话链的输入变量
+        """
+        # DSL紧跟在固定的系统提示词之后，使用规范的紧凑序列化，便于推理服务复用前缀缓存
+        if codec is not None:
+            encoded = canonical_json({**codec.tables(), "dsl": codec.encode(self.current_dsl)})
+            messages = [AIMessage(content=f"{CODEC_PROMPT.strip()}\n\n当前DSL结构:\n{encoded}")]
+        else:
+            messages = [AIMessage(content=f"当前DSL结构:\n{canonical_json(self.current_dsl)}")]
+        for message in self.history.window(self.chat_history):
+            if message["role"] == "user":
+                messages.append(HumanMessage(content=message["content"]))
+            elif message["role"] == "assistant":
+                messages.append(AIMessage(content=message["content"]))
+            else:
+                messages.append(SystemMessage(content=message["content"]))
+        return {"input": user_input, "chat_history": messages}
+
+    async def _summarize(self, messages: List[Dict[str, str]]) -> Optional[str]:
+        """
+        调用模型生成对话摘要，供历史管理器在后台使用
+        
+        Args:
+            messages: 摘要提示消息
+            
+        Returns:
+            Optional[str]: 摘要文本
+        """
+        result = await self.chat.ainvoke([
+            SystemMessage(content=messages[0]["content"]),
+            HumanMessage(content=messages[1]["content"])
+        ])
+        return result.content.strip() or None
+
+    def _decode_output(self, value: Any, codec: Optional[DSLCodec]) -> Any:
+        """解码模型按紧凑编码返回的DSL，未修改的部分复用当前DSL"""
+        if codec is None or not isinstance(value, dict):
+            return value
+        if "$codec" in value:
+            # 模型连同编码表一起返回时只取DSL本身
+            value = value.get("dsl", value)
+        return align(codec.decode(value), self.current_dsl)
+
+    def _output_acceptor(self, codec: Optional[DSLCodec] = None):
+        """
+        生成判断模型输出中的JSON是否为合法DSL的函数，供增量提取器使用
+        
+        Args:
+            codec: 本次请求使用的紧凑编码器
+            
+        Returns:
+            Callable[[Any], bool]: 值为DSL时返回True，完整的结构校验在应用输出时进行
+        """
+        def accept(value: Any) -> bool:
+            if not isinstance(value, dict):
+                return False
+            decoded = self._decode_output(value, codec)
+            return isinstance(decoded, dict) and isinstance(decoded.get("type"), str)
+        return accept
+
+    def _handle_model_output(self, user_input: str, raw_output: str, codec: Optional[DSLCodec] = None,
+                             extractor: Optional[JSONExtractor] = None) -> str:
+        """
+        解析模型输出并更新DSL，对话历史由调用方记录
+        
+        Args:
+            user_input: 用户输入的消息
+            raw_output: 模型返回的原始文本
+            codec: 本次请求使用的紧凑编码器，不为空时先解码模型返回的DSL
+            extractor: 流式读取输出时已经使用的提取器，为空时重新提取
+            
+        Returns:
+            str: 修改后的DSL JSON字符串或普通对话文本
+        """
+        self.last_output_rejected = False
+        accept = self._output_acceptor(codec)
+        if extractor is None:
+            extractor = extract_json(raw_output, accept)
+        
+        output = extractor.result
+        fixes = extractor.result_fixes
+        if not extractor.has_result and extractor.broken_start() is not None:
+            # 出错或未结束的JSON先在本地修复
+            repaired = try_repair_json(extractor.text[extractor.broken_start():])
+            if repaired is not None and accept(repaired.value):
+                output, fixes = repaired.value, repaired.fixes
+            else:
+                metrics.inc("model_output_repair_failures_total")
+        if fixes:
+            metrics.inc("model_output_repaired_total")
+            for fix in fixes:
+                metrics.inc(f"model_output_repair_{fix}_total")
+            logger.info(f"已在本地修复模型输出的JSON: {', '.join(fixes)}")
+        
+        if output is not None:
+            modified_dsl = self._decode_output(output, codec)
+            errors = self._validate_dsl(modified_dsl)
+            if errors:
+                metrics.inc("dsl_validation_failures_total")
+                detail = format_errors(errors)
+                logger.warning(f"模型返回的DSL未通过结构校验: {detail}")
+                self.last_output_rejected = True
+                return f"抱歉，模型返回的DSL未通过结构校验，已放弃修改：{detail}"
+            
+            # 更新DSL
+            self._update_dsl(modified_dsl, user_input)
+            self.last_response_type = "dsl"
+            return json.dumps(modified_dsl, ensure_ascii=False, indent=2)
+        
+        # 处理为普通对话，去掉其中的JSON和代码块标记
+        return extractor.prose()
+
+    async def _cache_output(self, cache: Optional[ResponseCache], cache_key: Optional[str], raw_output: str,
+                            cached: bool) -> None:
+        """
+        处理完模型输出后更新响应缓存：只缓存通过校验的输出，命中的缓存输出未通过校验时删除该条目
+        
+        Args:
+            cache: 响应缓存，跳过缓存时为None
+            cache_key: 缓存键
+            raw_output: 模型输出
+            cached: 输出是否来自缓存
+        """
+        if cache is None:
+            return
+        if self.last_output_rejected:
+            if cached:
+                await cache.discard(cache_key)
+        elif not cached:
+            await cache.aset(cache_key, raw_output)
+
+    def _cache_key(self, user_input: str) -> str:
+        """
+        计算本次请求的响应缓存键
+        
+        Args:
+            user_input: 用户输入的消息
+            
+        Returns:
+            str: 由完整DSL、规范化指令、模型、温度和编码设置得到的缓存键
+        """
+        return make_cache_key(self.get_complete_dsl(), user_input, self.chat.model_name, self.chat.temperature,
+                              index=self.merkle, codec=settings.DSL_PROMPT_CODEC,
+                              alias_keys=settings.DSL_CODEC_ALIAS_KEYS)
+
+    async def process_request(self, user_input: str, no_cache: bool = False) -> str:
         """
         处理用户请求，根据内容类型返回不同格式的响应：
         - 如果是普通对话，返回字符串
@@ -254,56 +517,131 @@ class DSLAssistant:
         
         Args:
             user_input: 用户输入的消息
+            no_cache: 为True时跳过响应缓存，总是调用对话链
             
         Returns:
             str: 助手的响应消息或JSON字符串
         """
         try:
             logger.info(f"开始处理用户请求: {user_input[:100]}...")
+            self.last_response_type = "text"
             
             # 根据当前状态生成响应
-            if not self.current_dsl:
-                return "你好！我是DSL智能助手，我可以帮助你理解和修改DSL结构。目前没有加载任何DSL文件，你可以先使用load_dsl接口加载一个DSL文件。"
-            
-            if "分析" in user_input or "结构" in user_input:
-                return self._format_dsl_structure()
-            
-            # 使用对话链处理请求
-            chain_response = self.chain({"input": user_input})  # 改为同步调用
-            raw_output = chain_response["text"]
-            
-            # 检查是否包含JSON结构
-            json_start = raw_output.find("{")
-            json_end = raw_output.rfind("}") + 1
-            
-            if json_start != -1 and json_end != -1:
-                try:
-                    # 尝试解析JSON
-                    dsl_json_str = raw_output[json_start:json_end]
-                    modified_dsl = json.loads(dsl_json_str)
-                    
-                    # 验证是否是有效的DSL
-                    if self._validate_dsl(modified_dsl):
-                        # 更新DSL
-                        self.current_dsl, self.separated_items = self._separate_items(modified_dsl)
-                        return json.dumps(modified_dsl, ensure_ascii=False, indent=2)
-                except json.JSONDecodeError:
-                    # 如果不是有效的JSON，当作普通对话处理
-                    pass
-            
-            # 处理为普通对话
-            # 移除可能的JSON格式内容
-            if json_start != -1 and json_end != -1:
-                conversation_text = raw_output[:json_start].strip() + " " + raw_output[json_end:].strip()
+            local_response = self._local_response(user_input)
+            if local_response is not None:
+                return local_response
+            
+            codec = self._prompt_codec()
+            
+            # 相同DSL上的相同指令直接使用缓存的模型输出
+            cache = None if no_cache else get_response_cache()
+            cache_key = self._cache_key(user_input) if cache is not None else None
+            raw_output = await cache.aget(cache_key) if cache is not None else None
+            cached = raw_output is not None
+            
+            if raw_output is None:
+                # 使用对话链处理请求
+                chain_response = await self.chain.ainvoke(self._chain_inputs(user_input, codec))  # 异步调用，避免阻塞事件循环
+                raw_output = chain_response["text"]
             else:
-                conversation_text = raw_output.strip()
+                logger.info("响应缓存命中，跳过对话链调用")
             
-            return conversation_text
+            # 输出通过校验后才写入缓存
+            result = self._handle_model_output(user_input, raw_output, codec)
+            await self._cache_output(cache, cache_key, raw_output, cached)
+            self._record_turn(user_input, raw_output)
+            self.history.schedule_compaction(lambda: self.chat_history)
+            return result
             
         except Exception as e:
             error_msg = f"处理请求时发生错误: {str(e)}"
             logger.error(error_msg)
             return error_msg
+
+    async def process_request_stream(self, user_input: str, no_cache: bool = False) -> AsyncIterator[Tuple[str, str]]:
+        """
+        流式处理用户请求，通过流式回调逐个产出模型生成的文本片段
+        
+        Args:
+            user_input: 用户输入的消息
+            no_cache: 为True时跳过响应缓存，总是调用对话链
+            
+        Yields:
+            Tuple[str, str]: ("token", 文本片段)，最后产出一次 ("result", 完整响应)，
+            完整响应与 process_request 的返回值一致
+        """
+        chain_task = None
+        try:
+            logger.info(f"开始流式处理用户请求: {user_input[:100]}...")
+            self.last_response_type = "text"
+            
+            local_response = self._local_response(user_input)
+            if local_response is not None:
+                yield "token", local_response
+                yield "result", local_response
+                return
+            
+            codec = self._prompt_codec()
+            cache = None if no_cache else get_response_cache()
+            cache_key = self._cache_key(user_input) if cache is not None else None
+            raw_output = await cache.aget(cache_key) if cache is not None else None
+            cached = raw_output is not None
+            extractor = None
+            
+            if raw_output is not None:
+                # 缓存命中时一次性产出完整输出
+                logger.info("响应缓存命中，跳过对话链调用")
+                yield "token", raw_output
+            else:
+                # 对话链在后台运行，回调处理器把生成的文本片段转交给当前生成器
+                callback = AsyncIteratorCallbackHandler()
+                chain_task = asyncio.create_task(
+                    self.chain.ainvoke(self._chain_inputs(user_input, codec), config={"callbacks": [callback]})
+                )
+                # 对话链在模型开始生成前失败时也要结束迭代，避免一直等待
+                chain_task.add_done_callback(lambda _: callback.done.set())
+                
+                # 边接收边提取JSON：拿到合法的DSL，或返回的JSON已不可能合法时立即停止生成
+                extractor = JSONExtractor(self._output_acceptor(codec))
+                async for token in callback.aiter():
+                    yield "token", token
+                    extractor.feed(token)
+                    if extractor.has_result or extractor.malformed:
+                        break
+                
+                stopped = not chain_task.done()
+                if stopped:
+                    chain_task.cancel()
+                    raw_output = extractor.text
+                else:
+                    chain_response = await chain_task
+                    raw_output = chain_response["text"]
+                
+                if extractor.text != raw_output:
+                    # 回调没有收到完整输出时按对话链的结果重新提取
+                    extractor = extract_json(raw_output, self._output_acceptor(codec))
+                elif stopped and extractor.malformed:
+                    metrics.inc("model_output_aborted_total")
+                    logger.warning(f"模型输出的JSON无效，已提前停止生成: {extractor.error_detail}")
+                    yield "result", "抱歉，模型返回的DSL格式错误，已停止生成，请重试。"
+                    return
+                elif stopped:
+                    metrics.inc("model_output_early_stop_total")
+            
+            result = self._handle_model_output(user_input, raw_output, codec, extractor)
+            await self._cache_output(cache, cache_key, raw_output, cached)
+            self._record_turn(user_input, raw_output)
+            self.history.schedule_compaction(lambda: self.chat_history)
+            yield "result", result
+            
+        except Exception as e:
+            error_msg = f"处理请求时发生错误: {str(e)}"
+            logger.error(error_msg)
+            yield "result", error_msg
+        finally:
+            # 客户端提前断开时取消仍在运行的对话链
+            if chain_task is not None and not chain_task.done():
+                chain_task.cancel()
     
     def get_chat_history(self) -> List[Dict[str, str]]:
         """
@@ -312,15 +650,41 @@ class DSLAssistant:
         Returns:
             List[Dict[str, str]]: 对话历史记录
         """
-        history = []
-        for message in self.memory.chat_memory.messages:
-            if isinstance(message, HumanMessage):
-                history.append({"role": "user", "content": message.content})
-            elif isinstance(message, AIMessage):
-                history.append({"role": "assistant", "content": message.content})
-        return history
+        return self.chat_history
     
     def clear_history(self) -> None:
         """清空对话历史"""
-        self.memory.clear()
+        self.chat_history = []
         logger.info("对话历史已清空")
+
+    def export_state(self) -> Dict[str, Any]:
+        """
+        导出会话状态，用于持久化到会话存储
+        
+        Returns:
+            Dict[str, Any]: 包含当前DSL、分离的items、DSL版本库和对话历史的会话状态
+        """
+        return {
+            "current_dsl": self.current_dsl,
+            "separated_items": self.separated_items,
+            "dsl_versions": self.versions.export_state(),
+            "chat_history": self.get_chat_history()
+        }
+    
+    def import_state(self, state: Dict[str, Any]) -> None:
+        """
+        从会话存储恢复会话状态
+        
+        Args:
+            state: export_state 导出的会话状态
+        """
+        self.current_dsl = state.get("current_dsl")
+        self.separated_items = state.get("separated_items") or {}
+        current = self.versions.import_state(state.get("dsl_versions") or {})
+        if current is not None:
+            # 使用版本库中共享结构后的数据，未变化的子树只保存一份
+            self.current_dsl, self.separated_items = current.dsl, current.items
+        elif self.current_dsl:
+            # 没有保存版本库的旧会话，以恢复的DSL作为第一个版本
+            self.versions.reset(self.current_dsl, self.separated_items, "从会话存储恢复")
+        self.chat_history = list(state.get("chat_history") or [])
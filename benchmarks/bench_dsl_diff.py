@@ -0,0 +1,56 @@
+"""
+DSL 差异基准
+
+在大规模 DSL 上测量节点级差异的耗时：修改一个组件并打乱一个页面中容器的顺序后，
+分别比较写时复制得到的新版本（与旧版本共享未变化的子树）和重新解析得到的新版本（没有共享的对象）。
+
+运行方式:
+    python benchmarks/bench_dsl_diff.py [节点数]
+"""
+import os
+import sys
+import json
+import random
+import time
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.dsl.diff import diff_dsl
+from app.dsl.merkle import MerkleIndex
+from app.dsl.tree import count_nodes, replace_nodes
+from bench_dsl_schema import build_dsl
+
+
+def timed(func):
+    """返回函数的耗时（秒）和结果"""
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    old = build_dsl(total)
+    print(f"节点数: {count_nodes(old)}")
+
+    page = old["items"][len(old["items"]) // 2]
+    button = page["items"][0]["children"][-1]
+    new, _ = replace_nodes(old, {button["id"]: {**button, "name": "新按钮"}})
+    shuffled = list(new["items"][0]["items"])
+    random.Random(0).shuffle(shuffled)
+    new = {**new, "items": [{**new["items"][0], "items": shuffled}] + new["items"][1:]}
+
+    index = MerkleIndex(max_entries=total * 4)
+    index.digest(old)
+    elapsed, ops = timed(lambda: diff_dsl(old, new, index))
+    print(f"共享子树的新版本: {elapsed * 1000:8.2f} ms  操作数: {len(ops)}")
+
+    reparsed = json.loads(json.dumps(new, ensure_ascii=False))
+    elapsed, reparsed_ops = timed(lambda: diff_dsl(old, reparsed, index))
+    assert reparsed_ops == ops
+    print(f"重新解析的新版本: {elapsed * 1000:8.2f} ms  操作数: {len(reparsed_ops)}")
+
+
+if __name__ == "__main__":
+    main()
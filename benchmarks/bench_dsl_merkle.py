@@ -0,0 +1,66 @@
+"""
+DSL Merkle 摘要基准
+
+在大规模 DSL 上模拟修改一个组件（写时复制替换单个节点），比较修改后的后续处理：
+完整校验与基于 Merkle 摘要的增量校验，以及规范 JSON 摘要与 Merkle 摘要（缓存键使用）。
+
+运行方式:
+    python benchmarks/bench_dsl_merkle.py [节点数]
+"""
+import os
+import sys
+import time
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.dsl.canonical import content_hash
+from app.dsl.merkle import MerkleIndex
+from app.dsl.schema import default_registry
+from app.dsl.tree import count_nodes, replace_nodes
+from bench_dsl_schema import build_dsl
+
+
+def timed(func):
+    """返回函数的耗时（秒）和结果"""
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    dsl = build_dsl(total)
+    print(f"节点数: {count_nodes(dsl)}")
+
+    validator = default_registry().compile()
+    index = MerkleIndex(max_entries=total * 4)
+    elapsed, _ = timed(lambda: validator.validate(dsl, index=index))
+    print(f"首次校验并计算摘要: {elapsed * 1000:8.2f} ms")
+
+    full_validate = full_hash = incremental_validate = incremental_hash = 0.0
+    rounds = 20
+    for i in range(rounds):
+        # 每轮修改一个页面中的一个按钮
+        page = dsl["items"][i % len(dsl["items"])]
+        button = page["children"][0]["children"][-1] if "children" in page else None
+        target = button or page["items"][0]["children"][-1]
+        dsl, _ = replace_nodes(dsl, {target["id"]: {**target, "name": f"按钮{i}"}})
+
+        elapsed, errors = timed(lambda: validator.validate(dsl))
+        full_validate += elapsed
+        elapsed, _ = timed(lambda: content_hash(dsl))
+        full_hash += elapsed
+        elapsed, incremental_errors = timed(lambda: validator.validate(dsl, index=index))
+        incremental_validate += elapsed
+        elapsed, _ = timed(lambda: index.hexdigest(dsl))
+        incremental_hash += elapsed
+        assert errors == incremental_errors == []
+
+    print(f"修改一个组件后，平均每轮（共 {rounds} 轮）:")
+    print(f"  完整校验: {full_validate / rounds * 1000:8.2f} ms  增量校验: {incremental_validate / rounds * 1000:8.2f} ms")
+    print(f"  规范JSON摘要: {full_hash / rounds * 1000:8.2f} ms  Merkle摘要: {incremental_hash / rounds * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+DSL 结构校验性能基准
+
+在大规模 DSL 上测量编译后的校验器一次完整校验的耗时，并与只检查根节点 type 的旧实现对比。
+
+运行方式:
+    python benchmarks/bench_dsl_schema.py [节点数]
+"""
+import os
+import sys
+import time
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.dsl.schema import default_registry
+from app.dsl.tree import count_nodes
+
+
+def build_dsl(total: int):
+    """构建一个应用：若干页面，每个页面若干容器，每个容器包含文本和按钮"""
+    pages = []
+    app = {"id": "app", "type": "app", "items": pages}
+    count = 1
+    while count < total:
+        page = {"id": f"p{len(pages)}", "type": "page", "items": []}
+        pages.append(page)
+        count += 1
+        for c in range(50):
+            if count >= total:
+                break
+            prefix = f"{page['id']}_c{c}"
+            children = [
+                {"id": f"{prefix}_t{i}", "type": "text", "text": f"文本 {i}", "style": {"color": "#333"}}
+                for i in range(8)
+            ] + [{"id": f"{prefix}_b", "type": "button", "name": "提交"}]
+            page["items"].append({"id": prefix, "type": "container", "children": children})
+            count += 1 + len(children)
+    return app
+
+
+def timed(func, *args, repeat: int = 5):
+    """返回多次运行中的最短耗时（秒）和最后一次的结果"""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    dsl = build_dsl(total)
+    print(f"节点数: {count_nodes(dsl)}")
+
+    validator = default_registry().compile()
+    elapsed, errors = timed(validator.validate, dsl)
+    assert errors == []
+    legacy, _ = timed(lambda value: "type" in value, dsl)
+    print(f"完整校验: {elapsed * 1000:8.2f} ms  每节点: {elapsed * 1e9 / count_nodes(dsl):6.0f} ns  "
+          f"（旧实现只检查根节点: {legacy * 1e6:.2f} us）")
+
+
+if __name__ == "__main__":
+    main()
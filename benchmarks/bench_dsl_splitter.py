@@ -0,0 +1,75 @@
+"""
+DSL 任务拆分内存基准
+
+在大规模 DSL 上比较 split_dsl（建立完整任务表）与 iter_tasks（逐个产出任务）的峰值内存，
+以及 get_task_with_children 与 get_subtree 取得根节点子树的开销。
+
+运行方式:
+    python benchmarks/bench_dsl_splitter.py [节点数]
+"""
+import os
+import sys
+import json
+import time
+import tracemalloc
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.agents.dsl_task_splitter import DSLTaskSplitter
+from app.dsl.tree import count_nodes
+
+
+def build_dsl(total: int):
+    """构建一个应用：若干页面，每个页面若干容器，每个容器包含若干文本"""
+    pages = []
+    app = {"id": "app", "type": "app", "items": pages}
+    count = 1
+    while count < total:
+        page = {"id": f"p{len(pages)}", "type": "page", "items": []}
+        pages.append(page)
+        count += 1
+        for c in range(50):
+            if count >= total:
+                break
+            prefix = f"{page['id']}_c{c}"
+            items = [{"id": f"{prefix}_t{i}", "type": "text", "text": f"文本 {i}"} for i in range(8)]
+            page["items"].append({"id": prefix, "type": "container", "items": items})
+            count += 1 + len(items)
+    return app
+
+
+def measure(func):
+    """返回函数运行的耗时（秒）和期间的峰值内存（字节）"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    dsl = build_dsl(total)
+    size = len(json.dumps(dsl, ensure_ascii=False).encode("utf-8"))
+    print(f"节点数: {count_nodes(dsl)}  JSON大小: {size / 1024 / 1024:.1f} MB")
+
+    def consume():
+        for _ in DSLTaskSplitter().iter_tasks(dsl):
+            pass
+
+    splitter = DSLTaskSplitter()
+    for name, func in (
+        ("split_dsl", lambda: splitter.split_dsl(dsl)),
+        ("iter_tasks", consume),
+        ("get_task_with_children(根)", lambda: splitter.get_task_with_children(splitter.root_task_id)),
+        ("get_subtree(根)", lambda: splitter.get_subtree(splitter.root_task_id)),
+    ):
+        elapsed, peak = measure(func)
+        print(f"{name:28s} 耗时: {elapsed * 1000:9.2f} ms  峰值内存: {peak / 1024 / 1024:8.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
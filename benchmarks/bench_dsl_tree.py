@@ -0,0 +1,98 @@
+"""
+DSL 树分离/组合性能基准
+
+对比旧的逐层 copy.deepcopy 实现与结构共享实现在大规模 DSL 上的耗时。
+
+运行方式:
+    python benchmarks/bench_dsl_tree.py [分支数] [深度]
+"""
+import copy
+import os
+import sys
+import time
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.dsl.tree import separate_items, combine_items, count_nodes
+
+
+def legacy_separate_items(dsl, path=""):
+    """旧实现：每一层递归都深拷贝整棵子树"""
+    result = copy.deepcopy(dsl)
+    separated = {}
+    if "items" in result:
+        items = result.pop("items")
+        current_path = f"{path}.items" if path else "items"
+        separated[current_path] = items
+    if "children" in result:
+        for i, child in enumerate(result["children"]):
+            child_path = f"{path}.children[{i}]" if path else f"children[{i}]"
+            processed_child, child_items = legacy_separate_items(child, child_path)
+            result["children"][i] = processed_child
+            separated.update(child_items)
+    return result, separated
+
+
+def legacy_combine_items(dsl, items, path=""):
+    """旧实现：每一层递归都深拷贝整棵子树"""
+    result = copy.deepcopy(dsl)
+    current_path = f"{path}.items" if path else "items"
+    if current_path in items:
+        result["items"] = items[current_path]
+    if "children" in result:
+        for i, child in enumerate(result["children"]):
+            child_path = f"{path}.children[{i}]" if path else f"children[{i}]"
+            result["children"][i] = legacy_combine_items(child, items, child_path)
+    return result
+
+
+def build_dsl(branching: int, depth: int, prefix: str = "n"):
+    """构建每个节点都带有 children 和 items 的测试 DSL"""
+    node = {
+        "id": prefix,
+        "type": "container",
+        "style": {"width": "100%", "height": "40px", "position": "relative", "top": 0, "left": 0},
+        "items": [
+            {"id": f"{prefix}_t{i}", "type": "text", "text": f"文本 {prefix} {i}", "style": {"color": "#333"}}
+            for i in range(2)
+        ]
+    }
+    if depth > 0:
+        node["children"] = [build_dsl(branching, depth - 1, f"{prefix}_{i}") for i in range(branching)]
+    return node
+
+
+def timed(func, *args, repeat: int = 3):
+    """返回多次运行中的最短耗时（秒）和最后一次的结果"""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    branching = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    depth = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+    dsl = build_dsl(branching, depth)
+    print(f"节点数: {count_nodes(dsl)}")
+
+    legacy_sep, (legacy_dsl, legacy_items) = timed(legacy_separate_items, dsl)
+    new_sep, (new_dsl, new_items) = timed(separate_items, dsl)
+    assert legacy_dsl == new_dsl and legacy_items == new_items
+
+    legacy_comb, legacy_full = timed(legacy_combine_items, legacy_dsl, legacy_items)
+    new_comb, new_full = timed(combine_items, new_dsl, new_items)
+    assert legacy_full == new_full == dsl
+
+    print(f"_separate_items  旧实现: {legacy_sep * 1000:9.2f} ms  结构共享: {new_sep * 1000:7.2f} ms  "
+          f"加速: {legacy_sep / new_sep:6.1f}x")
+    print(f"_combine_items   旧实现: {legacy_comb * 1000:9.2f} ms  结构共享: {new_comb * 1000:7.2f} ms  "
+          f"加速: {legacy_comb / new_comb:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,7 +10,9 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.core.config import settings
-from app.api.endpoints import router
+from app.api.endpoints import router, session_manager
+from app.core.model_client import close_model_clients
+from app.core.response_cache import close_response_cache
 
 # 配置日志
 logging.basicConfig(
@@ -41,6 +43,14 @@ app.add_middleware(
 # 注册路由
 app.include_router(router)  # 移除prefix，直接使用根路径
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时释放模型服务连接池、会话存储和响应缓存"""
+    await close_model_clients()
+    close_response_cache()
+    if session_manager.store is not None:
+        session_manager.store.close()
+
 if __name__ == "__main__":
     logger.info(f"启动{settings.PROJECT_NAME}服务...")
     uvicorn.run(
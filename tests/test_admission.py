@@ -0,0 +1,110 @@
+"""
+测试模型请求的准入控制
+"""
+import os
+import sys
+import json
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core import admission
+from app.core.admission import AdmissionController, AdmissionRejected
+from app.core.metrics import metrics
+
+
+def test_limit_and_fifo_order():
+    controller = AdmissionController(limit=2, max_queue=10, queue_timeout=1.0, metric_prefix="test_admission_fifo")
+    running = []
+    peak = []
+    order = []
+
+    async def job(name):
+        async with controller.slot():
+            order.append(name)
+            running.append(name)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.remove(name)
+
+    async def main():
+        tasks = [asyncio.create_task(job(i)) for i in range(6)]
+        await asyncio.sleep(0)
+        assert controller.active == 2 and controller.queued == 4
+        assert metrics.get("test_admission_fifo_queue_depth") == 4
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    assert max(peak) == 2 and order == list(range(6))
+    assert controller.active == 0 and controller.queued == 0
+    assert metrics.snapshot()["summaries"]["test_admission_fifo_wait_seconds"]["count"] == 6
+
+
+def test_full_queue_and_queue_timeout_are_rejected():
+    controller = AdmissionController(limit=1, max_queue=1, queue_timeout=0.05, metric_prefix="test_admission_reject")
+
+    async def main():
+        await controller.acquire()
+        waiting = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as full:
+            await controller.acquire()
+        with pytest.raises(AdmissionRejected) as timeout:
+            await waiting
+        controller.release()
+        return full.value, timeout.value
+
+    full, timeout = asyncio.run(main())
+    assert full.status_code == 429 and full.retry_after >= 1
+    assert timeout.status_code == 503 and timeout.retry_after >= 1
+    assert controller.active == 0 and controller.queued == 0
+    assert metrics.get("test_admission_reject_rejected_total") == 1
+    assert metrics.get("test_admission_reject_timeout_total") == 1
+
+
+def test_cancelled_waiter_leaves_queue():
+    controller = AdmissionController(limit=1, max_queue=10, queue_timeout=1.0, metric_prefix="test_admission_cancel")
+
+    async def main():
+        await controller.acquire()
+        leaving = asyncio.create_task(controller.acquire())
+        staying = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        leaving.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leaving
+        assert controller.queued == 1
+        controller.release()
+        await staying
+        assert controller.active == 1 and controller.queued == 0
+        controller.release()
+
+    asyncio.run(main())
+    assert controller.active == 0
+
+
+def test_chat_returns_retry_after_when_model_is_saturated(monkeypatch):
+    from app.api import endpoints
+
+    controller = AdmissionController(limit=1, max_queue=0, queue_timeout=1.0, metric_prefix="test_admission_chat")
+    monkeypatch.setattr(admission, "_controller", controller)
+    dsl = json.dumps({"id": "page", "type": "page", "name": "页面"}, ensure_ascii=False)
+    asyncio.run(endpoints.load_dsl(endpoints.DSLRequest(dsl_content=dsl, session_id="admission-test")))
+    request = endpoints.ChatRequest(message="把名称改成首页", session_id="admission-test", no_cache=True)
+
+    async def main():
+        # 唯一的名额已被占用且不允许排队
+        await controller.acquire()
+        try:
+            await endpoints.chat(request)
+        finally:
+            controller.release()
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(main())
+    assert error.value.status_code == 429
+    assert int(error.value.headers["Retry-After"]) >= 1
@@ -0,0 +1,95 @@
+"""
+测试批量作业的并发控制、会话串行以及 /chat/batch 的 NDJSON 输出
+"""
+import os
+import sys
+import json
+import asyncio
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.batch import run_batch
+
+
+def test_concurrency_limit_and_error_isolation():
+    running = []
+    peak = []
+
+    async def worker(job):
+        running.append(job)
+        peak.append(len(running))
+        await asyncio.sleep(0.01 * (job % 3))
+        running.remove(job)
+        if job == 4:
+            raise ValueError("作业失败")
+        return job * 10
+
+    async def collect():
+        return [outcome async for outcome in run_batch(list(range(10)), worker, concurrency=3)]
+
+    outcomes = asyncio.run(collect())
+    assert max(peak) == 3
+    assert sorted(outcome.index for outcome in outcomes) == list(range(10))
+    failed = [outcome for outcome in outcomes if not outcome.ok]
+    assert len(failed) == 1 and failed[0].index == 4 and str(failed[0].error) == "作业失败"
+    assert all(outcome.result == outcome.index * 10 for outcome in outcomes if outcome.ok)
+
+
+def test_jobs_with_same_key_run_in_order():
+    order = []
+
+    async def worker(job):
+        session, step = job
+        order.append((session, step, "start"))
+        await asyncio.sleep(0.02 if step == 0 else 0)
+        order.append((session, step, "end"))
+
+    jobs = [("a", 0), ("b", 0), ("a", 1), ("a", 2)]
+
+    async def collect():
+        return [outcome async for outcome in run_batch(jobs, worker, concurrency=4, key=lambda job: job[0])]
+
+    asyncio.run(collect())
+    steps = [(step, event) for session, step, event in order if session == "a"]
+    assert steps == [(0, "start"), (0, "end"), (1, "start"), (1, "end"), (2, "start"), (2, "end")]
+    # 其他会话的作业不需要等待
+    assert order.index(("b", 0, "start")) < order.index(("a", 0, "end"))
+
+
+def test_batch_endpoint_streams_ndjson(monkeypatch):
+    from app.api import endpoints
+    from app.models.dsl_assistant_api import DSLAssistantAPI
+
+    async def fake_send(self, messages, temperature=0.7):
+        name = messages[-1]["content"].rsplit("改成", 1)[-1]
+        return {"text": json.dumps({"id": "page", "type": "page", "name": name}, ensure_ascii=False)}
+
+    monkeypatch.setattr(DSLAssistantAPI, "_send_api_request", fake_send)
+    dsl = json.dumps({"id": "page", "type": "page", "name": "旧"}, ensure_ascii=False)
+    request = endpoints.BatchRequest(jobs=[
+        {"id": "s1", "session_id": "batch-test", "dsl_content": dsl, "message": "把名称改成一"},
+        {"id": "s2", "session_id": "batch-test", "message": "把名称改成二"},
+        {"id": "tmp", "dsl_content": dsl, "message": "把名称改成三", "no_cache": True},
+        {"id": "bad", "dsl_content": '{"name": "x"}', "message": "把名称改成四"},
+        {"id": "none", "message": "把名称改成五"},
+    ], concurrency=2)
+
+    async def collect():
+        response = await endpoints.chat_batch(request)
+        return [json.loads(line) async for line in response.body_iterator]
+
+    lines = asyncio.run(collect())
+    results = {line["id"]: line for line in lines[:-1]}
+    assert results["s1"]["dsl"]["name"] == "一"
+    assert results["s2"]["status"] == "ok" and results["s2"]["dsl"]["name"] == "二"
+    assert results["tmp"]["response_type"] == "dsl" and results["tmp"]["dsl"]["name"] == "三"
+    assert results["bad"]["status"] == "error" and "/: 缺少 type 属性" in results["bad"]["detail"]
+    assert results["none"] == {"index": 4, "id": "none", "status": "error", "detail": "作业需要指定 session_id 或 dsl_content"}
+    assert lines[-1] == {"status": "done", "total": 5, "succeeded": 3, "failed": 2}
+
+    async def current_dsl():
+        async with endpoints.session_manager.session("batch-test", "api") as assistant:
+            return assistant.get_complete_dsl()
+
+    assert asyncio.run(current_dsl())["name"] == "二"
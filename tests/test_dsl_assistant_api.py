@@ -1,6 +1,7 @@
 import os
 import sys
 import json
+import asyncio
 import pytest
 import logging
 
@@ -93,7 +94,7 @@ def test_dsl_assistant_api():
         
         # 测试2: 发送消息
         logger.info("\n=== 测试2: 发送消息 ===")
-        response = assistant.process_request("分析一下这个DSL的结构")
+        response = asyncio.run(assistant.process_request("分析一下这个DSL的结构"))
         assert response, "没有收到响应"
         logger.info(f"收到响应: {response}")
         
@@ -0,0 +1,87 @@
+"""
+测试DSL紧凑编码的无损还原、压缩效果以及助手对编码输出的解码
+"""
+import os
+import sys
+import json
+import asyncio
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.dsl.canonical import canonical_json
+from app.dsl.codec import build_codec, align
+
+
+def build_dsl(count: int = 12, child_key: str = "items") -> dict:
+    """构建一个包含大量相似按钮和文本的页面"""
+    items = []
+    for i in range(count):
+        items.append({"id": f"text_{i}", "type": "text", "name": f"说明{i}", "visible": True,
+                      "style": {"color": "#333333", "fontSize": "14px", "padding": "8px 16px"}})
+        items.append({"id": f"button_{i}", "type": "button", "name": f"提交{i}", "visible": True, "disabled": False,
+                      "style": {"color": "#ffffff", "background": "#1677ff", "borderRadius": "4px"}})
+    return {"id": "page", "type": "page", "name": "表单页", child_key: items}
+
+
+def test_round_trip_is_byte_identical():
+    dsl = build_dsl()
+    # 个别节点的键顺序与同类型节点不同、缺少默认属性
+    dsl["items"][3] = {"type": "button", "id": "button_1", "name": "提交1",
+                       "style": {"background": "#1677ff", "color": "#ffffff"}}
+    codec = build_codec([dsl])
+    assert codec is not None
+    original = json.dumps(dsl, ensure_ascii=False)
+    assert json.dumps(codec.decode(codec.encode(dsl)), ensure_ascii=False) == original
+    # 提示词中的编码按规范 JSON 排序了键，与原DSL对齐后仍然逐字节一致
+    decoded = codec.decode(json.loads(canonical_json(codec.encode(dsl))))
+    assert json.dumps(align(decoded, dsl), ensure_ascii=False) == original
+
+
+def test_encoding_is_shorter():
+    dsl = build_dsl()
+    codec = build_codec([dsl], alias_keys=True)
+    encoded = canonical_json({**codec.tables(), "dsl": codec.encode(dsl)})
+    assert len(encoded) < len(canonical_json(dsl)) * 0.7
+
+
+def test_reserved_names_disable_codec():
+    dsl = build_dsl()
+    dsl["items"][0]["$ref"] = "x"
+    assert build_codec([dsl]) is None
+    # 太小的DSL编码后不会更短
+    assert build_codec([{"id": "page", "type": "page"}]) is None
+
+
+def test_align_reuses_unchanged_nodes():
+    dsl = build_dsl(3)
+    changed = json.loads(json.dumps(dsl))
+    changed["items"][1]["style"]["color"] = "#ff0000"
+    result = align(changed, dsl)
+    assert result["items"][0] is dsl["items"][0]
+    assert result["items"][1]["style"]["color"] == "#ff0000"
+    assert result["items"][1]["id"] is dsl["items"][1]["id"]
+
+
+def test_assistant_decodes_model_output():
+    from app.models.dsl_assistant_api import DSLAssistantAPI
+
+    assistant = DSLAssistantAPI()
+    # 完整模式下发送的是分离items之后的DSL，这里用children承载子节点
+    dsl = build_dsl(child_key="children")
+    assistant.load_dsl(json.dumps(dsl, ensure_ascii=False))
+    sent = {}
+
+    async def fake_send(messages, temperature=0.7):
+        sent["messages"] = messages
+        # 模型按紧凑编码返回：只改页面名称，子节点保持省略默认值的编码形式
+        encoded = json.loads(messages[0]["content"].split("当前DSL结构:\n", 1)[1])["dsl"]
+        encoded["name"] = "新表单页"
+        return {"text": json.dumps(encoded, ensure_ascii=False)}
+
+    assistant._send_api_request = fake_send
+    result = json.loads(asyncio.run(assistant.process_request("把页面名称改成新表单页", no_cache=True)))
+    assert '"$defaults"' in sent["messages"][0]["content"]
+    assert result["name"] == "新表单页"
+    assert result["children"] == dsl["children"]
+    assert assistant.get_complete_dsl()["children"][1]["style"]["borderRadius"] == "4px"
@@ -0,0 +1,72 @@
+"""
+测试按相关性裁剪DSL上下文以及修改节点的合并
+"""
+import os
+import sys
+import json
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.dsl.context import ContextSelector
+from app.dsl.tree import replace_nodes
+
+
+def build_dsl(pages: int = 20) -> dict:
+    """构建一个包含多个页面的DSL"""
+    return {
+        "id": "app",
+        "type": "app",
+        "items": [
+            {
+                "id": f"page_{i}",
+                "type": "page",
+                "name": f"页面{i}",
+                "items": [
+                    {"id": f"title_{i}", "type": "text", "name": "标题" if i == 7 else f"段落{i}",
+                     "style": {"color": "#000000", "fontSize": "14px", "padding": "8px 16px"}},
+                    {"id": f"button_{i}", "type": "button", "name": f"提交{i}",
+                     "style": {"color": "#ffffff", "background": "#1677ff"}}
+                ]
+            }
+            for i in range(pages)
+        ]
+    }
+
+
+def test_small_dsl_uses_full_context():
+    assert ContextSelector(token_budget=100000).select(build_dsl(), "把标题改成红色") is None
+
+
+def test_selects_relevant_subtree_with_pointer():
+    dsl = build_dsl()
+    scope = ContextSelector(token_budget=600).select(dsl, "把标题改成红色")
+    assert scope is not None
+    assert scope.node_ids == ["title_7"]
+    assert scope.pointers == ["/items/7/items/0"]
+    assert scope.subtrees[0] == dsl["items"][7]["items"][0]
+    assert scope.estimated_tokens <= 600
+    # 大纲覆盖整体结构
+    assert "page_0 [page]" in scope.outline
+    assert "title_7" in scope.render()
+
+
+def test_ancestor_covers_descendants():
+    scope = ContextSelector(token_budget=800).select(build_dsl(), "修改 page_3 的 button_3")
+    assert scope is not None
+    assert scope.node_ids == ["page_3"]
+
+
+def test_no_match_falls_back():
+    assert ContextSelector(token_budget=600).select(build_dsl(), "你好") is None
+
+
+def test_replace_nodes_copy_on_write():
+    dsl = build_dsl(3)
+    original = json.dumps(dsl, ensure_ascii=False)
+    new_node = dict(dsl["items"][1]["items"][0], style={"color": "#ff0000"})
+    result, replaced = replace_nodes(dsl, {"title_1": new_node})
+    assert replaced == 1
+    assert result["items"][1]["items"][0] is new_node
+    assert result["items"][0] is dsl["items"][0]
+    assert json.dumps(dsl, ensure_ascii=False) == original
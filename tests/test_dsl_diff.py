@@ -0,0 +1,85 @@
+"""
+测试DSL版本之间的节点级差异
+"""
+import os
+import sys
+import json
+import asyncio
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.dsl.diff import diff_dsl
+from app.dsl.tree import replace_nodes
+
+
+def build_dsl():
+    return {
+        "id": "app", "type": "app", "items": [
+            {"id": "home", "type": "page", "items": [
+                {"id": f"t{i}", "type": "text", "text": f"文本{i}"} for i in range(6)
+            ]},
+            {"id": "about", "type": "page", "items": [{"id": "intro", "type": "text", "text": "介绍"}]},
+        ]
+    }
+
+
+def test_identical_and_property_changes():
+    dsl = build_dsl()
+    assert diff_dsl(dsl, json.loads(json.dumps(dsl))) == []
+    changed, _ = replace_nodes(dsl, {"t2": {"id": "t2", "type": "text", "style": {"color": "red"}}})
+    assert diff_dsl(dsl, changed) == [
+        {"op": "update", "path": "/items/0/items/2", "id": "t2", "set": {"style": {"color": "red"}}, "unset": ["text"]}
+    ]
+
+
+def test_reorder_reports_minimal_moves():
+    dsl = build_dsl()
+    new = json.loads(json.dumps(dsl))
+    items = new["items"][0]["items"]
+    # t5 移到最前面，其余节点相对顺序不变，只需要一次移动
+    items.insert(0, items.pop())
+    assert diff_dsl(dsl, new) == [{"op": "move", "from": "/items/0/items/5", "path": "/items/0/items/0", "id": "t5"}]
+
+
+def test_add_remove_and_move_across_parents():
+    dsl = build_dsl()
+    new = json.loads(json.dumps(dsl))
+    moved = new["items"][0]["items"].pop(1)
+    moved["text"] = "移动后的文本"
+    new["items"][1]["items"].append(moved)
+    del new["items"][0]["items"][0]
+    new["items"][1]["items"].insert(0, {"id": "banner", "type": "image", "src": "a.png"})
+    ops = diff_dsl(dsl, new)
+    assert {"op": "move", "from": "/items/0/items/1", "path": "/items/1/items/2", "id": "t1"} in ops
+    assert {"op": "update", "path": "/items/1/items/2", "id": "t1", "set": {"text": "移动后的文本"}, "unset": []} in ops
+    assert {"op": "remove", "path": "/items/0/items/0", "id": "t0"} in ops
+    assert {"op": "add", "path": "/items/1/items/0", "id": "banner", "node": new["items"][1]["items"][0]} in ops
+    assert len(ops) == 4
+
+
+def test_nodes_without_id_match_by_subtree_hash():
+    old = {"id": "app", "type": "app", "items": [{"type": "divider"}, {"type": "text", "text": "a"}]}
+    new = {"id": "app", "type": "app", "items": [{"type": "text", "text": "a"}, {"type": "divider"}, {"type": "divider"}]}
+    ops = diff_dsl(old, new)
+    assert {"op": "add", "path": "/items/2", "id": None, "node": {"type": "divider"}} in ops
+    assert len([op for op in ops if op["op"] == "move"]) == 1 and len(ops) == 2
+
+
+def test_chat_response_and_endpoint_include_diff(monkeypatch):
+    from app.api import endpoints
+    from app.models.dsl_assistant_api import DSLAssistantAPI
+
+    async def fake_send(self, messages, temperature=0.7):
+        return {"text": json.dumps({"id": "page", "type": "page", "name": "新名称"}, ensure_ascii=False)}
+
+    monkeypatch.setattr(DSLAssistantAPI, "_send_api_request", fake_send)
+    dsl = json.dumps({"id": "page", "type": "page", "name": "旧名称"}, ensure_ascii=False)
+    asyncio.run(endpoints.load_dsl(endpoints.DSLRequest(dsl_content=dsl, session_id="diff-test")))
+    request = endpoints.ChatRequest(message="把名称改成新名称", session_id="diff-test", no_cache=True)
+    result = json.loads(asyncio.run(endpoints.chat(request)).body)
+    expected = [{"op": "update", "path": "", "id": "page", "set": {"name": "新名称"}, "unset": []}]
+    assert result["response_type"] == "dsl" and result["diff"] == expected
+
+    response = asyncio.run(endpoints.diff_dsl_versions(session_id="diff-test", from_version=None, to_version=None))
+    assert json.loads(response.body) == {"from": 1, "to": 2, "diff": expected}
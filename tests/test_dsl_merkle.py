@@ -0,0 +1,78 @@
+"""
+测试 DSL 子树的 Merkle 摘要以及基于摘要的增量校验
+"""
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.dsl.codec import align
+from app.dsl.merkle import MerkleIndex
+from app.dsl.schema import default_registry
+from app.dsl.tree import replace_nodes
+
+
+def build_dsl():
+    return {
+        "id": "app", "type": "app", "items": [
+            {"id": f"page_{p}", "type": "page", "items": [
+                {"id": f"text_{p}_{i}", "type": "text", "text": f"文本{i}", "style": {"color": "#333"}} for i in range(5)
+            ]}
+            for p in range(4)
+        ]
+    }
+
+
+def test_digest_is_structural_and_recomputed_along_changed_path():
+    dsl = build_dsl()
+    index = MerkleIndex()
+    digest = index.digest(dsl)
+    assert len(index) == 1 + 4 + 20
+    # 与键顺序无关，与内容有关
+    reordered = {"items": dsl["items"], "type": "app", "id": "app"}
+    assert MerkleIndex().digest(reordered) == digest
+    assert index.digest({"id": "x", "type": "page", "items": []}) != index.digest({"id": "x", "type": "page", "children": []})
+    assert index.ids(dsl["items"][1]) == ("text_1_0", "text_1_1", "text_1_2", "text_1_3", "text_1_4", "page_1")
+
+    changed, _ = replace_nodes(dsl, {"text_2_3": {"id": "text_2_3", "type": "text", "text": "新文本"}})
+    before = len(index)
+    assert index.hexdigest(changed) != digest.hex()
+    # 只计算了根节点、所在页面和被替换的节点
+    assert len(index) == before + 3
+    assert changed["items"][0] is dsl["items"][0]
+
+
+def test_incremental_validation_matches_full_validation():
+    validator = default_registry().compile()
+    index = MerkleIndex()
+    dsl = build_dsl()
+    assert validator.validate(dsl, index=index) == []
+
+    edited, _ = replace_nodes(dsl, {"text_0_1": {"id": "text_0_1", "type": "button", "name": "提交"}})
+    assert validator.validate(edited, index=index) == []
+
+    # 新节点的 id 与跳过的子树中的节点重复
+    duplicated, _ = replace_nodes(dsl, {"text_0_1": {"id": "text_3_4", "type": "text"}})
+    errors = validator.validate(duplicated, index=index)
+    assert errors == validator.validate(duplicated)
+    assert [str(error) for error in errors] == ["/items/3/items/4: id text_3_4 与 /items/0/items/1 重复"]
+
+    # 校验通过的子树移动到不允许的父节点下仍会报错
+    moved, _ = replace_nodes(dsl, {"page_1": {"id": "tabs", "type": "tabs", "items": [dsl["items"][1]["items"][0]]}})
+    assert [str(error) for error in validator.validate(moved, index=index)] == ["/items/1/items/0: tabs 中不能包含 text"]
+
+
+def test_align_reuses_reference_objects():
+    dsl = build_dsl()
+    index = MerkleIndex()
+    new = {"type": "app", "id": "app", "items": [
+        {"type": "page", "id": page["id"], "items": [dict(reversed(list(node.items()))) for node in page["items"]]}
+        for page in dsl["items"]
+    ]}
+    new["items"][2]["items"][0]["text"] = "改过的文本"
+    result = align(new, dsl, index)
+    assert result["items"][0] is dsl["items"][0]
+    assert result["items"][2]["items"][1] is dsl["items"][2]["items"][1]
+    assert result["items"][2]["items"][0]["style"] is dsl["items"][2]["items"][0]["style"]
+    assert result["items"][2]["items"][0]["text"] == "改过的文本"
@@ -0,0 +1,97 @@
+"""
+测试按组件类型注册表编译的DSL结构校验
+"""
+import os
+import sys
+import json
+import asyncio
+
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.metrics import metrics
+from app.dsl.schema import ComponentSchema, SchemaRegistry, default_registry
+
+DSL = {
+    "id": "app",
+    "type": "app",
+    "items": [
+        {"id": "page", "type": "page", "items": [
+            {"id": "box", "type": "container", "children": [
+                {"id": "title", "type": "text", "text": "标题"},
+                {"id": "tabs", "type": "tabs", "children": [{"id": "tab1", "type": "tab", "items": [{"id": "ok", "type": "button"}]}]},
+            ]},
+        ]},
+    ],
+}
+
+
+def validate(dsl, **kwargs):
+    return default_registry().compile(**kwargs).validate(dsl)
+
+
+def test_valid_dsl_has_no_errors():
+    assert validate(DSL) == []
+
+
+@pytest.mark.parametrize("path, change, expected", [
+    ("/items/0/items/0/children/0", {"id": "box"}, ("/items/0/items/0/children/0", "id box 与 /items/0/items/0 重复")),
+    ("/items/0/items/0/children/1", {"type": "chart"}, ("/items/0/items/0/children/1", "未知的组件类型 chart")),
+    ("/items/0/items/0/children/1/children/0", {"type": "container"}, ("/items/0/items/0/children/1/children/0", "tabs 中不能包含 container")),
+    ("/items/0/items/0/children/0", {"items": [{"type": "text"}]}, ("/items/0/items/0/children/0", "text 不能包含子节点")),
+    ("/items/0/items/0", {"children": {"type": "text"}}, ("/items/0/items/0", "children 必须是数组")),
+    ("/items/0", {"items": [{"type": "image"}]}, ("/items/0/items/0", "image 缺少必填属性 src")),
+    ("", {"items": [{"type": "app"}]}, ("/items/0", "app 只能作为根节点")),
+])
+def test_errors_report_pointer_paths(path, change, expected):
+    dsl = json.loads(json.dumps(DSL))
+    node = dsl
+    for part in path.split("/")[1:]:
+        node = node[int(part)] if part.isdigit() else node[part]
+    node.update(change)
+    errors = validate(dsl)
+    assert [(error.path, error.message) for error in errors] == [expected]
+
+
+def test_registry_extensions_and_unknown_types():
+    dsl = {"type": "page", "items": [{"type": "chart", "items": [{"type": "text"}]}]}
+    assert validate(dsl, allow_unknown_types=True) == []
+    registry = SchemaRegistry([ComponentSchema("page"), ComponentSchema("chart", required=("series",), children=frozenset())])
+    errors = registry.compile().validate(dsl)
+    assert [str(error) for error in errors] == ["/items/0: chart 缺少必填属性 series", "/items/0: chart 不能包含子节点"]
+    assert validate("[]")[0].message == "DSL根节点必须是对象"
+
+
+def test_assistant_rejects_invalid_model_output():
+    from app.models.dsl_assistant_api import DSLAssistantAPI
+
+    assistant = DSLAssistantAPI()
+    assert not assistant.load_dsl(json.dumps({"type": "page", "items": [{"id": "a", "type": "text"}, {"id": "a", "type": "text"}]}))
+    assert assistant.last_load_error == "DSL结构验证失败：/items/1: id a 与 /items/0 重复"
+
+    assistant.load_dsl(json.dumps({"id": "page", "type": "page", "name": "旧"}, ensure_ascii=False))
+
+    async def fake_send(messages, temperature=0.7):
+        return {"text": json.dumps({"id": "page", "type": "page", "name": "新", "children": [{"type": "app"}]})}
+
+    assistant._send_api_request = fake_send
+    before = metrics.get("dsl_validation_failures_total")
+    result = asyncio.run(assistant.process_request("改名", no_cache=True))
+    assert "/children/0: app 只能作为根节点" in result
+    assert metrics.get("dsl_validation_failures_total") == before + 1
+    assert assistant.get_complete_dsl()["name"] == "旧"
+    assert assistant.last_response_type == "text"
+
+
+def test_load_dsl_endpoint_reports_validation_error_as_400():
+    from fastapi import HTTPException
+    from app.api import endpoints
+
+    request = endpoints.DSLRequest(dsl_content=json.dumps({"id": "page", "type": "未知组件"}, ensure_ascii=False),
+                                   session_id="schema-test")
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(endpoints.load_dsl(request))
+    assert error.value.status_code == 400
+    assert error.value.detail.startswith("DSL 格式无效：DSL结构验证失败")
@@ -0,0 +1,85 @@
+"""
+测试DSL任务拆分器的稳定任务ID、索引和深层嵌套的处理
+"""
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.agents.dsl_task_splitter import BFS, DSLTaskSplitter, make_task_id
+
+DSL = {
+    "id": "app", "type": "app", "items": [
+        {"id": "home", "type": "page", "items": [{"id": "title", "type": "text"}, {"id": "ok", "type": "button"}]},
+        {"id": "about", "type": "page", "items": [{"id": "intro", "type": "text"}]},
+    ]
+}
+
+
+def test_task_ids_are_stable_and_path_derived():
+    first = DSLTaskSplitter().split_dsl(DSL)
+    second = DSLTaskSplitter().split_dsl(DSL)
+    assert [task["task_id"] for task in first] == [task["task_id"] for task in second]
+    # 前序遍历顺序，路径为 JSON Pointer
+    assert [(task["node_id"], task["path"]) for task in first] == [
+        ("app", ""), ("home", "/items/0"), ("title", "/items/0/items/0"), ("ok", "/items/0/items/1"),
+        ("about", "/items/1"), ("intro", "/items/1/items/0"),
+    ]
+    assert first[2]["task_id"] == make_task_id("/items/0/items/0")
+    assert first[1]["items"] == [first[2]["task_id"], first[3]["task_id"]]
+    assert first[2]["parent_task_id"] == first[1]["task_id"]
+
+
+def test_lookup_by_node_id_and_type():
+    splitter = DSLTaskSplitter()
+    splitter.split_dsl(DSL)
+    assert splitter.get_task_by_node_id("intro")["path"] == "/items/1/items/0"
+    assert splitter.get_task_by_node_id("missing") is None
+    assert [task["node_id"] for task in splitter.get_tasks_by_type("text")] == ["title", "intro"]
+    assert splitter.get_tasks_by_type("table") == []
+    tree = splitter.get_task_with_children(splitter.root_task_id)
+    assert [child["node_id"] for child in tree["children_info"][0]["children_info"]] == ["title", "ok"]
+
+
+def test_deep_nesting_does_not_hit_recursion_limit():
+    depth = sys.getrecursionlimit() * 2
+    dsl = {"id": "n0", "type": "container"}
+    node = dsl
+    for i in range(1, depth):
+        child = {"id": f"n{i}", "type": "container"}
+        node["items"] = [child]
+        node = child
+    splitter = DSLTaskSplitter()
+    tasks = splitter.split_dsl(dsl)
+    assert len(tasks) == depth
+    assert splitter.get_task_by_node_id(f"n{depth - 1}")["path"] == "/items/0" * (depth - 1)
+    assert len(splitter.get_task_with_children(splitter.root_task_id)["children_info"]) == 1
+
+
+def test_iter_tasks_is_lazy_in_dfs_and_bfs_order():
+    splitter = DSLTaskSplitter()
+    tasks = splitter.iter_tasks(DSL)
+    root = next(tasks)
+    assert root.node_id == "app" and root.items == [make_task_id("/items/0"), make_task_id("/items/1")]
+    assert [task.node_id for task in tasks] == ["home", "title", "ok", "about", "intro"]
+    assert [task.node_id for task in splitter.iter_tasks(DSL, order=BFS)] == ["app", "home", "about", "title", "ok", "intro"]
+    # 生成器不建立任务表
+    assert splitter.tasks == {}
+    # 产出的任务与 split_dsl 一致
+    assert [task.task_id for task in splitter.iter_tasks(DSL)] == [task["task_id"] for task in DSLTaskSplitter().split_dsl(DSL)]
+
+
+def test_subtree_view_references_original_nodes():
+    splitter = DSLTaskSplitter()
+    splitter.split_dsl(DSL)
+    view = splitter.get_subtree(splitter.get_task_by_node_id("home")["task_id"])
+    assert view.to_dict() is DSL["items"][0]
+    assert len(view) == 2 and view.get("items") is None and view.get("type") == "page"
+    children = list(view.children())
+    assert children[1].node is DSL["items"][0]["items"][1] and children[1].path == "/items/0/items/1"
+    assert children[1].task_id == splitter.get_task_by_node_id("ok")["task_id"]
+    root = splitter.get_subtree(splitter.root_task_id)
+    assert [node.node_id for node in root.walk()] == ["app", "home", "title", "ok", "about", "intro"]
+    assert [node.node_id for node in root.walk(BFS)] == ["app", "home", "about", "title", "ok", "intro"]
+    assert splitter.get_subtree("missing") is None
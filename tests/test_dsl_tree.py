@@ -0,0 +1,40 @@
+"""
+测试结构共享的 items 分离与组合
+"""
+import os
+import sys
+import json
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.dsl.tree import separate_items, combine_items
+
+DSL = {
+    "type": "container",
+    "children": [
+        {"type": "list", "items": [{"type": "text", "content": "Item 1"}]},
+        {"type": "text", "content": "plain"},
+        {"type": "tabs", "children": [{"type": "tab", "items": [{"type": "button", "label": "B"}]}]}
+    ]
+}
+
+
+def test_roundtrip_is_byte_identical():
+    original = json.dumps(DSL, ensure_ascii=False)
+    separated_dsl, items = separate_items(DSL)
+    assert list(items) == ["children[0].items", "children[2].children[0].items"]
+    assert "items" not in separated_dsl["children"][0]
+    assert json.dumps(combine_items(separated_dsl, items), ensure_ascii=False) == original
+    # 输入没有被修改
+    assert json.dumps(DSL, ensure_ascii=False) == original
+
+
+def test_unchanged_subtrees_are_shared():
+    separated_dsl, items = separate_items(DSL)
+    assert separated_dsl["children"][1] is DSL["children"][1]
+    assert items["children[0].items"] is DSL["children"][0]["items"]
+    combined = combine_items(separated_dsl, items)
+    assert combined["children"][1] is DSL["children"][1]
+    # 没有需要组合的items时直接返回原树
+    assert combine_items(separated_dsl, {}) is separated_dsl
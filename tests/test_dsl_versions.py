@@ -0,0 +1,119 @@
+"""
+测试DSL版本库的结构共享、撤销/重做和内存预算
+"""
+import os
+import sys
+import json
+import asyncio
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.dsl.versions import DSLVersionStore, share_structure
+
+
+def make_dsl(color):
+    return {
+        "type": "app",
+        "children": [
+            {"type": "text", "style": {"color": color}},
+            {"type": "container", "children": [{"type": "text", "content": "x" * 200}]}
+        ]
+    }
+
+
+def test_share_structure_reuses_unchanged_subtrees():
+    old = make_dsl("#000")
+    shared, added = share_structure(make_dsl("#fff"), old)
+    assert shared == make_dsl("#fff")
+    assert shared["children"][1] is old["children"][1]
+    assert added < 300
+    same, added = share_structure(make_dsl("#000"), old)
+    assert same is old and added == 0
+
+
+def test_undo_redo_and_branch_truncation():
+    store = DSLVersionStore()
+    store.reset(make_dsl("#000"), {})
+    store.commit(make_dsl("#111"), {}, "v2")
+    store.commit(make_dsl("#222"), {}, "v3")
+    assert store.undo().number == 2
+    assert store.undo().number == 1
+    assert store.undo() is None
+    assert store.redo().number == 2
+    # 撤销后提交新版本会丢弃可重做的版本，版本号接续当前版本
+    assert store.commit(make_dsl("#333"), {}, "v3'").number == 3
+    assert store.redo() is None
+    assert store.get(3).dsl["children"][0]["style"]["color"] == "#333"
+
+
+def test_memory_budget_evicts_oldest():
+    store = DSLVersionStore(max_bytes=2000, max_versions=100)
+    store.reset(make_dsl("#000"), {})
+    for i in range(50):
+        store.commit(make_dsl(f"#{i:03d}"), {}, str(i))
+    assert store.total_bytes <= 2000
+    assert store.get(1) is None
+    assert store.current.number == 51
+
+
+def test_assistant_undo_redo():
+    from app.models.dsl_assistant_api import DSLAssistantAPI
+
+    assistant = DSLAssistantAPI()
+    assistant.load_dsl(json.dumps(make_dsl("#000")))
+
+    async def fake_send(messages, temperature=0.7):
+        return {"text": json.dumps(make_dsl("#fff"))}
+
+    assistant._send_api_request = fake_send
+    asyncio.run(assistant.process_request("把文字改成白色"))
+    assert assistant.get_complete_dsl()["children"][0]["style"]["color"] == "#fff"
+    assert assistant.undo()["children"][0]["style"]["color"] == "#000"
+    assert assistant.redo()["children"][0]["style"]["color"] == "#fff"
+    assert assistant.get_dsl_version(1)["children"][0]["style"]["color"] == "#000"
+
+
+def test_export_and_import_keep_history_and_sharing():
+    store = DSLVersionStore()
+    store.reset(make_dsl("#000"), {})
+    store.commit(make_dsl("#111"), {}, "v2")
+    store.commit(make_dsl("#222"), {}, "v3")
+    store.undo()
+
+    restored = DSLVersionStore()
+    state = json.loads(json.dumps(store.export_state()))
+    assert restored.import_state(state).number == 2
+    assert [v["message"] for v in restored.list_versions()] == ["加载DSL", "v2", "v3"]
+    assert restored.get(1).dsl["children"][1] is restored.get(3).dsl["children"][1]
+    assert restored.total_bytes == store.total_bytes
+    assert restored.redo().number == 3
+    assert restored.commit(make_dsl("#333"), {}, "v4").number == 4
+
+
+def test_undo_survives_session_store_reload(tmp_path):
+    from app.core.session import SessionManager
+    from app.core.session_store import SQLiteSessionStore
+    from app.models.dsl_assistant_api import DSLAssistantAPI
+
+    db_path = str(tmp_path / "sessions.db")
+    worker_a = SessionManager({"api": DSLAssistantAPI}, store=SQLiteSessionStore(db_path))
+    worker_b = SessionManager({"api": DSLAssistantAPI}, store=SQLiteSessionStore(db_path))
+
+    async def main():
+        async with worker_a.session("s1", "api") as assistant:
+            assistant.load_dsl(json.dumps(make_dsl("#000")))
+            assistant._update_dsl(make_dsl("#fff"), "把文字改成白色")
+            await worker_a.acommit("s1", "api")
+
+        # 另一个 worker（或重启后的进程）可以撤销在这里做的修改
+        async with worker_b.session("s1", "api") as other:
+            assert other.undo()["children"][0]["style"]["color"] == "#000"
+            await worker_b.acommit("s1", "api")
+        async with worker_a.session("s1", "api") as assistant:
+            assert assistant.redo()["children"][0]["style"]["color"] == "#fff"
+            await worker_a.acommit("s1", "api")
+        async with worker_b.session("s1", "api") as other:
+            assert [v["number"] for v in other.versions.list_versions()] == [1, 2]
+
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+"""
+测试对话历史窗口和后台摘要
+"""
+import os
+import sys
+import asyncio
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.history import HistoryManager, DSL_SNAPSHOT_PLACEHOLDER, SUMMARY_PREFIX
+
+
+def build_history(turns: int) -> list:
+    history = [
+        {"role": "user", "content": "我已经加载了以下 DSL:\n{\"type\": \"page\"}"},
+        {"role": "assistant", "content": "DSL 已成功加载，我可以帮您分析和修改它。"}
+    ]
+    for i in range(turns):
+        history.append({"role": "user", "content": f"第{i}次修改"})
+        history.append({"role": "assistant", "content": '{"type": "page", "name": "%d"}' % i})
+    return history
+
+
+def test_window_keeps_recent_turns_and_drops_snapshots():
+    manager = HistoryManager(keep_turns=2, token_ceiling=1000)
+    window = manager.window(build_history(5))
+    # 未折叠的对话最多保留 2 * keep_turns 轮
+    assert [m["content"] for m in window if m["role"] == "user"] == ["第1次修改", "第2次修改", "第3次修改", "第4次修改"]
+    assert all(m["content"] == DSL_SNAPSHOT_PLACEHOLDER for m in window if m["role"] == "assistant")
+
+
+def test_window_respects_token_ceiling():
+    history = build_history(0) + [
+        {"role": "user", "content": "很长的问题" * 200},
+        {"role": "assistant", "content": "回答"},
+        {"role": "user", "content": "短问题"},
+        {"role": "assistant", "content": "短回答"}
+    ]
+    window = HistoryManager(keep_turns=4, token_ceiling=50).window(history)
+    assert [m["content"] for m in window] == ["短问题", "短回答"]
+
+
+def test_compaction_folds_old_turns_into_summary():
+    prompts = []
+
+    async def summarizer(messages):
+        prompts.append(messages)
+        return "用户做了多次修改"
+
+    async def run():
+        history = build_history(5)
+        manager = HistoryManager(keep_turns=2, token_ceiling=1000, summarizer=summarizer)
+        manager.schedule_compaction(lambda: history)
+        await manager._task
+        return history
+
+    history = asyncio.run(run())
+    assert history[0] == {"role": "system", "content": f"{SUMMARY_PREFIX}用户做了多次修改"}
+    assert len(history) == 5
+    # 摘要输入中不包含DSL快照
+    assert '"name"' not in prompts[0][1]["content"]
+
+
+def test_compaction_abandoned_when_history_replaced():
+    async def run():
+        state = {"history": build_history(5)}
+
+        async def summarizer(messages):
+            state["history"] = []
+            return "摘要"
+
+        manager = HistoryManager(keep_turns=2, token_ceiling=1000, summarizer=summarizer)
+        manager.schedule_compaction(lambda: state["history"])
+        await manager._task
+        return state["history"]
+
+    assert asyncio.run(run()) == []
+
+
+def test_compaction_waits_for_a_full_batch():
+    history = build_history(3)
+    manager = HistoryManager(keep_turns=2, token_ceiling=1000)
+    # 4 轮未折叠的对话，还没有超过 2 * keep_turns
+    manager.schedule_compaction(lambda: history)
+    assert len(history) == 8
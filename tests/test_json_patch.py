@@ -0,0 +1,92 @@
+"""
+测试 JSON Patch 的应用和 patch 编辑模式
+"""
+import os
+import sys
+import json
+import asyncio
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.dsl.json_patch import apply_patch, is_patch, JsonPatchError
+
+DOC = {
+    "type": "app",
+    "items": [
+        {"id": "page", "type": "page", "style": {"color": "#000"}, "items": [{"id": "a", "type": "text"}]},
+        {"id": "other", "type": "page"}
+    ]
+}
+
+
+def test_operations():
+    patched = apply_patch(DOC, [
+        {"op": "replace", "path": "/items/0/style/color", "value": "#fff"},
+        {"op": "add", "path": "/items/0/items/-", "value": {"id": "b", "type": "text"}},
+        {"op": "remove", "path": "/items/1"},
+        {"op": "copy", "from": "/items/0/items/0", "path": "/items/0/items/0/copy"},
+        {"op": "move", "from": "/items/0/items/1", "path": "/items/0/items/0"},
+        {"op": "test", "path": "/type", "value": "app"}
+    ])
+    assert patched["items"][0]["style"]["color"] == "#fff"
+    assert [item["id"] for item in patched["items"][0]["items"]] == ["b", "a"]
+    assert patched["items"][0]["items"][1]["copy"] == {"id": "a", "type": "text"}
+    assert len(patched["items"]) == 1
+
+
+def test_copy_on_write():
+    original = json.dumps(DOC)
+    patched = apply_patch(DOC, [{"op": "replace", "path": "/items/0/style/color", "value": "#fff"}])
+    # 原文档不变，未修改的子树共享
+    assert json.dumps(DOC) == original
+    assert patched["items"][1] is DOC["items"][1]
+    assert patched["items"][0]["items"] is DOC["items"][0]["items"]
+
+
+def test_errors():
+    with pytest.raises(JsonPatchError):
+        apply_patch(DOC, [{"op": "replace", "path": "/missing", "value": 1}])
+    with pytest.raises(JsonPatchError):
+        apply_patch(DOC, [{"op": "test", "path": "/type", "value": "page"}])
+    with pytest.raises(JsonPatchError):
+        apply_patch(DOC, [{"op": "add", "path": "/items/5", "value": {}}])
+    with pytest.raises(JsonPatchError):
+        apply_patch(DOC, [{"op": "move", "from": "/items/0", "path": "/items/0/items/0"}])
+    assert not is_patch([{"type": "app"}])
+    assert is_patch([{"op": "remove", "path": "/items/0"}])
+
+
+def test_test_operation_compares_json_types():
+    doc = {"flag": 1, "size": 1, "style": {"bold": True, "sizes": [1, 2]}}
+    for path, value in (("/flag", True), ("/style", {"bold": 1, "sizes": [1, 2]})):
+        with pytest.raises(JsonPatchError):
+            apply_patch(doc, [{"op": "test", "path": path, "value": value}])
+    # JSON 只有一种数字类型，数值相等即相等
+    assert apply_patch(doc, [{"op": "test", "path": "/size", "value": 1.0}]) is doc
+    assert apply_patch(doc, [{"op": "test", "path": "/style/sizes", "value": [1.0, 2]}]) is doc
+    assert apply_patch(doc, [{"op": "test", "path": "/style", "value": {"sizes": [1, 2], "bold": True}}]) is doc
+    # 非 ASCII 数字不是合法的数组下标
+    with pytest.raises(JsonPatchError):
+        apply_patch(DOC, [{"op": "remove", "path": "/items/١"}])
+    with pytest.raises(JsonPatchError):
+        apply_patch(DOC, [{"op": "remove", "path": "/items/²"}])
+
+
+def test_patch_edit_mode():
+    from app.models.dsl_assistant_api import DSLAssistantAPI
+
+    assistant = DSLAssistantAPI(edit_mode="patch")
+    assistant.load_dsl(json.dumps(DOC))
+
+    async def fake_send(messages, temperature=0.7):
+        # patch 模式下模型看到包含items的完整DSL
+        assert '"id":"page"' in messages[0]["content"]
+        return {"text": '[{"op": "replace", "path": "/items/0/style/color", "value": "#f00"}]'}
+
+    assistant._send_api_request = fake_send
+    response = asyncio.run(assistant.process_request("把页面文字改成红色"))
+    assert json.loads(response)["items"][0]["style"]["color"] == "#f00"
+    assert assistant.get_complete_dsl()["items"][0]["style"]["color"] == "#f00"
+    assert assistant.get_chat_history()[-1]["content"].startswith('[{"op"')
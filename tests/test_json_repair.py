@@ -0,0 +1,129 @@
+"""
+测试模型输出 JSON 的本地修复以及截断输出的续写
+"""
+import os
+import sys
+import json
+import asyncio
+
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.metrics import metrics
+from app.dsl.json_repair import JsonRepairError, repair_json
+
+
+@pytest.mark.parametrize("text, expected, fixes", [
+    ('{"a": 1, "b": [1, 2,],}', {"a": 1, "b": [1, 2]}, ["trailing_comma"]),
+    ('{"type": "page" "name": "x"}', {"type": "page", "name": "x"}, ["missing_comma"]),
+    ('{"items": [1, 2}', {"items": [1, 2]}, ["missing_bracket"]),
+    ("{'name': '主页', 'ok': True, \"x\": None}", {"name": "主页", "ok": True, "x": None}, ["single_quote", "python_literal"]),
+    ('{"text": "第一行\n第二行"} // 说明', {"text": "第一行\n第二行"}, ["control_character"]),
+    ('{"a": 1, /* 注释 */ "b": 2}', {"a": 1, "b": 2}, ["comment"]),
+])
+def test_repairs_common_faults(text, expected, fixes):
+    result = repair_json(text)
+    assert result.value == expected
+    assert result.fixes == fixes
+    assert not result.truncated
+
+
+def test_repairs_truncated_tail():
+    result = repair_json('```json\n{"type": "page", "items": [{"id": "a"}, {"id": "b", "na')
+    assert result.value == {"type": "page", "items": [{"id": "a"}, {"id": "b"}]}
+    assert result.truncated
+
+
+def test_keeps_complete_value_at_end_of_input():
+    # 模型漏了结束括号，末尾完整的数字和字面量不会被丢弃
+    result = repair_json('{"type": "page", "width": 100')
+    assert result.value == {"type": "page", "width": 100}
+    assert result.truncated
+    assert repair_json('{"type": "page", "visible": true').value == {"type": "page", "visible": True}
+    # 不完整的字面量和数字仍然丢弃
+    assert repair_json('{"type": "page", "visible": tr').value == {"type": "page"}
+    assert repair_json('{"type": "page", "width": 1e').value == {"type": "page"}
+
+
+def test_unrepairable_json_raises():
+    with pytest.raises(JsonRepairError):
+        repair_json('{"type": "page", "color": red}')
+
+
+def make_assistant(replies):
+    from app.models.dsl_assistant_api import DSLAssistantAPI
+
+    assistant = DSLAssistantAPI()
+    assistant.load_dsl(json.dumps({"id": "page", "type": "page", "name": "旧"}, ensure_ascii=False))
+    calls = []
+
+    async def fake_send(messages, temperature=0.7):
+        calls.append(messages)
+        return replies[len(calls) - 1]
+
+    assistant._send_api_request = fake_send
+    return assistant, calls
+
+
+def test_assistant_repairs_trailing_comma():
+    before = metrics.get("model_output_repaired_total")
+    assistant, _ = make_assistant([{"text": '{"id": "page", "type": "page", "name": "新",}'}])
+    result = asyncio.run(assistant.process_request("改名", no_cache=True))
+    assert json.loads(result)["name"] == "新"
+    assert assistant.last_response_type == "dsl"
+    assert metrics.get("model_output_repaired_total") == before + 1
+
+
+def test_assistant_keeps_value_when_only_brace_is_missing():
+    assistant, _ = make_assistant([{"text": '{"id": "page", "type": "page", "name": "新", "width": 100',
+                                    "finish_reason": "stop"}])
+    result = asyncio.run(assistant.process_request("改名并设置宽度", no_cache=True))
+    assert json.loads(result)["width"] == 100
+    assert assistant.get_complete_dsl()["width"] == 100
+
+
+def test_assistant_continues_truncated_output():
+    assistant, calls = make_assistant([
+        {"text": '{"id": "page", "type": "page", "na', "finish_reason": "length"},
+        {"text": '```json\nme": "新"}', "finish_reason": "stop"},
+    ])
+    result = asyncio.run(assistant.process_request("改名", no_cache=True))
+    assert json.loads(result)["name"] == "新"
+    # 续写请求带上已有的输出，只要求模型输出剩余部分
+    assert len(calls) == 2
+    assert calls[1][-2] == {"role": "assistant", "content": '{"id": "page", "type": "page", "na'}
+
+
+def test_assistant_rejects_output_still_truncated():
+    truncated = {"text": '{"id": "page", "type": "page", "items": [{"id": "a"', "finish_reason": "length"}
+    assistant, calls = make_assistant([truncated, {"text": ', "type": "text"', "finish_reason": "length"},
+                                       {"text": ', "name": "x"', "finish_reason": "length"}])
+    result = asyncio.run(assistant.process_request("加一个节点", no_cache=True))
+    assert "截断" in result
+    assert len(calls) == 3
+    assert assistant.get_complete_dsl()["name"] == "旧"
+
+
+def test_stream_continues_truncated_output():
+    from app.models.dsl_assistant_api import DSLAssistantAPI
+
+    assistant = DSLAssistantAPI()
+    assistant.load_dsl(json.dumps({"id": "page", "type": "page", "name": "旧"}, ensure_ascii=False))
+    streams = [(['{"id": "page", ', '"type": "page", "na'], "length"), (["```", "json\n", 'me": "新"}'], "stop")]
+
+    async def fake_stream(messages, temperature=0.7):
+        tokens, finish_reason = streams.pop(0)
+        for token in tokens:
+            yield token
+        assistant.last_finish_reason = finish_reason
+
+    assistant._stream_api_request = fake_stream
+
+    async def collect():
+        return [event async for event in assistant.process_request_stream("改名", no_cache=True)]
+
+    events = asyncio.run(collect())
+    assert "".join(text for kind, text in events if kind == "token") == '{"id": "page", "type": "page", "name": "新"}'
+    assert json.loads(events[-1][1])["name"] == "新"
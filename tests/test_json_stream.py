@@ -0,0 +1,84 @@
+"""
+测试增量 JSON 提取以及流式请求中的提前停止
+"""
+import os
+import sys
+import json
+import asyncio
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.dsl.json_stream import JSONExtractor, extract_json
+
+DSL = {"id": "page", "type": "page", "name": "引号\"和括号}{", "items": [{"id": "t", "type": "text", "size": -1.5e3, "visible": True}]}
+
+
+def is_dsl(value):
+    return isinstance(value, dict) and "type" in value
+
+
+def test_extracts_dsl_from_fences_and_prose():
+    text = "好的，用 {name} 作占位符，[注意] 结果如下：\n```json\n" + json.dumps(DSL, ensure_ascii=False, indent=2) + "\n```\n以上。"
+    for size in (1, 3, 1000):
+        extractor = JSONExtractor(is_dsl)
+        for i in range(0, len(text), size):
+            extractor.feed(text[i:i + size])
+        assert extractor.result == DSL
+        assert extractor.errors == 0
+    assert extractor.prose() == "好的，用 {name} 作占位符，[注意] 结果如下： 以上。"
+
+
+def test_skips_values_that_are_not_accepted():
+    extractor = extract_json('示例 {"color": "red"} 最终结果 {"type": "page"}', is_dsl)
+    assert extractor.values == [{"color": "red"}, {"type": "page"}]
+    assert extractor.result == {"type": "page"}
+
+
+def test_broken_json_is_detected_and_skipped():
+    extractor = extract_json('```json\n{"type": "page", "items": [1,, 2]}')
+    assert extractor.malformed
+    # 说明文字中夹带的错误 JSON 不影响整段作为普通对话
+    extractor = extract_json('颜色写成 {"color": red, "x": "a}b"} 即可')
+    assert extractor.invalid and not extractor.malformed
+    assert extractor.prose() == "颜色写成 即可"
+    # 被截断的 JSON 仍在等待后续输出
+    extractor = extract_json('{"type": "page", "items": [1, 2')
+    assert extractor.pending() and not extractor.invalid
+
+
+def run_stream(tokens):
+    from app.models.dsl_assistant_api import DSLAssistantAPI
+
+    assistant = DSLAssistantAPI()
+    assistant.load_dsl(json.dumps({"id": "page", "type": "page", "name": "旧"}, ensure_ascii=False))
+    sent = []
+
+    async def fake_stream(messages, temperature=0.7):
+        for token in tokens:
+            sent.append(token)
+            yield token
+
+    assistant._stream_api_request = fake_stream
+
+    async def collect():
+        return [event async for event in assistant.process_request_stream("把名称改成新", no_cache=True)]
+
+    return assistant, sent, asyncio.run(collect())
+
+
+def test_stream_stops_after_dsl():
+    tokens = ['{"id": "page", ', '"type": "page", ', '"name": "新"}', "\n以上是", "修改后的", "DSL。"]
+    assistant, sent, events = run_stream(tokens)
+    assert len(sent) == 3
+    assert json.loads(events[-1][1])["name"] == "新"
+    assert assistant.last_response_type == "dsl"
+
+
+def test_stream_aborts_on_malformed_dsl():
+    tokens = ['{"id": "page", ', '"type" "page", ', '"name": "新"}'] + ["..."] * 20
+    assistant, sent, events = run_stream(tokens)
+    assert len(sent) == 2
+    assert events[-1] == ("result", "抱歉，模型返回的DSL格式错误，已停止生成，请重试。")
+    assert assistant.get_complete_dsl()["name"] == "旧"
+    assert assistant.last_response_type == "text"
@@ -0,0 +1,169 @@
+"""
+测试按子树拆分DSL并行请求模型修改以及结果的组装
+"""
+import os
+import sys
+import json
+import asyncio
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.agents.parallel_editor import ParallelDSLEditor, is_page_wide_instruction
+
+
+def build_dsl(pages: int = 3, texts: int = 20) -> dict:
+    """构建包含多个页面、每个页面有若干文本的应用"""
+    return {
+        "id": "app",
+        "type": "app",
+        "name": "应用",
+        "items": [
+            {"id": f"page_{p}", "type": "page", "name": f"页面{p}", "items": [
+                {"id": f"text_{p}_{i}", "type": "text", "text": f"第{p}页的第{i}段说明文字", "style": {"color": "#333333"}}
+                for i in range(texts)
+            ]}
+            for p in range(pages)
+        ],
+    }
+
+
+def translate(nodes):
+    """模拟模型：给每个节点的文字加上前缀"""
+    result = []
+    for node in nodes:
+        node = json.loads(json.dumps(node))
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            for key in ("name", "text"):
+                if key in current:
+                    current[key] = "EN:" + current[key]
+            stack.extend(current.get("items", []))
+        result.append(node)
+    return result
+
+
+def make_sender(fail_first_unit: bool = False):
+    calls = []
+    running = []
+    peak = []
+
+    async def send(messages, temperature):
+        nodes = json.loads(messages[-1]["content"].split("需要修改的节点:\n", 1)[1])["nodes"]
+        calls.append(nodes)
+        running.append(1)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.pop()
+        if fail_first_unit and nodes[0]["id"] == "app":
+            return {"text": "抱歉，我无法处理"}
+        return {"text": "```json\n" + json.dumps({"nodes": translate(nodes)}, ensure_ascii=False) + "\n```"}
+
+    return send, calls, peak
+
+
+def test_plan_splits_by_subtree_in_order():
+    dsl = build_dsl()
+    editor = ParallelDSLEditor(unit_token_budget=400, concurrency=4)
+    plan = editor.plan(dsl)
+    assert len(plan.units) > 3
+    # 超出预算的根节点和页面只发送自身属性，所有节点按前序遍历顺序恰好出现一次
+    ids = [node["id"] for unit in plan.units for node in unit.nodes]
+    assert ids[:2] == ["app", "page_0"] and "items" not in plan.units[0].nodes[0]
+    assert len(ids) == len(set(ids)) == 1 + 3 + 60
+    assert all(unit.tokens <= 400 for unit in plan.units)
+
+
+def test_edit_reassembles_and_shares_unchanged_nodes():
+    dsl = build_dsl()
+    original = json.dumps(dsl, ensure_ascii=False)
+    send, calls, peak = make_sender()
+    result = asyncio.run(ParallelDSLEditor(unit_token_budget=400, concurrency=3).edit(dsl, "翻译所有文字", send))
+    assert result.failures == [] and len(calls) == result.units > 3
+    assert max(peak) <= 3
+    assert result.dsl == json.loads(json.dumps(translate([dsl])[0]))
+    # items 保持原来的顺序和位置，未修改的样式对象直接复用
+    assert list(result.dsl["items"][1]) == ["id", "type", "name", "items"]
+    assert result.dsl["items"][2]["items"][5]["style"] is dsl["items"][2]["items"][5]["style"]
+    assert json.dumps(dsl, ensure_ascii=False) == original
+
+
+def test_failed_unit_keeps_original():
+    dsl = build_dsl()
+    send, _, _ = make_sender(fail_first_unit=True)
+    result = asyncio.run(ParallelDSLEditor(unit_token_budget=400, concurrency=3).edit(dsl, "翻译所有文字", send))
+    assert len(result.failures) == 1 and result.changed
+    assert result.dsl["name"] == "应用" and result.dsl["items"][0]["name"] == "页面0"
+    assert result.dsl["items"][2]["items"][19]["text"].startswith("EN:")
+
+
+def test_failed_unit_is_retried():
+    dsl = build_dsl()
+    send, calls, _ = make_sender()
+    attempts = []
+
+    async def flaky_send(messages, temperature):
+        # 第一个部分第一次返回不合法的输出
+        attempts.append(messages[-1]["content"])
+        if attempts.count(messages[-1]["content"]) == 1 and '"id":"app"' in messages[-1]["content"]:
+            return {"text": "抱歉，我无法处理"}
+        return await send(messages, temperature)
+
+    editor = ParallelDSLEditor(unit_token_budget=400, concurrency=3, max_retries=1)
+    editor.scheduler.retry_delay = 0
+    result = asyncio.run(editor.edit(dsl, "翻译所有文字", flaky_send))
+    assert result.failures == [] and len(attempts) == result.units + 1
+    assert result.dsl["name"] == "EN:应用"
+
+
+def test_assistant_uses_parallel_edit_for_page_wide_instructions(monkeypatch):
+    from app.core.config import settings
+    from app.models.dsl_assistant_api import DSLAssistantAPI
+
+    monkeypatch.setattr(settings, "DSL_PARALLEL_EDIT_MIN_TOKENS", 500)
+    assert is_page_wide_instruction("把所有文字翻译成英文") and not is_page_wide_instruction("把标题改成红色")
+    # 提问和只提到范围的消息不是修改要求
+    assert not is_page_wide_instruction("整个页面有几个按钮？")
+    assert not is_page_wide_instruction("每个按钮是什么颜色")
+    assert not is_page_wide_instruction("介绍一下整个页面的主题")
+    assistant = DSLAssistantAPI()
+    assistant.parallel_editor.unit_token_budget = 400
+    assistant.load_dsl(json.dumps(build_dsl(), ensure_ascii=False))
+    send, calls, _ = make_sender()
+
+    async def fake_send(messages, temperature=0.7):
+        return await send(messages, temperature)
+
+    assistant._send_api_request = fake_send
+    result = json.loads(asyncio.run(assistant.process_request("把所有文字翻译成英文")))
+    assert len(calls) > 3
+    assert result["items"][1]["items"][0]["text"] == "EN:第1页的第0段说明文字"
+    assert assistant.get_complete_dsl() == result
+    assert assistant.last_response_type == "dsl"
+    assert assistant.chat_history[-1]["content"].startswith("已把DSL拆分为")
+
+
+def test_parallel_mode_is_opt_in_and_skips_unchanged_result(monkeypatch):
+    from app.core.config import settings
+    from app.models.dsl_assistant_api import DSLAssistantAPI
+
+    monkeypatch.setattr(settings, "DSL_PARALLEL_EDIT_MIN_TOKENS", 0)
+    assistant = DSLAssistantAPI()
+    assistant.parallel_editor.unit_token_budget = 400
+    assistant.load_dsl(json.dumps(build_dsl(), ensure_ascii=False))
+    calls = []
+
+    async def unchanged_send(messages, temperature=0.7):
+        nodes = json.loads(messages[-1]["content"].split("需要修改的节点:\n", 1)[1])["nodes"]
+        calls.append(nodes)
+        return {"text": json.dumps({"nodes": nodes}, ensure_ascii=False)}
+
+    assistant._send_api_request = unchanged_send
+    before = assistant.get_complete_dsl()
+    result = asyncio.run(assistant.process_request("把所有文字翻译成英文", edit_mode="parallel"))
+    assert len(calls) > 3
+    assert assistant.last_response_type == "text" and "未做任何修改" in result
+    # 组装结果与当前DSL相同，不提交新版本
+    assert len(assistant.versions.list_versions()) == 1
+    assert assistant.get_complete_dsl() == before
@@ -0,0 +1,39 @@
+"""
+测试提示词的布局和前缀复用统计
+"""
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.metrics import metrics
+from app.core.prompt import PromptBuilder
+from app.core.tokens import estimate_tokens
+from app.dsl.canonical import canonical_json
+
+
+def reused_sum() -> float:
+    return metrics.snapshot()["summaries"].get("prompt_prefix_reused_tokens", {}).get("sum", 0)
+
+
+def test_stable_content_first_and_prefix_reuse():
+    builder = PromptBuilder()
+    dsl_context = f"当前DSL结构:\n{canonical_json({'type': 'page', 'id': 'p'})}"
+    history = [{"role": "user", "content": "你好"}, {"role": "assistant", "content": "你好！"}]
+
+    first = builder.build("系统提示词", dsl_context, history, "第一个问题")
+    assert first[0] == {"role": "system", "content": '系统提示词\n\n当前DSL结构:\n{"id":"p","type":"page"}'}
+    assert first[-1] == {"role": "user", "content": "第一个问题"}
+
+    before = reused_sum()
+    history = history + [{"role": "user", "content": "第一个问题"}, {"role": "assistant", "content": "回答"}]
+    second = builder.build("系统提示词", dsl_context, history, "第二个问题")
+    # 上一轮的提示词整体都是本轮的前缀
+    assert second[:len(first)] == first
+    assert reused_sum() - before == sum(estimate_tokens(f"{m['role']}\n{m['content']}") for m in first)
+
+    # DSL变化后只有系统提示词部分可以复用
+    before = reused_sum()
+    builder.build("系统提示词", f"当前DSL结构:\n{canonical_json({'type': 'text'})}", history, "第三个问题")
+    assert 0 < reused_sum() - before < estimate_tokens(f"system\n系统提示词\n\n{dsl_context}")
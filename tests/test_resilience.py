@@ -0,0 +1,112 @@
+"""
+测试模型请求的退避重试、重试预算和熔断器
+"""
+import os
+import sys
+import asyncio
+
+import httpx
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+from app.core.model_client import ModelClient
+from app.core.resilience import CircuitBreaker, CircuitOpen, RetryBudget, backoff_delay
+
+
+def test_backoff_grows_exponentially_up_to_cap():
+    assert [backoff_delay(attempt, 0.5, 3.0, rand=lambda: 1.0) for attempt in range(1, 6)] == [0.5, 1.0, 2.0, 3.0, 3.0]
+    assert backoff_delay(3, 0.5, 3.0, rand=lambda: 0.0) == 0.0
+
+
+def test_retry_budget_is_proportional_to_requests():
+    budget = RetryBudget(ratio=0.5, burst=2)
+    assert budget.withdraw() and budget.withdraw()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert budget.withdraw()
+
+
+def test_circuit_breaker_opens_and_probes_in_half_open_state():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10.0, clock=lambda: now[0])
+    breaker.before_request()
+    breaker.on_failure()
+    breaker.before_request()
+    breaker.on_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpen) as error:
+        breaker.before_request()
+    assert error.value.status_code == 503 and error.value.retry_after == 10
+
+    now[0] = 10.0
+    assert breaker.before_request() is True
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # 探测期间其他请求仍被拒绝
+    with pytest.raises(CircuitOpen):
+        breaker.before_request()
+    breaker.on_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    now[0] = 20.0
+    breaker.before_request()
+    breaker.on_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.before_request() is False
+
+
+def mock_assistant(monkeypatch, handler):
+    from app.models.dsl_assistant_api import DSLAssistantAPI
+
+    monkeypatch.setattr(settings, "MODEL_RETRY_DELAY", 0.0)
+    assistant = DSLAssistantAPI()
+    client = ModelClient("http://model.test/v1")
+    monkeypatch.setattr(client, "_get_client", lambda: httpx.AsyncClient(
+        base_url=client.api_base, transport=httpx.MockTransport(handler)))
+    assistant.client = client
+    return assistant
+
+
+def completion(text):
+    return httpx.Response(200, json={"choices": [{"message": {"content": text}, "finish_reason": "stop"}]})
+
+
+def test_retries_only_retryable_status_codes(monkeypatch):
+    statuses = [503, 429, 200]
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        status = statuses[len(calls) - 1]
+        return completion("好的") if status == 200 else httpx.Response(status)
+
+    assistant = mock_assistant(monkeypatch, handler)
+    result = asyncio.run(assistant._request_model([{"role": "user", "content": "你好"}]))
+    assert result == {"text": "好的", "finish_reason": "stop"} and len(calls) == 3
+
+    calls.clear()
+    statuses = [400, 200]
+    assert asyncio.run(assistant._request_model([{"role": "user", "content": "你好"}])) is None
+    assert len(calls) == 1
+
+
+def test_open_circuit_fails_fast(monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        raise httpx.ConnectError("连接被拒绝", request=request)
+
+    monkeypatch.setattr(settings, "MODEL_MAX_RETRIES", 2)
+    assistant = mock_assistant(monkeypatch, handler)
+    assistant.client.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30.0)
+    assert asyncio.run(assistant._request_model([{"role": "user", "content": "你好"}])) is None
+    assert assistant.client.breaker.state == CircuitBreaker.OPEN
+
+    # 熔断期间不再请求模型服务，直接返回 503
+    with pytest.raises(CircuitOpen):
+        asyncio.run(assistant._request_model([{"role": "user", "content": "你好"}]))
+    assert len(calls) == 2
@@ -0,0 +1,90 @@
+"""
+测试模型响应缓存
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core import response_cache
+from app.core.response_cache import ResponseCache, make_cache_key
+
+
+def test_key_ignores_key_order_and_whitespace():
+    key = make_cache_key({"type": "page", "name": "a"}, "把标题  改成红色 ", "m", 0.3, edit_mode="full")
+    assert key == make_cache_key({"name": "a", "type": "page"}, "把标题 改成红色", "m", 0.3, edit_mode="full")
+    assert key != make_cache_key({"type": "page", "name": "b"}, "把标题 改成红色", "m", 0.3, edit_mode="full")
+    assert key != make_cache_key({"type": "page", "name": "a"}, "把标题 改成红色", "m", 0.7, edit_mode="full")
+    assert key != make_cache_key({"type": "page", "name": "a"}, "把标题 改成红色", "m", 0.3, edit_mode="patch")
+
+
+def test_lru_and_ttl():
+    cache = ResponseCache(max_entries=2, ttl=0.05)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+    cache.set("c", "3")
+    # b 最久未使用，被淘汰
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    time.sleep(0.06)
+    assert cache.get("a") is None
+
+
+def test_sqlite_spill(tmp_path):
+    db_path = str(tmp_path / "cache.db")
+    cache = ResponseCache(max_entries=1, ttl=60, db_path=db_path)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    # a 被淘汰到 SQLite，仍然可以命中
+    assert cache.get("a") == "1"
+    # 其他进程打开同一个文件也能读到溢出的条目
+    other = ResponseCache(max_entries=1, ttl=60, db_path=db_path)
+    assert other.get("b") == "2"
+    cache.close()
+    other.close()
+
+
+def test_async_access_and_discard(tmp_path):
+    cache = ResponseCache(max_entries=1, ttl=60, db_path=str(tmp_path / "cache.db"))
+
+    async def main():
+        await cache.aset("a", "1")
+        await cache.aset("b", "2")
+        assert await cache.aget("a") == "1"
+        await cache.discard("a")
+        # 内存和 SQLite 中的条目都被删除
+        assert await cache.aget("a") is None
+        assert await cache.aget("b") == "2"
+
+    asyncio.run(main())
+    cache.close()
+
+
+def test_only_validated_output_is_cached(monkeypatch):
+    from app.models.dsl_assistant_api import DSLAssistantAPI
+
+    monkeypatch.setattr(response_cache, "_cache", ResponseCache(max_entries=16, ttl=60))
+    outputs = [{"id": "page", "type": "未知组件"}, {"id": "page", "type": "page", "name": "新"}]
+    calls = []
+
+    async def fake_send(self, messages, temperature=0.7):
+        calls.append(messages)
+        return {"text": json.dumps(outputs[min(len(calls), len(outputs)) - 1], ensure_ascii=False)}
+
+    monkeypatch.setattr(DSLAssistantAPI, "_send_api_request", fake_send)
+
+    def request():
+        assistant = DSLAssistantAPI()
+        assistant.load_dsl(json.dumps({"id": "page", "type": "page", "name": "旧"}, ensure_ascii=False))
+        return asyncio.run(assistant.process_request("把名称改成新"))
+
+    # 未通过校验的输出不缓存，重试时重新请求模型
+    assert "未通过结构校验" in request()
+    assert json.loads(request())["name"] == "新"
+    assert json.loads(request())["name"] == "新"
+    assert len(calls) == 2
@@ -0,0 +1,142 @@
+"""
+测试会话管理器的按需创建、LRU 淘汰和 TTL 淘汰
+"""
+import os
+import sys
+import asyncio
+
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.session import SessionManager
+
+
+class FakeAssistant:
+    """只保存会话状态的简单助手"""
+
+    def __init__(self):
+        self.current_dsl = None
+        self.separated_items = {}
+        self.chat_history = []
+
+    def get_chat_history(self):
+        return self.chat_history
+
+
+async def use(manager, session_id, version="api"):
+    """在会话锁内取出助手实例"""
+    async with manager.session(session_id, version) as assistant:
+        return assistant
+
+
+def test_sessions_are_isolated():
+    manager = SessionManager({"api": FakeAssistant})
+
+    async def main():
+        a = await use(manager, "a")
+        b = await use(manager, "b")
+        assert a is not b
+        assert await use(manager, "a") is a
+        assert await use(manager, None) is await use(manager, "default")
+
+    asyncio.run(main())
+
+
+def test_lru_eviction_by_count():
+    manager = SessionManager({"api": FakeAssistant}, max_sessions=2)
+
+    async def main():
+        a = await use(manager, "a")
+        await use(manager, "b")
+        await use(manager, "a")  # a 变为最近使用
+        await use(manager, "c")  # 淘汰 b
+        assert manager.stats()["sessions"] == 2
+        assert await use(manager, "a") is a
+
+    asyncio.run(main())
+
+
+def test_lru_eviction_by_bytes():
+    manager = SessionManager({"api": FakeAssistant}, max_bytes=100)
+
+    async def main():
+        async with manager.session("a", "api") as a:
+            a.current_dsl = {"type": "app", "name": "x" * 60}
+            await manager.acommit("a", "api")
+        async with manager.session("b", "api") as b:
+            b.current_dsl = {"type": "app", "name": "y" * 60}
+            await manager.acommit("b", "api")
+        stats = manager.stats()
+        assert stats["sessions"] == 1
+        assert stats["bytes_held"] <= 100
+        assert await use(manager, "b") is b
+
+    asyncio.run(main())
+
+
+def test_idle_ttl_eviction():
+    manager = SessionManager({"api": FakeAssistant}, idle_ttl=0.05)
+
+    async def main():
+        a = await use(manager, "a")
+        await asyncio.sleep(0.1)
+        assert await use(manager, "a") is not a
+
+    asyncio.run(main())
+
+
+def test_sessions_in_use_are_not_evicted():
+    manager = SessionManager({"api": FakeAssistant}, max_sessions=1, idle_ttl=0.05)
+
+    async def main():
+        async with manager.session("a", "api") as a:
+            # 超出数量上限和空闲时间时，正在使用的会话都不会被淘汰
+            async with manager.session("b", "api"):
+                pass
+            await asyncio.sleep(0.1)
+            async with manager.session("c", "api"):
+                pass
+            a.chat_history.append({"role": "user", "content": "hi"})
+            await manager.acommit("a", "api")
+        async with manager.session("a", "api") as again:
+            return a, again
+
+    a, again = asyncio.run(main())
+    assert again is a and a.chat_history
+    assert manager.stats()["sessions"] == 1
+
+
+def test_requests_on_same_session_are_serialized():
+    manager = SessionManager({"api": FakeAssistant})
+    order = []
+
+    async def request(name, session_id):
+        async with manager.session(session_id, "api") as assistant:
+            order.append(f"{name}+")
+            # 读取 → 等待模型 → 写回，期间同一会话的其他请求不能插入
+            history = list(assistant.chat_history)
+            await asyncio.sleep(0.01)
+            assistant.chat_history = history + [{"role": "user", "content": name}]
+            order.append(f"{name}-")
+
+    async def main():
+        await asyncio.gather(request("x", "s"), request("y", "s"), request("z", "other"))
+
+    asyncio.run(main())
+    assert [m["content"] for m in asyncio.run(use(manager, "s")).chat_history] == ["x", "y"]
+    assert order.index("x-") < order.index("y+")
+    assert order.index("z+") < order.index("x-")
+
+
+def test_commit_of_removed_session_is_not_silently_dropped():
+    manager = SessionManager({"api": FakeAssistant})
+
+    async def main():
+        async with manager.session("a", "api"):
+            manager.remove("a", "api")
+            await manager.acommit("a", "api")
+
+    with pytest.raises(KeyError):
+        asyncio.run(main())
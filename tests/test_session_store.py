@@ -0,0 +1,148 @@
+"""
+测试 SQLite 会话存储的快照读写和增量写入
+"""
+import os
+import sys
+import asyncio
+
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.metrics import metrics
+from app.core.session import SessionManager
+from app.core.session_store import SessionConflict, SQLiteSessionStore
+from tests.test_session import FakeAssistant
+
+
+class StatefulAssistant(FakeAssistant):
+    """支持导出和恢复会话状态的简单助手"""
+
+    def export_state(self):
+        return {
+            "current_dsl": self.current_dsl,
+            "separated_items": self.separated_items,
+            "chat_history": self.chat_history
+        }
+
+    def import_state(self, state):
+        self.current_dsl = state["current_dsl"]
+        self.separated_items = state["separated_items"]
+        self.chat_history = list(state["chat_history"])
+
+
+def test_save_and_load_roundtrip(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    state = {
+        "current_dsl": {"type": "app", "name": "主页"},
+        "separated_items": {"items": [{"type": "page"}]},
+        "dsl_versions": {"current": 1, "versions": [
+            {"number": 1, "dsl": {"type": "app", "name": "主页"}, "items": {"items": [{"type": "page"}]},
+             "message": "加载DSL", "created_at": 1.5}
+        ]},
+        "chat_history": [{"role": "user", "content": "你好"}, {"role": "assistant", "content": "好的"}]
+    }
+    revision = store.save("s1", "api", state, 0)
+    loaded, loaded_revision = store.load("s1", "api")
+    assert loaded == state
+    assert loaded_revision == revision == store.revision("s1", "api")
+    assert store.load("s2", "api") is None
+
+
+def test_only_changes_are_written(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    history = [{"role": "user", "content": "a"}, {"role": "assistant", "content": "b"}]
+    state = {"current_dsl": {"type": "app"}, "separated_items": {}, "chat_history": history}
+    revision = store.save("s1", "api", state, 0)
+
+    # 没有变化时不写入也不递增版本号
+    before = metrics.get("session_store_rows_written_total")
+    assert store.save("s1", "api", state, revision) == revision
+    assert metrics.get("session_store_rows_written_total") == before
+
+    # 只追加新消息，DSL 不变时不重写
+    history.append({"role": "user", "content": "c"})
+    assert store.save("s1", "api", state, revision) == revision + 1
+    assert metrics.get("session_store_rows_written_total") == before + 1
+
+    # 历史被清空后整体重写
+    state["chat_history"] = [{"role": "user", "content": "new"}]
+    store.save("s1", "api", state, revision + 1)
+    assert store.load("s1", "api")[0]["chat_history"] == state["chat_history"]
+
+
+def test_managers_share_state_through_store(tmp_path):
+    db_path = str(tmp_path / "sessions.db")
+    worker_a = SessionManager({"api": StatefulAssistant}, store=SQLiteSessionStore(db_path))
+    worker_b = SessionManager({"api": StatefulAssistant}, store=SQLiteSessionStore(db_path))
+
+    async def main():
+        async with worker_a.session("s1", "api") as assistant_a:
+            assistant_a.current_dsl = {"type": "app"}
+            await worker_a.acommit("s1", "api")
+        async with worker_b.session("s1", "api") as assistant_b:
+            assert assistant_b.current_dsl == {"type": "app"}
+            assistant_b.chat_history.append({"role": "user", "content": "hi"})
+            await worker_b.acommit("s1", "api")
+        # worker_b 修改后，worker_a 缓存的实例会重新加载
+        async with worker_a.session("s1", "api") as assistant_a:
+            assert assistant_a.chat_history == [{"role": "user", "content": "hi"}]
+
+    asyncio.run(main())
+
+
+def test_save_rejects_stale_revision(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    state = {"current_dsl": {"type": "app"}, "separated_items": {}, "chat_history": []}
+    revision = store.save("s1", "api", state, 0)
+    store.save("s1", "api", {**state, "current_dsl": {"type": "app", "name": "A"}}, revision)
+
+    # 基于旧版本号的保存被拒绝，不会覆盖已保存的修改
+    with pytest.raises(SessionConflict) as error:
+        store.save("s1", "api", {**state, "current_dsl": {"type": "app", "name": "B"}}, revision)
+    assert error.value.actual_revision == revision + 1
+    assert store.load("s1", "api")[0]["current_dsl"] == {"type": "app", "name": "A"}
+    with pytest.raises(SessionConflict):
+        store.save("s2", "api", state, 3)
+
+
+def test_concurrent_commits_conflict_and_reload(tmp_path):
+    db_path = str(tmp_path / "sessions.db")
+    worker_a = SessionManager({"api": StatefulAssistant}, store=SQLiteSessionStore(db_path))
+    worker_b = SessionManager({"api": StatefulAssistant}, store=SQLiteSessionStore(db_path))
+
+    async def main():
+        # 两个 worker 读取同一版本后各自修改，后提交的一方收到冲突
+        async with worker_a.session("s1", "api") as assistant_a, worker_b.session("s1", "api") as assistant_b:
+            assistant_a.current_dsl = {"type": "app", "name": "A"}
+            assistant_b.current_dsl = {"type": "app", "name": "B"}
+            await worker_a.acommit("s1", "api")
+            with pytest.raises(SessionConflict):
+                await worker_b.acommit("s1", "api")
+        # 下次获取时丢弃未保存的修改，从存储重新加载
+        async with worker_b.session("s1", "api") as assistant_b:
+            return assistant_b.current_dsl
+
+    assert asyncio.run(main()) == {"type": "app", "name": "A"}
+
+
+def test_compacted_history_is_rewritten(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+
+    def turns(*contents):
+        return [{"role": "user" if i % 2 else "system", "content": c} for i, c in enumerate(contents)]
+
+    state = {"current_dsl": {"type": "app"}, "separated_items": {}, "chat_history": turns("S1", "q1", "ok", "q2", "ok")}
+    revision = store.save("s1", "api", state, 0)
+    # 折叠改写了历史开头，最后一条消息与已存储的相同
+    state["chat_history"] = turns("S2", "q2", "ok", "q3", "ok")
+    assert store.save("s1", "api", state, revision) == revision + 1
+    assert store.load("s1", "api")[0]["chat_history"] == state["chat_history"]
+
+    # 改写后继续追加只写入新消息
+    before = metrics.get("session_store_rows_written_total")
+    state["chat_history"] = state["chat_history"] + turns("q4")
+    store.save("s1", "api", state, revision + 1)
+    assert metrics.get("session_store_rows_written_total") == before + 1
+    assert store.load("s1", "api")[0]["chat_history"] == state["chat_history"]
@@ -0,0 +1,106 @@
+"""
+测试相同并发请求的合并
+"""
+import os
+import sys
+import json
+import asyncio
+
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+
+    async def fetch(name):
+        calls.append(name)
+        await asyncio.sleep(0.01)
+        return f"结果-{name}"
+
+    async def main():
+        first = await asyncio.gather(*(flight.do("a", lambda: fetch("a")) for _ in range(5)), flight.do("b", lambda: fetch("b")))
+        assert len(flight) == 0
+        # 调用结束后不缓存结果
+        second = await flight.do("a", lambda: fetch("a"))
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert first == ["结果-a"] * 5 + ["结果-b"]
+    assert second == "结果-a" and calls == ["a", "b", "a"]
+
+
+def test_errors_are_shared():
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("模型服务不可用")
+
+    async def main():
+        return await asyncio.gather(*(flight.do("k", fail) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_cancelled_waiter_does_not_cancel_others():
+    flight = SingleFlight()
+    cancelled = []
+
+    async def fetch():
+        try:
+            await asyncio.sleep(0.05)
+            return "ok"
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def main():
+        leaving = asyncio.create_task(flight.do("k", fetch))
+        staying = asyncio.create_task(flight.do("k", fetch))
+        await asyncio.sleep(0.01)
+        leaving.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leaving
+        assert await staying == "ok"
+
+        # 所有调用方都离开后取消底层调用
+        only = asyncio.create_task(flight.do("k", fetch))
+        await asyncio.sleep(0.01)
+        only.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await only
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+    assert cancelled == [True]
+
+
+def test_assistants_share_identical_model_requests(monkeypatch):
+    from app.models.dsl_assistant_api import DSLAssistantAPI
+
+    calls = []
+
+    async def fake_request(self, messages, temperature=0.7):
+        calls.append(messages)
+        await asyncio.sleep(0.02)
+        return {"text": json.dumps({"id": "page", "type": "page", "name": "新"}, ensure_ascii=False)}
+
+    monkeypatch.setattr(DSLAssistantAPI, "_request_model", fake_request)
+    dsl = json.dumps({"id": "page", "type": "page", "name": "旧"}, ensure_ascii=False)
+    assistants = [DSLAssistantAPI(), DSLAssistantAPI()]
+    for assistant in assistants:
+        assistant.load_dsl(dsl)
+
+    async def main():
+        return await asyncio.gather(*(assistant.process_request("把名称改成新", no_cache=True) for assistant in assistants))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert [json.loads(result)["name"] for result in results] == ["新", "新"]
@@ -0,0 +1,132 @@
+"""
+测试按依赖关系并发执行DSL任务的调度器
+"""
+import os
+import sys
+import asyncio
+
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.agents.dsl_task_splitter import DSLTaskSplitter
+from app.agents.task_scheduler import (
+    BOTTOM_UP, CANCELLED, FAILED, SKIPPED, SUCCEEDED, TOP_DOWN, TaskScheduler
+)
+
+DSL = {
+    "id": "app", "type": "app", "items": [
+        {"id": f"page_{p}", "type": "page", "items": [{"id": f"text_{p}_{i}", "type": "text"} for i in range(4)]}
+        for p in range(3)
+    ]
+}
+
+
+def split():
+    return DSLTaskSplitter().split_dsl(DSL)
+
+
+def node_ids(tasks):
+    return {task["task_id"]: task["node_id"] for task in tasks}
+
+
+@pytest.mark.parametrize("order", [TOP_DOWN, BOTTOM_UP])
+def test_respects_dependencies_and_concurrency(order):
+    tasks = split()
+    names = node_ids(tasks)
+    finished_at = {}
+    running = []
+    peak = []
+
+    async def worker(task, inputs):
+        running.append(task["task_id"])
+        peak.append(len(running))
+        await asyncio.sleep(0.005)
+        running.remove(task["task_id"])
+        finished_at[task["node_id"]] = len(finished_at)
+        return [task["node_id"]] + sorted(name for value in inputs.values() for name in value)
+
+    result = asyncio.run(TaskScheduler(concurrency=4, order=order).run(tasks, worker))
+    assert result.ok and len(result.results) == 16
+    assert max(peak) == 4
+    root = next(task["task_id"] for task in tasks if task["parent_task_id"] is None)
+    if order == TOP_DOWN:
+        assert all(finished_at["app"] < finished_at[f"page_{p}"] < finished_at[f"text_{p}_0"] for p in range(3))
+        # 子任务收到父任务的结果
+        text_task = next(task_id for task_id, name in names.items() if name == "text_1_2")
+        assert result.results[text_task] == ["text_1_2", "app", "page_1"]
+    else:
+        assert all(finished_at[f"text_{p}_3"] < finished_at[f"page_{p}"] < finished_at["app"] for p in range(3))
+        # 父任务汇总所有子任务的结果
+        assert len(result.results[root]) == 16
+
+
+def test_retry_failure_skips_dependents_and_reports_progress():
+    tasks = split()
+    attempts = {}
+    events = []
+
+    async def worker(task, inputs):
+        attempts[task["node_id"]] = attempts.get(task["node_id"], 0) + 1
+        if task["node_id"] == "page_1" or (task["node_id"] == "page_2" and attempts["page_2"] == 1):
+            raise RuntimeError("模型请求失败")
+        return task["node_id"]
+
+    scheduler = TaskScheduler(concurrency=2, max_retries=1, retry_delay=0)
+    result = asyncio.run(scheduler.run(tasks, worker, on_progress=events.append))
+    states = {name: result.states[task_id] for task_id, name in node_ids(tasks).items()}
+    assert attempts["page_1"] == 2 and attempts["page_2"] == 2
+    assert states["page_1"] == FAILED and result.errors
+    assert [states[f"text_1_{i}"] for i in range(4)] == [SKIPPED] * 4
+    assert states["page_2"] == SUCCEEDED and states["text_2_0"] == SUCCEEDED
+    assert "text_1_0" not in attempts
+    assert any(event.kind == "retrying" for event in events)
+    assert events[-1].finished == events[-1].total == 16
+
+
+def test_cancel_stops_only_its_own_run():
+    tasks = split()
+    scheduler = TaskScheduler(concurrency=2)
+    cancel = asyncio.Event()
+    started = []
+
+    async def worker(task, inputs):
+        started.append(task["node_id"])
+        if len(started) == 3:
+            cancel.set()
+        await asyncio.sleep(0.005)
+        return task["node_id"]
+
+    async def other_worker(task, inputs):
+        await asyncio.sleep(0.005)
+        return task["node_id"]
+
+    async def main():
+        # 同一个调度器同时执行的另一次调度不受取消影响
+        return await asyncio.gather(scheduler.run(tasks, worker, cancel_event=cancel),
+                                    scheduler.run(split(), other_worker))
+
+    result, other = asyncio.run(main())
+    assert result.cancelled and not result.ok
+    assert CANCELLED in result.states.values()
+    assert len(started) < 16
+    assert other.ok and len(other.results) == 16
+
+
+def test_task_raising_cancelled_error_fails_without_hanging():
+    tasks = split()
+
+    async def worker(task, inputs):
+        if task["node_id"] == "page_0":
+            # 例如任务内部等待的子任务被取消
+            raise asyncio.CancelledError()
+        await asyncio.sleep(0.001)
+        return task["node_id"]
+
+    scheduler = TaskScheduler(concurrency=2, max_retries=1, retry_delay=0)
+    result = asyncio.run(asyncio.wait_for(scheduler.run(tasks, worker), 3))
+    states = {name: result.states[task_id] for task_id, name in node_ids(tasks).items()}
+    assert states["page_0"] == FAILED and "CancelledError" in result.errors.values()
+    assert [states[f"text_0_{i}"] for i in range(4)] == [SKIPPED] * 4
+    assert states["page_1"] == SUCCEEDED and not result.cancelled